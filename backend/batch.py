@@ -0,0 +1,110 @@
+"""``POST /api/batch``: several public GET requests in one round trip.
+
+Each sub-request must match a GET route of the public router; it is then
+handled in-process by the app, one after the other, inside one
+``db.shared_scope()``: one connection and one read transaction for the
+whole batch, and entities hydrated by one sub-request are reused by the
+next ones (an artist page's artist, songs and albums share their artists).
+Every sub-request gets its own status and body; one failing does not fail
+the others.
+"""
+import json
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+from fastapi.routing import APIRouter
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.routing import Match
+
+import db
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - optional speedup
+    _loads = json.loads
+
+MAX_REQUESTS = 20
+# Public GET routes that are not plain JSON reads
+EXCLUDED_ROUTES = {'stream_song', 'moment_events'}
+
+
+class SubRequest(BaseModel):
+    path: str
+    # Echoed back so clients can pick their results by name
+    id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest]
+
+
+def _is_public_read(router: APIRouter, scope: Dict) -> bool:
+    # The first full match is the route the app will run, as in Starlette's router
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'name', None) not in EXCLUDED_ROUTES
+    return False
+
+
+async def _dispatch(router: APIRouter, request: Request, path: str) -> Dict:
+    url = urlsplit(path)
+    if url.scheme or url.netloc:
+        return {"status": 400, "body": {"detail": "Sub-request paths must be relative, e.g. /api/songs/1"}}
+    scope = {
+        'type': 'http',
+        'asgi': request.scope.get('asgi', {'version': '3.0'}),
+        'http_version': request.scope.get('http_version', '1.1'),
+        'method': 'GET',
+        'scheme': request.scope.get('scheme', 'http'),
+        'server': request.scope.get('server'),
+        'client': request.scope.get('client'),
+        'root_path': request.scope.get('root_path', ''),
+        'path': url.path,
+        'raw_path': url.path.encode(),
+        'query_string': url.query.encode(),
+        # Sub-results are embedded in the batch document, which is encoded per the batch's Accept
+        'headers': [(b'accept', b'application/json')],
+        'app': request.scope.get('app'),
+    }
+    if not _is_public_read(router, scope):
+        return {"status": 404, "body": {"detail": f"No public GET route for {url.path}"}}
+
+    response: Dict = {"status": 500, "body": b''}
+
+    received = []
+
+    async def receive():
+        if received:
+            return {'type': 'http.disconnect'}
+        received.append(True)
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response["status"] = message['status']
+        elif message['type'] == 'http.response.body':
+            response["body"] += message.get('body', b'')
+
+    # Through the whole app (middleware, exception handlers), the route allow-listed above
+    await request.app(scope, receive, send)
+    body = response["body"]
+    response["body"] = _loads(body) if body else None
+    return response
+
+
+async def run_batch(router: APIRouter, request: Request, batch: BatchRequest) -> Dict:
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="No requests given")
+    if len(batch.requests) > MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_REQUESTS} requests per batch")
+
+    results: List[Dict] = []
+    with db.shared_scope():
+        for sub in batch.requests:
+            result = await _dispatch(router, request, sub.path)
+            results.append({"id": sub.id, "path": sub.path, **result})
+    return {"success": True, "results": results}
@@ -0,0 +1,96 @@
+"""Benchmark response encoding of a 100-song hydrated page.
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json) with the
+encoders in encoding.py: stdlib json without jsonable_encoder, orjson and
+MessagePack. Encoders whose package is not installed are skipped.
+
+Usage (from backend/):
+    python benchmarks/bench_encoding.py
+"""
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fastapi.encoders import jsonable_encoder
+
+import encoding
+
+PAGE_SIZE = 100
+ROUNDS = 200
+NOW = '2024-01-01T00:00:00.000000'
+
+
+def make_artist(i: int, primary: bool) -> dict:
+    return {
+        "id": str(uuid.UUID(int=i)), "name": f"Artist {i}",
+        "bio": "Singer-songwriter and producer. " * 12,
+        "avatar": f"https://cdn.example.com/artists/{i}.jpg", "coverUrl": f"https://cdn.example.com/artists/{i}-cover.jpg",
+        "followers": 1000 + i, "songCount": 40, "albumCount": 4, "genres": ["pop", "r&b"],
+        "verified": True, "createdAt": NOW, "updatedAt": NOW, "isPrimary": primary,
+    }
+
+
+def make_song_page(size: int = PAGE_SIZE) -> dict:
+    """A page shaped like the detail projection: each song embeds artists, album and moods"""
+    moods = [{
+        "id": str(uuid.UUID(int=10000 + i)), "name": f"Mood {i}", "description": "Calm evening tunes",
+        "icon": "🌙", "color": "#334455", "coverUrl": None, "songCount": 120, "createdAt": NOW, "updatedAt": NOW,
+    } for i in range(8)]
+    songs = []
+    for i in range(size):
+        artists = [make_artist(i % 10, True), make_artist(10 + i % 7, False)]
+        album_artists = [make_artist(i % 10, True)]
+        songs.append({
+            "id": str(uuid.UUID(int=20000 + i)), "title": f"歌曲 Song {i}", "artistId": artists[0]["id"],
+            "artist": artists[0], "artists": artists, "albumId": str(uuid.UUID(int=30000 + i % 12)),
+            "album": {
+                "id": str(uuid.UUID(int=30000 + i % 12)), "title": f"Album {i % 12}", "artistId": artists[0]["id"],
+                "artist": album_artists[0], "artists": album_artists,
+                "coverUrl": f"https://cdn.example.com/albums/{i % 12}.jpg", "releaseDate": "2020-05-01",
+                "songCount": 12, "duration": 2400, "genre": "pop", "description": "Debut studio album. " * 5,
+                "createdAt": NOW, "updatedAt": NOW,
+            },
+            "duration": 180 + i, "audioUrl": f"https://cdn.example.com/audio/{i}.mp3",
+            "coverUrl": f"https://cdn.example.com/covers/{i}.jpg", "hasLyrics": True,
+            "moodIds": [moods[i % 8]["id"], moods[(i + 3) % 8]["id"]], "moods": [moods[i % 8], moods[(i + 3) % 8]],
+            "playCount": i * 17, "liked": bool(i % 2), "genre": "pop", "createdAt": NOW, "updatedAt": NOW,
+        })
+    return {"success": True, "data": songs, "total": 5000, "page": 1, "limit": size, "totalPages": 50}
+
+
+def time_per_call(fn, rounds: int = ROUNDS) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def fastapi_default(page) -> bytes:
+    return json.dumps(jsonable_encoder(page), ensure_ascii=False, allow_nan=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def main():
+    page = make_song_page()
+    candidates = [
+        ('jsonable_encoder + json', fastapi_default),
+        ('json (no jsonable_encoder)', encoding._encode_json_stdlib),
+    ]
+    if encoding.orjson:
+        candidates.append(('orjson', encoding._encode_json_orjson))
+    if encoding.msgpack:
+        candidates.append(('msgpack', encoding._encode_msgpack))
+
+    print(f'{PAGE_SIZE}-song hydrated page')
+    print(f"{'encoder':<28} {'us/page':>10} {'bytes':>10}")
+    for name, encode in candidates:
+        size = len(encode(page))
+        print(f'{name:<28} {time_per_call(lambda: encode(page)):>10.1f} {size:>10}')
+
+
+if __name__ == '__main__':
+    main()
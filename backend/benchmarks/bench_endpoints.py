@@ -0,0 +1,505 @@
+"""Endpoint benchmark suite: latency percentiles and queries per request.
+
+Generates a synthetic catalog (generate.py) in a throwaway directory, then
+drives the app in-process through raw ASGI calls, route by route: public
+reads, admin listings and stats, and writes: plays, likes, logins and the
+admin create / update / delete of every entity (records a POST case
+creates are deleted by the DELETE case, so the catalog keeps its size).
+Each request of a route picks other ids and
+parameters from a seeded generator, so caches see a realistic mix and runs
+are repeatable. Per route it reports p50/p95/p99 latency from ``--requests``
+timed requests, and the SQL statements a request runs, counted by
+sqltrace on a separate pass so the latencies stay untraced.
+
+Routes are timed in rounds (a few requests of every route, ``ROUNDS``
+times over) so that the machine getting busier or quieter during the run
+affects all of them alike. Results are written as JSON and compared with a
+stored baseline: a route regresses when it runs more queries, or when its
+p50 grew by more than ``--tolerance`` or its p95 by more than twice that
+(and by more than ``MIN_REGRESSION_MS``) beyond the run's overall
+slowdown, the median p50 ratio of all routes. The exit status is 1 when something regressed.
+Latencies depend on the machine, so save a baseline on the machine you
+compare on (e.g. before a change).
+Routes the suite leaves out are listed in ``SKIPPED`` with the reason.
+
+Usage (from backend/):
+    python benchmarks/bench_endpoints.py --save-baseline     # before the change
+    python benchmarks/bench_endpoints.py                     # after: compare
+    python benchmarks/bench_endpoints.py --songs 50000 --requests 100 --output /tmp/run.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+import generate
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_REQUESTS = 200
+WARMUP = 20
+ROUNDS = 10
+# Requests traced per route to count its queries
+TRACED = 20
+DEFAULT_TOLERANCE = 0.25
+# Differences below this are noise whatever the percentage
+MIN_REGRESSION_MS = 0.5
+# The p95 of a few hundred requests moves more between identical runs than the p50
+P95_TOLERANCE = 2
+PLAY_SESSIONS = 300
+ADMIN_PASSWORD = 'bench'
+
+# Routes not benchmarked, and why
+SKIPPED = {
+    'GET /api/songs/{song_id}/stream': 'serves audio files, none in the synthetic catalog',
+    'GET /api/moments/events': 'long-lived SSE stream, see bench_live.py',
+    'WS /api/moments/ws': 'long-lived WebSocket stream',
+    'POST /api/admin/profile': 'samples for seconds by design',
+    'POST /api/admin/upload': 'file upload',
+    'POST /api/admin/import/check-exists': 'external metadata import',
+    'POST /api/admin/import/batch': 'external metadata import',
+    'POST /api/admin/{entity}/bulk': 'bulk writes, see bulk.py',
+    'POST /api/admin/counters/reconcile': 'maintenance operation',
+    'POST /api/admin/snapshot/rebuild': 'maintenance operation',
+    'POST /api/admin/sync/compact': 'maintenance operation',
+    'POST /api/admin/memory/tracemalloc/start': 'changes process-wide tracing',
+    'POST /api/admin/memory/tracemalloc/stop': 'changes process-wide tracing',
+    'POST /api/admin/memory/snapshots': 'needs tracemalloc running',
+    'DELETE /api/admin/memory/snapshots': 'needs tracemalloc running',
+    'GET /api/admin/memory/snapshots/{snapshot_id}': 'needs tracemalloc running',
+    'GET /api/admin/memory/diff': 'needs tracemalloc running',
+}
+
+# (path, query string, JSON body or None)
+Request = Tuple[str, str, Optional[Dict]]
+
+
+class Case:
+    __slots__ = ('method', 'route', 'make', 'admin', 'keep')
+
+    def __init__(self, method: str, route: str, make: Callable[[random.Random], Request], admin: bool = False,
+                 keep: Optional[List[Dict]] = None):
+        self.method = method
+        self.route = route
+        self.make = make
+        self.admin = admin
+        # Where to keep the records the case's requests create
+        self.keep = keep
+
+    def done(self, status: int, content: bytes):
+        if self.keep is not None and status == 200:
+            self.keep.append(json.loads(content)['data'])
+
+    @property
+    def key(self) -> str:
+        return f'{self.method} {self.route}'
+
+
+async def request(app, method: str, path: str, query: str = '', body: Optional[Dict] = None,
+                  headers: Optional[List] = None) -> Tuple[int, bytes]:
+    payload = json.dumps(body).encode() if body is not None else b''
+    status, chunks = [], []
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    request_headers = list(headers or [])
+    if body is not None:
+        request_headers.append((b'content-type', b'application/json'))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'server': ('bench', 80), 'client': ('127.0.0.1', 1234), 'root_path': '',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'headers': request_headers,
+    }
+    await app(scope, receive, send)
+    return status[0], b''.join(chunks)
+
+
+def build_cases(ids: Dict[str, List[str]], conn: sqlite3.Connection) -> List[Case]:
+    songs, artists, albums = ids['songs'], ids['artists'], ids['albums']
+    moods, playlists, moments = ids['moods'], ids['playlists'], ids['moments']
+    moment_songs = [row[0] for row in conn.execute('SELECT songId FROM music_moments')]
+    song_rows = {row[0]: row for row in conn.execute(
+        'SELECT id, title, artistId, albumId, duration, moodIds, lyrics, genre FROM songs')}
+    artist_rows = {row[0]: row for row in conn.execute('SELECT id, name, bio, genres FROM artists')}
+    playlist_songs = {row[0]: json.loads(row[1]) for row in conn.execute('SELECT id, songIds FROM playlists')}
+    words = generate.CJK_WORDS + generate.EN_WORDS
+
+    def page(rng: random.Random, limit: int = 20) -> str:
+        return f'page={rng.randint(1, 5)}&limit={limit}'
+
+    def get(route: str, make: Callable[[random.Random], Request], admin: bool = False) -> Case:
+        return Case('GET', route, make, admin)
+
+    def song_update(rng):
+        song_id, title, artist_id, album_id, duration, mood_ids, lyrics, genre = song_rows[rng.choice(songs)]
+        return f'/api/admin/songs/{song_id}', '', {
+            'title': title, 'artistId': artist_id, 'albumId': album_id, 'duration': duration,
+            'moodIds': json.loads(mood_ids), 'lyrics': lyrics, 'genre': genre}
+
+    def artist_update(rng):
+        artist_id, name, bio, genres = artist_rows[rng.choice(artists)]
+        return f'/api/admin/artists/{artist_id}', '', {'name': name, 'bio': bio, 'genres': json.loads(genres)}
+
+    album_rows = {row[0]: row for row in conn.execute('SELECT id, title, artistId, releaseDate, genre FROM albums')}
+    mood_rows = {row[0]: row for row in conn.execute('SELECT id, name, icon, color FROM moods')}
+    moment_rows = {row[0]: row for row in conn.execute('SELECT id, songId, content, tags FROM music_moments')}
+    songs_without_moment = sorted(set(songs) - set(moment_songs))
+    # Records created by the POST cases, by table, for the DELETE cases
+    created: Dict[str, List[Dict]] = {table: [] for table in ('artists', 'albums', 'songs', 'moods', 'playlists',
+                                                              'moments', 'comments')}
+    serial = itertools.count()
+
+    def take(table: str) -> Dict:
+        # Without the POST case (--route), deletes of a missing record
+        return created[table].pop() if created[table] else {'id': 'missing', 'momentId': 'missing'}
+
+    def album_update(rng):
+        album_id, title, artist_id, release_date, genre = album_rows[rng.choice(albums)]
+        return f'/api/admin/albums/{album_id}', '', {
+            'title': title, 'artistId': artist_id, 'releaseDate': release_date, 'genre': genre}
+
+    def mood_update(rng):
+        mood_id, name, icon, color = mood_rows[rng.choice(moods)]
+        return f'/api/admin/moods/{mood_id}', '', {'name': name, 'icon': icon, 'color': color}
+
+    def playlist_update(rng):
+        playlist_id = rng.choice(playlists)
+        return f'/api/admin/playlists/{playlist_id}', '', {
+            'name': generate.phrase(rng, 'zh', 2), 'songIds': playlist_songs[playlist_id]}
+
+    def moment_update(rng):
+        moment_id, song_id, content, tags = moment_rows[rng.choice(moments)]
+        return f'/api/admin/moments/{moment_id}', '', {'songId': song_id, 'content': content, 'tags': json.loads(tags)}
+
+    def write_cases(table: str, param: str, new_record: Callable[[random.Random], Dict],
+                    update: Callable[[random.Random], Request]) -> List[Case]:
+        route = f'/api/admin/{table}'
+        return [
+            Case('POST', route, lambda rng: (route, '', new_record(rng)), admin=True, keep=created[table]),
+            Case('PUT', f'{route}/{param}', update, admin=True),
+            Case('DELETE', f'{route}/{param}', lambda rng: (f"{route}/{take(table)['id']}", '', None),
+                 admin=True),
+        ]
+
+    def playlist_reorder(rng):
+        playlist_id = rng.choice(playlists)
+        order = list(playlist_songs[playlist_id])
+        rng.shuffle(order)
+        return f'/api/admin/playlists/{playlist_id}/reorder', '', {'songIds': order}
+
+    return [
+        # Public reads
+        get('/api/artists', lambda rng: ('/api/artists', page(rng), None)),
+        get('/api/artists/{artist_id}', lambda rng: (f'/api/artists/{rng.choice(artists)}', '', None)),
+        get('/api/artists/{artist_id}/songs', lambda rng: (f'/api/artists/{rng.choice(artists)}/songs', '', None)),
+        get('/api/artists/{artist_id}/albums', lambda rng: (f'/api/artists/{rng.choice(artists)}/albums', '', None)),
+        get('/api/albums', lambda rng: ('/api/albums', page(rng), None)),
+        get('/api/albums/{album_id}', lambda rng: (f'/api/albums/{rng.choice(albums)}', '', None)),
+        get('/api/albums/{album_id}/songs', lambda rng: (f'/api/albums/{rng.choice(albums)}/songs', '', None)),
+        get('/api/songs', lambda rng: ('/api/songs', page(rng) + '&sort_by=' + rng.choice(
+            ('created_desc', 'title_asc', 'play_count_desc')), None)),
+        get('/api/songs/{song_id}', lambda rng: (f'/api/songs/{rng.choice(songs)}', '', None)),
+        get('/api/songs/{song_id}/lyrics', lambda rng: (f'/api/songs/{rng.choice(songs)}/lyrics', '', None)),
+        get('/api/songs/{song_id}/next', lambda rng: (f'/api/songs/{rng.choice(songs)}/next', '', None)),
+        get('/api/songs/{song_id}/similar', lambda rng: (
+            f'/api/songs/{rng.choice(songs)}/similar', 'by=' + rng.choice(('metadata', 'lyrics')), None)),
+        get('/api/playlists', lambda rng: ('/api/playlists', page(rng), None)),
+        get('/api/playlists/{playlist_id}', lambda rng: (f'/api/playlists/{rng.choice(playlists)}', '', None)),
+        get('/api/moods', lambda rng: ('/api/moods', '', None)),
+        get('/api/moods/{mood_id}', lambda rng: (f'/api/moods/{rng.choice(moods)}', '', None)),
+        get('/api/moods/{mood_id}/songs', lambda rng: (f'/api/moods/{rng.choice(moods)}/songs', page(rng), None)),
+        get('/api/search', lambda rng: ('/api/search', 'q=' + rng.choice(words), None)),
+        get('/api/recommendations', lambda rng: ('/api/recommendations', f'seed={rng.randrange(1000)}', None)),
+        get('/api/trending/songs', lambda rng: ('/api/trending/songs', '', None)),
+        get('/api/hot/songs', lambda rng: ('/api/hot/songs', '', None)),
+        get('/api/new/songs', lambda rng: ('/api/new/songs', '', None)),
+        get('/api/moments', lambda rng: ('/api/moments', page(rng) + (
+            '&tags=' + rng.choice(generate.MOMENT_TAGS) if rng.random() < 0.5 else ''), None)),
+        get('/api/moments/{moment_id}', lambda rng: (f'/api/moments/{rng.choice(moments)}', '', None)),
+        get('/api/songs/{song_id}/moment', lambda rng: (f'/api/songs/{rng.choice(moment_songs)}/moment', '', None)),
+        get('/api/moments/filters/tags', lambda rng: ('/api/moments/filters/tags', '', None)),
+        get('/api/moments/filters/years', lambda rng: ('/api/moments/filters/years', '', None)),
+        get('/api/moments/filters/periods', lambda rng: ('/api/moments/filters/periods', '', None)),
+        get('/api/sync', lambda rng: ('/api/sync', 'limit=100', None)),
+        Case('POST', '/api/batch', lambda rng: ('/api/batch', '', {'requests': [
+            {'path': f'/api/artists/{rng.choice(artists)}'},
+            {'path': f'/api/albums/{rng.choice(albums)}/songs'},
+            {'path': f'/api/songs/{rng.choice(songs)}'},
+            {'path': f'/api/songs/{rng.choice(songs)}/lyrics'},
+        ]})),
+        # Public writes
+        Case('POST', '/api/songs/{song_id}/play', lambda rng: (
+            f'/api/songs/{rng.choice(songs)}/play', f'sessionId=bench-{rng.randrange(50)}', None)),
+        Case('POST', '/api/moments/{moment_id}/like', lambda rng: (f'/api/moments/{rng.choice(moments)}/like', '', None)),
+        Case('POST', '/api/auth/login', lambda rng: (
+            '/api/auth/login', '', {'username': 'admin', 'password': ADMIN_PASSWORD})),
+        # Admin listings and stats
+        get('/api/admin/artists', lambda rng: ('/api/admin/artists', page(rng, 50) + (
+            '&q=' + rng.choice(words) if rng.random() < 0.3 else ''), None), admin=True),
+        get('/api/admin/albums', lambda rng: ('/api/admin/albums', page(rng, 50), None), admin=True),
+        get('/api/admin/songs', lambda rng: ('/api/admin/songs', page(rng, 50) + rng.choice((
+            '', '&sort=title_asc', f'&moodId={rng.choice(moods)}', '&q=' + rng.choice(words))), None), admin=True),
+        get('/api/admin/songs/{song_id}', lambda rng: (f'/api/admin/songs/{rng.choice(songs)}', '', None), admin=True),
+        get('/api/admin/moods', lambda rng: ('/api/admin/moods', '', None), admin=True),
+        get('/api/admin/playlists', lambda rng: ('/api/admin/playlists', page(rng, 50), None), admin=True),
+        get('/api/admin/moments', lambda rng: ('/api/admin/moments', page(rng, 50), None), admin=True),
+        get('/api/admin/counters/drift', lambda rng: ('/api/admin/counters/drift', '', None), admin=True),
+        get('/api/admin/snapshot', lambda rng: ('/api/admin/snapshot', '', None), admin=True),
+        get('/api/admin/sync', lambda rng: ('/api/admin/sync', '', None), admin=True),
+        get('/api/admin/live', lambda rng: ('/api/admin/live', '', None), admin=True),
+        get('/api/admin/coalescing', lambda rng: ('/api/admin/coalescing', '', None), admin=True),
+        get('/api/admin/sqltrace', lambda rng: ('/api/admin/sqltrace', '', None), admin=True),
+        get('/api/admin/loop', lambda rng: ('/api/admin/loop', '', None), admin=True),
+        get('/api/admin/memory', lambda rng: ('/api/admin/memory', '', None), admin=True),
+        get('/metrics', lambda rng: ('/metrics', '', None)),
+        # Admin writes: each POST case creates records that the DELETE case after it deletes again
+        *write_cases('artists', '{artist_id}', lambda rng: {'name': f'bench artist {next(serial)}'},
+                     artist_update),
+        *write_cases('albums', '{album_id}', lambda rng: {
+            'title': generate.phrase(rng, 'zh', 2), 'artistId': rng.choice(artists), 'releaseDate': '2023-05-01'},
+            album_update),
+        *write_cases('songs', '{song_id}', lambda rng: {
+            'title': generate.phrase(rng, 'zh', 2), 'artistId': rng.choice(artists), 'albumId': rng.choice(albums),
+            'duration': 200, 'moodIds': rng.sample(moods, 2), 'lyrics': song_rows[rng.choice(songs)][6]},
+            song_update),
+        *write_cases('moods', '{mood_id}', lambda rng: {
+            'name': f'bench mood {next(serial)}', 'icon': 'smile', 'color': '#FFFFFF'}, mood_update),
+        *write_cases('playlists', '{playlist_id}', lambda rng: {
+            'name': generate.phrase(rng, 'zh', 2), 'songIds': rng.sample(songs, 30)}, playlist_update),
+        Case('PUT', '/api/admin/playlists/{playlist_id}/reorder', playlist_reorder, admin=True),
+        *write_cases('moments', '{moment_id}', lambda rng: {
+            'songId': songs_without_moment.pop(), 'content': generate.phrase(rng, 'zh', 8), 'tags': ['通勤']},
+            moment_update),
+        Case('POST', '/api/admin/moments/{moment_id}/comments', lambda rng: (
+            f'/api/admin/moments/{rng.choice(moments)}/comments', '',
+            {'content': generate.phrase(rng, 'zh', 6), 'location': '上海'}), admin=True, keep=created['comments']),
+        Case('DELETE', '/api/admin/moments/{moment_id}/comments/{comment_id}', lambda rng: (
+            '/api/admin/moments/{momentId}/comments/{id}'.format(**take('comments')), '', None), admin=True),
+    ]
+
+
+def percentile(quantiles: List[float], p: int) -> float:
+    return round(quantiles[p - 1], 3)
+
+
+def summarize(times: List[float], traces: List, statuses: set) -> Dict:
+    quantiles = statistics.quantiles(times, n=100, method='inclusive')
+    return {
+        'p50Ms': percentile(quantiles, 50),
+        'p95Ms': percentile(quantiles, 95),
+        'p99Ms': percentile(quantiles, 99),
+        'meanMs': round(statistics.fmean(times), 3),
+        'queries': round(sum(t.queries for t in traces) / len(traces), 2) if traces else 0,
+        # Most runs of one statement shape in a request, see sqltrace.nplus1
+        'maxRepeat': max((s.count for t in traces for s in t.statements.values()), default=0),
+        'statuses': sorted(statuses),
+    }
+
+
+async def measure(app, cases: List[Case], admin: List, requests: int, seed: int) -> Dict[str, Dict]:
+    """Time every case, in rounds: drift of the machine's speed then affects all routes alike"""
+    import sqltrace
+
+    rngs = {case.key: random.Random(f'{seed}:{case.key}') for case in cases}
+    times: Dict[str, List[float]] = {case.key: [] for case in cases}
+    statuses: Dict[str, set] = {case.key: set() for case in cases}
+
+    async def send(case: Case) -> float:
+        path, query, body = case.make(rngs[case.key])
+        started = time.perf_counter()
+        status, content = await request(app, case.method, path, query, body, admin if case.admin else [])
+        elapsed = (time.perf_counter() - started) * 1000
+        statuses[case.key].add(status)
+        case.done(status, content)
+        return elapsed
+
+    for case in cases:
+        for _ in range(WARMUP):
+            await send(case)
+    per_round = max(1, requests // ROUNDS)
+    for round_number in range(ROUNDS):
+        print(f'round {round_number + 1}/{ROUNDS}', end='\r', flush=True)
+        for case in cases:
+            for _ in range(per_round):
+                times[case.key].append(await send(case))
+    print(' ' * 20, end='\r')
+    # Counted apart: tracing slows the statements down
+    results = {}
+    for case in cases:
+        with sqltrace.capture() as traces:
+            for _ in range(TRACED):
+                await send(case)
+        results[case.key] = summarize(times[case.key], traces, statuses[case.key])
+    return results
+
+
+def prepare(songs: int, seed: int) -> Dict[str, List[str]]:
+    """Schema, catalog, play history and derived indexes in a new ./music.db"""
+    with open('config.yaml', 'w') as f:
+        f.write(f'admin:\n  username: "admin"\n  password: "{ADMIN_PASSWORD}"\nmetrics:\n  enabled: true\n')
+    import main  # noqa: F401  (creates the schema in ./music.db)
+    import catalog
+    import listening
+    import lyrics_index
+
+    conn = sqlite3.connect('music.db')
+    ids = generate.generate(conn.cursor(), songs, seed)
+    # Listening sessions, so "next" recommendations have transitions to use
+    rng = random.Random(seed)
+    events = []
+    for session in range(PLAY_SESSIONS):
+        played = time.time() - rng.randrange(7 * 24 * 3600)
+        for song_id in rng.sample(ids['songs'], rng.randint(3, 30)):
+            played += rng.randint(120, 300)
+            events.append((f'session-{session}', song_id, played))
+    conn.executemany('INSERT INTO play_events (sessionId, songId, playedAt) VALUES (?, ?, ?)', events)
+    conn.commit()
+    conn.close()
+    catalog.bump_version()
+    listening.run_listening_job()
+    lyrics_index.run_lyrics_job()
+    return ids
+
+
+async def run(args) -> Dict:
+    os.chdir(tempfile.mkdtemp())
+    started = time.perf_counter()
+    ids = prepare(args.songs, args.seed)
+    print(f'catalog: {", ".join(f"{len(v)} {k}" for k, v in ids.items())} '
+          f'({time.perf_counter() - started:.1f}s)')
+    import main
+
+    app = main.app
+    status, body = await request(app, 'POST', '/api/auth/login', body={'username': 'admin', 'password': ADMIN_PASSWORD})
+    assert status == 200, body
+    admin = [(b'authorization', f'Bearer {json.loads(body)["access_token"]}'.encode())]
+
+    conn = sqlite3.connect('music.db')
+    cases = build_cases(ids, conn)
+    conn.close()
+    benchmarked = {case.key for case in cases}
+    if args.route:
+        cases = [case for case in cases if args.route in case.key]
+
+    results = await measure(app, cases, admin, args.requests, args.seed)
+    print(f"{'route':<64} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}  status")
+    for case in cases:
+        result = results[case.key]
+        print(f"{case.key:<64} {result['p50Ms']:>8.2f} {result['p95Ms']:>8.2f} {result['p99Ms']:>8.2f} "
+              f"{result['queries']:>7.1f}  {','.join(map(str, result['statuses']))}")
+
+    import profiler
+    routes = {f"{method} {route.path}" for route in profiler._iter_routes(app.routes)
+              for method in (getattr(route, 'methods', None) or {'WS'}) if method != 'HEAD'}
+    covered = benchmarked | set(SKIPPED)
+    uncovered = sorted(key for key in routes - covered
+                       if not key.split(' ', 1)[1].startswith(('/docs', '/redoc', '/openapi')))
+    return {
+        'meta': {
+            'songs': args.songs, 'seed': args.seed, 'requests': args.requests,
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(), 'cpus': os.cpu_count(), 'at': time.time(),
+        },
+        'endpoints': results,
+        'uncovered': uncovered,
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of results against the baseline, one line each"""
+    regressions = []
+    if {k: baseline['meta'].get(k) for k in ('songs', 'seed')} != {k: results['meta'][k] for k in ('songs', 'seed')}:
+        print(f"note: baseline catalog differs (songs={baseline['meta'].get('songs')}, "
+              f"seed={baseline['meta'].get('seed')}); latencies are not comparable")
+    shared = [key for key in results['endpoints'] if key in baseline['endpoints']]
+    # A machine that is busier or slower than when the baseline was taken slows every route down;
+    # only growth beyond the median one is the route's own
+    ratios = [results['endpoints'][key]['p50Ms'] / baseline['endpoints'][key]['p50Ms']
+              for key in shared if baseline['endpoints'][key]['p50Ms']]
+    factor = statistics.median(ratios) if ratios else 1.0
+    print(f'\nroutes are {factor:.2f}x the baseline overall (median p50 ratio); compared after scaling by it')
+    if factor > 1 + tolerance:
+        print('warning: every route got slower; a busier machine or a change on every request path '
+              '(middleware, connections) would do that')
+    print(f"{'route':<64} {'p50':>8} {'base':>8} {'p95':>8} {'base':>8} {'queries':>9}")
+    for key, result in results['endpoints'].items():
+        base = baseline['endpoints'].get(key)
+        if base is None:
+            print(f'{key:<64} (new)')
+            continue
+        flags = []
+        if result['queries'] > base['queries']:
+            flags.append(f"queries {base['queries']:g} -> {result['queries']:g}")
+        for stat, allowed in (('p50Ms', tolerance), ('p95Ms', tolerance * P95_TOLERANCE)):
+            expected = base[stat] * factor
+            grown = result[stat] - expected
+            if grown > MIN_REGRESSION_MS and grown > expected * allowed:
+                flags.append(f'{stat[:3]} +{grown / expected * 100:.0f}%')
+        print(f"{key:<64} {result['p50Ms']:>8.2f} {base['p50Ms']:>8.2f} {result['p95Ms']:>8.2f} "
+              f"{base['p95Ms']:>8.2f} {result['queries']:>4g}/{base['queries']:<4g}"
+              + (f"  REGRESSED: {', '.join(flags)}" if flags else ''))
+        regressions.extend(f'{key}: {flag}' for flag in flags)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every endpoint on a synthetic catalog')
+    parser.add_argument('--songs', type=int, default=generate.DEFAULT_SONGS)
+    parser.add_argument('--seed', type=int, default=generate.DEFAULT_SEED)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='timed requests per route')
+    parser.add_argument('--route', help='only routes whose "METHOD /path" contains this')
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='latency growth over the baseline reported as a regression (0.25 = 25%%)')
+    args = parser.parse_args()
+    args.output = args.output and os.path.abspath(args.output)
+    args.baseline = os.path.abspath(args.baseline)
+
+    results = asyncio.run(run(args))
+    if results['uncovered']:
+        print(f"\nnot benchmarked: {', '.join(results['uncovered'])}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f'\nbaseline saved to {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'\nno baseline at {args.baseline}; run with --save-baseline first')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s):')
+        for line in regressions:
+            print(f'  {line}')
+        sys.exit(1)
+    print('\nno regressions')
+
+
+if __name__ == '__main__':
+    main()
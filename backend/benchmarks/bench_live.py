@@ -0,0 +1,219 @@
+"""Load test of the live moment events: thousands of SSE subscribers on one server.
+
+Starts uvicorn in a subprocess on a scratch database, then opens
+N_SUBSCRIBERS SSE connections following moment A, plus N_SLOW connections
+following moment B that never read (with a tiny receive buffer). Then:
+
+1. likes moment A N_EVENTS times and measures how long each like takes to
+   reach every subscriber (from sending the POST to the last delivery);
+2. floods moment B with BURST large comments, which fills the slow clients'
+   sockets and queues until they are evicted, while still liking moment A,
+   and measures the same latencies again: the slow clients must not hold
+   back the others.
+
+Reports delivery latencies, lost events, evictions and the server's RSS.
+The clients run on the same machine as the server, so on few cores the
+latencies include the clients' own parsing of every event.
+
+Usage (from backend/):
+    python benchmarks/bench_live.py            # 5000 subscribers
+    N_SUBSCRIBERS=1000 python benchmarks/bench_live.py
+"""
+import asyncio
+import os
+import re
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+N_SUBSCRIBERS = int(os.environ.get('N_SUBSCRIBERS', 5000))
+N_SLOW = int(os.environ.get('N_SLOW', 50))
+N_EVENTS = 20
+# Seconds between likes in the first phase
+INTERVAL = float(os.environ.get('INTERVAL', 1.0))
+BURST = 400
+COMMENT_SIZE = 32 * 1024
+PORT = int(os.environ.get('PORT', 8799))
+CONNECT_BATCH = 500
+LIKE_COUNT = re.compile(rb'"likeCount":(\d+)')
+NOW = '2024-01-01T00:00:00'
+
+
+def prepare(workdir: str):
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+        f.write('admin:\n  username: "admin"\n  password: "bench"\n')
+    env = dict(os.environ, PYTHONPATH=BACKEND)
+    subprocess.run([sys.executable, '-c', 'import main'], cwd=workdir, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(os.path.join(workdir, 'music.db'))
+    conn.execute("INSERT INTO artists (id, name, createdAt, updatedAt) VALUES ('ar', 'Artist', ?, ?)", (NOW, NOW))
+    for name in ('a', 'b'):
+        conn.execute("INSERT INTO songs (id, title, artistId, createdAt, updatedAt) VALUES (?, ?, 'ar', ?, ?)",
+                     (f'song-{name}', f'Song {name}', NOW, NOW))
+        conn.execute("INSERT INTO music_moments (id, songId, content, tags, likeCount, createdAt, updatedAt) "
+                     "VALUES (?, ?, 'moment', '[]', 0, ?, ?)", (f'moment-{name}', f'song-{name}', NOW, NOW))
+    conn.commit()
+    conn.close()
+    return env
+
+
+def rss_mb(pid: int) -> float:
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Client:
+    __slots__ = ('reader', 'writer', 'received', 'connected')
+
+    def __init__(self):
+        self.received = {}
+        self.connected = False
+
+
+async def open_stream(moment_id: str, rcvbuf: int = 0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', PORT))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(f'GET /api/moments/events?ids={moment_id} HTTP/1.1\r\nHost: bench\r\n'
+                 f'Accept: text/event-stream\r\n\r\n'.encode())
+    await writer.drain()
+    return reader, writer
+
+
+async def follow(client: Client):
+    """Read the stream, noting when each like count arrived"""
+    try:
+        await client.reader.readuntil(b'\r\n\r\n')
+        await client.reader.readuntil(b': connected\n\n')
+        client.connected = True
+        while True:
+            chunk = await client.reader.readuntil(b'\n\n')
+            match = LIKE_COUNT.search(chunk)
+            if match:
+                client.received[int(match.group(1))] = time.perf_counter()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+def like(session: requests.Session) -> int:
+    response = session.post(f'http://127.0.0.1:{PORT}/api/moments/moment-a/like')
+    return response.json()['data']['likeCount']
+
+
+def comment(session: requests.Session, headers, content: str):
+    session.post(f'http://127.0.0.1:{PORT}/api/admin/moments/moment-b/comments',
+                 json={'content': content}, headers=headers)
+
+
+async def settle(sent: dict, clients, timeout: float = 30):
+    """Wait until every subscriber got every event (or the timeout)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(count in c.received for c in clients for count in sent):
+            return
+        await asyncio.sleep(0.2)
+
+
+def report(label: str, sent: dict, clients):
+    fanout, deliveries, lost = [], [], 0
+    for count, started in sent.items():
+        times = [c.received[count] - started for c in clients if count in c.received]
+        lost += len(clients) - len(times)
+        if times:
+            fanout.append(max(times))
+            deliveries.extend(times)
+    deliveries.sort()
+    print(f'{label}: {len(sent)} events x {len(clients)} subscribers, lost {lost}')
+    print(f'  delivery p50 {deliveries[len(deliveries) // 2] * 1000:.1f} ms, '
+          f'p99 {deliveries[int(len(deliveries) * 0.99)] * 1000:.1f} ms; '
+          f'all subscribers reached in {statistics.median(fanout) * 1000:.1f} ms median, '
+          f'{max(fanout) * 1000:.1f} ms worst')
+
+
+async def main():
+    workdir = tempfile.mkdtemp()
+    env = prepare(workdir)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(PORT), '--log-level', 'warning',
+         '--backlog', '4096'],
+        cwd=workdir, env=env,
+    )
+    loop = asyncio.get_running_loop()
+    session = requests.Session()
+    try:
+        for _ in range(100):
+            try:
+                session.get(f'http://127.0.0.1:{PORT}/api/moods')
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        token = session.post(f'http://127.0.0.1:{PORT}/api/auth/login',
+                             json={'username': 'admin', 'password': 'bench'}).json()['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        idle_rss = rss_mb(server.pid)
+
+        started = time.perf_counter()
+        clients, tasks = [], []
+        for offset in range(0, N_SUBSCRIBERS, CONNECT_BATCH):
+            batch = [Client() for _ in range(min(CONNECT_BATCH, N_SUBSCRIBERS - offset))]
+            streams = await asyncio.gather(*(open_stream('moment-a') for _ in batch))
+            for client, (reader, writer) in zip(batch, streams):
+                client.reader, client.writer = reader, writer
+                tasks.append(asyncio.ensure_future(follow(client)))
+            clients.extend(batch)
+        slow = [await open_stream('moment-b', rcvbuf=4096) for _ in range(N_SLOW)]
+        while sum(c.connected for c in clients) < N_SUBSCRIBERS:
+            await asyncio.sleep(0.1)
+        print(f'{N_SUBSCRIBERS} subscribers (+{N_SLOW} slow) connected in {time.perf_counter() - started:.1f} s; '
+              f'server RSS {idle_rss:.0f} MB idle, {rss_mb(server.pid):.0f} MB connected')
+
+        sent = {}
+        for _ in range(N_EVENTS):
+            t0 = time.perf_counter()
+            sent[await loop.run_in_executor(None, like, session)] = t0
+            await asyncio.sleep(INTERVAL)
+        await settle(sent, clients)
+        report(f'likes every {INTERVAL:g} s', sent, clients)
+
+        # Flood the slow clients' moment, keep liking moment A meanwhile
+        content = 'x' * COMMENT_SIZE
+        burst_sent = {}
+        for i in range(BURST):
+            await loop.run_in_executor(None, comment, session, headers, content)
+            if i % (BURST // N_EVENTS) == 0:
+                t0 = time.perf_counter()
+                burst_sent[await loop.run_in_executor(None, like, session)] = t0
+        await settle(burst_sent, clients)
+        report(f'likes during a burst of {BURST} x {COMMENT_SIZE // 1024} KB comments to the slow clients',
+               burst_sent, clients)
+
+        stats = session.get(f'http://127.0.0.1:{PORT}/api/admin/live', headers=headers).json()['data']
+        print(f"hub: {stats['subscribers']} subscribers, evicted {stats['evicted']}, rejected {stats['rejected']}, "
+              f"published {stats['published']}, delivered {stats['delivered']}; server RSS {rss_mb(server.pid):.0f} MB")
+
+        for task in tasks:
+            task.cancel()
+        for client in clients:
+            client.writer.close()
+        for _, writer in slow:
+            writer.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Benchmark the overhead of request metrics (metrics.py).
+
+Builds a throwaway 10000-song catalog with the app's schema and drives the
+app in-process through raw ASGI calls (no HTTP client in the loop), timing
+a few read routes with metrics disabled and enabled. Requests alternate
+between the two and medians are compared, so drift and noise on a busy
+machine affect both alike. Enabled covers the middleware, the timed
+SQLite cursors and the cache counters. Also times the middleware alone
+around an app that does nothing, which is its fixed cost per request.
+
+Usage (from backend/):
+    python benchmarks/bench_metrics.py
+"""
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+from bench_snapshot import build_catalog
+
+N_SONGS = 10000
+REQUESTS = 1000
+
+
+async def request(app, path: str, query: str = '') -> int:
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'server': ('bench', 80), 'client': ('127.0.0.1', 1234), 'root_path': '',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'headers': [],
+    }
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def timed(app, path: str, query: str = '') -> float:
+    started = time.perf_counter()
+    await request(app, path, query)
+    return (time.perf_counter() - started) * 1e6
+
+
+async def run():
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    # Importing the app creates the schema and triggers in ./music.db
+    import main
+    import catalog
+    import metrics
+
+    conn = sqlite3.connect('music.db')
+    song_ids, album_ids = build_catalog(conn.cursor(), N_SONGS)
+    conn.commit()
+    conn.close()
+    catalog.bump_version()
+
+    app = main.app
+    cases = [
+        ('/api/moods', ''),
+        (f'/api/songs/{song_ids[123]}', ''),
+        (f'/api/albums/{album_ids[45]}', ''),
+        ('/api/songs', 'limit=50&sort_by=play_count_desc'),
+        ('/api/recommendations', 'limit=20'),
+    ]
+    for path, query in cases:
+        assert await request(app, path, query) == 200, path
+
+    print(f"{'route':<36} {'off us':>9} {'on us':>9} {'overhead':>9}")
+    for path, query in cases:
+        off, on = [], []
+        for _ in range(REQUESTS):
+            metrics.disable()
+            off.append(await timed(app, path, query))
+            metrics.enable()
+            on.append(await timed(app, path, query))
+        off_us, on_us = statistics.median(off), statistics.median(on)
+        label = path + ('?' + query if query else '')
+        print(f'{label[:36]:<36} {off_us:>9.1f} {on_us:>9.1f} {(on_us - off_us) / off_us * 100:>8.1f}%')
+
+    async def empty_app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{}'})
+
+    wrapped = metrics.MetricsMiddleware(empty_app)
+    bare, observed = [], []
+    for _ in range(REQUESTS * 10):
+        bare.append(await timed(empty_app, '/empty'))
+        observed.append(await timed(wrapped, '/empty'))
+    print(f'middleware alone: {statistics.median(observed) - statistics.median(bare):.1f} us per request')
+    print(f'/metrics document: {len(metrics.render()) / 1024:.0f} KB')
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
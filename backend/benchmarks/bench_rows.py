@@ -0,0 +1,164 @@
+"""Measure memory allocated per hydrated row, old row handling against the loaders.
+
+Songs: the hand-written ``SELECT *`` + positional dict literal the handlers
+used to have, the generic per-field converter loop with read-time https
+rewriting, and ``load_songs`` with its compiled row mapper reading URLs
+normalized on write. Moments: decoding every row's tags to filter in
+Python, against filtering with json_each in SQLite and decoding only the
+page. Peak traced memory (tracemalloc) is reported per row, or per request.
+
+Usage (from backend/):
+    python benchmarks/bench_rows.py
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_snapshot import NOW, build_catalog
+
+N_SONGS = 20000
+ROWS = 2000
+N_MOMENTS = 20000
+TAGS = ['夏天', '雨天', '通勤', '深夜', '旅行', '青春', '校园', '回忆']
+
+# The flat song payload the old list handlers built
+SONG_FIELDS = ('id title artistId artistName albumId albumTitle duration audioUrl coverUrl moodIds playCount liked '
+               'genre createdAt updatedAt')
+
+
+def ensure_https_url(url):
+    if url and url.startswith('http://'):
+        return url.replace('http://', 'https://', 1)
+    return url
+
+
+def parse_json_field(value):
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except ValueError:
+        return []
+
+
+def legacy_songs(cursor, ids):
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute(f'''
+        SELECT s.*, ar.name, al.title FROM songs s
+        JOIN artists ar ON s.artistId = ar.id LEFT JOIN albums al ON s.albumId = al.id
+        WHERE s.id IN ({placeholders})
+    ''', ids)
+    return [{
+        "id": row[0], "title": row[1], "artistId": row[2], "artistName": row[14], "albumId": row[3],
+        "albumTitle": row[15], "duration": row[4], "audioUrl": row[5], "coverUrl": ensure_https_url(row[6]),
+        "moodIds": parse_json_field(row[8]), "playCount": row[9], "liked": bool(row[10]), "genre": row[11],
+        "createdAt": row[12], "updatedAt": row[13],
+    } for row in cursor.fetchall()]
+
+
+def generic_songs(cursor, ids, entity, converters):
+    """Entity columns with a converter lookup per field per row, as before the compiled mappers"""
+    fields = SONG_FIELDS.split()
+    select = ', '.join(entity.columns[f][0] for f in fields)
+    cursor.execute(f'SELECT {select} FROM songs s WHERE s.id IN ({",".join("?" * len(ids))})', ids)
+    records = []
+    for row in cursor.fetchall():
+        record = {}
+        for field, value in zip(fields, row):
+            convert = converters.get(field)
+            record[field] = convert(value) if convert and value is not None else value
+        records.append(record)
+    return records
+
+
+def legacy_moments(cursor, tag, page, limit):
+    cursor.execute('''
+        SELECT m.*, s.title, s.coverUrl, ar.name FROM music_moments m
+        JOIN songs s ON m.songId = s.id JOIN artists ar ON s.artistId = ar.id
+        ORDER BY m.createdAt DESC
+    ''')
+    rows = [row for row in cursor.fetchall() if tag in parse_json_field(row[3])]
+    return len(rows), [{
+        "id": row[0], "songId": row[1], "content": row[2], "tags": parse_json_field(row[3]),
+        "song": {"id": row[1], "title": row[10], "coverUrl": ensure_https_url(row[11]), "artistName": row[12]},
+    } for row in rows[(page - 1) * limit:page * limit]]
+
+
+def sql_moments(cursor, tag, page, limit, load_moments, spec):
+    from_sql = '''
+        FROM music_moments m JOIN songs s ON m.songId = s.id JOIN artists ar ON s.artistId = ar.id
+        WHERE json_valid(m.tags) AND EXISTS (SELECT 1 FROM json_each(m.tags) t WHERE t.value = ?)
+    '''
+    total = cursor.execute(f'SELECT COUNT(*) {from_sql}', (tag,)).fetchone()[0]
+    cursor.execute(f'SELECT m.id {from_sql} ORDER BY m.createdAt DESC LIMIT ? OFFSET ?', (tag, limit, (page - 1) * limit))
+    return total, load_moments(cursor, [row[0] for row in cursor.fetchall()], spec)
+
+
+def measure(fn):
+    """(peak traced bytes, retained bytes, seconds) of one call"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, retained, elapsed
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    import main as app  # noqa: F401  (creates the schema in ./music.db)
+    from fields import PROJECTIONS, SONG, load_songs, load_moments, _fields
+
+    conn = sqlite3.connect('music.db')
+    cursor = conn.cursor()
+    song_ids, _ = build_catalog(cursor, N_SONGS)
+    cursor.executemany(
+        'INSERT INTO music_moments (id, songId, content, tags, energyLevel, likeCount, createdAt, updatedAt) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'moment-{i}', song_ids[i % N_SONGS], '那年夏天第一次听到这首歌' * 3,
+          json.dumps([TAGS[i % 8], TAGS[(i * 3 + 1) % 8]], ensure_ascii=False), 0, 0, NOW, NOW)
+         for i in range(N_MOMENTS)])
+    conn.commit()
+    ids = song_ids[:ROWS]
+    spec = _fields(SONG_FIELDS)
+    read_time = {'coverUrl': ensure_https_url, 'moodIds': parse_json_field, 'liked': bool}
+
+    print(f'{ROWS} song rows (stored URLs http:// for the old paths, normalized for the loader)')
+    print(f"{'path':<34} {'peak B/row':>11} {'kept B/row':>11} {'us/row':>8}")
+    for label, fn in (
+        ('SELECT * + dict literal', lambda: legacy_songs(cursor, ids)),
+        ('per-field converters, https on read', lambda: generic_songs(cursor, ids, SONG, read_time)),
+    ):
+        fn()
+        peak, kept, elapsed = measure(fn)
+        print(f'{label:<34} {peak / ROWS:>11.0f} {kept / ROWS:>11.0f} {elapsed / ROWS * 1e6:>8.2f}')
+
+    cursor.execute("UPDATE songs SET coverUrl = 'https://' || substr(coverUrl, 8) WHERE substr(coverUrl, 1, 7) = 'http://'")
+    conn.commit()
+    load_songs(cursor, ids, spec)
+    peak, kept, elapsed = measure(lambda: load_songs(cursor, ids, spec))
+    print(f"{'load_songs (compiled mapper)':<34} {peak / ROWS:>11.0f} {kept / ROWS:>11.0f} {elapsed / ROWS * 1e6:>8.2f}")
+
+    moment_spec = PROJECTIONS['moment']['detail']
+    print(f'\n{N_MOMENTS} moments, one 20-row page filtered by tag')
+    print(f"{'path':<34} {'peak KB':>11} {'kept KB':>11} {'ms':>8}")
+    for label, fn in (
+        ('decode all tags, filter in Python', lambda: legacy_moments(cursor, TAGS[0], 2, 20)),
+        ('json_each filter, decode page', lambda: sql_moments(cursor, TAGS[0], 2, 20, load_moments, moment_spec)),
+    ):
+        fn()
+        peak, kept, elapsed = measure(fn)
+        print(f'{label:<34} {peak / 1024:>11.0f} {kept / 1024:>11.0f} {elapsed * 1000:>8.1f}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark random recommendation sampling against ORDER BY RANDOM().
+
+Builds throwaway catalogs of increasing size and times a 20-song pick with
+both approaches. The sampler should stay flat while ORDER BY RANDOM() grows
+with the catalog.
+
+Usage (from backend/):
+    python benchmarks/bench_sampler.py
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sampler import SongSampler
+
+SIZES = [1000, 10000, 100000]
+PICK = 20
+ROUNDS = 200
+SQL_ROUNDS = 10
+
+
+def build_catalog(path: str, n_songs: int):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE artists (id TEXT PRIMARY KEY, name TEXT)')
+    conn.execute('''
+        CREATE TABLE songs (
+            id TEXT PRIMARY KEY, title TEXT, artistId TEXT, albumId TEXT,
+            moodIds TEXT, genre TEXT, playCount INTEGER DEFAULT 0
+        )
+    ''')
+    artist_ids = [str(uuid.uuid4()) for _ in range(max(1, n_songs // 20))]
+    conn.executemany('INSERT INTO artists VALUES (?, ?)', [(a, f'Artist {i}') for i, a in enumerate(artist_ids)])
+    moods = [f'mood-{i}' for i in range(8)]
+    conn.executemany('INSERT INTO songs (id, title, artistId, moodIds, genre) VALUES (?, ?, ?, ?, ?)', (
+        (str(uuid.uuid4()), f'Song {i}', artist_ids[i % len(artist_ids)],
+         json.dumps([moods[i % len(moods)]]), 'pop' if i % 3 else 'rock')
+        for i in range(n_songs)
+    ))
+    conn.commit()
+    conn.close()
+
+
+def time_per_call(fn, rounds: int = ROUNDS) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    print(f"{'songs':>8} {'sampler us':>12} {'seeded us':>14} {'RANDOM() us':>12}")
+    for n in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            build_catalog(path, n)
+
+            sampler = SongSampler(path)
+            sampler.pool()  # warm the pools; rebuild cost is paid once per catalog change
+
+            unseeded = time_per_call(lambda: sampler.sample(PICK, mood_id='mood-1'))
+            seeded = time_per_call(lambda: sampler.sample(PICK, seed=42, offset=40))
+
+            conn = sqlite3.connect(path)
+            order_by_random = time_per_call(lambda: conn.execute(
+                'SELECT s.* FROM songs s JOIN artists ar ON s.artistId = ar.id '
+                'WHERE s.moodIds LIKE ? ORDER BY RANDOM() LIMIT ?', ('%mood-1%', PICK)
+            ).fetchall(), SQL_ROUNDS)
+            conn.close()
+
+            print(f'{n:>8} {unseeded:>12.1f} {seeded:>14.1f} {order_by_random:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark the normalized (entity-table) response shape against the nested one.
+
+Encodes the same 100-song hydrated page from bench_encoding.py both ways and
+reports payload size and time per page. The normalized column includes the
+time spent normalizing.
+
+Usage (from backend/):
+    python benchmarks/bench_shape.py
+"""
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import encoding
+from fields import normalize
+from bench_encoding import PAGE_SIZE, make_song_page, time_per_call
+
+
+def main():
+    songs = make_song_page()['data']
+    encoders = [('json', encoding._encode_json_stdlib)]
+    if encoding.orjson:
+        encoders.append(('orjson', encoding._encode_json_orjson))
+    if encoding.msgpack:
+        encoders.append(('msgpack', encoding._encode_msgpack))
+
+    normalized = normalize('song', songs)
+    print(f'{PAGE_SIZE}-song page: {len(normalized["artists"])} distinct artists, '
+          f'{len(normalized["albums"])} albums, {len(normalized["moods"])} moods')
+    print(f"{'encoder':<10} {'shape':<11} {'bytes':>9} {'gzip':>8} {'us/page':>10}")
+    for name, encode in encoders:
+        for shape, build in (('nested', lambda: songs), ('normalized', lambda: normalize('song', songs))):
+            body = encode(build())
+            elapsed = time_per_call(lambda: encode(build()))
+            print(f'{name:<10} {shape:<11} {len(body):>9} {len(gzip.compress(body)):>8} {elapsed:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
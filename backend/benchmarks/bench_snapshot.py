@@ -0,0 +1,135 @@
+"""Benchmark hydrating pages from the in-memory catalog snapshot against SQLite.
+
+Builds throwaway catalogs of increasing size with the app's own schema
+(counters maintained by its triggers), then times loading a random page of
+songs, albums and playlists through the batch loaders in fields.py, once
+reading SQLite and once reading the snapshot. Also reports snapshot build
+time, its own size estimate and the memory tracemalloc saw the build keep.
+
+Usage (from backend/):
+    python benchmarks/bench_snapshot.py
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+SIZES = [1000, 10000, 100000]
+PAGE_SIZE = 50
+ROUNDS = 200
+NOW = '2024-01-01T00:00:00.000000'
+
+
+def build_catalog(cursor, n_songs: int):
+    n_artists = max(10, n_songs // 20)
+    n_albums = max(10, n_songs // 10)
+    artists = [f'artist-{i}' for i in range(n_artists)]
+    albums = [f'album-{i}' for i in range(n_albums)]
+    moods = [f'mood-{i}' for i in range(8)]
+    cursor.executemany(
+        'INSERT INTO artists (id, name, bio, avatar, genres, verified, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(a, f'Artist {i}', 'bio ' * 10, f'http://cdn.example.com/a/{i}.jpg', '["pop","rock"]', i % 3 == 0, NOW, NOW)
+         for i, a in enumerate(artists)])
+    cursor.executemany(
+        'INSERT INTO moods (id, name, icon, color, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?)',
+        [(m, f'Mood {i}', 'smile', '#ffffff', NOW, NOW) for i, m in enumerate(moods)])
+    cursor.executemany(
+        'INSERT INTO albums (id, title, artistId, coverUrl, releaseDate, genre, createdAt, updatedAt) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(al, f'Album {i}', artists[i % n_artists], f'http://cdn.example.com/al/{i}.jpg', '2020-01-01', 'pop', NOW, NOW)
+         for i, al in enumerate(albums)])
+    cursor.executemany(
+        'INSERT INTO album_artists (id, albumId, artistId, isPrimary, createdAt) VALUES (?, ?, ?, ?, ?)',
+        [(f'aa-{i}', al, artists[i % n_artists], True, NOW) for i, al in enumerate(albums)])
+
+    songs = [f'song-{i}' for i in range(n_songs)]
+    rng = random.Random(1)
+    cursor.executemany(
+        'INSERT INTO songs (id, title, artistId, albumId, duration, audioUrl, coverUrl, lyrics, moodIds, playCount, '
+        'genre, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(s, f'Song {i}', artists[i % n_artists], albums[i % n_albums], 180 + i % 120, f'/uploads/{i}.mp3',
+          f'http://cdn.example.com/s/{i}.jpg', '[00:01.00]la la' if i % 2 else None,
+          f'["{moods[i % 8]}","{moods[(i + 3) % 8]}"]', rng.randrange(10000), 'pop', NOW, NOW)
+         for i, s in enumerate(songs)])
+    links = []
+    for i, s in enumerate(songs):
+        links.append((f'sa-{i}', s, artists[i % n_artists], True, NOW))
+        if i % 4 == 0:
+            links.append((f'sa-{i}-b', s, artists[(i + 7) % n_artists], False, NOW))
+    cursor.executemany('INSERT INTO song_artists (id, songId, artistId, isPrimary, createdAt) VALUES (?, ?, ?, ?, ?)',
+                       links)
+    cursor.executemany(
+        'INSERT INTO song_moods (songId, moodId) VALUES (?, ?)',
+        [(s, moods[m % 8]) for i, s in enumerate(songs) for m in (i, i + 3)])
+    cursor.executemany(
+        'INSERT INTO playlists (id, name, songIds, creator, isPublic, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(f'playlist-{i}', f'Playlist {i}', '[' + ','.join(f'"{s}"' for s in rng.sample(songs, 20)) + ']',
+          'admin', True, NOW, NOW) for i in range(max(10, n_songs // 100))])
+    return songs, albums
+
+
+def time_per_call(fn, rounds: int = ROUNDS) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    # Importing the app creates the schema and triggers in ./music.db
+    import main as app  # noqa: F401
+    import catalog
+    import fields
+    import snapshot
+    from fields import PROJECTIONS, load_songs, load_albums, load_playlists
+
+    print(f"{'songs':>8} {'build ms':>9} {'est MB':>8} {'traced MB':>10}  "
+          f"{'page':<16} {'sqlite us':>10} {'snapshot us':>12} {'speedup':>8}")
+    for n_songs in SIZES:
+        conn = sqlite3.connect('music.db')
+        cursor = conn.cursor()
+        for table in ('song_moods', 'song_artists', 'album_artists', 'playlists', 'songs', 'albums', 'moods', 'artists'):
+            cursor.execute(f'DELETE FROM {table}')
+        song_ids, album_ids = build_catalog(cursor, n_songs)
+        playlist_ids = [row[0] for row in cursor.execute('SELECT id FROM playlists')]
+        conn.commit()
+        catalog.bump_version()
+
+        tracemalloc.start()
+        snap = snapshot.build()
+        traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rebuild_ms = min(snapshot.build().build_seconds for _ in range(3)) * 1000
+
+        rng = random.Random(n_songs)
+        pages = [
+            ('songs card', load_songs, song_ids, PROJECTIONS['song']['card']),
+            ('songs detail', load_songs, song_ids, PROJECTIONS['song']['detail']),
+            ('albums detail', load_albums, album_ids, PROJECTIONS['album']['detail']),
+            ('playlists card', load_playlists, playlist_ids, PROJECTIONS['playlist']['card']),
+        ]
+        for i, (label, loader, ids, spec) in enumerate(pages):
+            page = rng.sample(ids, min(PAGE_SIZE, len(ids)))
+            fields.snapshot_source = None
+            sql_us = time_per_call(lambda: loader(cursor, page, spec))
+            expected = loader(cursor, page, spec)
+            fields.snapshot_source = lambda entity, spec_: snap if snap.covers(entity, spec_) else None
+            mem_us = time_per_call(lambda: loader(cursor, page, spec))
+            assert loader(cursor, page, spec) == expected, label
+            fields.snapshot_source = None
+            prefix = (f'{n_songs:>8} {rebuild_ms:>9.1f} {snap.bytes / 2**20:>8.1f} {traced / 2**20:>10.1f}'
+                      if i == 0 else ' ' * 39)
+            print(f'{prefix}  {label:<16} {sql_us:>10.1f} {mem_us:>12.1f} {sql_us / mem_us:>7.1f}x')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""Throughput of serve.py with 1, 2, 4, ... worker processes, and cache coherence across them.
+
+Generates a synthetic catalog (generate.py, through bench_endpoints.prepare)
+in a throwaway directory with the in-memory snapshot enabled. For each
+worker count it starts ``serve.py --workers N``, warms it up, then drives a
+mix of public reads for ``--duration`` seconds from ``--clients`` client
+processes holding ``--connections`` keep-alive connections each, and
+reports requests per second, p50/p99 latency and the speedup over one
+worker. The clients run on the same machine and take CPU too, so scaling
+flattens out before the core count; with a single core there is nothing
+to scale.
+
+After each run a coherence check renames a song through the admin API
+``COHERENCE_ROUNDS`` times and reads it back ``COHERENCE_READS`` times
+after each rename, from whichever workers answer. Sparse reads are served
+from the workers' in-memory snapshots, so a worker that missed the change
+answers with the old title; every such read is counted as stale. Then it
+plays the song ``COHERENCE_ROUNDS`` times and, after waiting
+``PLAY_SETTLE`` seconds for the snapshot jobs (before and after), reads its play count back
+from the workers; every read short of the plays is counted as stale too.
+
+Usage (from backend/):
+    python benchmarks/bench_workers.py                       # 1, 2, 4 ... up to the core count
+    python benchmarks/bench_workers.py --workers 1,2,4,8 --duration 20
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import quote
+
+import requests
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(BENCHMARKS, '..')
+PORT = 8798
+DEFAULT_SONGS = 5000
+DEFAULT_DURATION = 10.0
+WARMUP = 10.0
+DEFAULT_CONNECTIONS = 32
+COHERENCE_ROUNDS = 10
+COHERENCE_READS = 20
+# Seconds for every worker's snapshot job to pick up plays recorded by another worker
+PLAY_SETTLE = 2.0
+ADMIN_PASSWORD = 'bench'
+CONFIG = f'''admin:
+  username: "admin"
+  password: "{ADMIN_PASSWORD}"
+snapshot:
+  enabled: true
+'''
+
+
+def prepare(workdir: str, songs: int):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND, BENCHMARKS]))
+    # Catalog, play history and the lyrics index, built up front so no worker rebuilds them while measured
+    subprocess.run([sys.executable, '-c', f'import bench_endpoints; bench_endpoints.prepare({songs}, 1)'],
+                   cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+        f.write(CONFIG)
+    return env
+
+
+def read_paths(workdir: str) -> List[str]:
+    conn = sqlite3.connect(os.path.join(workdir, 'music.db'))
+    songs = [row[0] for row in conn.execute('SELECT id FROM songs')]
+    albums = [row[0] for row in conn.execute('SELECT id FROM albums')]
+    artists = [row[0] for row in conn.execute('SELECT id FROM artists')]
+    conn.close()
+    rng = random.Random(1)
+    paths = []
+    for _ in range(2000):
+        paths += [
+            f'/api/songs/{rng.choice(songs)}',
+            f'/api/songs?page={rng.randint(1, 20)}&limit=20',
+            f'/api/albums/{rng.choice(albums)}/songs',
+            f'/api/artists/{rng.choice(artists)}',
+            f'/api/moments?limit=20&page={rng.randint(1, 5)}',
+            f'/api/search?q={quote(rng.choice(["love", "night", "雨", "夏天", "city"]))}',
+        ]
+    return paths
+
+
+async def read_response(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status
+
+
+async def connection(paths: List[str], rng: random.Random, deadline: float, latencies: List[float],
+                     errors: List[int]):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    try:
+        while time.monotonic() < deadline:
+            path = rng.choice(paths)
+            started = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors[0] += 1
+    finally:
+        writer.close()
+
+
+def drive(paths: List[str], seed: int, duration: float, connections: int) -> Tuple[List[float], int]:
+    """One client process: keep-alive connections sending requests back to back"""
+    latencies: List[float] = []
+    errors = [0]
+
+    async def run():
+        rng = random.Random(seed)
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*(connection(paths, random.Random(rng.random()), deadline, latencies, errors)
+                               for _ in range(connections)))
+
+    asyncio.run(run())
+    return latencies, errors[0]
+
+
+def load(pool, paths: List[str], clients: int, duration: float, connections: int) -> Dict:
+    started = time.perf_counter()
+    results = pool.starmap(drive, [(paths, seed, duration, connections) for seed in range(clients)])
+    elapsed = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for process, _ in results for seconds in process)
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50Ms': quantiles[49],
+        'p99Ms': quantiles[98],
+        'errors': sum(errors for _, errors in results),
+    }
+
+
+def coherence(session: requests.Session, song_id: str) -> int:
+    base = f'http://127.0.0.1:{PORT}'
+    token = session.post(f'{base}/api/auth/login',
+                         json={'username': 'admin', 'password': ADMIN_PASSWORD}).json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    song = session.get(f'{base}/api/admin/songs/{song_id}', headers=headers).json()['data']
+    stale = 0
+    for round_number in range(COHERENCE_ROUNDS):
+        song['title'] = f'Coherence check {round_number} {time.time()}'
+        response = session.put(f'{base}/api/admin/songs/{song_id}', json=song, headers=headers)
+        response.raise_for_status()
+        for _ in range(COHERENCE_READS):
+            if session.get(f'{base}/api/songs/{song_id}?fields=id,title').json()['title'] != song['title']:
+                stale += 1
+
+    # Snapshots rebuilt after the renames first, so the plays are not picked up by the rebuild
+    time.sleep(PLAY_SETTLE)
+    plays = session.get(f'{base}/api/admin/songs/{song_id}', headers=headers).json()['data']['playCount']
+    # New connections, not the session's: a kept-alive one stays with the worker that counted the plays
+    for _ in range(COHERENCE_ROUNDS):
+        requests.post(f'{base}/api/songs/{song_id}/play').raise_for_status()
+    time.sleep(PLAY_SETTLE)
+    for _ in range(COHERENCE_READS):
+        if requests.get(f'{base}/api/songs/{song_id}?fields=id,playCount').json()['playCount'] != \
+                plays + COHERENCE_ROUNDS:
+            stale += 1
+    return stale
+
+
+def measure(workdir: str, env: Dict, workers: int, pool, paths: List[str], args) -> Dict:
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND, 'serve.py'), '--workers', str(workers), '--port', str(PORT)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    session = requests.Session()
+    try:
+        for _ in range(300):
+            try:
+                session.get(f'http://127.0.0.1:{PORT}/api/moods')
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        # Every worker builds its snapshot and warms its caches
+        load(pool, paths, args.clients, WARMUP, args.connections)
+        result = load(pool, paths, args.clients, args.duration, args.connections)
+        song_id = paths[0].rsplit('/', 1)[1]
+        result['stale'] = coherence(session, song_id)
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = [1]
+    while default_workers[-1] * 2 <= cores:
+        default_workers.append(default_workers[-1] * 2)
+    parser = argparse.ArgumentParser(description='Throughput of serve.py by worker count')
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)),
+                        help='comma-separated worker counts')
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONGS)
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='seconds measured per run')
+    parser.add_argument('--clients', type=int, default=max(1, cores // 2), help='client processes')
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS, help='connections per client')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    started = time.perf_counter()
+    env = prepare(workdir, args.songs)
+    paths = read_paths(workdir)
+    print(f'{args.songs} songs ready in {time.perf_counter() - started:.1f}s; {cores} cores, '
+          f'{args.clients} client processes x {args.connections} connections')
+
+    print(f"\n{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'stale':>9}")
+    single = None
+    with multiprocessing.Pool(args.clients) as pool:
+        for workers in (int(value) for value in args.workers.split(',')):
+            result = measure(workdir, env, workers, pool, paths, args)
+            single = single or result['rps']
+            print(f"{workers:>7} {result['rps']:>9.0f} {result['rps'] / single:>7.2f}x {result['p50Ms']:>8.2f} "
+                  f"{result['p99Ms']:>8.2f} {result['errors']:>7} "
+                  f"{result['stale']:>4}/{COHERENCE_ROUNDS * COHERENCE_READS + COHERENCE_READS}")
+    print('\nstale: reads of a renamed song that still returned the old title, or of a played song '
+          'that still returned the old play count')
+
+
+if __name__ == '__main__':
+    main()
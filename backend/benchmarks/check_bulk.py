@@ -0,0 +1,106 @@
+"""Checks of the bulk admin endpoints (bulk.py) on a small synthetic catalog.
+
+Patching only ``artistId`` of a song or album must make the new artist the
+primary one in its artist links, keep the other linked artists, and move
+the denormalized counts with it, as the single-item update endpoints do.
+Renames that swap names within a batch, or take a name another operation
+of the batch gives up, must succeed, also with ``atomic: false``.
+
+Usage (from backend/):
+    python benchmarks/check_bulk.py
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, '..'))
+
+import bench_endpoints  # noqa: E402
+
+SONGS = 200
+
+
+def links(conn: sqlite3.Connection, table: str, owner_column: str, owner_id: str):
+    return conn.execute(f'SELECT artistId, isPrimary FROM {table} WHERE {owner_column} = ? '
+                        f'ORDER BY isPrimary DESC, createdAt ASC', (owner_id,)).fetchall()
+
+
+async def check_patch_artist(app, admin, conn: sqlite3.Connection, entity: str, table: str, owner_column: str,
+                             count_column: str, record: dict):
+    artist_a, artist_b, artist_c = [row[0] for row in conn.execute('SELECT id FROM artists LIMIT 3')]
+    path = f'/api/admin/{entity}/bulk'
+
+    async def bulk(operations):
+        status, body = await bench_endpoints.request(app, 'POST', path, body={'operations': operations},
+                                                     headers=admin)
+        assert status == 200, body
+        return json.loads(body)
+
+    def count(artist_id):
+        return conn.execute(f'SELECT {count_column} FROM artists WHERE id = ?', (artist_id,)).fetchone()[0]
+
+    created = await bulk([{'op': 'create', 'data': {**record, 'artistId': artist_a,
+                                                    'artistIds': [artist_a, artist_c]}}])
+    owner_id = created['results'][0]['id']
+    before_a, before_b = count(artist_a), count(artist_b)
+
+    await bulk([{'op': 'patch', 'id': owner_id, 'data': {'artistId': artist_b}}])
+    assert links(conn, table, owner_column, owner_id) == [(artist_b, 1), (artist_c, 0)], \
+        f'{entity}: patched artistId is not the primary artist link'
+    assert (count(artist_a), count(artist_b)) == (before_a - 1, before_b + 1), \
+        f'{entity}: {count_column} did not move to the new artist'
+
+    # An explicit artistIds still wins
+    await bulk([{'op': 'patch', 'id': owner_id, 'data': {'artistId': artist_a, 'artistIds': [artist_a]}}])
+    assert links(conn, table, owner_column, owner_id) == [(artist_a, 1)], f'{entity}: artistIds was not kept'
+    print(f'{entity}: patching artistId ok')
+
+
+async def check_renames(app, admin, conn: sqlite3.Connection):
+    a, b, c, d = [row for row in conn.execute('SELECT id, name FROM artists ORDER BY rowid LIMIT 4')]
+    for atomic in (True, False):
+        # Swap a and b; c takes d's name while d takes a new one
+        operations = [
+            {'op': 'patch', 'id': a[0], 'data': {'name': b[1]}},
+            {'op': 'patch', 'id': b[0], 'data': {'name': a[1]}},
+            {'op': 'patch', 'id': c[0], 'data': {'name': d[1]}},
+            {'op': 'patch', 'id': d[0], 'data': {'name': f'{d[1]} (renamed)'}},
+        ]
+        status, body = await bench_endpoints.request(app, 'POST', '/api/admin/artists/bulk', headers=admin,
+                                                     body={'operations': operations, 'atomic': atomic})
+        assert status == 200, body
+        names = dict(conn.execute('SELECT id, name FROM artists WHERE id IN (?, ?, ?, ?)',
+                                  (a[0], b[0], c[0], d[0])))
+        assert names == {a[0]: b[1], b[0]: a[1], c[0]: d[1], d[0]: f'{d[1]} (renamed)'}, names
+        # The next round renames from the current names
+        a, b, c, d = (a[0], names[a[0]]), (b[0], names[b[0]]), (c[0], names[c[0]]), (d[0], names[d[0]])
+    print('artists: swapped and chained renames ok')
+
+
+async def run():
+    os.chdir(tempfile.mkdtemp())
+    bench_endpoints.prepare(SONGS, 1)
+    import main
+
+    app = main.app
+    status, body = await bench_endpoints.request(app, 'POST', '/api/auth/login', body={
+        'username': 'admin', 'password': bench_endpoints.ADMIN_PASSWORD})
+    assert status == 200, body
+    admin = [(b'authorization', f'Bearer {json.loads(body)["access_token"]}'.encode())]
+
+    conn = sqlite3.connect('music.db', isolation_level=None)
+    album_id = conn.execute('SELECT id FROM albums LIMIT 1').fetchone()[0]
+    await check_patch_artist(app, admin, conn, 'songs', 'song_artists', 'songId', 'songCount',
+                             {'title': 'bulk check', 'albumId': album_id, 'duration': 200})
+    await check_patch_artist(app, admin, conn, 'albums', 'album_artists', 'albumId', 'albumCount',
+                             {'title': 'bulk check', 'releaseDate': '2023-05-01'})
+    await check_renames(app, admin, conn)
+    conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+"""Checks of seeded paging in the recommendation sampler (sampler.py).
+
+Pages of a seeded pick must never repeat a song and together cover the
+whole pool, for the full catalog and for a filtered pool, and the same
+seed must give the same pages again.
+
+Usage (from backend/):
+    python benchmarks/check_sampler.py
+"""
+import os
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, '..'))
+
+from bench_sampler import build_catalog  # noqa: E402
+from sampler import SongSampler  # noqa: E402
+
+SONGS = 1000
+PAGE = 20
+SEEDS = (0, 7, 12345)
+
+
+def check_pages(sampler: SongSampler, seed: int, **filters):
+    pool = set(sampler.pool(**filters))
+    seen = []
+    offset = 0
+    while True:
+        page = sampler.sample(PAGE, seed=seed, offset=offset, **filters)
+        if not page:
+            break
+        seen += page
+        offset += PAGE
+    assert len(seen) == len(set(seen)), f'seed {seed} {filters}: pages overlap'
+    assert set(seen) == pool, f'seed {seed} {filters}: pages do not cover the pool'
+    assert sampler.sample(PAGE, seed=seed, offset=PAGE, **filters) == seen[PAGE:2 * PAGE], \
+        f'seed {seed} {filters}: page 2 changed between calls'
+    print(f'seed {seed} {filters or "all songs"}: {offset // PAGE} pages, {len(seen)} songs, no overlap')
+
+
+def run():
+    path = os.path.join(tempfile.mkdtemp(), 'music.db')
+    build_catalog(path, SONGS)
+    sampler = SongSampler(path)
+    for seed in SEEDS:
+        check_pages(sampler, seed)
+        check_pages(sampler, seed, mood_id='mood-1')
+
+
+if __name__ == '__main__':
+    run()
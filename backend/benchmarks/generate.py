@@ -0,0 +1,307 @@
+"""Synthetic catalog generator: a reproducible, realistically shaped music.db.
+
+Fills the app's tables (the schema comes from importing main) with artists,
+albums, songs, moods, playlists, music moments and their comments, all
+derived from one seed, so the same arguments always give the same database
+and benchmark runs compare like with like. The shape follows a real
+personal library rather than uniform test rows:
+
+- artist popularity is Zipf-like: a few artists own many songs and albums,
+  most have a handful; play counts and moment likes are heavy-tailed;
+- about a quarter of the songs have two or three artists (features);
+- titles, names and lyrics are mostly Chinese, with Japanese, Korean and
+  English ones mixed in, and some "(Live)" / "(feat. ...)" variants;
+- about two thirds of the songs have LRC lyrics (with credit lines), parsed
+  into song_lyrics as the app does on write;
+- playlist lengths are log-normal (median ~30 songs, a long tail past a
+  thousand); moments have a few comments each, some have hundreds.
+
+Counters (songCount, duration, ...) are filled by the app's triggers.
+
+Usage (from backend/, writes ./music.db like the app):
+    python benchmarks/generate.py                      # 10000 songs
+    python benchmarks/generate.py --songs 100000 --seed 7 --replace
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+
+from lyrics import parse_lrc, serialize_parsed_lyrics
+
+DEFAULT_SONGS = 10000
+DEFAULT_SEED = 1
+# Catalog sizes relative to the number of songs
+SONGS_PER_ARTIST = 12
+SONGS_PER_ALBUM = 10
+SONGS_PER_PLAYLIST = 100
+SONGS_PER_MOMENT = 20
+# Everything is dated within the three years before this
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 3 * 365 * 24 * 3600
+CDN = 'https://cdn.example.com'
+
+# Tables the generator fills, children first (the order to clear them in)
+TABLES = ('moment_comments', 'music_moments', 'song_lyrics', 'song_moods', 'song_artists', 'album_artists',
+          'playlists', 'songs', 'albums', 'moods', 'artists')
+
+CJK_WORDS = ['夏天', '晴天', '雨', '夜空', '星星', '海', '风', '告白', '回忆', '青春', '时光', '远方', '城市',
+             '月亮', '秘密', '梦', '花', '雪', '故事', '温柔', '孤单', '未来', '约定', '旅行', '光', '你',
+             '我们', '再见', '爱', '心', '微笑', '眼泪', '路口', '黄昏', '春天', '屋顶', '列车', '信']
+JA_WORDS = ['さくら', '夜', '空', '君', '僕', '夢', 'ひかり', '恋', '花火', '雨', '約束', 'ありがとう']
+KO_WORDS = ['사랑', '밤', '너', '우리', '봄날', '하늘', '별', '기억', '바다', '눈물']
+EN_WORDS = ['love', 'night', 'summer', 'dream', 'light', 'home', 'rain', 'fire', 'heart', 'sky', 'blue',
+            'golden', 'forever', 'stay', 'city', 'ocean', 'wild', 'young', 'lost', 'echo', 'midnight']
+SURNAMES = ['周', '林', '陈', '王', '李', '张', '刘', '杨', '黄', '吴', '孙', '蔡', '邓', '许', '薛']
+EN_NAMES = ['Taylor', 'Ed', 'Billie', 'Bruno', 'Adele', 'Lana', 'Harry', 'Dua', 'Sam', 'Olivia', 'Jay']
+GENRES = ['流行', '摇滚', '民谣', 'R&B', '电子', '说唱', '爵士', '古典', 'J-Pop', 'K-Pop', '独立']
+GENRE_WEIGHTS = [40, 12, 12, 8, 6, 6, 3, 2, 5, 4, 2]
+MOODS = [('开心', 'smile', '#FFD166'), ('伤感', 'cloud-rain', '#118AB2'), ('放松', 'coffee', '#06D6A0'),
+         ('治愈', 'heart', '#EF476F'), ('怀旧', 'clock', '#8D6E63'), ('浪漫', 'sparkles', '#FF8FAB'),
+         ('专注', 'target', '#3A86FF'), ('运动', 'activity', '#FB5607'), ('深夜', 'moon', '#22223B'),
+         ('孤独', 'user', '#6C757D'), ('兴奋', 'zap', '#FFBE0B'), ('旅行', 'map', '#2A9D8F')]
+MOMENT_TAGS = ['夏天', '雨天', '通勤', '深夜', '旅行', '青春', '校园', '回忆', '失恋', '毕业', '跑步', '加班']
+# Lyrics draw Zipf-distributed words from a larger vocabulary per language, built from these units,
+# so lyric similarity sees the long tail real lyrics have
+LYRIC_UNITS = {
+    'zh': '的一是不了人我在有他这中大来上个们到说时地也子就你要会可以过去天下爱心里想还好看都没走知道'
+          '梦风雨花月夜星光海云城路歌声泪笑等待回忆远方青春时间温柔孤单世界故事秘密未来永远相遇离别',
+    'ja': 'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん',
+    'ko': '가나다라마바사아자차카타파하너우리사랑별밤하늘기억바다눈물봄날꿈',
+    'en': ['ba', 'lo', 've', 'ni', 'ght', 'sum', 'mer', 'dre', 'am', 'li', 'ho', 'me', 'ra', 'in', 'fi',
+           're', 'hea', 'rt', 'sky', 'blu', 'go', 'ld', 'en', 'for', 'ev', 'er', 'sta', 'y', 'ci', 'ty'],
+}
+LYRIC_VOCABULARY = 4000
+PERIODS = ['小学', '初中', '高中', '大学', '工作后']
+LOCATIONS = ['北京', '上海', '广州', '深圳', '杭州', '成都', '东京', '首尔', '地铁上', '家里', None]
+
+
+def new_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def timestamp(rng: random.Random) -> str:
+    return (EPOCH - timedelta(seconds=rng.randrange(SPAN_SECONDS))).isoformat()
+
+
+def phrase(rng: random.Random, language: str, words: int) -> str:
+    if language == 'zh':
+        return ''.join(rng.choice(CJK_WORDS) for _ in range(words))
+    if language == 'ja':
+        return ''.join(rng.choice(JA_WORDS) for _ in range(words))
+    if language == 'ko':
+        return ' '.join(rng.choice(KO_WORDS) for _ in range(words))
+    return ' '.join(rng.choice(EN_WORDS) for _ in range(words + 1)).title()
+
+
+def language(rng: random.Random) -> str:
+    return rng.choices(('zh', 'ja', 'ko', 'en'), (55, 10, 5, 30))[0]
+
+
+def artist_name(rng: random.Random, i: int) -> str:
+    lang = language(rng)
+    if lang == 'zh':
+        name = rng.choice(SURNAMES) + ''.join(rng.choice(CJK_WORDS)[0] for _ in range(rng.randint(1, 2)))
+    elif lang == 'en':
+        name = f'{rng.choice(EN_NAMES)} {phrase(rng, "en", 0)}'
+    else:
+        name = phrase(rng, lang, 2)
+    # artists.name is UNIQUE
+    return f'{name} {i}'
+
+
+def zipf_weights(n: int, s: float = 1.07) -> List[float]:
+    """Cumulative weights of ranks 1..n for rng.choices"""
+    total, cumulative = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** s
+        cumulative.append(total)
+    return cumulative
+
+
+def heavy_tail(rng: random.Random, scale: float, cap: int) -> int:
+    return min(int(rng.paretovariate(1.2) * scale - scale), cap)
+
+
+def lyric_vocabularies(rng: random.Random) -> Dict[str, Tuple[List[str], List[float]]]:
+    """Language -> (words, cumulative Zipf weights)"""
+    vocabularies = {}
+    for lang, units in LYRIC_UNITS.items():
+        words = sorted({''.join(rng.choice(units) for _ in range(rng.randint(1, 3))) for _ in range(LYRIC_VOCABULARY)})
+        rng.shuffle(words)
+        vocabularies[lang] = (words, zipf_weights(len(words), 1.0))
+    return vocabularies
+
+
+def lrc(rng: random.Random, vocabulary: Tuple[List[str], List[float]], lang: str, lines: int) -> str:
+    words, weights = vocabulary
+    separator = '' if lang in ('zh', 'ja') else ' '
+    header = [f'[00:00.00]作词 : {rng.choice(SURNAMES)}{rng.choice(CJK_WORDS)}',
+              f'[00:01.00]作曲 : {rng.choice(SURNAMES)}{rng.choice(CJK_WORDS)}']
+    at = 15.0
+    body = []
+    for _ in range(lines):
+        at += rng.uniform(2.5, 6.0)
+        minutes, seconds = divmod(at, 60)
+        line = separator.join(rng.choices(words, cum_weights=weights, k=rng.randint(3, 8)))
+        body.append(f'[{int(minutes):02d}:{seconds:05.2f}]{line}')
+    return '\n'.join(header + body)
+
+
+def clear(cursor):
+    for table in TABLES:
+        cursor.execute(f'DELETE FROM {table}')
+
+
+def generate(cursor, n_songs: int = DEFAULT_SONGS, seed: int = DEFAULT_SEED) -> Dict[str, List[str]]:
+    """Insert a catalog of n_songs songs; returns the ids of what was inserted, by table"""
+    rng = random.Random(seed)
+    n_artists = max(10, n_songs // SONGS_PER_ARTIST)
+    n_albums = max(10, n_songs // SONGS_PER_ALBUM)
+    popularity = zipf_weights(n_artists)
+    vocabularies = lyric_vocabularies(rng)
+
+    artists = [new_id(rng) for _ in range(n_artists)]
+    names = {artist_id: artist_name(rng, i) for i, artist_id in enumerate(artists)}
+    rows = []
+    for i, artist_id in enumerate(artists):
+        created = timestamp(rng)
+        genres = rng.sample(GENRES, rng.randint(1, 3))
+        rows.append((artist_id, names[artist_id], phrase(rng, 'zh', rng.randint(5, 30)),
+                     f'{CDN}/artists/{i}.jpg', f'{CDN}/artists/{i}-cover.jpg', heavy_tail(rng, 2000, 10 ** 7),
+                     json.dumps(genres, ensure_ascii=False), i < n_artists // 20, created, created))
+    cursor.executemany('INSERT INTO artists (id, name, bio, avatar, coverUrl, followers, genres, verified, '
+                       'createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    moods = [new_id(rng) for _ in MOODS]
+    rows = [(mood_id, name, f'{name}时听的歌', icon, color, f'{CDN}/moods/{i}.jpg', EPOCH.isoformat(), EPOCH.isoformat())
+            for i, (mood_id, (name, icon, color)) in enumerate(zip(moods, MOODS))]
+    cursor.executemany('INSERT INTO moods (id, name, description, icon, color, coverUrl, createdAt, updatedAt) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    # Albums belong to artists by popularity too; an album's songs are its artist's
+    albums = [new_id(rng) for _ in range(n_albums)]
+    albums_of: Dict[str, List[str]] = {}
+    rows, links = [], []
+    for i, album_id in enumerate(albums):
+        artist_id = rng.choices(artists, cum_weights=popularity)[0]
+        albums_of.setdefault(artist_id, []).append(album_id)
+        created = timestamp(rng)
+        rows.append((album_id, phrase(rng, language(rng), rng.randint(1, 3)), artist_id, f'{CDN}/albums/{i}.jpg',
+                     created[:10], rng.choices(GENRES, GENRE_WEIGHTS)[0], phrase(rng, 'zh', rng.randint(0, 20)),
+                     created, created))
+        links.append((new_id(rng), album_id, artist_id, True, created))
+        if rng.random() < 0.1:
+            guest = rng.choice(artists)
+            if guest != artist_id:
+                links.append((new_id(rng), album_id, guest, False, created))
+    cursor.executemany('INSERT INTO albums (id, title, artistId, coverUrl, releaseDate, genre, description, '
+                       'createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    cursor.executemany('INSERT INTO album_artists (id, albumId, artistId, isPrimary, createdAt) '
+                       'VALUES (?, ?, ?, ?, ?)', links)
+
+    songs = [new_id(rng) for _ in range(n_songs)]
+    rows, links, song_moods, parsed = [], [], [], []
+    for i, song_id in enumerate(songs):
+        artist_id = rng.choices(artists, cum_weights=popularity)[0]
+        own_albums = albums_of.get(artist_id)
+        album_id = rng.choice(own_albums) if own_albums and rng.random() < 0.85 else None
+        lang = language(rng)
+        title = phrase(rng, lang, rng.randint(1, 3))
+        featured = []
+        roll = rng.random()
+        if roll < 0.28:
+            featured = [a for a in rng.sample(artists, 2 if roll < 0.06 else 1) if a != artist_id]
+        variant = rng.random()
+        if variant < 0.05:
+            title += ' (Live)'
+        elif variant < 0.08 and featured:
+            title += f' (feat. {names[featured[0]]})'
+        mood_ids = rng.sample(moods, rng.choices((0, 1, 2, 3), (10, 35, 40, 15))[0])
+        lyrics_text = lrc(rng, vocabularies[lang], lang, rng.randint(20, 80)) if rng.random() < 0.65 else None
+        created = timestamp(rng)
+        rows.append((song_id, title, artist_id, album_id, max(60, min(900, int(rng.gauss(235, 60)))),
+                     f'/uploads/{song_id}.mp3', f'{CDN}/songs/{i}.jpg', lyrics_text,
+                     json.dumps(mood_ids), heavy_tail(rng, 100, 10 ** 6), rng.random() < 0.1,
+                     rng.choices(GENRES, GENRE_WEIGHTS)[0], created, created))
+        links.append((new_id(rng), song_id, artist_id, True, created))
+        links.extend((new_id(rng), song_id, other, False, created) for other in featured)
+        song_moods.extend((song_id, mood_id) for mood_id in mood_ids)
+        if lyrics_text:
+            parsed.append((song_id, serialize_parsed_lyrics(parse_lrc(lyrics_text)), created))
+    cursor.executemany('INSERT INTO songs (id, title, artistId, albumId, duration, audioUrl, coverUrl, lyrics, '
+                       'moodIds, playCount, liked, genre, createdAt, updatedAt) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    cursor.executemany('INSERT INTO song_artists (id, songId, artistId, isPrimary, createdAt) '
+                       'VALUES (?, ?, ?, ?, ?)', links)
+    cursor.executemany('INSERT INTO song_moods (songId, moodId) VALUES (?, ?)', song_moods)
+    cursor.executemany('INSERT INTO song_lyrics (songId, parsed, updatedAt) VALUES (?, ?, ?)', parsed)
+
+    playlists = [new_id(rng) for _ in range(max(5, n_songs // SONGS_PER_PLAYLIST))]
+    rows = []
+    for i, playlist_id in enumerate(playlists):
+        length = max(1, min(n_songs, int(rng.lognormvariate(math.log(30), 1.0))))
+        created = timestamp(rng)
+        rows.append((playlist_id, phrase(rng, language(rng), rng.randint(1, 3)), phrase(rng, 'zh', rng.randint(0, 15)),
+                     f'{CDN}/playlists/{i}.jpg', json.dumps(rng.sample(songs, length)), heavy_tail(rng, 50, 10 ** 6),
+                     rng.random() < 0.9, created, created))
+    cursor.executemany('INSERT INTO playlists (id, name, description, coverUrl, songIds, playCount, isPublic, '
+                       'createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    # One moment per song at most, as the app keeps them
+    moments = [new_id(rng) for _ in range(max(5, n_songs // SONGS_PER_MOMENT))]
+    rows, comment_rows = [], []
+    for moment_id, song_id in zip(moments, rng.sample(songs, len(moments))):
+        created = timestamp(rng)
+        year = rng.randint(2000, 2023) if rng.random() < 0.7 else None
+        rows.append((moment_id, song_id, '，'.join(phrase(rng, 'zh', rng.randint(3, 8)) for _ in range(rng.randint(1, 4))),
+                     json.dumps(rng.sample(MOMENT_TAGS, rng.randint(1, 4)), ensure_ascii=False), rng.randint(-5, 5),
+                     year, rng.choice(PERIODS) if year else None, heavy_tail(rng, 5, 10 ** 5), created, created))
+        for _ in range(min(heavy_tail(rng, 2, 500), 500)):
+            comment_rows.append((new_id(rng), moment_id, phrase(rng, 'zh', rng.randint(2, 12)),
+                                 timestamp(rng)[:10], rng.choice(LOCATIONS), timestamp(rng)))
+    cursor.executemany('INSERT INTO music_moments (id, songId, content, tags, energyLevel, firstHeardYear, '
+                       'firstHeardPeriod, likeCount, createdAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    cursor.executemany('INSERT INTO moment_comments (id, momentId, content, listenDate, location, createdAt) '
+                       'VALUES (?, ?, ?, ?, ?, ?)', comment_rows)
+
+    return {
+        'artists': artists, 'albums': albums, 'songs': songs, 'moods': moods, 'playlists': playlists,
+        'moments': moments, 'comments': [row[0] for row in comment_rows],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill ./music.db with a synthetic catalog')
+    parser.add_argument('--songs', type=int, default=DEFAULT_SONGS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--replace', action='store_true', help='delete the existing catalog first')
+    args = parser.parse_args()
+
+    import main as app  # noqa: F401  (creates the schema in ./music.db)
+    import catalog
+
+    conn = sqlite3.connect('music.db')
+    cursor = conn.cursor()
+    if cursor.execute('SELECT COUNT(*) FROM songs').fetchone()[0]:
+        if not args.replace:
+            sys.exit('music.db already has songs; pass --replace to delete the catalog and generate a new one')
+        clear(cursor)
+    ids = generate(cursor, args.songs, args.seed)
+    conn.commit()
+    conn.close()
+    catalog.bump_version()
+    print(', '.join(f'{len(values)} {table}' for table, values in ids.items()))
+
+
+if __name__ == '__main__':
+    main()
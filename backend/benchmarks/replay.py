@@ -0,0 +1,281 @@
+"""Replay captured traffic (capture.py) against the app and report per route.
+
+Requests are sent open-loop at the times they were recorded, sped up by
+``--speed`` (2 = twice the recorded rate), whether or not earlier ones have
+answered, so a server that falls behind shows it as latency and errors
+rather than as a lower send rate. Latency is measured from the time a request
+was due, not from when it could be sent, so waiting for a free connection
+(``--max-in-flight``) counts too.
+
+Two targets:
+
+- in-process (default): the app imported from backend/ and called through
+  ``httpx.ASGITransport`` on this event loop, against the music.db and
+  config.yaml in ``--workdir``. No server, no network: handy for profiling a
+  real request mix. Background jobs do not run.
+- ``--target http://127.0.0.1:8000``: a running uvicorn (or several workers
+  behind one port), with client and server in separate processes.
+
+Replay repeats the captured writes (plays, likes), so point it at a copy of
+the database. Requests the log cannot reproduce are skipped and counted: bodies
+that were not captured (logins, admin edits), the moment event stream and
+WebSocket. Admin requests log in first with ``--admin-user`` and
+``--admin-password`` (by default those in the workdir's config.yaml).
+
+Per route it reports requests, throughput, p50/p95/p99 latency, errors
+(5xx and failed connections or timeouts), other statuses than recorded
+(e.g. 404s against another catalog), and the same in total.
+
+Needs httpx (``pip install httpx``).
+
+Usage (from backend/):
+    python benchmarks/replay.py traffic.jsonl --workdir /tmp/copy
+    python benchmarks/replay.py traffic.jsonl --speed 4 --target http://127.0.0.1:8000 --output /tmp/replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+import httpx
+import yaml
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_MAX_IN_FLIGHT = 256
+DEFAULT_TIMEOUT = 30.0
+SKIPPED_ROUTES = {
+    '/api/moments/events': 'long-lived event stream',
+    '/api/moments/ws': 'WebSocket',
+}
+TOTAL = 'total'
+
+
+def load(path: str, limit: Optional[int], duration: Optional[float]) -> List[Dict]:
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda record: record['ts'])
+    if records and duration is not None:
+        end = records[0]['ts'] + duration
+        records = [record for record in records if record['ts'] < end]
+    if limit is not None:
+        records = records[:limit]
+    return records
+
+
+def skip_reason(record: Dict) -> Optional[str]:
+    if record['route'] in SKIPPED_ROUTES:
+        return SKIPPED_ROUTES[record['route']]
+    if 'body' in record and record['body'] is None:
+        return 'request body not captured'
+    return None
+
+
+class RouteStats:
+    __slots__ = ('latencies', 'statuses', 'errors', 'mismatched')
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+        self.mismatched = 0
+
+    def add(self, seconds: float, status: Optional[int], expected: int):
+        self.latencies.append(seconds)
+        key = str(status) if status is not None else 'failed'
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        if status is None or status >= 500:
+            self.errors += 1
+        if status != expected:
+            self.mismatched += 1
+
+    def merge(self, other: 'RouteStats'):
+        self.latencies.extend(other.latencies)
+        for key, count in other.statuses.items():
+            self.statuses[key] = self.statuses.get(key, 0) + count
+        self.errors += other.errors
+        self.mismatched += other.mismatched
+
+    def summary(self, elapsed: float) -> Dict:
+        count = len(self.latencies)
+        ms = sorted(seconds * 1000 for seconds in self.latencies)
+        if count > 1:
+            quantiles = statistics.quantiles(ms, n=100, method='inclusive')
+            p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+        else:
+            p50 = p95 = p99 = ms[0] if ms else 0.0
+        return {
+            'requests': count,
+            'rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'p50Ms': round(p50, 2),
+            'p95Ms': round(p95, 2),
+            'p99Ms': round(p99, 2),
+            'errors': self.errors,
+            'errorRate': round(self.errors / count, 4) if count else 0.0,
+            'mismatched': self.mismatched,
+            'statuses': dict(sorted(self.statuses.items())),
+        }
+
+
+def admin_credentials(args) -> Dict:
+    user, password = args.admin_user, args.admin_password
+    if user is None or password is None:
+        try:
+            with open(os.path.join(args.workdir, 'config.yaml')) as f:
+                admin = (yaml.safe_load(f) or {}).get('admin', {})
+        except FileNotFoundError:
+            admin = {}
+        user = user or admin.get('username', 'admin')
+        password = password or admin.get('password')
+    return {'username': user, 'password': password}
+
+
+async def login(client: httpx.AsyncClient, credentials: Dict) -> Optional[str]:
+    if not credentials['password']:
+        return None
+    response = await client.post('/api/auth/login', json=credentials)
+    if response.status_code != 200:
+        print(f"admin login failed ({response.status_code}); admin requests are skipped")
+        return None
+    return response.json()['access_token']
+
+
+def make_client(args) -> httpx.AsyncClient:
+    timeout = httpx.Timeout(args.timeout)
+    if args.target:
+        limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+        return httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits)
+    # The app reads music.db and config.yaml from the working directory, as under uvicorn
+    os.chdir(args.workdir)
+    sys.path.insert(0, BACKEND)
+    import main
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://replay', timeout=timeout)
+
+
+async def replay(args, records: List[Dict]) -> Dict:
+    client = make_client(args)
+    routes: Dict[str, RouteStats] = {}
+    skipped: Dict[str, int] = {}
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    loop = asyncio.get_running_loop()
+    max_late = 0.0
+
+    async def send(record: Dict, due: float, token: Optional[str]):
+        headers = dict(record.get('headers', {}))
+        if record.get('session'):
+            headers['X-Session-Id'] = record['session']
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        url = record['path'] + ('?' + record['query'] if record['query'] else '')
+        status = None
+        async with in_flight:
+            try:
+                response = await client.request(record['method'], url, headers=headers, json=record.get('body'))
+                status = response.status_code
+            except httpx.HTTPError:
+                pass
+        key = f"{record['method']} {record['route']}"
+        stats = routes.get(key)
+        if stats is None:
+            stats = routes[key] = RouteStats()
+        stats.add(loop.time() - due, status, record['status'])
+
+    async with client:
+        token = None
+        if any(record.get('admin') for record in records):
+            token = await login(client, admin_credentials(args))
+        tasks = []
+        first = records[0]['ts']
+        started = loop.time()
+        for number, record in enumerate(records):
+            reason = skip_reason(record)
+            if reason is None and record.get('admin') and token is None:
+                reason = 'admin request without a login'
+            if reason is not None:
+                skipped[reason] = skipped.get(reason, 0) + 1
+                continue
+            due = started + (record['ts'] - first) / args.speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_late = max(max_late, -delay)
+            tasks.append(asyncio.ensure_future(send(record, due, token)))
+            if number % 500 == 0:
+                print(f'\r{number}/{len(records)} sent', end='', file=sys.stderr, flush=True)
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+    print('\r' + ' ' * 40 + '\r', end='', file=sys.stderr, flush=True)
+
+    total = RouteStats()
+    for stats in routes.values():
+        total.merge(stats)
+    recorded = (records[-1]['ts'] - first) if records else 0.0
+    return {
+        'meta': {
+            'target': args.target or 'in-process',
+            'speed': args.speed,
+            'recordedSeconds': round(recorded, 1),
+            'elapsedSeconds': round(elapsed, 2),
+            # How far behind schedule the sender fell; large values mean the client was the bottleneck
+            'maxSendLagMs': round(max_late * 1000, 1),
+            'skipped': skipped,
+        },
+        TOTAL: total.summary(elapsed),
+        'routes': {key: stats.summary(elapsed) for key, stats in
+                   sorted(routes.items(), key=lambda item: len(item[1].latencies), reverse=True)},
+    }
+
+
+def print_report(result: Dict):
+    meta = result['meta']
+    print(f"{meta['target']}, {meta['speed']}x: {meta['recordedSeconds']}s of traffic replayed in "
+          f"{meta['elapsedSeconds']}s (sender fell up to {meta['maxSendLagMs']} ms behind)")
+    for reason, count in meta['skipped'].items():
+        print(f'  skipped {count}: {reason}')
+    print(f"\n{'route':<60} {'reqs':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7} {'other':>6}")
+    rows = list(result['routes'].items()) + [(TOTAL, result[TOTAL])]
+    for key, row in rows:
+        print(f"{key:<60} {row['requests']:>6} {row['rps']:>8.1f} {row['p50Ms']:>8.2f} {row['p95Ms']:>8.2f} "
+              f"{row['p99Ms']:>8.2f} {row['errorRate']:>7.1%} {row['mismatched']:>6}")
+    print('\nlatencies in ms from when each request was due; other = status differs from the recorded one')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('log', help='capture log (capture.path in config.yaml)')
+    parser.add_argument('--speed', type=float, default=1.0, help='multiple of the recorded request rate')
+    parser.add_argument('--target', help='base URL of a running server (default: the app in-process)')
+    parser.add_argument('--workdir', default=BACKEND, help='directory with music.db and config.yaml (in-process)')
+    parser.add_argument('--limit', type=int, help='replay the first N requests only')
+    parser.add_argument('--duration', type=float, help='replay the first S seconds of the recording only')
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--admin-user')
+    parser.add_argument('--admin-password')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+    args.workdir = os.path.abspath(args.workdir)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    records = load(args.log, args.limit, args.duration)
+    if not records:
+        sys.exit(f'{args.log} has no requests')
+    result = asyncio.run(replay(args, records))
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'written to {args.output}')
+    sys.exit(1 if result[TOTAL]['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Transactional bulk admin writes.
+
+``POST /api/admin/{songs,albums,artists,moods,playlists}/bulk`` takes a list
+of operations and applies them together::
+
+    {"operations": [{"op": "create", "data": {...}},
+                    {"op": "update", "id": "...", "data": {...}},
+                    {"op": "patch", "id": "...", "data": {"genre": "rock"}},
+                    {"op": "delete", "id": "..."}],
+     "atomic": true}
+
+``update`` takes the full record like the PUT endpoints. ``patch`` takes only
+the fields to change and merges them onto the stored record.
+
+Every operation is validated first. Records are checked against the
+entity's model. Target rows and referenced artists, albums, moods and songs
+are each checked with one ``IN (...)`` query per table, and unique names
+are checked the same way. The valid operations are then written in a single
+transaction with one ``executemany`` per statement. Denormalized counters
+follow through the triggers in counters.py. When
+``atomic`` is set (the default), nothing is written if any operation is
+invalid. Results are returned per operation, in request order.
+"""
+import json
+import sqlite3
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from fields import ensure_https_url
+from lyrics import parse_lrc, serialize_parsed_lyrics
+
+OPS = ('create', 'update', 'patch', 'delete')
+MAX_OPERATIONS = 5000
+# Stay well below SQLite's bound parameter limit in IN (...) lookups
+CHUNK_SIZE = 500
+
+
+class ArtistLink:
+    """Association table between an entity and its artists"""
+
+    def __init__(self, table: str, owner_column: str):
+        self.table = table
+        self.owner_column = owner_column
+
+
+class BulkEntity:
+    """How one entity type is validated and written in bulk"""
+
+    def __init__(self, table: str, model: type, columns: Sequence[str], json_columns: Sequence[str] = (),
+                 url_columns: Sequence[str] = (), references: Optional[Dict[str, str]] = None,
+                 unique_column: Optional[str] = None, artist_link: Optional[ArtistLink] = None,
+                 after_write: Optional[Callable[[sqlite3.Cursor, List[Tuple[str, Dict]], str], None]] = None,
+                 after_delete: Optional[Callable[[sqlite3.Cursor, List[str]], None]] = None):
+        self.table = table
+        self.model = model
+        self.columns = list(columns)
+        self.json_columns = set(json_columns)
+        # stored as https, like the single-item endpoints do
+        self.url_columns = set(url_columns)
+        # record field -> table its id (or list of ids) must exist in
+        self.references = references or {}
+        self.unique_column = unique_column
+        self.artist_link = artist_link
+        self.after_write = after_write
+        self.after_delete = after_delete
+
+    @property
+    def fields(self) -> Set[str]:
+        model_fields = getattr(self.model, 'model_fields', None) or self.model.__fields__
+        return set(model_fields) - {'id', 'createdAt', 'updatedAt'}
+
+
+class BulkOperation(BaseModel):
+    op: str
+    id: Optional[str] = None
+    data: Dict[str, Any] = {}
+
+
+def _chunks(values: Sequence, size: int = CHUNK_SIZE) -> Iterable[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _placeholders(values: Sequence) -> str:
+    return ','.join('?' * len(values))
+
+
+def existing_ids(cursor, table: str, ids: Iterable[str]) -> Set[str]:
+    """Which of ids exist in table"""
+    found: Set[str] = set()
+    for chunk in _chunks(list(set(ids))):
+        cursor.execute(f'SELECT id FROM {table} WHERE id IN ({_placeholders(chunk)})', chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+def load_records(cursor, entity: BulkEntity, ids: Sequence[str]) -> Dict[str, Dict]:
+    """Stored records by id, shaped like the entity's model"""
+    records: Dict[str, Dict] = {}
+    for chunk in _chunks(list(ids)):
+        cursor.execute(
+            f'SELECT id, {", ".join(entity.columns)} FROM {entity.table} WHERE id IN ({_placeholders(chunk)})', chunk
+        )
+        for row in cursor.fetchall():
+            record = dict(zip(entity.columns, row[1:]))
+            for column in entity.json_columns:
+                try:
+                    record[column] = json.loads(record[column]) if record[column] else []
+                except ValueError:
+                    record[column] = []
+            records[row[0]] = record
+
+    link = entity.artist_link
+    if link:
+        for record in records.values():
+            record['artistIds'] = []
+        for chunk in _chunks(list(records)):
+            cursor.execute(f'''
+                SELECT {link.owner_column}, artistId FROM {link.table}
+                WHERE {link.owner_column} IN ({_placeholders(chunk)})
+                ORDER BY isPrimary DESC, createdAt ASC
+            ''', chunk)
+            for owner_id, artist_id in cursor.fetchall():
+                records[owner_id]['artistIds'].append(artist_id)
+    return records
+
+
+def _validation_message(error: ValidationError) -> str:
+    return '; '.join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def _referenced_ids(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v]
+    return [value]
+
+
+def _linked_artist_ids(record: Dict) -> List[str]:
+    """Artists an entity is linked to, as the single-item endpoints do it (deduplicated)"""
+    return list(dict.fromkeys(record.get('artistIds') or [record['artistId']]))
+
+
+def _patched_artist_ids(stored: Dict, changes: Dict) -> List[str]:
+    """artistIds after a patch: a new artistId replaces the old primary in the stored list"""
+    if 'artistIds' in changes or changes.get('artistId', stored['artistId']) == stored['artistId']:
+        return changes.get('artistIds', stored['artistIds'])
+    old, new = stored['artistId'], changes['artistId']
+    return [new] + [a for a in stored['artistIds'] if a not in (old, new)]
+
+
+def _column_value(entity: BulkEntity, record: Dict, column: str):
+    value = record[column]
+    if column in entity.json_columns:
+        return json.dumps(value) if value else '[]'
+    if column in entity.url_columns and value:
+        return ensure_https_url(value)
+    return value
+
+
+def run_bulk(conn: sqlite3.Connection, entity: BulkEntity, operations: List[BulkOperation],
+             atomic: bool, now: str) -> Tuple[bool, Dict[str, int], List[Dict]]:
+    """Validate and apply operations; returns (applied, counts, per-operation results)"""
+    cursor = conn.cursor()
+    results: List[Dict] = [{"index": i, "op": op.op, "id": op.id} for i, op in enumerate(operations)]
+    errors: Dict[int, str] = {}
+
+    # Shape checks: every op targets at most one id
+    seen_ids: Set[str] = set()
+    for i, op in enumerate(operations):
+        if op.op not in OPS:
+            errors[i] = f"Unknown op '{op.op}'"
+        elif op.op == 'create':
+            op.id = results[i]['id'] = str(uuid.uuid4())
+        elif not op.id:
+            errors[i] = "id is required"
+        elif op.id in seen_ids:
+            errors[i] = "id appears more than once in this batch"
+        else:
+            seen_ids.add(op.id)
+        if op.op == 'patch' and i not in errors:
+            unknown = set(op.data) - entity.fields
+            if unknown:
+                errors[i] = f"Unknown fields: {', '.join(sorted(unknown))}"
+
+    stored = load_records(cursor, entity, [op.id for i, op in enumerate(operations)
+                                           if i not in errors and op.op != 'create'])
+
+    # Records as they will be written
+    records: Dict[int, Dict] = {}
+    for i, op in enumerate(operations):
+        if i in errors:
+            continue
+        if op.op != 'create' and op.id not in stored:
+            errors[i] = f"{entity.table[:-1].capitalize()} not found"
+            continue
+        if op.op == 'delete':
+            continue
+        data = {**stored[op.id], **op.data} if op.op == 'patch' else op.data
+        if op.op == 'patch' and entity.artist_link:
+            data['artistIds'] = _patched_artist_ids(stored[op.id], op.data)
+        try:
+            records[i] = entity.model(**data).dict()
+        except ValidationError as e:
+            errors[i] = _validation_message(e)
+
+    # Referenced ids, one query per referenced table
+    wanted: Dict[str, Set[str]] = {}
+    for record in records.values():
+        for field, table in entity.references.items():
+            wanted.setdefault(table, set()).update(_referenced_ids(record.get(field)))
+    found = {table: existing_ids(cursor, table, ids) for table, ids in wanted.items()}
+    for i, record in list(records.items()):
+        for field, table in entity.references.items():
+            missing = [v for v in _referenced_ids(record.get(field)) if v not in found[table]]
+            if missing:
+                errors[i] = f"{field}: {table[:-1]} {', '.join(missing)} not found"
+                del records[i]
+                break
+
+    # Unique names: taken by a row outside this batch, or used twice within it
+    column = entity.unique_column
+    if column:
+        batch_ids = {op.id for i, op in enumerate(operations) if i not in errors and op.op != 'create'}
+        names = Counter(record[column] for record in records.values())
+        taken: Dict[str, str] = {}
+        for chunk in _chunks(list(names)):
+            cursor.execute(f'SELECT {column}, id FROM {entity.table} WHERE {column} IN ({_placeholders(chunk)})', chunk)
+            taken.update(cursor.fetchall())
+        for i, record in list(records.items()):
+            owner = taken.get(record[column])
+            if names[record[column]] > 1 or (owner and owner not in batch_ids):
+                errors[i] = f"{column} '{record[column]}' already exists"
+                del records[i]
+
+    for i, message in errors.items():
+        results[i].update(status="error", error=message)
+    counts = {"created": 0, "updated": 0, "deleted": 0, "failed": len(errors)}
+    if errors and atomic:
+        for i, result in enumerate(results):
+            if i not in errors:
+                result["status"] = "skipped"
+        return False, counts, results
+
+    deletes = [op.id for i, op in enumerate(operations) if op.op == 'delete' and i not in errors]
+    creates = [(operations[i].id, record) for i, record in records.items() if operations[i].op == 'create']
+    updates = [(operations[i].id, record) for i, record in records.items() if operations[i].op != 'create']
+    if not (deletes or creates or updates):
+        return False, counts, results
+
+    try:
+        _apply(cursor, entity, deletes, creates, updates, stored, now)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+    for i, op in enumerate(operations):
+        if i not in errors:
+            results[i]["status"] = {'create': 'created', 'delete': 'deleted'}.get(op.op, 'updated')
+    counts.update(created=len(creates), updated=len(updates), deleted=len(deletes))
+    return True, counts, results
+
+
+def _apply(cursor, entity: BulkEntity, deletes: List[str], creates: List[Tuple[str, Dict]],
+           updates: List[Tuple[str, Dict]], stored: Dict[str, Dict], now: str):
+    table, columns = entity.table, entity.columns
+    if deletes:
+        cursor.executemany(f'DELETE FROM {table} WHERE id = ?', [(i,) for i in deletes])
+        if entity.after_delete:
+            entity.after_delete(cursor, deletes)
+    # Updates before creates, so a name freed by a rename can be reused in the same batch
+    column = entity.unique_column
+    if column:
+        # Renamed rows first move to a placeholder (their id), so swapped or chained
+        # names within the batch are free whatever order the updates run in
+        renamed = [(f'\x00{i}', i) for i, r in updates if r[column] != stored[i].get(column)]
+        cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', renamed)
+    if updates:
+        cursor.executemany(
+            f'UPDATE {table} SET {", ".join(f"{c} = ?" for c in columns)}, updatedAt = ? WHERE id = ?',
+            [(*(_column_value(entity, r, c) for c in columns), now, i) for i, r in updates]
+        )
+    if creates:
+        cursor.executemany(
+            f'INSERT INTO {table} (id, {", ".join(columns)}, createdAt, updatedAt) '
+            f'VALUES ({_placeholders(range(len(columns) + 3))})',
+            [(i, *(_column_value(entity, r, c) for c in columns), now, now) for i, r in creates]
+        )
+
+    link = entity.artist_link
+    if link:
+        cursor.executemany(f'DELETE FROM {link.table} WHERE {link.owner_column} = ?',
+                           [(owner_id,) for owner_id, _ in updates])
+        rows = []
+        for owner_id, record in creates + updates:
+            primary = record['artistId']
+            for position, artist_id in enumerate(_linked_artist_ids(record)):
+                is_primary = artist_id == primary or (position == 0 and not primary)
+                rows.append((str(uuid.uuid4()), owner_id, artist_id, is_primary, now))
+        cursor.executemany(
+            f'INSERT INTO {link.table} (id, {link.owner_column}, artistId, isPrimary, createdAt) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+
+    if entity.after_write and (creates or updates):
+        entity.after_write(cursor, creates + updates, now)
+
+
+# Entity-specific side tables
+
+def write_song_side_tables(cursor, written: List[Tuple[str, Dict]], now: str):
+    """song_moods and parsed lyrics for created/updated songs"""
+    song_ids = [(song_id,) for song_id, _ in written]
+    cursor.executemany('DELETE FROM song_moods WHERE songId = ?', song_ids)
+    cursor.executemany('INSERT OR IGNORE INTO song_moods (songId, moodId) VALUES (?, ?)',
+                       [(song_id, mood_id) for song_id, record in written for mood_id in record['moodIds']])
+
+    parsed_rows, cleared = [], []
+    for song_id, record in written:
+        parsed = parse_lrc(record['lyrics'])
+        if parsed is None:
+            cleared.append((song_id,))
+        else:
+            parsed_rows.append((song_id, serialize_parsed_lyrics(parsed), now))
+    cursor.executemany('DELETE FROM song_lyrics WHERE songId = ?', cleared)
+    cursor.executemany('''
+        INSERT INTO song_lyrics (songId, parsed, updatedAt) VALUES (?, ?, ?)
+        ON CONFLICT(songId) DO UPDATE SET parsed = excluded.parsed, updatedAt = excluded.updatedAt
+    ''', parsed_rows)
+
+
+def delete_song_side_tables(cursor, song_ids: List[str]):
+    """Parsed lyrics of deleted songs (their association rows go with the song, see counters.py)"""
+    cursor.executemany('DELETE FROM song_lyrics WHERE songId = ?', [(song_id,) for song_id in song_ids])
@@ -0,0 +1,223 @@
+"""Traffic capture: a sampled, anonymized log of real requests to replay.
+
+Opt-in (``capture.enabled`` in config.yaml). ``CaptureMiddleware`` records
+``sample_rate`` of the HTTP requests, one JSON object per line appended to
+``path``, which ``benchmarks/replay.py`` plays back against the app::
+
+    {"ts": 1700000000.123, "method": "GET", "route": "/api/songs/{song_id}",
+     "path": "/api/songs/2c9f...", "query": "limit=20", "status": 200,
+     "ms": 3.1, "bytes": 5120, "admin": false, "session": "9f2c41d07ab3e8f1"}
+
+Anonymized: the client address, cookies and headers are not recorded, except
+the few that change the response (``KEPT_HEADERS``: encoding negotiation,
+ranges of audio streams, conditional requests). An Authorization header is
+reduced to ``"admin": true``. Session ids (``sessionId`` and
+``X-Session-Id``) and the values of ``redact_params`` are replaced by a
+keyed hash: a listener's plays stay together, but the id cannot be recovered
+from the log. Paths are kept, their ids are catalog ids. Request bodies are
+kept only for ``BODY_ROUTES`` (batches of public GET paths, whose queries are
+anonymized like the request's own); other requests with a body (logins, admin edits) are recorded with ``"body": null`` and
+replay skips them.
+
+Records are buffered and appended by a background job every
+``FLUSH_INTERVAL`` seconds, one write per flush, so the event loop never
+writes the file; capturing stops once the file reaches ``max_mb``.
+"""
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+import metrics
+
+DEFAULT_PATH = 'traffic.jsonl'
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_MAX_MB = 100
+FLUSH_INTERVAL = 5
+SESSION_PARAMS = ('sessionId',)
+KEPT_HEADERS = (b'accept', b'accept-encoding', b'range', b'if-none-match', b'if-modified-since')
+BODY_ROUTES = {('POST', '/api/batch')}
+MAX_BODY = 64 * 1024
+
+enabled = False
+sample_rate = DEFAULT_SAMPLE_RATE
+path = DEFAULT_PATH
+max_bytes = DEFAULT_MAX_MB * 1024 * 1024
+redacted = set(SESSION_PARAMS)
+_key = b''
+_buffer: List[str] = []
+_lock = threading.Lock()
+captured = 0
+dropped = 0
+_nested: contextvars.ContextVar[bool] = contextvars.ContextVar('capture_nested', default=False)
+
+
+def enable(capture_path: str = DEFAULT_PATH, rate: float = DEFAULT_SAMPLE_RATE, key: bytes = b'',
+           redact_params=(), max_mb: float = DEFAULT_MAX_MB):
+    """Start sampling requests; key makes the pseudonyms (the jwt secret, so every worker agrees)"""
+    global enabled, sample_rate, path, max_bytes, redacted, _key
+    path = capture_path
+    sample_rate = rate
+    max_bytes = int(max_mb * 1024 * 1024)
+    redacted = set(SESSION_PARAMS) | set(redact_params)
+    _key = key or os.urandom(16)
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def pseudonym(value: str) -> str:
+    return hmac.new(_key, value.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def anonymize_query(query: str) -> str:
+    if not query:
+        return ''
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(name, pseudonym(value) if name in redacted and value else value) for name, value in pairs])
+
+
+def anonymize_batch(body):
+    """A /api/batch body with the query of every sub-request path anonymized"""
+    if not isinstance(body, dict) or not isinstance(body.get('requests'), list):
+        return body
+    for sub in body['requests']:
+        if isinstance(sub, dict) and isinstance(sub.get('path'), str) and '?' in sub['path']:
+            sub_path, query = sub['path'].split('?', 1)
+            sub['path'] = f'{sub_path}?{anonymize_query(query)}'
+    return body
+
+
+def flush():
+    """Append the buffered records to the file (run by the capture job and at shutdown)"""
+    global _buffer, dropped
+    with _lock:
+        lines, _buffer = _buffer, []
+    if not lines:
+        return
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    if size >= max_bytes:
+        if enabled:
+            print(f"Traffic capture stopped: {path} reached {max_bytes // (1024 * 1024)} MB")
+            disable()
+        dropped += len(lines)
+        return
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(lines))
+
+
+def _record(record: Dict):
+    global captured
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+    with _lock:
+        _buffer.append(line)
+    captured += 1
+
+
+class CaptureMiddleware:
+    """Pure ASGI middleware; requests that are not sampled pass straight through"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not enabled or _nested.get():
+            await self.app(scope, receive, send)
+            return
+        # Batch sub-requests go through the app again; replaying the batch replays them
+        token = _nested.set(True)
+        try:
+            if random.random() < sample_rate:
+                await self._capture(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+        finally:
+            _nested.reset(token)
+
+    async def _capture(self, scope, receive, send):
+        method = scope['method']
+        keep_body = (method, scope['path']) in BODY_ROUTES
+        body: List[bytes] = []
+        body_size = 0
+        status = 500
+        size = 0
+
+        async def receive_recorded():
+            nonlocal body_size
+            message = await receive()
+            if message['type'] == 'http.request':
+                chunk = message.get('body', b'')
+                body_size += len(chunk)
+                if keep_body and body_size <= MAX_BODY:
+                    body.append(chunk)
+            return message
+
+        async def send_recorded(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        started = time.time()
+        timer = time.perf_counter()
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            elapsed = time.perf_counter() - timer
+            headers = {}
+            admin = False
+            session: Optional[str] = None
+            for name, value in scope['headers']:
+                if name == b'authorization':
+                    admin = True
+                elif name == b'x-session-id':
+                    session = pseudonym(value.decode('latin-1'))
+                elif name in KEPT_HEADERS:
+                    headers[name.decode()] = value.decode('latin-1')
+            record = {
+                "ts": round(started, 3),
+                "method": method,
+                "route": getattr(scope.get('route'), 'path', None) or metrics.UNMATCHED,
+                "path": scope['path'],
+                "query": anonymize_query(scope['query_string'].decode('latin-1')),
+                "status": status,
+                "ms": round(elapsed * 1000, 2),
+                "bytes": size,
+                "admin": admin,
+            }
+            if session:
+                record["session"] = session
+            if headers:
+                record["headers"] = headers
+            if body_size:
+                record["body"] = None
+                if keep_body and body_size <= MAX_BODY:
+                    try:
+                        record["body"] = anonymize_batch(json.loads(b''.join(body)))
+                    except ValueError:
+                        pass
+            _record(record)
+
+
+def _metric_lines() -> List[str]:
+    if not enabled and not captured:
+        return []
+    return metrics.family('capture_records_total', 'counter', 'Requests written to the traffic capture log',
+                          [({}, captured - dropped)])
+
+
+metrics.register_collector(_metric_lines)
@@ -0,0 +1,64 @@
+"""Catalog change tracking shared by the in-process caches.
+
+Admin write paths call ``bump_version()`` after committing a change to the
+song catalog; caches remember the version they were built from and rebuild
+lazily when ``current_version()`` moves on.
+
+With several worker processes (see serve.py) every worker has its own
+caches, so the version must move for all of them. ``share()`` keeps it in
+``app_state`` instead: ``bump_version()`` increments it there, and
+``current_version()`` re-reads it whenever SQLite's ``PRAGMA data_version``
+says another connection committed something. A change made in any worker
+therefore invalidates the caches of every worker before their next read,
+and while nothing is written a version check is one pragma on an open
+connection.
+"""
+import sqlite3
+import threading
+from typing import Optional
+
+VERSION_KEY = 'catalog.version'
+
+_lock = threading.Lock()
+_version = 0
+_conn: Optional[sqlite3.Connection] = None
+_data_version: Optional[int] = None
+
+
+def share(db_path: str = 'music.db'):
+    """Keep the version in the database, shared with the other worker processes"""
+    global _conn
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES (?, '0')", (VERSION_KEY,))
+    with _lock:
+        _conn = conn
+        _read_shared()
+
+
+def _read_shared():
+    global _version, _data_version
+    # data_version first: a commit landing in between is in the value read, and seen again next time
+    _data_version = _conn.execute('PRAGMA data_version').fetchone()[0]
+    _version = int(_conn.execute('SELECT value FROM app_state WHERE key = ?', (VERSION_KEY,)).fetchone()[0])
+
+
+def bump_version() -> int:
+    """Mark the catalog as changed and return the new version"""
+    global _version
+    with _lock:
+        if _conn is None:
+            _version += 1
+        else:
+            _conn.execute('UPDATE app_state SET value = CAST(value AS INTEGER) + 1 WHERE key = ?', (VERSION_KEY,))
+            _read_shared()
+        return _version
+
+
+def current_version() -> int:
+    if _conn is None:
+        return _version
+    with _lock:
+        # Our own commits leave data_version alone; bump_version() reads those back itself
+        if _conn.execute('PRAGMA data_version').fetchone()[0] != _data_version:
+            _read_shared()
+        return _version
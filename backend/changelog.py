@@ -0,0 +1,230 @@
+"""Catalog change log behind the delta sync endpoint (``GET /api/sync``).
+
+SQLite triggers append one ``change_log`` row per created, updated or
+deleted artist, album, song, mood or playlist, so every admin write path
+(single, bulk, import, reorder, and the counter triggers of counters.py)
+is logged without the handlers knowing. A row's ``seq`` is the change
+token: clients pass the last one they saw and get what changed after it.
+
+Sync payloads are flat (``sync`` fieldsets in fields.py): relations are
+sent as ids, and clients join artists/albums/moods locally, so a changed
+artist is one row instead of every song that embeds it. Song play counts
+are not logged; they refresh with the next change to the song.
+
+The compaction job keeps the log at one row per entity: a row with a newer
+row for the same entity is dropped (clients paging past it still get the
+newer one), and tombstones older than ``TOMBSTONE_TTL`` are dropped. The
+highest seq dropped that way is the horizon: a client whose token is older
+than the horizon may have missed a deletion and gets ``reset``, a full sync
+from the start of the log.
+"""
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+from fields import PROJECTIONS, load_albums, load_artists, load_moods, load_playlists, load_songs
+
+COMPACT_INTERVAL = 3600
+TOMBSTONE_TTL = 30 * 24 * 3600
+HORIZON_KEY = 'sync.horizon'
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+# entity -> (table, response key, loader); seeded and returned in this order
+ENTITIES: Dict[str, Tuple[str, str, object]] = {
+    'artist': ('artists', 'artists', load_artists),
+    'album': ('albums', 'albums', load_albums),
+    'mood': ('moods', 'moods', load_moods),
+    'song': ('songs', 'songs', load_songs),
+    'playlist': ('playlists', 'playlists', load_playlists),
+}
+
+_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+_LOG = "INSERT INTO change_log (entity, entityId, op, changedAt) VALUES ('{entity}', {id}, '{op}', " + _NOW + ");"
+
+# Everything but the play counter, which changes on every play
+SONG_COLUMNS = 'title, artistId, albumId, duration, audioUrl, coverUrl, lyrics, moodIds, liked, genre, createdAt, updatedAt'
+
+
+def _entity_triggers(entity: str, table: str, update_of: str = '') -> Dict[str, str]:
+    of = f' OF {update_of}' if update_of else ''
+    return {
+        f'trg_log_{table}_insert': f"AFTER INSERT ON {table} BEGIN {_LOG.format(entity=entity, id='NEW.id', op='upsert')} END",
+        f'trg_log_{table}_update': f"AFTER UPDATE{of} ON {table} BEGIN {_LOG.format(entity=entity, id='NEW.id', op='upsert')} END",
+        f'trg_log_{table}_delete': f"AFTER DELETE ON {table} BEGIN {_LOG.format(entity=entity, id='OLD.id', op='delete')} END",
+    }
+
+
+def _association_triggers(entity: str, table: str, owners: str, key: str) -> Dict[str, str]:
+    """An owner's artist list is part of its sync payload.
+
+    Rows deleted along with their owner log nothing: an upsert after the
+    owner's tombstone would outlive it in compaction.
+    """
+    def when(row: str) -> str:
+        return f"WHEN EXISTS (SELECT 1 FROM {owners} WHERE id = {row}.{key})"
+
+    return {
+        f'trg_log_{table}_insert': f"AFTER INSERT ON {table} {when('NEW')} "
+                                   f"BEGIN {_LOG.format(entity=entity, id=f'NEW.{key}', op='upsert')} END",
+        f'trg_log_{table}_update': f"AFTER UPDATE ON {table} {when('NEW')} "
+                                   f"BEGIN {_LOG.format(entity=entity, id=f'NEW.{key}', op='upsert')} END",
+        f'trg_log_{table}_delete': f"AFTER DELETE ON {table} {when('OLD')} "
+                                   f"BEGIN {_LOG.format(entity=entity, id=f'OLD.{key}', op='upsert')} END",
+    }
+
+
+TRIGGERS: Dict[str, str] = {
+    **_entity_triggers('artist', 'artists'),
+    **_entity_triggers('album', 'albums'),
+    **_entity_triggers('mood', 'moods'),
+    **_entity_triggers('song', 'songs', update_of=SONG_COLUMNS),
+    **_entity_triggers('playlist', 'playlists'),
+    **_association_triggers('song', 'song_artists', 'songs', 'songId'),
+    **_association_triggers('album', 'album_artists', 'albums', 'albumId'),
+}
+
+
+def install(conn: sqlite3.Connection):
+    """Create the log and (re)create its triggers; a new log starts with every existing entity"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entityId TEXT NOT NULL,
+            op TEXT NOT NULL,
+            changedAt REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_change_log_entity ON change_log (entity, entityId, seq)')
+    for name, body in TRIGGERS.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(f'CREATE TRIGGER {name} {body}')
+
+    if conn.execute('SELECT 1 FROM change_log LIMIT 1').fetchone() is None:
+        # Every live entity keeps its latest row, so an empty log means nothing was logged yet
+        for entity, (table, _, _) in ENTITIES.items():
+            conn.execute(f'''
+                INSERT INTO change_log (entity, entityId, op, changedAt)
+                SELECT '{entity}', id, 'upsert', {_NOW} FROM {table} ORDER BY createdAt
+            ''')
+
+
+def _horizon(cursor) -> int:
+    cursor.execute('SELECT value FROM app_state WHERE key = ?', (HORIZON_KEY,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+
+def parse_token(since: Optional[str]) -> Optional[int]:
+    """Change token -> seq; None for a token this server never issued"""
+    if not since:
+        return 0
+    try:
+        seq = int(since)
+    except ValueError:
+        return None
+    return seq if seq >= 0 else None
+
+
+def changes_since(conn: sqlite3.Connection, since: Optional[int], limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+    """One page of changes after the token ``since``, with the token to continue from.
+
+    The log page and the entities are read in one transaction, so a page
+    never carries a record newer than its token.
+    """
+    cursor = conn.cursor()
+    started = not conn.in_transaction
+    if started:
+        cursor.execute('BEGIN')
+    try:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+        row = cursor.fetchone()
+        latest = row[0] if row else 0
+        # Too old to have seen every deletion, or from another database
+        reset = since is None or since < _horizon(cursor) or since > latest
+        if reset:
+            since = 0
+
+        cursor.execute('SELECT seq, entity, entityId, op FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+                       (since, limit + 1))
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # The last change of each entity on the page wins
+        ops: Dict[str, Dict[str, str]] = {entity: {} for entity in ENTITIES}
+        for _, entity, entity_id, op in rows:
+            if entity in ops:
+                ops[entity].pop(entity_id, None)
+                ops[entity][entity_id] = op
+
+        data: Dict = {"deleted": {}}
+        for entity, (_, key, loader) in ENTITIES.items():
+            upserts = [entity_id for entity_id, op in ops[entity].items() if op == 'upsert']
+            records = loader(cursor, upserts, PROJECTIONS[entity]['sync']) if upserts else []
+            found = {record['id'] for record in records}
+            # Logged as changed but gone by now: its tombstone is on a later page, send it already
+            deleted = [entity_id for entity_id, op in ops[entity].items()
+                       if op == 'delete' or entity_id not in found]
+            data[key] = records
+            data["deleted"][key] = deleted
+    finally:
+        if started:
+            conn.rollback()
+
+    data.update({
+        "next": str(rows[-1][0] if rows else max(since, 0)),
+        "hasMore": has_more,
+        "reset": reset,
+    })
+    return data
+
+
+def compact(conn: sqlite3.Connection, ttl: float = TOMBSTONE_TTL) -> Dict:
+    """Drop superseded rows and expired tombstones; returns what was dropped and the horizon"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            DELETE FROM change_log WHERE seq < (
+                SELECT MAX(newer.seq) FROM change_log newer
+                WHERE newer.entity = change_log.entity AND newer.entityId = change_log.entityId
+            )
+        ''')
+        superseded = cursor.rowcount
+        cursor.execute("SELECT MAX(seq) FROM change_log WHERE op = 'delete' AND changedAt < ?", (time.time() - ttl,))
+        expired_up_to = cursor.fetchone()[0]
+        tombstones = 0
+        horizon = _horizon(cursor)
+        if expired_up_to is not None:
+            cursor.execute("DELETE FROM change_log WHERE op = 'delete' AND seq <= ?", (expired_up_to,))
+            tombstones = cursor.rowcount
+            horizon = max(horizon, expired_up_to)
+            cursor.execute('INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)', (HORIZON_KEY, str(horizon)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"superseded": superseded, "tombstones": tombstones, "horizon": horizon}
+
+
+def stats(conn: sqlite3.Connection) -> Dict:
+    cursor = conn.cursor()
+    cursor.execute('SELECT entity, op, COUNT(*) FROM change_log GROUP BY entity, op')
+    rows: Dict[str, Dict[str, int]] = {}
+    for entity, op, count in cursor.fetchall():
+        rows.setdefault(entity, {})[op] = count
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+    row = cursor.fetchone()
+    return {"latest": row[0] if row else 0, "horizon": _horizon(cursor), "rows": rows}
+
+
+def run_compact_job(db_path: str = 'music.db'):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        report = compact(conn)
+        if report["superseded"] or report["tombstones"]:
+            print(f"Change log compacted: {report}")
+    finally:
+        conn.close()
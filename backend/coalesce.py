@@ -0,0 +1,115 @@
+"""Single-flight coalescing of identical concurrent requests.
+
+Routes opt in with ``@coalesced()`` under their route decorator. While a
+call for a route and a set of (validated, defaulted) parameters is in
+flight, identical calls don't run the handler again: they await the running
+computation and get the same result. Nothing is cached: the next call after
+it finished runs the handler again. Routes whose result is not determined by
+their parameters (a random sample, say) pass ``when``, a predicate on the
+parameters; calls it rejects run the handler on their own.
+
+A plain ``def`` handler runs in the threadpool, so the event loop keeps
+accepting requests (and coalescing them) while the queries run. The
+computation runs in its own task, so a client disconnecting does not cancel
+it for the others waiting on it. Handlers must not mutate their result
+after returning it, since all callers share it.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+
+class RouteStats:
+    __slots__ = ('requests', 'executions', 'coalesced', 'errors', 'max_waiters')
+
+    def __init__(self):
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+        # Most callers that ever shared one computation
+        self.max_waiters = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "maxWaiters": self.max_waiters,
+        }
+
+
+class SingleFlight:
+    """In-flight computations by key, shared by every caller asking for the same key"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, Tuple[asyncio.Task, list]] = {}
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def _route_stats(self, route: str) -> RouteStats:
+        with self._lock:
+            return self._stats.setdefault(route, RouteStats())
+
+    async def run(self, route: str, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        stats = self._route_stats(route)
+        stats.requests += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            stats.executions += 1
+            task = asyncio.ensure_future(compute())
+            entry = self._inflight[key] = (task, [1])
+            task.add_done_callback(lambda done: self._finish(route, key, done))
+        else:
+            stats.coalesced += 1
+            entry[1][0] += 1
+            stats.max_waiters = max(stats.max_waiters, entry[1][0])
+        # shield: one caller going away must not cancel the computation for the others
+        return await asyncio.shield(entry[0])
+
+    def _finish(self, route: str, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self._route_stats(route).errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = {route: stats.as_dict() for route, stats in sorted(self._stats.items())}
+        return {"inFlight": len(self._inflight), "routes": routes}
+
+
+flights = SingleFlight()
+
+
+def _params_key(kwargs: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((name, repr(value)) for name, value in kwargs.items()))
+
+
+def coalesced(name: str = None, when: Optional[Callable[[Dict[str, Any]], bool]] = None):
+    """Coalesce concurrent identical calls of a route handler (place it below the route decorator)
+
+    ``when`` gets the call's parameters; calls for which it returns False are not coalesced.
+    """
+
+    def decorate(handler: Callable):
+        route = name or handler.__name__
+        is_async = inspect.iscoroutinefunction(handler)
+
+        @functools.wraps(handler)
+        async def endpoint(*args, **kwargs):
+            if is_async:
+                compute = lambda: handler(*args, **kwargs)
+            else:
+                compute = lambda: run_in_threadpool(handler, *args, **kwargs)
+            if when is not None and not when(kwargs):
+                return await compute()
+            return await flights.run(route, (route, _params_key(kwargs)), compute)
+
+        return endpoint
+
+    return decorate
@@ -0,0 +1,222 @@
+"""Denormalized catalog counters.
+
+``artists.songCount``/``albumCount``, ``albums.songCount``/``duration``,
+``moods.songCount`` and ``playlists.songCount``/``duration`` are maintained
+by SQLite triggers on the tables that define them. Writers only touch the
+associations (``song_artists``, ``album_artists``, ``song_moods``,
+``songs.albumId``, ``playlists.songIds``), and every association row
+inserted or deleted costs one counter UPDATE. Deleting a song, album,
+artist or mood also deletes its association rows, as the ON DELETE CASCADE
+clauses intend (foreign keys are not enforced on our connections).
+
+Nothing updates a playlist's counters when one of its songs changes
+duration or is deleted, and counters can drift for other reasons too (old
+data, writes made outside the app). ``reconcile`` recomputes every counter
+set-based, fixes the rows that drifted and reports what it changed. The
+reconcile job runs it at startup and then periodically.
+"""
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, List
+
+import catalog
+
+RECONCILE_INTERVAL = 3600
+REPORT_KEY = 'counters.lastReconcile'
+SAMPLE_SIZE = 10
+
+_PLAYLIST_SONGS = 'FROM json_each({songIds}) j JOIN songs s ON s.id = j.value'
+_PLAYLIST_COUNTERS = (
+    f"songCount = (SELECT COUNT(*) {_PLAYLIST_SONGS.format(songIds='NEW.songIds')}), "
+    f"duration = (SELECT COALESCE(SUM(s.duration), 0) {_PLAYLIST_SONGS.format(songIds='NEW.songIds')})"
+)
+
+TRIGGERS: Dict[str, str] = {
+    # artists.songCount <- song_artists
+    'trg_song_artists_insert': '''
+        AFTER INSERT ON song_artists BEGIN
+            UPDATE artists SET songCount = songCount + 1 WHERE id = NEW.artistId;
+        END''',
+    'trg_song_artists_delete': '''
+        AFTER DELETE ON song_artists BEGIN
+            UPDATE artists SET songCount = songCount - 1 WHERE id = OLD.artistId;
+        END''',
+    'trg_song_artists_update': '''
+        AFTER UPDATE OF artistId ON song_artists WHEN OLD.artistId IS NOT NEW.artistId BEGIN
+            UPDATE artists SET songCount = songCount - 1 WHERE id = OLD.artistId;
+            UPDATE artists SET songCount = songCount + 1 WHERE id = NEW.artistId;
+        END''',
+    # artists.albumCount <- album_artists
+    'trg_album_artists_insert': '''
+        AFTER INSERT ON album_artists BEGIN
+            UPDATE artists SET albumCount = albumCount + 1 WHERE id = NEW.artistId;
+        END''',
+    'trg_album_artists_delete': '''
+        AFTER DELETE ON album_artists BEGIN
+            UPDATE artists SET albumCount = albumCount - 1 WHERE id = OLD.artistId;
+        END''',
+    'trg_album_artists_update': '''
+        AFTER UPDATE OF artistId ON album_artists WHEN OLD.artistId IS NOT NEW.artistId BEGIN
+            UPDATE artists SET albumCount = albumCount - 1 WHERE id = OLD.artistId;
+            UPDATE artists SET albumCount = albumCount + 1 WHERE id = NEW.artistId;
+        END''',
+    # moods.songCount <- song_moods
+    'trg_song_moods_insert': '''
+        AFTER INSERT ON song_moods BEGIN
+            UPDATE moods SET songCount = songCount + 1 WHERE id = NEW.moodId;
+        END''',
+    'trg_song_moods_delete': '''
+        AFTER DELETE ON song_moods BEGIN
+            UPDATE moods SET songCount = songCount - 1 WHERE id = OLD.moodId;
+        END''',
+    # albums.songCount / duration <- songs.albumId, songs.duration
+    'trg_songs_insert': '''
+        AFTER INSERT ON songs WHEN NEW.albumId IS NOT NULL BEGIN
+            UPDATE albums SET songCount = songCount + 1, duration = duration + COALESCE(NEW.duration, 0)
+            WHERE id = NEW.albumId;
+        END''',
+    'trg_songs_update': '''
+        AFTER UPDATE OF albumId, duration ON songs
+        WHEN OLD.albumId IS NOT NEW.albumId OR OLD.duration IS NOT NEW.duration BEGIN
+            UPDATE albums SET songCount = songCount - 1, duration = duration - COALESCE(OLD.duration, 0)
+            WHERE id = OLD.albumId;
+            UPDATE albums SET songCount = songCount + 1, duration = duration + COALESCE(NEW.duration, 0)
+            WHERE id = NEW.albumId;
+        END''',
+    'trg_songs_delete': '''
+        AFTER DELETE ON songs BEGIN
+            UPDATE albums SET songCount = songCount - 1, duration = duration - COALESCE(OLD.duration, 0)
+            WHERE id = OLD.albumId;
+            DELETE FROM song_artists WHERE songId = OLD.id;
+            DELETE FROM song_moods WHERE songId = OLD.id;
+        END''',
+    # Cascades from the other catalog tables
+    'trg_albums_delete': '''
+        AFTER DELETE ON albums BEGIN
+            DELETE FROM album_artists WHERE albumId = OLD.id;
+        END''',
+    'trg_artists_delete': '''
+        AFTER DELETE ON artists BEGIN
+            DELETE FROM song_artists WHERE artistId = OLD.id;
+            DELETE FROM album_artists WHERE artistId = OLD.id;
+        END''',
+    'trg_moods_delete': '''
+        AFTER DELETE ON moods BEGIN
+            DELETE FROM song_moods WHERE moodId = OLD.id;
+        END''',
+    # playlists.songCount / duration <- playlists.songIds (songs that exist)
+    'trg_playlists_insert': f'''
+        AFTER INSERT ON playlists BEGIN
+            UPDATE playlists SET {_PLAYLIST_COUNTERS} WHERE id = NEW.id;
+        END''',
+    'trg_playlists_update': f'''
+        AFTER UPDATE OF songIds ON playlists BEGIN
+            UPDATE playlists SET {_PLAYLIST_COUNTERS} WHERE id = NEW.id;
+        END''',
+}
+
+# Association rows whose owner or target no longer exists
+ORPHANS: Dict[str, str] = {
+    'song_artists': 'songId NOT IN (SELECT id FROM songs) OR artistId NOT IN (SELECT id FROM artists)',
+    'album_artists': 'albumId NOT IN (SELECT id FROM albums) OR artistId NOT IN (SELECT id FROM artists)',
+    'song_moods': 'songId NOT IN (SELECT id FROM songs) OR moodId NOT IN (SELECT id FROM moods)',
+}
+
+# counter -> (table, column, expected value for the row, correlated on the table name)
+COUNTERS: Dict[str, tuple] = {
+    'artists.songCount': ('artists', 'songCount', '''
+        SELECT COUNT(*) FROM song_artists x JOIN songs s ON s.id = x.songId WHERE x.artistId = artists.id'''),
+    'artists.albumCount': ('artists', 'albumCount', '''
+        SELECT COUNT(*) FROM album_artists x JOIN albums a ON a.id = x.albumId WHERE x.artistId = artists.id'''),
+    'albums.songCount': ('albums', 'songCount', '''
+        SELECT COUNT(*) FROM songs s WHERE s.albumId = albums.id'''),
+    'albums.duration': ('albums', 'duration', '''
+        SELECT COALESCE(SUM(s.duration), 0) FROM songs s WHERE s.albumId = albums.id'''),
+    'moods.songCount': ('moods', 'songCount', '''
+        SELECT COUNT(*) FROM song_moods x JOIN songs s ON s.id = x.songId WHERE x.moodId = moods.id'''),
+    'playlists.songCount': ('playlists', 'songCount',
+                            'SELECT COUNT(*) ' + _PLAYLIST_SONGS.format(songIds='playlists.songIds')),
+    'playlists.duration': ('playlists', 'duration',
+                           'SELECT COALESCE(SUM(s.duration), 0) ' + _PLAYLIST_SONGS.format(songIds='playlists.songIds')),
+}
+
+
+def install_triggers(conn: sqlite3.Connection):
+    """(Re)create the counter triggers, so changed definitions take effect on the next start"""
+    for name, body in TRIGGERS.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(f'CREATE TRIGGER {name} {body}')
+
+
+def reconcile(conn: sqlite3.Connection, fix: bool = True) -> Dict:
+    """Recompute every counter and fix (or, with fix=False, only report) the drift.
+
+    Runs in one write transaction, so no trigger-maintained write lands
+    between computing a counter and storing it.
+    """
+    report: Dict = {"orphans": {}, "counters": {}, "fixed": fix}
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for table, condition in ORPHANS.items():
+            cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE {condition}')
+            count = cursor.fetchone()[0]
+            if count:
+                report["orphans"][table] = count
+                if fix:
+                    cursor.execute(f'DELETE FROM {table} WHERE {condition}')
+
+        for name, (table, column, expected) in COUNTERS.items():
+            cursor.execute(f'''
+                SELECT id, stored, actual FROM (
+                    SELECT id, {column} AS stored, ({expected}) AS actual FROM {table}
+                ) WHERE stored IS NOT actual
+            ''')
+            drifted: List[tuple] = cursor.fetchall()
+            if not drifted:
+                continue
+            report["counters"][name] = {
+                "rows": len(drifted),
+                "totalDrift": sum(abs((stored or 0) - actual) for _, stored, actual in drifted),
+                "sample": [{"id": row_id, "stored": stored, "actual": actual}
+                           for row_id, stored, actual in drifted[:SAMPLE_SIZE]],
+            }
+            if fix:
+                cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?',
+                                   [(actual, row_id) for row_id, _, actual in drifted])
+        if fix:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if fix and (report["orphans"] or report["counters"]):
+        catalog.bump_version()
+    return report
+
+
+def last_report(db_path: str = 'music.db'):
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute('SELECT value FROM app_state WHERE key = ?', (REPORT_KEY,)).fetchone()
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def run_reconcile_job(db_path: str = 'music.db'):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        report = reconcile(conn)
+        report["at"] = datetime.now().isoformat()
+        if report["orphans"] or report["counters"]:
+            drifted_rows = {name: counter["rows"] for name, counter in report["counters"].items()}
+            print(f"Counter reconciliation fixed drift: orphans={report['orphans']} counters={drifted_rows}")
+        conn.execute('INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)',
+                     (REPORT_KEY, json.dumps(report)))
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,158 @@
+"""SQLite connections for the public read handlers.
+
+``connect()`` opens a new connection as before, except inside a
+``shared_scope()``: there every handler gets the scope's one connection
+(``close()`` on it is a no-op) and the batch loaders in fields.py remember
+the records they loaded, so sub-requests of one ``/api/batch`` call share
+both. The scope's connection holds one read transaction, so every
+sub-request sees the same state of the database.
+
+Query hooks (``add_query_hook``) see every statement run on connections
+from ``connect()``, with its duration, and connection hooks
+(``add_connection_hook``) get each new connection, e.g. to set a trace
+callback; without hooks the connections are plain ``sqlite3`` ones and
+nothing is timed.
+"""
+import contextvars
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+DB_PATH = 'music.db'
+
+# hook(sql, seconds, statement): statement is False for the time spent fetching a statement's rows
+QueryHook = Callable[[str, float, bool], None]
+_query_hooks: List[QueryHook] = []
+_connection_hooks: List[Callable[[sqlite3.Connection], None]] = []
+
+
+def add_query_hook(hook: QueryHook):
+    if hook not in _query_hooks:
+        _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: QueryHook):
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+def add_connection_hook(hook: Callable[[sqlite3.Connection], None]):
+    if hook not in _connection_hooks:
+        _connection_hooks.append(hook)
+
+
+def remove_connection_hook(hook: Callable[[sqlite3.Connection], None]):
+    if hook in _connection_hooks:
+        _connection_hooks.remove(hook)
+
+
+def _observe(sql: str, seconds: float, statement: bool):
+    for hook in _query_hooks:
+        hook(sql, seconds, statement)
+
+
+class ObservedCursor(sqlite3.Cursor):
+    """Times statements and row fetches for the query hooks"""
+
+    _sql = ''
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            _observe(sql, time.perf_counter() - started, True)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = sql
+            _observe(sql, time.perf_counter() - started, True)
+
+    def _fetched(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            _observe(self._sql, time.perf_counter() - started, False)
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall)
+
+
+class ObservedConnection(sqlite3.Connection):
+    # Connection.execute() makes its cursor without calling cursor(), so route it here
+    def cursor(self, factory=ObservedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class SharedConnection(ObservedConnection):
+    """Connection owned by a scope; handlers closing it leave it open"""
+
+    def close(self):
+        pass
+
+    def close_shared(self):
+        super().close()
+
+
+class Scope:
+    __slots__ = ('conn', 'records', 'links')
+
+    def __init__(self, conn: SharedConnection):
+        self.conn = conn
+        # entity name -> id -> record with the columns loaded so far
+        self.records: Dict[str, Dict[str, Dict]] = {}
+        # association table -> owner id -> (columns loaded, artist records)
+        self.links: Dict[str, Dict[str, tuple]] = {}
+
+
+_scope: contextvars.ContextVar[Optional[Scope]] = contextvars.ContextVar('db_scope', default=None)
+
+
+def connect(path: str = DB_PATH, **kwargs) -> sqlite3.Connection:
+    scope = _scope.get()
+    if scope is not None and path == DB_PATH:
+        return scope.conn
+    if not (_query_hooks or _connection_hooks):
+        return sqlite3.connect(path, **kwargs)
+    conn = sqlite3.connect(path, factory=ObservedConnection, **kwargs)
+    for hook in _connection_hooks:
+        hook(conn)
+    return conn
+
+
+def current_scope() -> Optional[Scope]:
+    return _scope.get()
+
+
+@contextmanager
+def shared_scope():
+    # Sync handlers run in the threadpool; sub-requests use the connection one at a time
+    conn = sqlite3.connect(DB_PATH, factory=SharedConnection, check_same_thread=False)
+    for hook in _connection_hooks:
+        hook(conn)
+    conn.execute('BEGIN')
+    token = _scope.set(Scope(conn))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        conn.rollback()
+        conn.close_shared()
@@ -0,0 +1,145 @@
+"""Response encoding with content negotiation.
+
+Route handlers keep returning plain dicts and lists. ``EncodedRoute`` wraps
+every endpoint so its return value is encoded directly by the fastest
+available encoder instead of going through ``jsonable_encoder`` first, and
+picks the format from the request's ``Accept`` header:
+
+- ``application/json`` (default): orjson when installed, stdlib json otherwise
+- ``application/msgpack`` / ``application/x-msgpack``: MessagePack, when installed
+
+Encoders are registered by media type with ``register_encoder``.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+JSON_MEDIA_TYPE = 'application/json'
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+# Accept header of the request being handled, set by EncodedRoute
+_accept: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('accept', default=None)
+
+
+def _fallback(obj: Any) -> Any:
+    """Types the fast encoders don't know (pydantic models, sets, ...) go through jsonable_encoder"""
+    return jsonable_encoder(obj)
+
+
+def _encode_json_stdlib(content: Any) -> bytes:
+    # Same output options as starlette's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'),
+                      default=_fallback).encode('utf-8')
+
+
+def _encode_json_orjson(content: Any) -> bytes:
+    return orjson.dumps(content, default=_fallback, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_fallback, use_bin_type=True)
+
+
+encode_json: Callable[[Any], bytes] = _encode_json_orjson if orjson else _encode_json_stdlib
+
+# media type -> encoder; JSON is used when the client accepts nothing registered
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {JSON_MEDIA_TYPE: encode_json}
+# alternative media types accepted for a registered one
+ALIASES: Dict[str, str] = {'application/x-msgpack': MSGPACK_MEDIA_TYPE, '*/*': JSON_MEDIA_TYPE}
+
+
+def register_encoder(media_type: str, encoder: Callable[[Any], bytes]):
+    ENCODERS[media_type] = encoder
+
+
+if msgpack:
+    register_encoder(MSGPACK_MEDIA_TYPE, _encode_msgpack)
+
+
+def negotiate(accept: Optional[str]) -> Tuple[str, Callable[[Any], bytes]]:
+    """Best registered encoder for an Accept header (q-values honoured, JSON when nothing matches)"""
+    if accept:
+        candidates = []
+        for position, part in enumerate(accept.split(',')):
+            media_type, _, params = part.strip().partition(';')
+            quality = 1.0
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if key == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            media_type = ALIASES.get(media_type.strip().lower(), media_type.strip().lower())
+            if quality > 0 and media_type in ENCODERS:
+                candidates.append((-quality, position, media_type))
+        if candidates:
+            media_type = min(candidates)[2]
+            return media_type, ENCODERS[media_type]
+    return JSON_MEDIA_TYPE, ENCODERS[JSON_MEDIA_TYPE]
+
+
+class EncodedResponse(Response):
+    """Response encoded with the encoder negotiated for the current request"""
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(self, content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                 accept: Optional[str] = None):
+        self.media_type, self._encoder = negotiate(accept if accept is not None else _accept.get())
+        super().__init__(content, status_code, headers)
+        self.headers.setdefault('vary', 'Accept')
+
+    def render(self, content: Any) -> bytes:
+        return self._encoder(content)
+
+
+class EncodedRoute(APIRoute):
+    """APIRoute whose plain return values are encoded by EncodedResponse.
+
+    Responses returned explicitly by a handler are passed through untouched.
+    Only async endpoints are wrapped; sync ones keep FastAPI's default path.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        # include_router re-creates routes from already wrapped endpoints
+        if asyncio.iscoroutinefunction(endpoint) and not getattr(endpoint, '_encoded', False):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kw):
+                result = await original(*args, **kw)
+                if isinstance(result, Response):
+                    return result
+                return EncodedResponse(result)
+
+            endpoint._encoded = True
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            token = _accept.set(request.headers.get('accept'))
+            try:
+                return await handler(request)
+            finally:
+                _accept.reset(token)
+
+        return route_handler
@@ -0,0 +1,669 @@
+"""Sparse fieldsets and projections for list endpoints.
+
+List endpoints accept ``?fields=`` with either a projection name (``card``,
+``detail``, ...) or a comma separated list of fields, where nested entity
+fields use dots: ``fields=id,title,artist.name,album.title``. A field given
+without sub-fields (``album``) returns the whole nested entity.
+
+Loaders only select the columns a fieldset needs and batch-load nested
+artists, albums and moods for the whole page with one query per relation.
+Rows become records through a mapper compiled once per column list, which
+only converts the columns that need it: JSON columns are decoded when their
+field is selected, URLs are stored as https already (normalized on write).
+When the in-memory catalog snapshot is enabled and current (snapshot.py),
+loaders read from it instead of SQLite.
+"""
+import json
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+import db
+import metrics
+
+# Resolved fieldset: field name -> None for plain columns, nested fieldset for relations
+FieldSpec = Dict[str, Optional[dict]]
+
+# SQLite's default limit on bound parameters is 999 on older builds
+CHUNK_SIZE = 500
+
+# Served from the snapshot vs. from SQL; records reused within a batch vs. loaded
+SNAPSHOT_CACHE = metrics.cache('snapshot')
+MEMO_CACHE = metrics.cache('batch_memo')
+
+
+def parse_json_field(field_value: str) -> List[str]:
+    if not field_value:
+        return []
+    try:
+        return json.loads(field_value)
+    except:
+        return []
+
+
+def ensure_https_url(url: str) -> str:
+    """Convert HTTP URLs to HTTPS to prevent mixed content issues"""
+    if url and url.startswith('http://'):
+        return url.replace('http://', 'https://', 1)
+    return url
+
+
+class Entity:
+    """Output fields of one entity: SQL expressions for columns, and relations"""
+
+    def __init__(self, name: str, table: str, alias: str, columns: List[Tuple[str, str, Optional[Callable]]],
+                 relations: Optional[Dict[str, str]] = None, requires: Optional[Dict[str, List[str]]] = None):
+        self.name = name
+        self.table = table
+        self.alias = alias
+        # field -> (sql expression, converter)
+        self.columns = {field: (expr, convert) for field, expr, convert in columns}
+        # relation field -> entity name
+        self.relations = relations or {}
+        # relation field -> columns its loader needs
+        self.requires = requires or {}
+        # column list -> compiled row mapper
+        self._mappers: Dict[Tuple[str, ...], Callable[[tuple], Dict]] = {}
+
+    def select_list(self, spec: FieldSpec) -> List[str]:
+        """Columns to select for a fieldset, id first"""
+        needed = ['id']
+        for field in spec:
+            if field in self.columns and field not in needed:
+                needed.append(field)
+            for column in self.requires.get(field, []):
+                if column not in needed:
+                    needed.append(column)
+        return needed
+
+    def row_mapper(self, fields: List[str]) -> Callable[[tuple], Dict]:
+        """row -> record for rows selecting these fields, compiled once per column list"""
+        key = tuple(fields)
+        mapper = self._mappers.get(key)
+        if mapper is None:
+            conversions = [(field, self.columns[field][1]) for field in key if self.columns[field][1]]
+
+            def mapper(row) -> Dict:
+                record = dict(zip(key, row))
+                for field, convert in conversions:
+                    value = record[field]
+                    if value is not None:
+                        record[field] = convert(value)
+                return record
+
+            self._mappers[key] = mapper
+        return mapper
+
+    def row_to_dict(self, fields: List[str], row) -> Dict:
+        return self.row_mapper(fields)(row)
+
+
+ENTITIES: Dict[str, Entity] = {}
+
+
+def register(entity: Entity) -> Entity:
+    ENTITIES[entity.name] = entity
+    return entity
+
+
+ARTIST = register(Entity('artist', 'artists', 'a', [
+    ('id', 'a.id', None),
+    ('name', 'a.name', None),
+    ('bio', 'a.bio', None),
+    ('avatar', 'a.avatar', None),
+    ('coverUrl', 'a.coverUrl', None),
+    ('followers', 'a.followers', None),
+    ('songCount', 'a.songCount', None),
+    ('albumCount', 'a.albumCount', None),
+    ('genres', 'a.genres', parse_json_field),
+    ('verified', 'a.verified', bool),
+    ('createdAt', 'a.createdAt', None),
+    ('updatedAt', 'a.updatedAt', None),
+    # Only set when the artist is loaded through a song/album association
+    ('isPrimary', 'isPrimary', bool),
+]))
+
+MOOD = register(Entity('mood', 'moods', 'm', [
+    ('id', 'm.id', None),
+    ('name', 'm.name', None),
+    ('description', 'm.description', None),
+    ('icon', 'm.icon', None),
+    ('color', 'm.color', None),
+    ('coverUrl', 'm.coverUrl', None),
+    ('songCount', 'm.songCount', None),
+    ('createdAt', 'm.createdAt', None),
+    ('updatedAt', 'm.updatedAt', None),
+]))
+
+ALBUM = register(Entity('album', 'albums', 'al', [
+    ('id', 'al.id', None),
+    ('title', 'al.title', None),
+    ('artistId', 'al.artistId', None),
+    ('coverUrl', 'al.coverUrl', None),
+    ('releaseDate', 'al.releaseDate', None),
+    ('songCount', 'al.songCount', None),
+    ('duration', 'al.duration', None),
+    ('genre', 'al.genre', None),
+    ('description', 'al.description', None),
+    ('createdAt', 'al.createdAt', None),
+    ('updatedAt', 'al.updatedAt', None),
+    ('artistName', '(SELECT name FROM artists WHERE id = al.artistId)', None),
+], relations={'artist': 'artist', 'artists': 'artist'}))
+
+SONG = register(Entity('song', 'songs', 's', [
+    ('id', 's.id', None),
+    ('title', 's.title', None),
+    ('artistId', 's.artistId', None),
+    ('artistName', '(SELECT name FROM artists WHERE id = s.artistId)', None),
+    ('albumId', 's.albumId', None),
+    ('albumTitle', '(SELECT title FROM albums WHERE id = s.albumId)', None),
+    ('duration', 's.duration', None),
+    ('audioUrl', 's.audioUrl', None),
+    ('coverUrl', 's.coverUrl', None),
+    ('lyrics', 's.lyrics', None),
+    ('hasLyrics', "(s.lyrics IS NOT NULL AND s.lyrics != '')", bool),
+    ('moodIds', 's.moodIds', parse_json_field),
+    ('playCount', 's.playCount', None),
+    ('liked', 's.liked', bool),
+    ('genre', 's.genre', None),
+    ('createdAt', 's.createdAt', None),
+    ('updatedAt', 's.updatedAt', None),
+], relations={'artist': 'artist', 'artists': 'artist', 'album': 'album', 'moods': 'mood'},
+   requires={'album': ['albumId'], 'moods': ['moodIds']}))
+
+PLAYLIST = register(Entity('playlist', 'playlists', 'p', [
+    ('id', 'p.id', None),
+    ('name', 'p.name', None),
+    ('description', 'p.description', None),
+    ('coverUrl', 'p.coverUrl', None),
+    ('songIds', 'p.songIds', parse_json_field),
+    ('songCount', 'p.songCount', None),
+    ('playCount', 'p.playCount', None),
+    ('duration', 'p.duration', None),
+    ('creator', 'p.creator', None),
+    ('isPublic', 'p.isPublic', bool),
+    ('createdAt', 'p.createdAt', None),
+    ('updatedAt', 'p.updatedAt', None),
+]))
+
+COMMENT = register(Entity('comment', 'moment_comments', 'mc', [
+    ('id', 'mc.id', None),
+    ('momentId', 'mc.momentId', None),
+    ('content', 'mc.content', None),
+    ('listenDate', 'mc.listenDate', None),
+    ('location', 'mc.location', None),
+    ('createdAt', 'mc.createdAt', None),
+]))
+
+MOMENT = register(Entity('moment', 'music_moments', 'mo', [
+    ('id', 'mo.id', None),
+    ('songId', 'mo.songId', None),
+    ('content', 'mo.content', None),
+    ('tags', 'mo.tags', parse_json_field),
+    ('energyLevel', 'mo.energyLevel', None),
+    ('firstHeardYear', 'mo.firstHeardYear', None),
+    ('firstHeardPeriod', 'mo.firstHeardPeriod', None),
+    ('likeCount', 'mo.likeCount', None),
+    ('createdAt', 'mo.createdAt', None),
+    ('updatedAt', 'mo.updatedAt', None),
+], relations={'song': 'song', 'comments': 'comment'},
+   requires={'song': ['songId']}))
+
+
+def full_spec(entity: Entity, exclude: Tuple[str, ...] = ()) -> FieldSpec:
+    """Every column plus every relation (relations one level deep, as the API always returned)"""
+    spec: FieldSpec = {field: None for field in entity.columns if field not in exclude}
+    for field, target in entity.relations.items():
+        if field not in exclude:
+            spec[field] = full_spec(ENTITIES[target], exclude=tuple(ENTITIES[target].relations))
+    return spec
+
+
+def _fields(names: str, **nested: FieldSpec) -> FieldSpec:
+    """Fieldset from space separated names, in that order; relations take their sub-fieldset from nested"""
+    return {name: nested.get(name) for name in names.split()}
+
+
+ARTIST_REF = _fields('id name avatar isPrimary')
+MOOD_REF = _fields('id name icon color')
+ARTIST_DETAIL = full_spec(ARTIST)
+MOOD_DETAIL = full_spec(MOOD)
+ALBUM_DETAIL = _fields(
+    'id title artistId artist artists coverUrl releaseDate songCount duration genre description createdAt updatedAt',
+    artist=ARTIST_DETAIL, artists=ARTIST_DETAIL,
+)
+# Delta sync sends relations as ids; clients join the synced artists, albums and moods themselves
+ARTIST_LINK = _fields('id isPrimary')
+SONG_DETAIL = _fields(
+    'id title artistId artist artists albumId album duration audioUrl coverUrl hasLyrics moodIds moods '
+    'playCount liked genre createdAt updatedAt',
+    artist=ARTIST_DETAIL, artists=ARTIST_DETAIL, album=ALBUM_DETAIL, moods=MOOD_DETAIL,
+)
+
+PROJECTIONS: Dict[str, Dict[str, FieldSpec]] = {
+    'song': {
+        # What song cards, the player bar and the play page render
+        'card': _fields(
+            'id title artistId artist artists albumId album duration audioUrl coverUrl hasLyrics '
+            'moodIds moods playCount liked genre',
+            artist=ARTIST_REF, artists=ARTIST_REF, moods=MOOD_REF,
+            album=_fields('id title coverUrl artists', artists=ARTIST_REF),
+        ),
+        # The full payload list endpoints have always returned
+        'detail': SONG_DETAIL,
+        # Single song page: detail plus the raw lyrics
+        'full': _fields(
+            'id title artistId artist artists albumId album duration audioUrl coverUrl lyrics hasLyrics moodIds moods '
+            'playCount liked genre createdAt updatedAt',
+            artist=ARTIST_DETAIL, artists=ARTIST_DETAIL, album=ALBUM_DETAIL, moods=MOOD_DETAIL,
+        ),
+        # Admin song table
+        'admin': _fields(
+            'id title artistId artistName artists albumId albumTitle duration audioUrl coverUrl lyrics moodIds '
+            'playCount liked genre createdAt updatedAt',
+            artists=ARTIST_DETAIL,
+        ),
+        # Admin song table pages; lyrics are fetched per song when editing
+        'admin_list': _fields(
+            'id title artistId artistName artists albumId albumTitle duration audioUrl coverUrl hasLyrics moodIds '
+            'playCount liked genre createdAt updatedAt',
+            artists=ARTIST_DETAIL,
+        ),
+        'sync': _fields(
+            'id title artistId artists albumId duration audioUrl coverUrl hasLyrics moodIds playCount liked genre '
+            'createdAt updatedAt',
+            artists=ARTIST_LINK,
+        ),
+    },
+    'album': {
+        'card': _fields('id title artistId artist artists coverUrl releaseDate songCount genre',
+                        artist=ARTIST_REF, artists=ARTIST_REF),
+        'detail': ALBUM_DETAIL,
+        # Admin album table
+        'admin': _fields(
+            'id title artistId artistName artists coverUrl releaseDate songCount duration genre description '
+            'createdAt updatedAt',
+            artists=ARTIST_DETAIL,
+        ),
+        'sync': _fields(
+            'id title artistId artists coverUrl releaseDate songCount duration genre description createdAt updatedAt',
+            artists=ARTIST_LINK,
+        ),
+    },
+    'artist': {
+        'card': _fields('id name avatar coverUrl followers songCount albumCount verified'),
+        'detail': _fields('id name bio avatar coverUrl followers songCount albumCount genres verified createdAt updatedAt'),
+        'sync': _fields('id name bio avatar coverUrl followers songCount albumCount genres verified createdAt updatedAt'),
+    },
+    'mood': {
+        'card': _fields('id name icon color coverUrl songCount'),
+        'detail': MOOD_DETAIL,
+        'sync': MOOD_DETAIL,
+    },
+    'playlist': {
+        # Playlist cards never show the song list itself
+        'card': _fields('id name description coverUrl songCount playCount duration creator isPublic createdAt updatedAt'),
+        'detail': full_spec(PLAYLIST),
+        'sync': full_spec(PLAYLIST),
+    },
+    'moment': {
+        # Moment feed entries with their song and comments
+        'detail': _fields(
+            'id songId content tags energyLevel firstHeardYear firstHeardPeriod likeCount createdAt updatedAt '
+            'song comments',
+            song=_fields('id title coverUrl artistName'), comments=full_spec(COMMENT),
+        ),
+    },
+}
+
+
+def _resolve(entity: Entity, raw: dict, path: str = '') -> FieldSpec:
+    spec: FieldSpec = {'id': None}
+    for field, sub in raw.items():
+        if field in entity.columns:
+            if sub is not None:
+                raise HTTPException(status_code=400, detail=f"Field {path}{field} has no sub-fields")
+            spec[field] = None
+        elif field in entity.relations:
+            target = ENTITIES[entity.relations[field]]
+            spec[field] = full_spec(target, exclude=tuple(target.relations)) if sub is None \
+                else _resolve(target, sub, f"{path}{field}.")
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {path}{field}")
+    return spec
+
+
+def parse_fields(value: Optional[str], entity_name: str, default: str = 'detail') -> FieldSpec:
+    """Turn a ?fields= value into a resolved fieldset (400 on unknown fields)"""
+    projections = PROJECTIONS[entity_name]
+    value = (value or '').strip()
+    if not value:
+        return projections[default]
+    if value in projections:
+        return projections[value]
+
+    raw: dict = {}
+    for path in value.split(','):
+        parts = [part.strip() for part in path.split('.') if part.strip()]
+        node = raw
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = None  # whole field; wins over earlier sub-field picks
+            else:
+                if part in node and node[part] is None:
+                    break  # whole relation already requested
+                node = node.setdefault(part, {})
+    return _resolve(ENTITIES[entity_name], raw)
+
+
+def _chunks(values: List, size: int = CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _project(entity: Entity, record: Dict, spec: FieldSpec) -> Dict:
+    """Keep only the fieldset's keys, in the fieldset's order"""
+    return {field: record[field] for field in spec if field in record}
+
+
+def _in_order(entity: Entity, records: Dict[str, Dict], ids: List[str], spec: FieldSpec) -> List[Dict]:
+    """Loaded records in the given order, projected unless the mapper already built exactly the fieldset"""
+    if list(spec) == entity.select_list(spec):
+        return [records[i] for i in ids if i in records]
+    return [_project(entity, records[i], spec) for i in ids if i in records]
+
+
+def _union_spec(*specs: Optional[FieldSpec]) -> FieldSpec:
+    merged: FieldSpec = {}
+    for spec in specs:
+        for field, sub in (spec or {}).items():
+            if isinstance(sub, dict):
+                merged[field] = _union_spec(merged.get(field) or {}, sub)
+            else:
+                merged.setdefault(field, None)
+    return merged
+
+
+def _attach_artists(entity: Entity, records: Dict[str, Dict], artists_by_owner: Dict[str, List[Dict]],
+                    spec: FieldSpec):
+    for owner_id, record in records.items():
+        artists = artists_by_owner.get(owner_id, [])
+        if 'artist' in spec:
+            primary = next((a for a in artists if a.get('isPrimary')), artists[0] if artists else None)
+            record['artist'] = _project(ARTIST, primary, spec['artist']) if primary else None
+        if 'artists' in spec:
+            record['artists'] = [_project(ARTIST, a, spec['artists']) for a in artists]
+
+
+class SqlSource:
+    """Loader reads straight from SQLite"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def fetch(self, entity: Entity, ids: List[str], spec: FieldSpec) -> Dict[str, Dict]:
+        fields = entity.select_list(spec)
+        select = ', '.join(entity.columns[f][0] for f in fields)
+        alias = entity.alias
+        to_record = entity.row_mapper(fields)
+        records: Dict[str, Dict] = {}
+        for chunk in _chunks(ids):
+            placeholders = ','.join('?' * len(chunk))
+            self.cursor.execute(
+                f'SELECT {select} FROM {entity.table} {alias} WHERE {alias}.id IN ({placeholders})', chunk
+            )
+            for row in self.cursor.fetchall():
+                records[row[0]] = to_record(row)
+        return records
+
+    def associated_artists(self, table: str, key: str, owner_ids: List[str],
+                           spec: FieldSpec) -> Dict[str, List[Dict]]:
+        """Artists per song/album from an association table, primary artist first"""
+        fields = [f for f in ARTIST.select_list(spec) if f != 'isPrimary']
+        select = ', '.join(ARTIST.columns[f][0] for f in fields)
+        to_record = ARTIST.row_mapper(fields)
+        by_owner: Dict[str, List[Dict]] = {}
+        for chunk in _chunks(owner_ids):
+            placeholders = ','.join('?' * len(chunk))
+            self.cursor.execute(f'''
+                SELECT j.{key}, j.isPrimary, {select} FROM {table} j
+                JOIN artists a ON a.id = j.artistId
+                WHERE j.{key} IN ({placeholders})
+                ORDER BY j.isPrimary DESC, a.name ASC
+            ''', chunk)
+            for row in self.cursor.fetchall():
+                record = to_record(row[2:])
+                record['isPrimary'] = bool(row[1])
+                by_owner.setdefault(row[0], []).append(record)
+        return by_owner
+
+
+class MemoSource:
+    """Wraps a source for a db.shared_scope(): records loaded earlier in the scope are reused"""
+
+    def __init__(self, inner, scope: db.Scope):
+        self.inner = inner
+        self.scope = scope
+
+    def fetch(self, entity: Entity, ids: List[str], spec: FieldSpec) -> Dict[str, Dict]:
+        fields = entity.select_list(spec)
+        memo = self.scope.records.setdefault(entity.name, {})
+        records: Dict[str, Dict] = {}
+        missing = []
+        for row_id in ids:
+            known = memo.get(row_id)
+            if known is not None and all(f in known for f in fields):
+                records[row_id] = {f: known[f] for f in fields}
+            else:
+                missing.append(row_id)
+        MEMO_CACHE.hits += len(ids) - len(missing)
+        MEMO_CACHE.misses += len(missing)
+        if missing:
+            for row_id, record in self.inner.fetch(entity, missing, spec).items():
+                # Loaders attach relations to the records they get back; keep the memo to plain columns
+                memo.setdefault(row_id, {}).update(record)
+                records[row_id] = record
+        return records
+
+    def associated_artists(self, table: str, key: str, owner_ids: List[str],
+                           spec: FieldSpec) -> Dict[str, List[Dict]]:
+        fields = set(ARTIST.select_list(spec))
+        memo = self.scope.links.setdefault(table, {})
+        missing = [o for o in owner_ids if o not in memo or not fields <= memo[o][0]]
+        if missing:
+            loaded = self.inner.associated_artists(table, key, missing, spec)
+            for owner_id in missing:
+                memo[owner_id] = (fields, loaded.get(owner_id, []))
+        return {o: memo[o][1] for o in owner_ids if memo[o][1]}
+
+
+# Set by snapshot.enable(): (entity, spec) -> snapshot able to serve them, or None
+snapshot_source: Optional[Callable[[Entity, FieldSpec], Optional[object]]] = None
+
+
+def _source(cursor, entity: Entity, spec: FieldSpec):
+    source = None
+    if snapshot_source is not None:
+        source = snapshot_source(entity, spec)
+        if source is not None:
+            SNAPSHOT_CACHE.hits += 1
+        else:
+            SNAPSHOT_CACHE.misses += 1
+    if source is None:
+        source = SqlSource(cursor)
+    scope = db.current_scope()
+    return MemoSource(source, scope) if scope is not None else source
+
+
+def load_artists(cursor, artist_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    ids = list(dict.fromkeys(artist_ids))
+    records = _source(cursor, ARTIST, spec).fetch(ARTIST, ids, spec)
+    return _in_order(ARTIST, records, ids, spec)
+
+
+def load_moods(cursor, mood_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    ids = list(dict.fromkeys(mood_ids))
+    records = _source(cursor, MOOD, spec).fetch(MOOD, ids, spec)
+    return _in_order(MOOD, records, ids, spec)
+
+
+def load_playlists(cursor, playlist_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    ids = list(dict.fromkeys(playlist_ids))
+    records = _source(cursor, PLAYLIST, spec).fetch(PLAYLIST, ids, spec)
+    return _in_order(PLAYLIST, records, ids, spec)
+
+
+def load_albums(cursor, album_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    """Albums in the given order with their artists batch-loaded"""
+    ids = list(dict.fromkeys(album_ids))
+    source = _source(cursor, ALBUM, spec)
+    records = source.fetch(ALBUM, ids, spec)
+    if 'artist' in spec or 'artists' in spec:
+        artist_spec = _union_spec(spec.get('artist'), spec.get('artists'))
+        _attach_artists(ALBUM, records, source.associated_artists(
+            'album_artists', 'albumId', list(records), artist_spec), spec)
+    return _in_order(ALBUM, records, ids, spec)
+
+
+def load_songs(cursor, song_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    """Songs in the given order (missing ids skipped), hydrated per the fieldset.
+
+    One query for the song columns plus at most one per requested relation,
+    however many songs are loaded.
+    """
+    ids = list(dict.fromkeys(song_ids))
+    source = _source(cursor, SONG, spec)
+    records = source.fetch(SONG, ids, spec)
+
+    if 'artist' in spec or 'artists' in spec:
+        artist_spec = _union_spec(spec.get('artist'), spec.get('artists'))
+        _attach_artists(SONG, records, source.associated_artists(
+            'song_artists', 'songId', list(records), artist_spec), spec)
+
+    if 'album' in spec:
+        album_ids = [r['albumId'] for r in records.values() if r.get('albumId')]
+        albums = {a['id']: a for a in load_albums(cursor, album_ids, _union_spec(spec['album'], {'id': None}))}
+        for record in records.values():
+            album = albums.get(record.get('albumId'))
+            record['album'] = _project(ALBUM, album, spec['album']) if album else None
+
+    if 'moods' in spec:
+        all_mood_ids = [m for r in records.values() for m in (r.get('moodIds') or [])]
+        moods = {m['id']: m for m in load_moods(cursor, all_mood_ids, _union_spec(spec['moods'], {'id': None}))}
+        for record in records.values():
+            record['moods'] = [_project(MOOD, moods[m], spec['moods'])
+                               for m in (record.get('moodIds') or []) if m in moods]
+
+    return _in_order(SONG, records, ids, spec)
+
+
+def load_moments(cursor, moment_ids: List[str], spec: FieldSpec) -> List[Dict]:
+    """Moments in the given order with their song and comments (oldest first) batch-loaded"""
+    ids = list(dict.fromkeys(moment_ids))
+    records = _source(cursor, MOMENT, spec).fetch(MOMENT, ids, spec)
+
+    if 'song' in spec:
+        song_ids = [r['songId'] for r in records.values() if r.get('songId')]
+        songs = {s['id']: s for s in load_songs(cursor, song_ids, _union_spec(spec['song'], {'id': None}))}
+        for record in records.values():
+            song = songs.get(record.get('songId'))
+            record['song'] = _project(SONG, song, spec['song']) if song else None
+
+    if 'comments' in spec:
+        fields = COMMENT.select_list(_union_spec(spec['comments'], {'momentId': None}))
+        select = ', '.join(COMMENT.columns[f][0] for f in fields)
+        to_record = COMMENT.row_mapper(fields)
+        by_moment: Dict[str, List[Dict]] = {}
+        for chunk in _chunks(list(records)):
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'''
+                SELECT {select} FROM moment_comments mc
+                WHERE mc.momentId IN ({placeholders}) ORDER BY mc.createdAt ASC
+            ''', chunk)
+            for row in cursor.fetchall():
+                comment = to_record(row)
+                by_moment.setdefault(comment['momentId'], []).append(_project(COMMENT, comment, spec['comments']))
+        for moment_id, record in records.items():
+            record['comments'] = by_moment.get(moment_id, [])
+
+    return _in_order(MOMENT, records, ids, spec)
+
+
+# Fields that describe an association (song/album -> artist) rather than the entity itself
+ASSOCIATION_FIELDS = ('isPrimary',)
+
+SHAPE_PATTERN = '^(nested|normalized)$'
+
+
+def _reference_key(field: str, many: bool) -> str:
+    # artist -> artistId, artists -> artistIds, moods -> moodIds
+    return (field[:-1] if field.endswith('s') else field) + ('Ids' if many else 'Id')
+
+
+def _normalize_record(entity: Entity, record: Dict, tables: Dict[str, Dict[str, Dict]],
+                      seen: Dict[str, Dict[str, set]]) -> Dict:
+    """Replace embedded relations by ids, collecting each related entity once in tables"""
+    out = {}
+    for field, value in record.items():
+        if field not in entity.relations:
+            out[field] = value
+            continue
+        target = ENTITIES[entity.relations[field]]
+        table_name = target.name + 's'
+        table = tables.setdefault(table_name, {})
+        seen_keys = seen.setdefault(table_name, {})
+        related = value if isinstance(value, list) else ([value] if value else [])
+        for item in related:
+            # Popular artists repeat across a page; only normalize projections not seen yet
+            keys = seen_keys.get(item['id'])
+            if keys is not None and item.keys() <= keys:
+                continue
+            normalized = _normalize_record(target, item, tables, seen)
+            for association_field in ASSOCIATION_FIELDS:
+                normalized.pop(association_field, None)
+            # The same entity may arrive with different projections (e.g. card artist vs. album artist)
+            table.setdefault(item['id'], {}).update(normalized)
+            seen_keys[item['id']] = set(item.keys()) | (keys or set())
+        ids = [item['id'] for item in related]
+        out[_reference_key(field, isinstance(value, list))] = ids if isinstance(value, list) else (ids[0] if ids else None)
+    return out
+
+
+def normalize(entity_name: str, records: List[Dict]) -> Dict:
+    """Entity-table shape: records reference related entities by id; each entity is serialized once.
+
+    ``normalize('song', songs)`` returns ``{"songs": [...], "artists": {id: artist},
+    "albums": {id: album}, "moods": {id: mood}}`` (only the tables the fieldset touches).
+    """
+    entity = ENTITIES[entity_name]
+    tables: Dict[str, Dict[str, Dict]] = {}
+    seen: Dict[str, Dict[str, set]] = {}
+    refs = [_normalize_record(entity, record, tables, seen) for record in records]
+    return {entity_name + 's': refs, **tables}
+
+
+def normalize_sections(sections: Dict[str, Tuple[str, List[Dict]]]) -> Dict:
+    """Several result lists sharing one set of entity maps.
+
+    ``sections`` maps a section name to (entity name, records). Returns the ids
+    of each section in order (``songs`` -> ``songIds``) plus one map per entity
+    table, holding every listed or embedded entity once:
+    ``{"songIds": [...], "artistIds": [...], "songs": {id: song}, "artists": {id: artist}, ...}``.
+    """
+    tables: Dict[str, Dict[str, Dict]] = {}
+    seen: Dict[str, Dict[str, set]] = {}
+    ids: Dict[str, List[str]] = {}
+    for section, (entity_name, records) in sections.items():
+        entity = ENTITIES[entity_name]
+        table = tables.setdefault(entity_name + 's', {})
+        for record in records:
+            table.setdefault(record['id'], {}).update(_normalize_record(entity, record, tables, seen))
+        ids[_reference_key(section, True)] = [record['id'] for record in records]
+    return {**ids, **tables}
+
+
+def shape_records(entity_name: str, records: List[Dict], shape: str = 'nested'):
+    """Records as returned by the loaders, or normalized when ?shape=normalized"""
+    if shape == 'normalized':
+        return normalize(entity_name, records)
+    return records
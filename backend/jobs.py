@@ -0,0 +1,80 @@
+"""Minimal periodic background jobs.
+
+Each job runs on its own daemon thread so the blocking sqlite work it does
+never runs on the event loop.
+
+With several worker processes (see serve.py) every worker starts the same
+jobs. Work on the shared database should be done once, not once per
+worker: after ``share()``, ``run_exclusive()`` (and jobs started with
+``exclusive=True``) take a non-blocking file lock next to the database and
+skip the run when another worker holds it. A worker that dies releases its
+locks, so another one takes over at its next run.
+"""
+import threading
+import time
+import traceback
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no file locks (Windows): single process only
+    fcntl = None
+
+import db
+
+_jobs: Dict[str, threading.Thread] = {}
+_stop = threading.Event()
+_shared = False
+
+
+def share():
+    """Make exclusive work run in one worker process at a time"""
+    global _shared
+    _shared = fcntl is not None
+
+
+def run_exclusive(name: str, fn: Callable[[], None]) -> bool:
+    """Run fn unless another worker is running the work called name; True if it ran"""
+    if not _shared:
+        fn()
+        return True
+    with open(f'{db.DB_PATH}.{name}.lock', 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            fn()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return True
+
+
+def start_periodic(name: str, interval: float, fn: Callable[[], None], initial_delay: float = 0,
+                   exclusive: bool = False):
+    """Run fn every interval seconds in a daemon thread (once per name)"""
+    if name in _jobs:
+        return
+
+    def loop():
+        if _stop.wait(initial_delay):
+            return
+        while not _stop.is_set():
+            started = time.monotonic()
+            try:
+                if exclusive:
+                    run_exclusive(name, fn)
+                else:
+                    fn()
+            except Exception:
+                print(f"Background job {name} failed:")
+                traceback.print_exc()
+            _stop.wait(max(0, interval - (time.monotonic() - started)))
+
+    thread = threading.Thread(target=loop, name=f"job-{name}", daemon=True)
+    _jobs[name] = thread
+    thread.start()
+
+
+def stop_all():
+    _stop.set()
@@ -0,0 +1,205 @@
+"""Session co-listening model for "up next" recommendations.
+
+Plays recorded with an anonymous client session id are appended to
+``play_events``. A background job folds consecutive plays of each session
+into ``song_transitions`` (decayed counts of song A being followed by song
+B) and keeps a compact in-memory index of the top successors per song.
+"""
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Tuple
+
+import jobs
+
+# Two plays further apart than this are not treated as "played next"
+SESSION_GAP_SECONDS = 30 * 60
+# Transition weights halve every HALF_LIFE_DAYS without new plays
+HALF_LIFE_DAYS = 30
+# Successors kept per song in the in-memory index
+TOP_SUCCESSORS = 20
+# Play events folded into the matrix per transaction
+BATCH_SIZE = 5000
+# Processed play events older than this are pruned
+EVENT_RETENTION_SECONDS = 24 * 60 * 60
+
+STATE_KEY = 'listening.lastEventId'
+
+
+def decay_factor(age_seconds: float) -> float:
+    if age_seconds <= 0:
+        return 1.0
+    return 0.5 ** (age_seconds / (HALF_LIFE_DAYS * 86400))
+
+
+def record_play_event(cursor, session_id: str, song_id: str):
+    """Append a play to the session log; folded into transitions by the background job"""
+    cursor.execute('''
+        INSERT INTO play_events (sessionId, songId, playedAt)
+        VALUES (?, ?, ?)
+    ''', (session_id, song_id, time.time()))
+
+
+def fold_play_events(db_path: str = 'music.db') -> int:
+    """Fold unprocessed play events into song_transitions.
+
+    Runs inside one IMMEDIATE transaction that also advances the processed
+    event id, so concurrent runs (e.g. several workers) never count an event
+    twice. Returns the number of events processed.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT value FROM app_state WHERE key = ?', (STATE_KEY,))
+        state = cursor.fetchone()
+        last_id = int(state[0]) if state else 0
+
+        cursor.execute('''
+            SELECT id, sessionId, songId, playedAt FROM play_events
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, BATCH_SIZE))
+        events = cursor.fetchall()
+        if not events:
+            cursor.execute('COMMIT')
+            return 0
+
+        # Last play of each session seen so far, seeded lazily from already processed events
+        previous: Dict[str, Tuple[str, float]] = {}
+        counts: Dict[Tuple[str, str], float] = {}
+        for event_id, session_id, song_id, played_at in events:
+            if session_id not in previous:
+                cursor.execute('''
+                    SELECT songId, playedAt FROM play_events
+                    WHERE sessionId = ? AND id < ? ORDER BY id DESC LIMIT 1
+                ''', (session_id, event_id))
+                prev_row = cursor.fetchone()
+                if prev_row:
+                    previous[session_id] = (prev_row[0], prev_row[1])
+
+            prev = previous.get(session_id)
+            if prev and prev[0] != song_id and played_at - prev[1] <= SESSION_GAP_SECONDS:
+                pair = (prev[0], song_id)
+                counts[pair] = counts.get(pair, 0) + 1
+            previous[session_id] = (song_id, played_at)
+
+        now = time.time()
+        if counts:
+            from_ids = list({pair[0] for pair in counts})
+            existing: Dict[Tuple[str, str], Tuple[float, float]] = {}
+            for i in range(0, len(from_ids), 500):
+                chunk = from_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT fromSongId, toSongId, weight, updatedAt FROM song_transitions
+                    WHERE fromSongId IN ({placeholders})
+                ''', chunk)
+                for from_id, to_id, weight, updated_at in cursor.fetchall():
+                    existing[(from_id, to_id)] = (weight, updated_at)
+
+            rows = []
+            for pair, count in counts.items():
+                weight, updated_at = existing.get(pair, (0.0, now))
+                rows.append((pair[0], pair[1], weight * decay_factor(now - updated_at) + count, now))
+            cursor.executemany('''
+                INSERT INTO song_transitions (fromSongId, toSongId, weight, updatedAt)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(fromSongId, toSongId) DO UPDATE SET weight = excluded.weight, updatedAt = excluded.updatedAt
+            ''', rows)
+
+        cursor.execute('''
+            INSERT INTO app_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (STATE_KEY, str(events[-1][0])))
+        cursor.execute('DELETE FROM play_events WHERE id <= ? AND playedAt < ?',
+                       (events[-1][0], now - EVENT_RETENTION_SECONDS))
+        cursor.execute('COMMIT')
+        return len(events)
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+class TransitionIndex:
+    """Top successors per song, stored as parallel arrays of interned song indexes.
+
+    Song ids are interned once into ``_ids``; each song's successors are an
+    ``array('I')`` of indexes plus an ``array('f')`` of decayed weights.
+    """
+
+    def __init__(self, db_path: str = 'music.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._index_of: Dict[str, int] = {}
+        self._successors: Dict[int, Tuple[array, array]] = {}
+        self._synced_at = None
+
+    def _intern(self, song_id: str) -> int:
+        idx = self._index_of.get(song_id)
+        if idx is None:
+            idx = len(self._ids)
+            self._ids.append(song_id)
+            self._index_of[song_id] = idx
+        return idx
+
+    def refresh(self):
+        """Reload successors of every song whose transitions changed since the last refresh"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        started = time.time()
+
+        if self._synced_at is None:
+            cursor.execute('SELECT fromSongId, toSongId, weight, updatedAt FROM song_transitions')
+        else:
+            # Small overlap so rows committed while the last refresh ran are not missed
+            cursor.execute('''
+                SELECT fromSongId, toSongId, weight, updatedAt FROM song_transitions
+                WHERE fromSongId IN (
+                    SELECT DISTINCT fromSongId FROM song_transitions WHERE updatedAt >= ?
+                )
+            ''', (self._synced_at - 5,))
+        rows = cursor.fetchall()
+        conn.close()
+
+        grouped: Dict[str, List[Tuple[float, str]]] = {}
+        for from_id, to_id, weight, updated_at in rows:
+            grouped.setdefault(from_id, []).append((weight * decay_factor(started - updated_at), to_id))
+
+        with self._lock:
+            for from_id, successors in grouped.items():
+                successors.sort(reverse=True)
+                top = successors[:TOP_SUCCESSORS]
+                self._successors[self._intern(from_id)] = (
+                    array('I', (self._intern(to_id) for _, to_id in top)),
+                    array('f', (weight for weight, _ in top)),
+                )
+            self._synced_at = started
+
+    def successors(self, song_id: str, limit: int) -> List[Tuple[str, float]]:
+        idx = self._index_of.get(song_id)
+        if idx is None:
+            return []
+        entry = self._successors.get(idx)
+        if not entry:
+            return []
+        song_indexes, weights = entry
+        return [(self._ids[i], w) for i, w in zip(song_indexes[:limit], weights[:limit])]
+
+
+transitions = TransitionIndex()
+
+
+def fold_all_play_events():
+    while fold_play_events() == BATCH_SIZE:
+        pass
+
+
+def run_listening_job():
+    # The shared matrix is updated by one worker; each worker reloads its own index
+    jobs.run_exclusive('listening', fold_all_play_events)
+    transitions.refresh()
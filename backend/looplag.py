@@ -0,0 +1,186 @@
+"""Event loop watchdog: measures loop lag and reports what blocks the loop.
+
+A heartbeat task sleeps ``INTERVAL`` seconds at a time on the event loop;
+how late it wakes up is the loop lag, recorded in a histogram. A watchdog
+thread checks the heartbeat: once it is ``threshold_ms`` overdue, the loop
+is stalled by something running on it without awaiting, typically an
+``async def`` handler doing sqlite3 or file I/O. The watchdog then takes the
+loop thread's stack, which at that moment is the blocking coroutine's, and
+attributes it to a route: the route whose endpoint is on the stack, or the
+request the running task handles (tracked by profiler.ProfilerMiddleware).
+When the heartbeat resumes, the stall is logged as one line (duration,
+route, innermost frame), counted per route on ``/metrics``, and kept with
+its whole stack (the last ``RECENT``) for ``GET /api/admin/loop``.
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import metrics
+import profiler
+
+# Stall durations are measured to within one interval
+INTERVAL = 0.025
+DEFAULT_THRESHOLD_MS = 100
+RECENT = 100
+STACK_DEPTH = 30
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+NO_ROUTE = 'none'
+
+
+class RouteStalls:
+    __slots__ = ('count', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {"count": self.count, "totalMs": round(self.seconds * 1000, 1), "maxMs": round(self.max_seconds * 1000, 1)}
+
+
+def _stack(frame) -> List[str]:
+    """Frames of a stack, outermost first, with the line each one is at"""
+    frames = []
+    while frame is not None and len(frames) < STACK_DEPTH:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class Watchdog:
+    def __init__(self, routes, threshold_ms: float = DEFAULT_THRESHOLD_MS, interval: float = INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.endpoints = profiler.endpoint_codes(routes)
+        self.lag = metrics.Histogram(LAG_BUCKETS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.routes: Dict[str, RouteStalls] = {}
+        self.stalls: Deque[Dict] = deque(maxlen=RECENT)
+        self._beat = time.monotonic()
+        self._stall: Optional[Dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Call from the event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = self._loop.create_task(self._heartbeat())
+        profiler.track_requests()
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    def stop(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+        profiler.untrack_requests()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lag.observe(lag)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self._beat = now
+
+    def _watch(self):
+        poll = max(self.threshold / 4, 0.01)
+        while not self._stop.wait(poll):
+            beat = self._beat
+            if self._stall is None:
+                if time.monotonic() - beat - self.interval >= self.threshold:
+                    self._stall = self._capture(beat)
+            elif beat != self._stall["beat"]:
+                stall, self._stall = self._stall, None
+                self._record(stall, beat - stall["beat"] - self.interval)
+
+    def _capture(self, beat: float) -> Dict:
+        frame = sys._current_frames().get(self._loop_thread)
+        route = None
+        scan = frame
+        while scan is not None and route is None:
+            route = self.endpoints.get(scan.f_code)
+            scan = scan.f_back
+        if route is None and self._loop is not None:
+            route = profiler.request_route(self._loop)
+        return {"beat": beat, "at": time.time(), "route": route, "stack": _stack(frame)}
+
+    def _record(self, stall: Dict, seconds: float):
+        route = stall["route"] or NO_ROUTE
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStalls()
+        stats.count += 1
+        stats.seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        entry = {"at": stall["at"], "route": route, "ms": round(seconds * 1000, 1), "stack": stall["stack"]}
+        self.stalls.append(entry)
+        # One line per stall; the stack is only in GET /api/admin/loop
+        at = f" at {stall['stack'][-1]}" if stall["stack"] else ''
+        print(f"Event loop blocked for {entry['ms']:.0f} ms by {route}{at}")
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": not self._stop.is_set(),
+            "intervalMs": self.interval * 1000,
+            "thresholdMs": self.threshold * 1000,
+            "lastLagMs": round(self.last_lag * 1000, 2),
+            "maxLagMs": round(self.max_lag * 1000, 2),
+            "routes": {route: stats.as_dict() for route, stats in
+                       sorted(self.routes.items(), key=lambda item: item[1].seconds, reverse=True)},
+            "stalls": list(reversed(self.stalls)),
+        }
+
+
+watchdog: Optional[Watchdog] = None
+
+
+def start(routes, threshold_ms: float = DEFAULT_THRESHOLD_MS):
+    """Start the watchdog for the running loop (once)"""
+    global watchdog
+    if watchdog is None:
+        watchdog = Watchdog(routes, threshold_ms)
+        watchdog.start()
+
+
+def stop():
+    if watchdog is not None:
+        watchdog.stop()
+
+
+def stats() -> Dict:
+    if watchdog is None:
+        return {"enabled": False}
+    return watchdog.stats()
+
+
+def _metric_lines() -> List[str]:
+    if watchdog is None:
+        return []
+    routes = list(watchdog.routes.items())
+    lines = metrics.histogram_family('event_loop_lag_seconds', 'How late the event loop heartbeat woke up',
+                                     [({}, watchdog.lag)])
+    lines += metrics.family('event_loop_stalls_total', 'counter', 'Event loop stalls over the threshold, by route',
+                            (({"route": route}, stats.count) for route, stats in routes))
+    lines += metrics.family('event_loop_stall_seconds_total', 'counter', 'Time the event loop was stalled, by route',
+                            (({"route": route}, stats.seconds) for route, stats in routes))
+    return lines
+
+
+metrics.register_collector(_metric_lines)
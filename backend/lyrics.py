@@ -0,0 +1,159 @@
+"""LRC lyrics helpers: parsing into timed lines, stripping and tokenizing."""
+import json
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+# [mm:ss], [mm:ss.xx], [mm:ss:xx]
+TIMESTAMP_RE = re.compile(r'\[\d{1,3}:\d{1,2}(?:[.:]\d{1,3})?\]')
+# One or more leading timestamps followed by the line text
+TIMED_LINE_RE = re.compile(r'^((?:\[\d{1,3}:\d{1,2}(?:[.:]\d{1,3})?\])+)(.*)$')
+TIMESTAMP_PARTS_RE = re.compile(r'\[(\d{1,3}):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+# Spacing used for lyrics without timestamps, same as the player's fallback
+PLAIN_LINE_INTERVAL_MS = 10000
+# [ar:...], [ti:...], [offset:...] and other ID tags
+ID_TAG_RE = re.compile(r'^\[[a-zA-Z#]+:[^\]]*\]$')
+# "作词 : xxx", "Composer: xxx" credit lines at the top of imported lyrics
+CREDIT_RE = re.compile(
+    r'^\s*(作词|作曲|编曲|制作人|制作|监制|混音|母带|和声|吉他|贝斯|鼓|弦乐|录音|出品|发行|'
+    r'lyricist|lyrics|composer|arranger|producer|mixing|mastering)\s*[:：]',
+    re.IGNORECASE
+)
+# CJK unified ideographs, kana and hangul; segmented into character bigrams
+CJK_RUN_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+LATIN_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = {
+    'the', 'and', 'you', 'for', 'are', 'but', 'not', 'all', 'can', 'was', 'that', 'with',
+    'this', 'have', 'from', 'your', 'what', 'when', 'will', 'just', 'don\'t', 'i\'m',
+    'it\'s', 'me', 'my', 'to', 'in', 'on', 'of', 'is', 'it', 'be', 'so', 'do', 'no', 'oh',
+    'yeah', 'la', 'na', 'ah', 'ooh', 'woo',
+}
+
+
+def lyric_text_lines(lyrics: str) -> List[str]:
+    """Plain text lines of an LRC document, without timestamps, ID tags or credits"""
+    if not lyrics:
+        return []
+    lines = []
+    for raw in lyrics.splitlines():
+        line = raw.strip()
+        if not line or ID_TAG_RE.match(line):
+            continue
+        line = TIMESTAMP_RE.sub('', line).strip()
+        if not line or CREDIT_RE.match(line):
+            continue
+        lines.append(line)
+    return lines
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize mixed CJK/Latin text.
+
+    Latin text is split into lowercase words; runs of CJK characters are
+    split into overlapping character bigrams (a single character stays a
+    unigram), which works without a segmentation dictionary.
+    """
+    tokens = []
+    lowered = text.lower()
+    for word in LATIN_WORD_RE.findall(lowered):
+        if len(word) > 1 and word not in STOPWORDS and not word.isdigit():
+            tokens.append(word)
+    for run in CJK_RUN_RE.findall(lowered):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def tokenize_lyrics(lyrics: str) -> List[str]:
+    return tokenize('\n'.join(lyric_text_lines(lyrics)))
+
+
+def parse_lrc(lyrics: str) -> Optional[Dict]:
+    """Parse LRC text into the compact timed-line form stored in song_lyrics.
+
+    Returns ``{"t": [ms, ...], "l": [text, ...]}`` with ``t`` sorted so a
+    playback position can be located with a binary search. Lines sharing a
+    timestamp are merged: the first is the original, the rest its
+    translation, kept in a parallel ``"tr"`` list (only present when any
+    line has one). Lyrics without timestamps get evenly spaced times and
+    ``"timed": false``.
+    """
+    if not lyrics or not lyrics.strip():
+        return None
+
+    texts_by_time: Dict[int, List[str]] = {}
+    plain_lines = []
+    for raw in lyrics.splitlines():
+        line = raw.strip()
+        if not line or ID_TAG_RE.match(line):
+            continue
+        match = TIMED_LINE_RE.match(line)
+        if not match:
+            plain_lines.append(line)
+            continue
+        text = match.group(2).strip()
+        if not text:
+            continue
+        for minutes, seconds, fraction in TIMESTAMP_PARTS_RE.findall(match.group(1)):
+            ms = (int(minutes) * 60 + int(seconds)) * 1000 + int((fraction or '0').ljust(3, '0')[:3])
+            texts_by_time.setdefault(ms, []).append(text)
+
+    if not texts_by_time:
+        return {
+            "t": [i * PLAIN_LINE_INTERVAL_MS for i in range(len(plain_lines))],
+            "l": plain_lines,
+            "timed": False,
+        }
+
+    times = sorted(texts_by_time)
+    parsed = {"t": times, "l": [texts_by_time[t][0] for t in times]}
+    translations = [' / '.join(texts_by_time[t][1:]) for t in times]
+    if any(translations):
+        parsed["tr"] = translations
+    return parsed
+
+
+def serialize_parsed_lyrics(parsed: Optional[Dict]) -> Optional[str]:
+    if parsed is None:
+        return None
+    return json.dumps(parsed, ensure_ascii=False, separators=(',', ':'))
+
+
+def lyric_line_at(parsed: Dict, at_ms: int) -> int:
+    """Index of the line playing at at_ms, or -1 before the first line"""
+    return bisect_right(parsed["t"], at_ms) - 1
+
+
+def lyrics_payload(song_id: str, parsed: Optional[Dict], at_ms: Optional[int] = None, window: int = 5) -> Dict:
+    """API shape: lines with time in seconds, optionally only a window around at_ms"""
+    times = parsed["t"] if parsed else []
+    texts = parsed["l"] if parsed else []
+    translations = parsed.get("tr") if parsed else None
+
+    start, end = 0, len(times)
+    current = None
+    if at_ms is not None:
+        current = lyric_line_at(parsed, at_ms) if parsed else -1
+        start = max(0, current - window)
+        end = min(len(times), max(current, 0) + window + 1)
+
+    lines = []
+    for i in range(start, end):
+        line = {"time": times[i] / 1000, "text": texts[i]}
+        if translations and translations[i]:
+            line["translation"] = translations[i]
+        lines.append(line)
+
+    payload = {
+        "songId": song_id,
+        "timed": bool(parsed) and parsed.get("timed", True),
+        "total": len(times),
+        "startIndex": start,
+        "lines": lines,
+    }
+    if current is not None:
+        payload["currentIndex"] = current
+    return payload
@@ -0,0 +1,182 @@
+"""Lyrics-content similarity index.
+
+A background job tokenizes ``songs.lyrics`` (see lyrics.py), builds a
+sparse TF-IDF matrix and precomputes, per song, its top lyric neighbours
+by cosine similarity and its most distinctive keywords. Results are stored
+in ``song_lyric_index`` so every worker serves the same data, and the
+keywords are kept in memory as an extra ranking signal for search.
+"""
+import heapq
+import json
+import math
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import jobs
+from lyrics import tokenize, tokenize_lyrics
+
+TOP_NEIGHBORS = 20
+TOP_KEYWORDS = 10
+# Only the strongest terms of each song take part in similarity
+MAX_TERMS_PER_SONG = 64
+# Terms found in more than this share of songs carry no signal
+MAX_DF_RATIO = 0.5
+MIN_SIMILARITY = 0.05
+
+SIGNATURE_KEY = 'lyrics.signature'
+
+
+def catalog_signature(cursor) -> str:
+    """Cheap fingerprint of the lyrics column; changes on any song insert, update or delete"""
+    cursor.execute('SELECT COUNT(*), MAX(updatedAt), TOTAL(LENGTH(lyrics)) FROM songs')
+    return json.dumps(cursor.fetchone())
+
+
+def build_lyrics_index(docs: List[Tuple[str, List[str]]]) -> Dict[str, Dict]:
+    """Compute keywords and nearest neighbours for tokenized documents.
+
+    Term frequencies are sublinear (1 + log tf), idf is smoothed, and each
+    song vector is L2-normalized, so the dot product of two vectors is their
+    cosine similarity. Dot products are accumulated through an inverted
+    index, touching only pairs of songs that share a term.
+    """
+    n = len(docs)
+    vocab: Dict[str, int] = {}
+    terms: List[str] = []
+    df = array('I')
+    term_counts = []
+    for _, tokens in docs:
+        counts = Counter()
+        for token in tokens:
+            term_id = vocab.get(token)
+            if term_id is None:
+                term_id = vocab[token] = len(terms)
+                terms.append(token)
+                df.append(0)
+            counts[term_id] += 1
+        for term_id in counts:
+            df[term_id] += 1
+        term_counts.append(counts)
+
+    idf = [math.log((1 + n) / (1 + d)) + 1 for d in df]
+    max_df = max(2, int(n * MAX_DF_RATIO))
+
+    vectors: List[List[Tuple[int, float]]] = []
+    postings: Dict[int, List[Tuple[int, float]]] = {}
+    for doc_index, counts in enumerate(term_counts):
+        weighted = [(term_id, (1 + math.log(count)) * idf[term_id]) for term_id, count in counts.items()]
+        weighted.sort(key=lambda item: item[1], reverse=True)
+        norm = math.sqrt(sum(w * w for _, w in weighted)) or 1.0
+        vector = [(term_id, w / norm) for term_id, w in weighted[:MAX_TERMS_PER_SONG]]
+        vectors.append(vector)
+        for term_id, w in vector:
+            if 1 < df[term_id] <= max_df:
+                postings.setdefault(term_id, []).append((doc_index, w))
+
+    index = {}
+    for doc_index, (song_id, _) in enumerate(docs):
+        vector = vectors[doc_index]
+        scores: Dict[int, float] = {}
+        for term_id, w in vector:
+            for other, other_w in postings.get(term_id, ()):
+                if other != doc_index:
+                    scores[other] = scores.get(other, 0.0) + w * other_w
+        top = heapq.nlargest(TOP_NEIGHBORS, scores.items(), key=lambda item: item[1])
+        index[song_id] = {
+            "keywords": [terms[term_id] for term_id, _ in vector[:TOP_KEYWORDS]],
+            "neighbors": [[docs[other][0], round(score, 4)] for other, score in top if score >= MIN_SIMILARITY],
+        }
+    return index
+
+
+def rebuild_lyrics_index(db_path: str = 'music.db') -> bool:
+    """Rebuild song_lyric_index if the lyrics changed; returns True when rebuilt"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    cursor = conn.cursor()
+    try:
+        signature = catalog_signature(cursor)
+        cursor.execute('SELECT value FROM app_state WHERE key = ?', (SIGNATURE_KEY,))
+        state = cursor.fetchone()
+        if state and state[0] == signature:
+            return False
+
+        cursor.execute("SELECT id, lyrics FROM songs WHERE lyrics IS NOT NULL AND lyrics != ''")
+        docs = [(song_id, tokenize_lyrics(text)) for song_id, text in cursor.fetchall()]
+        docs = [(song_id, tokens) for song_id, tokens in docs if tokens]
+        index = build_lyrics_index(docs)
+
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('DELETE FROM song_lyric_index')
+        cursor.executemany('''
+            INSERT INTO song_lyric_index (songId, keywords, neighbors) VALUES (?, ?, ?)
+        ''', [
+            (song_id, json.dumps(entry["keywords"], ensure_ascii=False), json.dumps(entry["neighbors"]))
+            for song_id, entry in index.items()
+        ])
+        cursor.execute('''
+            INSERT INTO app_state (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (SIGNATURE_KEY, signature))
+        cursor.execute('COMMIT')
+        return True
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+class LyricsKeywords:
+    """In-memory keyword -> songs map used to rank search results"""
+
+    def __init__(self, db_path: str = 'music.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._songs_by_keyword: Dict[str, List[str]] = {}
+
+    def refresh(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT value FROM app_state WHERE key = ?', (SIGNATURE_KEY,))
+        state = cursor.fetchone()
+        signature = state[0] if state else None
+        if signature == self._signature:
+            conn.close()
+            return
+
+        songs_by_keyword: Dict[str, List[str]] = {}
+        cursor.execute('SELECT songId, keywords FROM song_lyric_index')
+        for song_id, keywords in cursor.fetchall():
+            for keyword in json.loads(keywords or '[]'):
+                songs_by_keyword.setdefault(keyword, []).append(song_id)
+        conn.close()
+
+        with self._lock:
+            self._songs_by_keyword = songs_by_keyword
+            self._signature = signature
+
+    def match(self, query: str) -> Dict[str, float]:
+        """Share of the query's tokens found in each song's lyric keywords"""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return {}
+        songs_by_keyword = self._songs_by_keyword
+        hits: Dict[str, int] = {}
+        for token in tokens:
+            for song_id in songs_by_keyword.get(token, ()):
+                hits[song_id] = hits.get(song_id, 0) + 1
+        return {song_id: count / len(tokens) for song_id, count in hits.items()}
+
+
+lyrics_keywords = LyricsKeywords()
+
+
+def run_lyrics_job():
+    # The stored index is rebuilt by one worker; each worker reloads its own keywords
+    jobs.run_exclusive('lyrics-index', rebuild_lyrics_index)
+    lyrics_keywords.refresh()
@@ -1,14 +1,16 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, status
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, status, Query, Path
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import sqlite3
 import json
 import jwt
 import hashlib
+import hmac
 import uuid
 import os
 import shutil
@@ -19,6 +21,30 @@ import yaml
 
 # Import user routes
 from user import router as user_router
+import catalog
+import jobs
+import listening
+import lyrics_index
+from lyrics import parse_lrc, serialize_parsed_lyrics
+from fields import (
+    PROJECTIONS, parse_fields, load_songs, load_albums, load_artists, load_playlists, load_moods, load_moments
+)
+from streaming import paged_listing, Filters, STREAM_PATTERN, MAX_PAGE_SIZE
+from encoding import EncodedRoute
+import bulk
+import counters
+import changelog
+import snapshot
+import coalesce
+import pubsub
+import db
+import metrics
+import sqltrace
+import profiler
+import memory
+import looplag
+import capture
+import serve
 
 # Load config
 try:
@@ -28,6 +54,8 @@ except FileNotFoundError:
     config = {}
 
 app = FastAPI(title="Self-Music API", version="1.0.0")
+# Encode plain return values with the negotiated fast encoder (see encoding.py)
+app.router.route_class = EncodedRoute
 security = HTTPBearer()
 
 SECRET_KEY = config.get('jwt_secret', "your-secret-key-change-this-in-production")
@@ -41,10 +69,66 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so request metrics include the other middleware (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+METRICS_CONFIG = config.get('metrics', {})
+if METRICS_CONFIG.get('enabled', False):
+    metrics.enable()
+    if not METRICS_CONFIG.get('token'):
+        print("Warning: metrics.token is not set, GET /metrics is readable by any client")
+app.add_middleware(profiler.ProfilerMiddleware)
+# Dev mode: slow-query log and N+1 detection per request, see sqltrace.py
+app.add_middleware(sqltrace.SQLTraceMiddleware)
+SQLTRACE_CONFIG = config.get('sqltrace', {})
+if SQLTRACE_CONFIG.get('enabled'):
+    sqltrace.enable(SQLTRACE_CONFIG.get('slow_ms', sqltrace.DEFAULT_SLOW_MS),
+                    SQLTRACE_CONFIG.get('nplus1_threshold', sqltrace.DEFAULT_NPLUS1_THRESHOLD))
+# Opt-in sampled, anonymized request log for benchmarks/replay.py, see capture.py
+app.add_middleware(capture.CaptureMiddleware)
+CAPTURE_CONFIG = config.get('capture', {})
+if CAPTURE_CONFIG.get('enabled'):
+    capture.enable(CAPTURE_CONFIG.get('path', capture.DEFAULT_PATH),
+                   CAPTURE_CONFIG.get('sample_rate', capture.DEFAULT_SAMPLE_RATE),
+                   SECRET_KEY.encode(),
+                   CAPTURE_CONFIG.get('redact_params', []),
+                   CAPTURE_CONFIG.get('max_mb', capture.DEFAULT_MAX_MB))
 
 # Include user routes (no authentication required)
 app.include_router(user_router)
 
+@app.on_event("startup")
+async def start_background_jobs():
+    # Several worker processes share the catalog version, live events and database jobs, see serve.py
+    if serve.worker_count() > 1:
+        catalog.share()
+        jobs.share()
+        pubsub.hub.relay()
+    jobs.start_periodic("listening", 30, listening.run_listening_job)
+    jobs.start_periodic("lyrics-index", 60, lyrics_index.run_lyrics_job)
+    jobs.start_periodic("counters", counters.RECONCILE_INTERVAL, counters.run_reconcile_job, exclusive=True)
+    jobs.start_periodic("changelog", changelog.COMPACT_INTERVAL, changelog.run_compact_job, exclusive=True)
+    memory.install()
+    jobs.start_periodic("memory", memory.SAMPLE_INTERVAL, memory.sample)
+    # Reports handlers that block the event loop, see looplag.py
+    watchdog_config = config.get('loop_watchdog', {})
+    if watchdog_config.get('enabled', False):
+        looplag.start(app.routes, watchdog_config.get('threshold_ms', looplag.DEFAULT_THRESHOLD_MS))
+    # Optional in-memory catalog snapshot for read endpoints, see snapshot.py
+    if config.get('snapshot', {}).get('enabled'):
+        snapshot.enable()
+        if serve.worker_count() > 1:
+            snapshot.share()
+        jobs.start_periodic("snapshot", snapshot.REFRESH_INTERVAL, snapshot.refresh)
+    if capture.enabled:
+        jobs.start_periodic("capture", capture.FLUSH_INTERVAL, capture.flush)
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    jobs.stop_all()
+    looplag.stop()
+    pubsub.hub.stop_relay()
+    capture.flush()
+
 # Database Models
 class Artist(BaseModel):
     id: Optional[str] = None
@@ -201,6 +285,10 @@ class CheckExistsRequest(BaseModel):
 class PlaylistReorder(BaseModel):
     songIds: List[str]
 
+class BulkRequest(BaseModel):
+    operations: List[bulk.BulkOperation]
+    atomic: bool = True
+
 # Music Moments models
 class MomentComment(BaseModel):
     id: Optional[str] = None
@@ -388,6 +476,90 @@ def init_db():
         )
     ''')
     
+    # Key/value state shared by background jobs
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # Anonymous session play log, folded into song_transitions by the listening job
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS play_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sessionId TEXT NOT NULL,
+            songId TEXT NOT NULL,
+            playedAt REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_play_events_session ON play_events (sessionId, id)')
+
+    # Song-to-song "played next" counts with time decay
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS song_transitions (
+            fromSongId TEXT NOT NULL,
+            toSongId TEXT NOT NULL,
+            weight REAL DEFAULT 0,
+            updatedAt REAL NOT NULL,
+            PRIMARY KEY (fromSongId, toSongId)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_song_transitions_updated ON song_transitions (updatedAt)')
+    
+    # Precomputed lyric keywords and lyric-similar songs, rebuilt by the lyrics job
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS song_lyric_index (
+            songId TEXT PRIMARY KEY,
+            keywords TEXT,
+            neighbors TEXT
+        )
+    ''')
+    
+    # Lyrics parsed into timed lines once on write, served by /api/songs/{id}/lyrics
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS song_lyrics (
+            songId TEXT PRIMARY KEY,
+            parsed TEXT,
+            updatedAt TEXT,
+            FOREIGN KEY (songId) REFERENCES songs (id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # songs.moodIds as rows, so listings can filter by mood through an index
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS song_moods (
+            songId TEXT NOT NULL,
+            moodId TEXT NOT NULL,
+            PRIMARY KEY (songId, moodId),
+            FOREIGN KEY (songId) REFERENCES songs (id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Indexes behind the admin listing filters and sort orders
+    for table, columns in (
+        ('songs', 'createdAt'), ('songs', 'title'), ('songs', 'playCount'),
+        ('songs', 'artistId'), ('songs', 'albumId'), ('songs', 'genre'),
+        ('song_artists', 'artistId, songId'), ('album_artists', 'artistId, albumId'),
+        ('song_moods', 'moodId, songId'),
+        ('albums', 'createdAt'), ('albums', 'title'), ('albums', 'releaseDate'), ('albums', 'genre'),
+        ('artists', 'createdAt'), ('artists', 'songCount'), ('artists', 'followers'),
+        ('playlists', 'createdAt'), ('playlists', 'name'), ('playlists', 'playCount'),
+        ('music_moments', 'createdAt'), ('music_moments', 'likeCount'), ('music_moments', 'songId'),
+        ('moment_comments', 'momentId, createdAt'),
+    ):
+        index_name = f"idx_{table}_{columns.replace(', ', '_')}"
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})')
+    
+    # Counters (songCount, albumCount, duration) are kept up to date by triggers
+    counters.install_triggers(conn)
+    # Catalog writes are logged for /api/sync by triggers too, see changelog.py
+    changelog.install(conn)
+    # Live moment events are relayed between worker processes through a table, see pubsub.py
+    pubsub.install(conn)
+    # Plays are passed to the other workers' snapshots through a table as well, see snapshot.py
+    snapshot.install(conn)
+    
     # Update or Insert default admin user based on config
     admin_config = config.get('admin', {})
     admin_username = admin_config.get('username', 'admin')
@@ -464,6 +636,39 @@ def init_db():
     except Exception as e:
         print(f"Album-Artist migration warning: {e}")
     
+    # Fill song_moods from songs.moodIds once
+    try:
+        cursor.execute('SELECT COUNT(*) FROM song_moods')
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("SELECT id, moodIds FROM songs WHERE moodIds IS NOT NULL AND moodIds != '[]'")
+            for song_id, mood_ids in cursor.fetchall():
+                sync_song_moods(cursor, song_id, parse_json_field(mood_ids))
+    except Exception as e:
+        print(f"Song-Mood migration warning: {e}")
+    
+    # Image URLs used to be rewritten to https on every read; store them that way once
+    try:
+        for table, column in (('artists', 'avatar'), ('artists', 'coverUrl'), ('albums', 'coverUrl'),
+                              ('songs', 'coverUrl'), ('moods', 'coverUrl'), ('playlists', 'coverUrl')):
+            cursor.execute(f'''
+                UPDATE {table} SET {column} = 'https://' || substr({column}, 8)
+                WHERE substr({column}, 1, 7) = 'http://'
+            ''')
+    except Exception as e:
+        print(f"URL normalization migration warning: {e}")
+    
+    # Parse lyrics of songs written before song_lyrics existed
+    try:
+        cursor.execute('''
+            SELECT s.id, s.lyrics FROM songs s
+            LEFT JOIN song_lyrics sl ON sl.songId = s.id
+            WHERE sl.songId IS NULL AND s.lyrics IS NOT NULL AND s.lyrics != ''
+        ''')
+        for song_id, lyrics_text in cursor.fetchall():
+            store_parsed_lyrics(cursor, song_id, lyrics_text)
+    except Exception as e:
+        print(f"Lyrics parsing migration warning: {e}")
+    
     conn.commit()
     conn.close()
 
@@ -490,7 +695,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 # Auth endpoints
 @app.post("/api/auth/login")
 async def login(user_data: UserLogin):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('SELECT id, username, password, role FROM users WHERE username = ?', (user_data.username,))
@@ -522,6 +727,16 @@ def ensure_https_url(url: str) -> str:
         return url.replace('http://', 'https://', 1)
     return url
 
+# Image URL fields, stored as https so reads never have to rewrite them
+URL_FIELDS = ('avatar', 'coverUrl')
+
+def normalize_urls(record: BaseModel) -> BaseModel:
+    for field in URL_FIELDS:
+        value = getattr(record, field, None)
+        if value:
+            setattr(record, field, ensure_https_url(value))
+    return record
+
 def parse_json_field(field_value: str) -> List[str]:
     if not field_value:
         return []
@@ -533,69 +748,24 @@ def parse_json_field(field_value: str) -> List[str]:
 def serialize_json_field(field_value: List[str]) -> str:
     return json.dumps(field_value) if field_value else "[]"
 
-# Multi-artist helper functions
-def get_song_artists(cursor, song_id: str) -> List[Dict]:
-    """Get all artists for a song with primary artist info"""
+def store_parsed_lyrics(cursor, song_id: str, lyrics_text: Optional[str]):
+    """Parse LRC lyrics once on write into the compact timed-line form"""
+    parsed = parse_lrc(lyrics_text)
+    if parsed is None:
+        cursor.execute('DELETE FROM song_lyrics WHERE songId = ?', (song_id,))
+        return
     cursor.execute('''
-        SELECT a.*, sa.isPrimary FROM artists a
-        JOIN song_artists sa ON a.id = sa.artistId
-        WHERE sa.songId = ?
-        ORDER BY sa.isPrimary DESC, a.name ASC
-    ''', (song_id,))
-    rows = cursor.fetchall()
-    
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": ensure_https_url(row[3]),
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11],
-            "isPrimary": bool(row[12])
-        }
-        artists.append(artist)
-    
-    return artists
+        INSERT INTO song_lyrics (songId, parsed, updatedAt) VALUES (?, ?, ?)
+        ON CONFLICT(songId) DO UPDATE SET parsed = excluded.parsed, updatedAt = excluded.updatedAt
+    ''', (song_id, serialize_parsed_lyrics(parsed), get_current_time()))
 
-def get_album_artists(cursor, album_id: str) -> List[Dict]:
-    """Get all artists for an album with primary artist info"""
-    cursor.execute('''
-        SELECT a.*, aa.isPrimary FROM artists a
-        JOIN album_artists aa ON a.id = aa.artistId
-        WHERE aa.albumId = ?
-        ORDER BY aa.isPrimary DESC, a.name ASC
-    ''', (album_id,))
-    rows = cursor.fetchall()
-    
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": ensure_https_url(row[3]),
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11],
-            "isPrimary": bool(row[12])
-        }
-        artists.append(artist)
-    
-    return artists
+def sync_song_moods(cursor, song_id: str, mood_ids: List[str]):
+    """Mirror a song's moodIds into song_moods"""
+    cursor.execute('DELETE FROM song_moods WHERE songId = ?', (song_id,))
+    cursor.executemany('INSERT OR IGNORE INTO song_moods (songId, moodId) VALUES (?, ?)',
+                       [(song_id, mood_id) for mood_id in mood_ids or []])
 
+# Multi-artist helper functions
 def manage_song_artists(cursor, song_id: str, artist_ids: List[str], primary_artist_id: str = None):
     """Manage artist associations for a song"""
     if not artist_ids:
@@ -632,38 +802,56 @@ def manage_album_artists(cursor, album_id: str, artist_ids: List[str], primary_a
             VALUES (?, ?, ?, ?, ?)
         ''', (association_id, album_id, artist_id, is_primary, now))
 
+# Admin listing sort orders, ?sort= key -> ORDER BY
+ARTIST_SORTS = {
+    'created_desc': 'createdAt DESC', 'created_asc': 'createdAt ASC',
+    'name_asc': 'name ASC', 'name_desc': 'name DESC',
+    'song_count_desc': 'songCount DESC', 'followers_desc': 'followers DESC',
+}
+ALBUM_SORTS = {
+    'created_desc': 'a.createdAt DESC', 'created_asc': 'a.createdAt ASC',
+    'title_asc': 'a.title ASC', 'title_desc': 'a.title DESC',
+    'release_desc': 'a.releaseDate DESC', 'release_asc': 'a.releaseDate ASC',
+}
+SONG_SORTS = {
+    'created_desc': 's.createdAt DESC', 'created_asc': 's.createdAt ASC',
+    'title_asc': 's.title ASC', 'title_desc': 's.title DESC',
+    'play_count_desc': 's.playCount DESC', 'play_count_asc': 's.playCount ASC',
+}
+PLAYLIST_SORTS = {
+    'created_desc': 'createdAt DESC', 'created_asc': 'createdAt ASC',
+    'name_asc': 'name ASC', 'name_desc': 'name DESC',
+    'play_count_desc': 'playCount DESC',
+}
+MOMENT_SORTS = {
+    'created_desc': 'm.createdAt DESC', 'created_asc': 'm.createdAt ASC',
+    'like_count_desc': 'm.likeCount DESC',
+}
+
+def sort_pattern(sorts: Dict[str, str]) -> str:
+    return '^(' + '|'.join(sorts) + ')$'
+
 # Artist CRUD
 @app.get("/api/admin/artists")
-async def get_artists(username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM artists ORDER BY createdAt DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": ensure_https_url(row[3]),
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        artists.append(artist)
-    
-    return {"success": True, "data": artists}
+async def get_artists(
+    q: Optional[str] = Query(None),
+    sort: str = Query('created_desc', pattern=sort_pattern(ARTIST_SORTS)),
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    username: str = Depends(verify_token)
+):
+    spec = PROJECTIONS['artist']['detail']
+    return paged_listing(
+        'id', 'FROM artists', Filters().search(q, 'name'), ARTIST_SORTS[sort],
+        lambda cursor, rows: load_artists(cursor, [row[0] for row in rows], spec),
+        page, limit, stream
+    )
 
 @app.post("/api/admin/artists")
 async def create_artist(artist: Artist, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(artist)
+    conn = db.connect()
     cursor = conn.cursor()
     
     artist_id = str(uuid.uuid4())
@@ -671,35 +859,35 @@ async def create_artist(artist: Artist, username: str = Depends(verify_token)):
     
     try:
         cursor.execute('''
-            INSERT INTO artists (id, name, bio, avatar, coverUrl, followers, songCount, albumCount, genres, verified, createdAt, updatedAt)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO artists (id, name, bio, avatar, coverUrl, followers, genres, verified, createdAt, updatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             artist_id, artist.name, artist.bio, artist.avatar, artist.coverUrl,
-            artist.followers, artist.songCount, artist.albumCount,
-            serialize_json_field(artist.genres), artist.verified, now, now
+            artist.followers, serialize_json_field(artist.genres), artist.verified, now, now
         ))
         conn.commit()
         conn.close()
+        catalog.bump_version()
         
-        return {"success": True, "data": {"id": artist_id, **artist.dict()}}
+        return {"success": True, "data": {**artist.dict(), "id": artist_id}}
     except sqlite3.IntegrityError:
         conn.close()
         raise HTTPException(status_code=400, detail="Artist name already exists")
 
 @app.put("/api/admin/artists/{artist_id}")
 async def update_artist(artist_id: str, artist: Artist, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(artist)
+    conn = db.connect()
     cursor = conn.cursor()
     
     now = get_current_time()
     
     cursor.execute('''
-        UPDATE artists SET name=?, bio=?, avatar=?, coverUrl=?, followers=?, songCount=?, albumCount=?, genres=?, verified=?, updatedAt=?
+        UPDATE artists SET name=?, bio=?, avatar=?, coverUrl=?, followers=?, genres=?, verified=?, updatedAt=?
         WHERE id=?
     ''', (
         artist.name, artist.bio, artist.avatar, artist.coverUrl,
-        artist.followers, artist.songCount, artist.albumCount,
-        serialize_json_field(artist.genres), artist.verified, now, artist_id
+        artist.followers, serialize_json_field(artist.genres), artist.verified, now, artist_id
     ))
     
     if cursor.rowcount == 0:
@@ -708,12 +896,13 @@ async def update_artist(artist_id: str, artist: Artist, username: str = Depends(
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": artist_id, **artist.dict()}}
+    return {"success": True, "data": {**artist.dict(), "id": artist_id}}
 
 @app.delete("/api/admin/artists/{artist_id}")
 async def delete_artist(artist_id: str, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM artists WHERE id=?', (artist_id,))
@@ -724,50 +913,38 @@ async def delete_artist(artist_id: str, username: str = Depends(verify_token)):
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Artist deleted successfully"}
 
 # Album CRUD
 @app.get("/api/admin/albums")
-async def get_albums(username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT a.*, ar.name as artist_name FROM albums a 
-        JOIN artists ar ON a.artistId = ar.id 
-        ORDER BY a.createdAt DESC
-    ''')
-    rows = cursor.fetchall()
-    
-    albums = []
-    for row in rows:
-        # Get all artists for this album
-        album_artists = get_album_artists(cursor, row[0])
-        primary_artist = next((a for a in album_artists if a.get('isPrimary')), album_artists[0] if album_artists else None)
-        
-        album = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artistName": primary_artist['name'] if primary_artist else row[11],
-            "artists": album_artists,  # All artists
-            "coverUrl": ensure_https_url(row[3]),
-            "releaseDate": row[4],
-            "songCount": row[5],
-            "duration": row[6],
-            "genre": row[7],
-            "description": row[8],
-            "createdAt": row[9],
-            "updatedAt": row[10]
-        }
-        albums.append(album)
-    
-    conn.close()
-    return {"success": True, "data": albums}
+async def get_albums(
+    q: Optional[str] = Query(None),
+    artistId: Optional[str] = Query(None),
+    genre: Optional[str] = Query(None),
+    sort: str = Query('created_desc', pattern=sort_pattern(ALBUM_SORTS)),
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    username: str = Depends(verify_token)
+):
+    spec = PROJECTIONS['album']['admin']
+    filters = Filters().search(q, 'a.title', 'ar.name')
+    if artistId:
+        filters.add('a.id IN (SELECT albumId FROM album_artists WHERE artistId = ?)', artistId)
+    if genre:
+        filters.add('a.genre = ?', genre)
+    return paged_listing(
+        'a.id', 'FROM albums a JOIN artists ar ON a.artistId = ar.id', filters, ALBUM_SORTS[sort],
+        lambda cursor, rows: load_albums(cursor, [row[0] for row in rows], spec),
+        page, limit, stream
+    )
 
 @app.post("/api/admin/albums")
 async def create_album(album: Album, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(album)
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify primary artist exists
@@ -788,35 +965,29 @@ async def create_album(album: Album, username: str = Depends(verify_token)):
     now = get_current_time()
     
     cursor.execute('''
-        INSERT INTO albums (id, title, artistId, coverUrl, releaseDate, songCount, duration, genre, description, createdAt, updatedAt)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO albums (id, title, artistId, coverUrl, releaseDate, genre, description, createdAt, updatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         album_id, album.title, album.artistId, album.coverUrl, album.releaseDate,
-        album.songCount, album.duration, album.genre, album.description, now, now
+        album.genre, album.description, now, now
     ))
     
     # Handle multiple artists
     artist_ids = album.artistIds if album.artistIds else [album.artistId]
     manage_album_artists(cursor, album_id, artist_ids, album.artistId)
     
-    # Update artist album counts
-    for artist_id in set(artist_ids):  # Use set to avoid duplicate updates
-        cursor.execute('UPDATE artists SET albumCount = albumCount + 1 WHERE id=?', (artist_id,))
-    
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": album_id, **album.dict()}}
+    return {"success": True, "data": {**album.dict(), "id": album_id}}
 
 @app.put("/api/admin/albums/{album_id}")
 async def update_album(album_id: str, album: Album, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(album)
+    conn = db.connect()
     cursor = conn.cursor()
     
-    # Get existing album artists for count adjustment
-    existing_artists = get_album_artists(cursor, album_id)
-    existing_artist_ids = [a['id'] for a in existing_artists]
-    
     # Verify primary artist exists
     cursor.execute('SELECT id FROM artists WHERE id=?', (album.artistId,))
     if not cursor.fetchone():
@@ -834,11 +1005,11 @@ async def update_album(album_id: str, album: Album, username: str = Depends(veri
     now = get_current_time()
     
     cursor.execute('''
-        UPDATE albums SET title=?, artistId=?, coverUrl=?, releaseDate=?, songCount=?, duration=?, genre=?, description=?, updatedAt=?
+        UPDATE albums SET title=?, artistId=?, coverUrl=?, releaseDate=?, genre=?, description=?, updatedAt=?
         WHERE id=?
     ''', (
         album.title, album.artistId, album.coverUrl, album.releaseDate,
-        album.songCount, album.duration, album.genre, album.description, now, album_id
+        album.genre, album.description, now, album_id
     ))
     
     if cursor.rowcount == 0:
@@ -849,23 +1020,15 @@ async def update_album(album_id: str, album: Album, username: str = Depends(veri
     new_artist_ids = album.artistIds if album.artistIds else [album.artistId]
     manage_album_artists(cursor, album_id, new_artist_ids, album.artistId)
     
-    # Update artist album counts
-    # Decrease count for removed artists
-    for artist_id in set(existing_artist_ids) - set(new_artist_ids):
-        cursor.execute('UPDATE artists SET albumCount = albumCount - 1 WHERE id=? AND albumCount > 0', (artist_id,))
-    
-    # Increase count for new artists
-    for artist_id in set(new_artist_ids) - set(existing_artist_ids):
-        cursor.execute('UPDATE artists SET albumCount = albumCount + 1 WHERE id=?', (artist_id,))
-    
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": album_id, **album.dict()}}
+    return {"success": True, "data": {**album.dict(), "id": album_id}}
 
 @app.delete("/api/admin/albums/{album_id}")
 async def delete_album(album_id: str, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM albums WHERE id=?', (album_id,))
@@ -876,56 +1039,63 @@ async def delete_album(album_id: str, username: str = Depends(verify_token)):
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Album deleted successfully"}
 
 # Song CRUD
 @app.get("/api/admin/songs")
-async def get_songs(username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+async def get_songs(
+    q: Optional[str] = Query(None),
+    ids: Optional[str] = Query(None),
+    artistId: Optional[str] = Query(None),
+    albumId: Optional[str] = Query(None),
+    moodId: Optional[str] = Query(None),
+    genre: Optional[str] = Query(None),
+    sort: str = Query('created_desc', pattern=sort_pattern(SONG_SORTS)),
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    username: str = Depends(verify_token)
+):
+    # Lyrics only in GET /api/admin/songs/{id} (or with fields=admin)
+    spec = parse_fields(fields, 'song', default='admin_list')
+    filters = Filters().search(q, 's.title', 'ar.name')
+    if ids:
+        song_ids = [song_id for song_id in ids.split(',') if song_id][:MAX_PAGE_SIZE]
+        filters.add(f"s.id IN ({','.join('?' * len(song_ids))})", *song_ids)
+    if artistId:
+        filters.add('s.id IN (SELECT songId FROM song_artists WHERE artistId = ?)', artistId)
+    if albumId:
+        filters.add('s.albumId = ?', albumId)
+    if moodId:
+        filters.add('s.id IN (SELECT songId FROM song_moods WHERE moodId = ?)', moodId)
+    if genre:
+        filters.add('s.genre = ?', genre)
+    return paged_listing(
+        's.id', 'FROM songs s JOIN artists ar ON s.artistId = ar.id', filters, SONG_SORTS[sort],
+        lambda cursor, rows: load_songs(cursor, [row[0] for row in rows], spec),
+        page, limit, stream
+    )
+
+@app.get("/api/admin/songs/{song_id}")
+async def get_song_admin(song_id: str, fields: Optional[str] = Query(None), username: str = Depends(verify_token)):
+    spec = parse_fields(fields, 'song', default='admin')
+    conn = db.connect()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
-        JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
-        ORDER BY s.createdAt DESC
-    ''')
-    rows = cursor.fetchall()
+    songs = load_songs(cursor, [song_id], spec)
+    conn.close()
     
-    songs = []
-    for row in rows:
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artistName": primary_artist['name'] if primary_artist else row[14],
-            "artists": song_artists,  # All artists
-            "albumId": row[3],
-            "albumTitle": row[15],
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": parse_json_field(row[8]),
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    if not songs:
+        raise HTTPException(status_code=404, detail="Song not found")
     
-    conn.close()
-    return {"success": True, "data": songs}
+    return {"success": True, "data": songs[0]}
 
 @app.post("/api/admin/songs")
 async def create_song(song: Song, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(song)
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify primary artist exists
@@ -957,25 +1127,21 @@ async def create_song(song: Song, username: str = Depends(verify_token)):
     # Handle multiple artists
     artist_ids = song.artistIds if song.artistIds else [song.artistId]
     manage_song_artists(cursor, song_id, artist_ids, song.artistId)
-    
-    # Update artist song counts
-    for artist_id in set(artist_ids):  # Use set to avoid duplicate updates
-        cursor.execute('UPDATE artists SET songCount = songCount + 1 WHERE id=?', (artist_id,))
+    store_parsed_lyrics(cursor, song_id, song.lyrics)
+    sync_song_moods(cursor, song_id, song.moodIds)
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": song_id, **song.dict()}}
+    return {"success": True, "data": {**song.dict(), "id": song_id}}
 
 @app.put("/api/admin/songs/{song_id}")
 async def update_song(song_id: str, song: Song, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(song)
+    conn = db.connect()
     cursor = conn.cursor()
     
-    # Get existing song artists for count adjustment
-    existing_artists = get_song_artists(cursor, song_id)
-    existing_artist_ids = [a['id'] for a in existing_artists]
-    
     # Verify primary artist exists
     cursor.execute('SELECT id FROM artists WHERE id=?', (song.artistId,))
     if not cursor.fetchone():
@@ -1008,74 +1174,50 @@ async def update_song(song_id: str, song: Song, username: str = Depends(verify_t
     # Handle multiple artists
     new_artist_ids = song.artistIds if song.artistIds else [song.artistId]
     manage_song_artists(cursor, song_id, new_artist_ids, song.artistId)
-    
-    # Update artist song counts
-    # Decrease count for removed artists
-    for artist_id in set(existing_artist_ids) - set(new_artist_ids):
-        cursor.execute('UPDATE artists SET songCount = songCount - 1 WHERE id=? AND songCount > 0', (artist_id,))
-    
-    # Increase count for new artists
-    for artist_id in set(new_artist_ids) - set(existing_artist_ids):
-        cursor.execute('UPDATE artists SET songCount = songCount + 1 WHERE id=?', (artist_id,))
+    store_parsed_lyrics(cursor, song_id, song.lyrics)
+    sync_song_moods(cursor, song_id, song.moodIds)
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": song_id, **song.dict()}}
+    return {"success": True, "data": {**song.dict(), "id": song_id}}
 
 @app.delete("/api/admin/songs/{song_id}")
 async def delete_song(song_id: str, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
-    # Get existing song artists for count adjustment
-    existing_artists = get_song_artists(cursor, song_id)
-    existing_artist_ids = [a['id'] for a in existing_artists]
-    
+    # song_artists/song_moods rows and the counters go with it (triggers)
     cursor.execute('DELETE FROM songs WHERE id=?', (song_id,))
     
     if cursor.rowcount == 0:
         conn.close()
         raise HTTPException(status_code=404, detail="Song not found")
     
-    # Update artist song counts (the song_artists associations will be deleted automatically due to CASCADE)
-    for artist_id in existing_artist_ids:
-        cursor.execute('UPDATE artists SET songCount = songCount - 1 WHERE id=? AND songCount > 0', (artist_id,))
+    cursor.execute('DELETE FROM song_lyrics WHERE songId=?', (song_id,))
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Song deleted successfully"}
 
 # Mood CRUD
 @app.get("/api/admin/moods")
 async def get_moods(username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM moods ORDER BY createdAt DESC')
-    rows = cursor.fetchall()
+    cursor.execute('SELECT id FROM moods ORDER BY createdAt DESC')
+    moods = load_moods(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['mood']['detail'])
     conn.close()
     
-    moods = []
-    for row in rows:
-        mood = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "icon": row[3],
-            "color": row[4],
-            "coverUrl": ensure_https_url(row[5]),
-            "songCount": row[6],
-            "createdAt": row[7],
-            "updatedAt": row[8]
-        }
-        moods.append(mood)
-    
     return {"success": True, "data": moods}
 
 @app.post("/api/admin/moods")
 async def create_mood(mood: Mood, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(mood)
+    conn = db.connect()
     cursor = conn.cursor()
     
     mood_id = str(uuid.uuid4())
@@ -1083,33 +1225,35 @@ async def create_mood(mood: Mood, username: str = Depends(verify_token)):
     
     try:
         cursor.execute('''
-            INSERT INTO moods (id, name, description, icon, color, coverUrl, songCount, createdAt, updatedAt)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO moods (id, name, description, icon, color, coverUrl, createdAt, updatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             mood_id, mood.name, mood.description, mood.icon, mood.color,
-            mood.coverUrl, mood.songCount, now, now
+            mood.coverUrl, now, now
         ))
         conn.commit()
         conn.close()
+        catalog.bump_version()
         
-        return {"success": True, "data": {"id": mood_id, **mood.dict()}}
+        return {"success": True, "data": {**mood.dict(), "id": mood_id}}
     except sqlite3.IntegrityError:
         conn.close()
         raise HTTPException(status_code=400, detail="Mood name already exists")
 
 @app.put("/api/admin/moods/{mood_id}")
 async def update_mood(mood_id: str, mood: Mood, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(mood)
+    conn = db.connect()
     cursor = conn.cursor()
     
     now = get_current_time()
     
     cursor.execute('''
-        UPDATE moods SET name=?, description=?, icon=?, color=?, coverUrl=?, songCount=?, updatedAt=?
+        UPDATE moods SET name=?, description=?, icon=?, color=?, coverUrl=?, updatedAt=?
         WHERE id=?
     ''', (
         mood.name, mood.description, mood.icon, mood.color,
-        mood.coverUrl, mood.songCount, now, mood_id
+        mood.coverUrl, now, mood_id
     ))
     
     if cursor.rowcount == 0:
@@ -1118,12 +1262,13 @@ async def update_mood(mood_id: str, mood: Mood, username: str = Depends(verify_t
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": mood_id, **mood.dict()}}
+    return {"success": True, "data": {**mood.dict(), "id": mood_id}}
 
 @app.delete("/api/admin/moods/{mood_id}")
 async def delete_mood(mood_id: str, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM moods WHERE id=?', (mood_id,))
@@ -1134,74 +1279,66 @@ async def delete_mood(mood_id: str, username: str = Depends(verify_token)):
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Mood deleted successfully"}
 
 # Playlist CRUD
 @app.get("/api/admin/playlists")
-async def get_playlists(username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM playlists ORDER BY createdAt DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    
-    playlists = []
-    for row in rows:
-        playlist = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "coverUrl": ensure_https_url(row[3]),
-            "songIds": parse_json_field(row[4]),
-            "songCount": row[5],
-            "playCount": row[6],
-            "duration": row[7],
-            "creator": row[8],
-            "isPublic": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        playlists.append(playlist)
-    
-    return {"success": True, "data": playlists}
+async def get_playlists(
+    q: Optional[str] = Query(None),
+    sort: str = Query('created_desc', pattern=sort_pattern(PLAYLIST_SORTS)),
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    username: str = Depends(verify_token)
+):
+    spec = PROJECTIONS['playlist']['detail']
+    return paged_listing(
+        'id', 'FROM playlists', Filters().search(q, 'name', 'description'), PLAYLIST_SORTS[sort],
+        lambda cursor, rows: load_playlists(cursor, [row[0] for row in rows], spec),
+        page, limit, stream
+    )
 
 @app.post("/api/admin/playlists")
 async def create_playlist(playlist: Playlist, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(playlist)
+    conn = db.connect()
     cursor = conn.cursor()
     
     playlist_id = str(uuid.uuid4())
     now = get_current_time()
     
     cursor.execute('''
-        INSERT INTO playlists (id, name, description, coverUrl, songIds, songCount, playCount, duration, creator, isPublic, createdAt, updatedAt)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO playlists (id, name, description, coverUrl, songIds, playCount, creator, isPublic, createdAt, updatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         playlist_id, playlist.name, playlist.description, playlist.coverUrl,
-        serialize_json_field(playlist.songIds), playlist.songCount, playlist.playCount,
-        playlist.duration, playlist.creator, playlist.isPublic, now, now
+        serialize_json_field(playlist.songIds), playlist.playCount,
+        playlist.creator, playlist.isPublic, now, now
     ))
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": playlist_id, **playlist.dict()}}
+    return {"success": True, "data": {**playlist.dict(), "id": playlist_id}}
 
 @app.put("/api/admin/playlists/{playlist_id}")
 async def update_playlist(playlist_id: str, playlist: Playlist, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    normalize_urls(playlist)
+    conn = db.connect()
     cursor = conn.cursor()
     
     now = get_current_time()
     
     cursor.execute('''
-        UPDATE playlists SET name=?, description=?, coverUrl=?, songIds=?, songCount=?, playCount=?, duration=?, creator=?, isPublic=?, updatedAt=?
+        UPDATE playlists SET name=?, description=?, coverUrl=?, songIds=?, playCount=?, creator=?, isPublic=?, updatedAt=?
         WHERE id=?
     ''', (
         playlist.name, playlist.description, playlist.coverUrl,
-        serialize_json_field(playlist.songIds), playlist.songCount, playlist.playCount,
-        playlist.duration, playlist.creator, playlist.isPublic, now, playlist_id
+        serialize_json_field(playlist.songIds), playlist.playCount,
+        playlist.creator, playlist.isPublic, now, playlist_id
     ))
     
     if cursor.rowcount == 0:
@@ -1210,12 +1347,13 @@ async def update_playlist(playlist_id: str, playlist: Playlist, username: str =
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
-    return {"success": True, "data": {"id": playlist_id, **playlist.dict()}}
+    return {"success": True, "data": {**playlist.dict(), "id": playlist_id}}
 
 @app.delete("/api/admin/playlists/{playlist_id}")
 async def delete_playlist(playlist_id: str, username: str = Depends(verify_token)):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM playlists WHERE id=?', (playlist_id,))
@@ -1226,13 +1364,14 @@ async def delete_playlist(playlist_id: str, username: str = Depends(verify_token
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Playlist deleted successfully"}
 
 @app.put("/api/admin/playlists/{playlist_id}/reorder")
 async def reorder_playlist_songs(playlist_id: str, reorder_data: PlaylistReorder, username: str = Depends(verify_token)):
     """重新排序歌单中的歌曲"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Check if playlist exists
@@ -1273,73 +1412,297 @@ async def reorder_playlist_songs(playlist_id: str, reorder_data: PlaylistReorder
     
     conn.commit()
     conn.close()
+    catalog.bump_version()
     
     return {"success": True, "message": "Playlist order updated successfully"}
 
-# Music Moments CRUD
-@app.get("/api/admin/moments")
-async def get_moments_admin(username: str = Depends(verify_token)):
-    """管理员获取所有音乐朋友圈"""
-    conn = sqlite3.connect('music.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT m.*, s.title, s.coverUrl, ar.name as artist_name
-        FROM music_moments m
-        JOIN songs s ON m.songId = s.id
-        JOIN artists ar ON s.artistId = ar.id
-        ORDER BY m.createdAt DESC
-    ''')
-    rows = cursor.fetchall()
+# Bulk writes: one transaction per request, see bulk.py
+BULK_ENTITIES = {
+    'songs': bulk.BulkEntity(
+        'songs', Song,
+        ['title', 'artistId', 'albumId', 'duration', 'audioUrl', 'coverUrl', 'lyrics', 'moodIds',
+         'playCount', 'liked', 'genre'],
+        json_columns=['moodIds'],
+        url_columns=URL_FIELDS,
+        references={'artistId': 'artists', 'artistIds': 'artists', 'albumId': 'albums', 'moodIds': 'moods'},
+        artist_link=bulk.ArtistLink('song_artists', 'songId'),
+        after_write=bulk.write_song_side_tables,
+        after_delete=bulk.delete_song_side_tables,
+    ),
+    'albums': bulk.BulkEntity(
+        'albums', Album,
+        ['title', 'artistId', 'coverUrl', 'releaseDate', 'genre', 'description'],
+        url_columns=URL_FIELDS,
+        references={'artistId': 'artists', 'artistIds': 'artists'},
+        artist_link=bulk.ArtistLink('album_artists', 'albumId'),
+    ),
+    'artists': bulk.BulkEntity(
+        'artists', Artist,
+        ['name', 'bio', 'avatar', 'coverUrl', 'followers', 'genres', 'verified'],
+        json_columns=['genres'],
+        url_columns=URL_FIELDS,
+        unique_column='name',
+    ),
+    'moods': bulk.BulkEntity(
+        'moods', Mood,
+        ['name', 'description', 'icon', 'color', 'coverUrl'],
+        url_columns=URL_FIELDS,
+        unique_column='name',
+    ),
+    'playlists': bulk.BulkEntity(
+        'playlists', Playlist,
+        ['name', 'description', 'coverUrl', 'songIds', 'playCount', 'creator', 'isPublic'],
+        json_columns=['songIds'],
+        url_columns=URL_FIELDS,
+        references={'songIds': 'songs'},
+    ),
+}
+
+@app.post("/api/admin/{entity}/bulk")
+async def bulk_write(
+    request: BulkRequest,
+    entity: str = Path(..., pattern='^(' + '|'.join(BULK_ENTITIES) + ')$'),
+    username: str = Depends(verify_token)
+):
+    """Create/update/patch/delete many records of one type in a single transaction"""
+    if not request.operations:
+        raise HTTPException(status_code=400, detail="No operations")
+    if len(request.operations) > bulk.MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {bulk.MAX_OPERATIONS} operations per request")
+    
+    conn = db.connect()
+    try:
+        applied, counts, results = bulk.run_bulk(
+            conn, BULK_ENTITIES[entity], request.operations, request.atomic, get_current_time()
+        )
+    except sqlite3.IntegrityError as e:
+        raise HTTPException(status_code=400, detail=f"Bulk write rejected: {e}")
+    finally:
+        conn.close()
+    
+    if applied:
+        catalog.bump_version()
+    
+    body = {"success": counts["failed"] == 0, "data": counts, "results": results}
+    if counts["failed"] and request.atomic:
+        return JSONResponse(status_code=400, content=body)
+    return body
 
-    moments = []
-    for row in rows:
-        moment_id = row[0]
+# Counter reconciliation, see counters.py
+@app.get("/api/admin/counters/drift")
+async def get_counter_drift(username: str = Depends(verify_token)):
+    """Report counter drift without fixing it, plus the last reconcile job run"""
+    conn = db.connect(timeout=30)
+    try:
+        report = counters.reconcile(conn, fix=False)
+    finally:
+        conn.close()
+    return {"success": True, "data": report, "lastRun": counters.last_report()}
 
-        # Get comments for this moment
-        cursor.execute('''
-            SELECT * FROM moment_comments WHERE momentId = ? ORDER BY createdAt ASC
-        ''', (moment_id,))
-        comment_rows = cursor.fetchall()
-
-        comments = []
-        for c_row in comment_rows:
-            comments.append({
-                "id": c_row[0],
-                "momentId": c_row[1],
-                "content": c_row[2],
-                "listenDate": c_row[3],
-                "location": c_row[4],
-                "createdAt": c_row[5]
-            })
-
-        moment = {
-            "id": row[0],
-            "songId": row[1],
-            "content": row[2],
-            "tags": parse_json_field(row[3]),
-            "energyLevel": row[4],
-            "firstHeardYear": row[5],
-            "firstHeardPeriod": row[6],
-            "likeCount": row[7],
-            "createdAt": row[8],
-            "updatedAt": row[9],
-            "song": {
-                "id": row[1],
-                "title": row[10],
-                "coverUrl": ensure_https_url(row[11]),
-                "artistName": row[12]
-            },
-            "comments": comments
-        }
-        moments.append(moment)
+@app.post("/api/admin/counters/reconcile")
+async def reconcile_counters(username: str = Depends(verify_token)):
+    conn = db.connect(timeout=30)
+    try:
+        report = counters.reconcile(conn)
+    finally:
+        conn.close()
+    return {"success": True, "data": report}
+
+# In-memory catalog snapshot, see snapshot.py
+@app.get("/api/admin/snapshot")
+async def get_snapshot_stats(username: str = Depends(verify_token)):
+    return {"success": True, "data": snapshot.stats()}
+
+@app.post("/api/admin/snapshot/rebuild")
+async def rebuild_snapshot(username: str = Depends(verify_token)):
+    if not snapshot.stats()["enabled"]:
+        raise HTTPException(status_code=400, detail="Snapshot engine is disabled")
+    snapshot.rebuild()
+    return {"success": True, "data": snapshot.stats()}
+
+# Delta sync change log, see changelog.py
+@app.get("/api/admin/sync")
+async def get_sync_stats(username: str = Depends(verify_token)):
+    conn = db.connect()
+    try:
+        return {"success": True, "data": changelog.stats(conn)}
+    finally:
+        conn.close()
 
-    conn.close()
-    return {"success": True, "data": moments}
+@app.post("/api/admin/sync/compact")
+async def compact_change_log(username: str = Depends(verify_token)):
+    conn = db.connect(timeout=30)
+    try:
+        return {"success": True, "data": changelog.compact(conn)}
+    finally:
+        conn.close()
+
+# Live moment subscribers, see pubsub.py
+@app.get("/api/admin/live")
+async def get_live_stats(username: str = Depends(verify_token)):
+    return {"success": True, "data": pubsub.hub.stats()}
+
+# Request coalescing metrics, see coalesce.py
+@app.get("/api/admin/coalescing")
+async def get_coalescing_stats(username: str = Depends(verify_token)):
+    return {"success": True, "data": coalesce.flights.stats()}
+
+# Slow queries and N+1 findings of the SQL tracing dev mode, see sqltrace.py
+@app.get("/api/admin/sqltrace")
+async def get_sqltrace(username: str = Depends(verify_token)):
+    return {"success": True, "data": sqltrace.stats()}
+
+# On-demand sampling CPU profile of the running server, see profiler.py
+@app.post("/api/admin/profile")
+async def run_profile(
+    seconds: float = Query(profiler.DEFAULT_SECONDS, gt=0, le=profiler.MAX_SECONDS),
+    hz: int = Query(profiler.DEFAULT_HZ, ge=1, le=profiler.MAX_HZ),
+    route: Optional[str] = Query(None),
+    format: str = Query('collapsed', pattern=profiler.FORMAT_PATTERN),
+    idle: bool = Query(False),
+    username: str = Depends(verify_token)
+):
+    try:
+        result = await profiler.profile(app.routes, seconds=seconds, hz=hz, route=route, include_idle=idle)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    summary = result.summary()
+    headers = {
+        "X-Profile-Samples": str(summary["samples"]),
+        "X-Profile-Seconds": str(summary["seconds"]),
+        "X-Profile-Overhead": str(summary["overhead"]),
+    }
+    if format == 'speedscope':
+        headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+        return JSONResponse(result.speedscope(), headers=headers)
+    return PlainTextResponse(result.collapsed(), headers=headers)
+
+# Event loop lag and stalls by route, see looplag.py
+@app.get("/api/admin/loop")
+async def get_loop_stats(username: str = Depends(verify_token)):
+    return {"success": True, "data": looplag.stats()}
+
+# Memory diagnostics: RSS/GC history and tracemalloc snapshots, see memory.py
+@app.get("/api/admin/memory")
+async def get_memory_stats(username: str = Depends(verify_token)):
+    return {"success": True, "data": memory.stats()}
+
+@app.post("/api/admin/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: int = Query(1, ge=1, le=memory.MAX_FRAMES),
+    username: str = Depends(verify_token)
+):
+    return {"success": True, "data": memory.start_tracing(frames)}
+
+@app.post("/api/admin/memory/tracemalloc/stop")
+async def stop_tracemalloc(username: str = Depends(verify_token)):
+    return {"success": True, "data": memory.stop_tracing()}
+
+@app.post("/api/admin/memory/snapshots")
+async def take_memory_snapshot(
+    group: str = Query('lineno', pattern=memory.GROUP_PATTERN),
+    limit: int = Query(memory.DEFAULT_LIMIT, ge=1, le=memory.MAX_LIMIT),
+    username: str = Depends(verify_token)
+):
+    try:
+        summary = await run_in_threadpool(memory.take_snapshot)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "data": await run_in_threadpool(memory.top, summary["id"], group, limit)}
+
+@app.delete("/api/admin/memory/snapshots")
+async def clear_memory_snapshots(username: str = Depends(verify_token)):
+    memory.clear_snapshots()
+    return {"success": True}
+
+@app.get("/api/admin/memory/snapshots/{snapshot_id}")
+async def get_memory_snapshot(
+    snapshot_id: int,
+    group: str = Query('lineno', pattern=memory.GROUP_PATTERN),
+    limit: int = Query(memory.DEFAULT_LIMIT, ge=1, le=memory.MAX_LIMIT),
+    username: str = Depends(verify_token)
+):
+    try:
+        return {"success": True, "data": await run_in_threadpool(memory.top, snapshot_id, group, limit)}
+    except memory.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+@app.get("/api/admin/memory/diff")
+async def diff_memory_snapshots(
+    base: Optional[int] = Query(None),
+    target: Optional[int] = Query(None),
+    group: str = Query('lineno', pattern=memory.GROUP_PATTERN),
+    limit: int = Query(memory.DEFAULT_LIMIT, ge=1, le=memory.MAX_LIMIT),
+    username: str = Depends(verify_token)
+):
+    try:
+        return {"success": True, "data": await run_in_threadpool(memory.diff, base, target, group, limit)}
+    except memory.SnapshotNotFound:
+        raise HTTPException(status_code=404, detail="Snapshot not found; take two snapshots to diff")
+
+# Prometheus scrape endpoint, see metrics.py; metrics.token in config.yaml protects it
+metrics_security = HTTPBearer(auto_error=False)
+
+def _runtime_metrics():
+    routes = coalesce.flights.stats()["routes"]
+    lines = metrics.family('coalesce_requests_total', 'counter', 'Calls of coalesced routes',
+                           (({"route": route}, stats["requests"]) for route, stats in routes.items()))
+    lines += metrics.family('coalesce_executions_total', 'counter', 'Handler runs of coalesced routes',
+                            (({"route": route}, stats["executions"]) for route, stats in routes.items()))
+    live = pubsub.hub.stats()
+    lines += metrics.family('live_subscribers', 'gauge', 'Live moment subscribers', [({}, live["subscribers"])])
+    lines += metrics.family('live_events_delivered_total', 'counter', 'Live events queued to subscribers',
+                            [({}, live["delivered"])])
+    lines += metrics.family('live_subscribers_evicted_total', 'counter', 'Live subscribers evicted for falling behind',
+                            [({}, live["evicted"])])
+    current = snapshot.stats()
+    built = current["snapshot"]
+    lines += metrics.family('snapshot_current', 'gauge', 'Whether the catalog snapshot serves reads',
+                            [({}, int(current["enabled"] and current["current"]))])
+    lines += metrics.family('snapshot_bytes', 'gauge', 'Estimated size of the catalog snapshot',
+                            [({}, built["bytes"] if built else 0)])
+    return lines
+
+metrics.register_collector(_runtime_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(credentials: Optional[HTTPAuthorizationCredentials] = Depends(metrics_security)):
+    token = METRICS_CONFIG.get('token')
+    if token and (credentials is None or not hmac.compare_digest(credentials.credentials, str(token))):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Music Moments CRUD
+@app.get("/api/admin/moments")
+async def get_moments_admin(
+    q: Optional[str] = Query(None),
+    songId: Optional[str] = Query(None),
+    sort: str = Query('created_desc', pattern=sort_pattern(MOMENT_SORTS)),
+    page: int = Query(1, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    stream: Optional[str] = Query(None, pattern=STREAM_PATTERN),
+    username: str = Depends(verify_token)
+):
+    """管理员获取所有音乐朋友圈"""
+    filters = Filters().search(q, 'm.content', 's.title')
+    if songId:
+        filters.add('m.songId = ?', songId)
+    return paged_listing(
+        'm.id',
+        'FROM music_moments m JOIN songs s ON m.songId = s.id JOIN artists ar ON s.artistId = ar.id',
+        filters, MOMENT_SORTS[sort], hydrate_admin_moments, page, limit, stream
+    )
+
+def hydrate_admin_moments(cursor, rows) -> List[Dict]:
+    """Admin moment records for a batch of rows, songs and comments loaded with one query per batch"""
+    return load_moments(cursor, [row[0] for row in rows], PROJECTIONS['moment']['detail'])
 
 @app.post("/api/admin/moments")
 async def create_moment(moment: MusicMoment, username: str = Depends(verify_token)):
     """创建音乐朋友圈"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
 
     # Verify song exists
@@ -1361,14 +1724,17 @@ async def create_moment(moment: MusicMoment, username: str = Depends(verify_toke
     ))
 
     conn.commit()
+    created = load_moments(cursor, [moment_id], PROJECTIONS['moment']['detail'])
     conn.close()
+    if created:
+        pubsub.publish('moment.created', moment_id, moment=created[0])
 
-    return {"success": True, "data": {"id": moment_id, **moment.dict()}}
+    return {"success": True, "data": {**moment.dict(), "id": moment_id}}
 
 @app.put("/api/admin/moments/{moment_id}")
 async def update_moment(moment_id: str, moment: MusicMoment, username: str = Depends(verify_token)):
     """更新音乐朋友圈"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
 
     now = get_current_time()
@@ -1388,13 +1754,17 @@ async def update_moment(moment_id: str, moment: MusicMoment, username: str = Dep
 
     conn.commit()
     conn.close()
+    pubsub.publish('moment.updated', moment_id, changes={
+        "content": moment.content, "tags": moment.tags, "energyLevel": moment.energyLevel,
+        "firstHeardYear": moment.firstHeardYear, "firstHeardPeriod": moment.firstHeardPeriod, "updatedAt": now,
+    })
 
-    return {"success": True, "data": {"id": moment_id, **moment.dict()}}
+    return {"success": True, "data": {**moment.dict(), "id": moment_id}}
 
 @app.delete("/api/admin/moments/{moment_id}")
 async def delete_moment(moment_id: str, username: str = Depends(verify_token)):
     """删除音乐朋友圈"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute('DELETE FROM music_moments WHERE id=?', (moment_id,))
@@ -1405,6 +1775,7 @@ async def delete_moment(moment_id: str, username: str = Depends(verify_token)):
 
     conn.commit()
     conn.close()
+    pubsub.publish('moment.deleted', moment_id)
 
     return {"success": True, "message": "Moment deleted successfully"}
 
@@ -1431,12 +1802,12 @@ async def delete_moment(moment_id: str, username: str = Depends(verify_token)):
 #     conn.commit()
 #     conn.close()
 
-#     return {"success": True, "data": {"id": comment_id, **comment.dict()}}
+#     return {"success": True, "data": {**comment.dict(), "id": comment_id}}
 
 @app.delete("/api/admin/moments/{moment_id}/comments/{comment_id}")
 async def delete_moment_comment(moment_id: str, comment_id: str, username: str = Depends(verify_token)):
     """删除朋友圈跟评"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute('DELETE FROM moment_comments WHERE id=? AND momentId=?', (comment_id, moment_id))
@@ -1447,10 +1818,13 @@ async def delete_moment_comment(moment_id: str, comment_id: str, username: str =
 
     conn.commit()
     conn.close()
+    pubsub.publish('comment.deleted', moment_id, commentId=comment_id)
 
     return {"success": True, "message": "Comment deleted successfully"}
 
-init_db()
+# The one init_db call: at import, unless serve.py already ran it for the workers
+if not serve.db_ready():
+    init_db()
 @app.post("/api/admin/upload")
 async def upload_file(file: UploadFile = File(...), username: str = Depends(verify_token)):
     if not file.filename:
@@ -1475,7 +1849,7 @@ async def upload_file(file: UploadFile = File(...), username: str = Depends(veri
 @app.post("/api/admin/import/check-exists")
 async def check_song_exists(request: CheckExistsRequest, username: str = Depends(verify_token)):
     """检查歌曲是否已存在于数据库中"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     try:
@@ -1510,7 +1884,7 @@ async def check_song_exists(request: CheckExistsRequest, username: str = Depends
 @app.post("/api/admin/import/batch")
 async def batch_import(request: ImportBatchRequest, username: str = Depends(verify_token)):
     """批量导入音乐数据"""
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     imported_count = 0
@@ -1600,10 +1974,6 @@ async def batch_import(request: ImportBatchRequest, username: str = Depends(veri
                         
                         # 创建专辑-艺术家关联
                         manage_album_artists(cursor, album_id, created_artists, primary_artist_id)
-                        
-                        # 更新艺术家专辑计数
-                        for artist_id in created_artists:
-                            cursor.execute('UPDATE artists SET albumCount = albumCount + 1 WHERE id=?', (artist_id,))
                 
                 # 创建歌曲
                 song_id = str(uuid.uuid4())
@@ -1619,14 +1989,8 @@ async def batch_import(request: ImportBatchRequest, username: str = Depends(veri
                 
                 # 创建歌曲-艺术家关联
                 manage_song_artists(cursor, song_id, created_artists, primary_artist_id)
-                
-                # 更新艺术家歌曲计数
-                for artist_id in created_artists:
-                    cursor.execute('UPDATE artists SET songCount = songCount + 1 WHERE id=?', (artist_id,))
-                
-                # 更新专辑歌曲计数
-                if album_id:
-                    cursor.execute('UPDATE albums SET songCount = songCount + 1 WHERE id=?', (album_id,))
+                store_parsed_lyrics(cursor, song_id, lyrics)
+                # 艺术家、专辑的歌曲计数由触发器维护（counters.py）
                 
                 imported_count += 1
                 results.append({
@@ -1644,6 +2008,7 @@ async def batch_import(request: ImportBatchRequest, username: str = Depends(veri
                 })
         
         conn.commit()
+        catalog.bump_version()
         
         return {
             "success": True,
@@ -1664,7 +2029,7 @@ async def batch_import(request: ImportBatchRequest, username: str = Depends(veri
 @app.post("/api/admin/moments")
 async def create_moment(moment: MusicMoment, user: dict = Depends(verify_token)):
     """创建音乐朋友圈（管理员）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     try:
@@ -1722,7 +2087,7 @@ async def create_moment(moment: MusicMoment, user: dict = Depends(verify_token))
 @app.post("/api/admin/moments/{moment_id}/comments")
 async def add_comment(moment_id: str, comment: MomentCommentCreate, user: dict = Depends(verify_token)):
     """添加朋友圈评论（管理员）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     try:
@@ -1744,16 +2109,18 @@ async def add_comment(moment_id: str, comment: MomentCommentCreate, user: dict =
 
         conn.commit()
 
+        created = {
+            "id": comment_id,
+            "momentId": moment_id,
+            "content": comment.content,
+            "listenDate": comment.listenDate,
+            "location": comment.location,
+            "createdAt": now
+        }
+        pubsub.publish('comment.added', moment_id, comment=created)
         return {
             "success": True,
-            "data": {
-                "id": comment_id,
-                "momentId": moment_id,
-                "content": comment.content,
-                "listenDate": comment.listenDate,
-                "location": comment.location,
-                "createdAt": now
-            }
+            "data": created
         }
     except HTTPException:
         raise
@@ -1766,7 +2133,7 @@ async def add_comment(moment_id: str, comment: MomentCommentCreate, user: dict =
 @app.put("/api/admin/moments/{moment_id}")
 async def update_moment(moment_id: str, moment: MusicMoment, user: dict = Depends(verify_token)):
     """更新音乐朋友圈（管理员）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     try:
@@ -1799,7 +2166,7 @@ async def update_moment(moment_id: str, moment: MusicMoment, user: dict = Depend
 @app.delete("/api/admin/moments/{moment_id}")
 async def delete_moment(moment_id: str, user: dict = Depends(verify_token)):
     """删除音乐朋友圈（管理员）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     try:
@@ -1824,7 +2191,7 @@ async def delete_moment(moment_id: str, user: dict = Depends(verify_token)):
 @app.delete("/api/admin/moments/{moment_id}/comments/{comment_id}")
 async def delete_comment(moment_id: str, comment_id: str, user: dict = Depends(verify_token)):
     """删除朋友圈评论（管理员）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     try:
@@ -1845,7 +2212,6 @@ async def delete_comment(moment_id: str, comment_id: str, user: dict = Depends(v
     finally:
         conn.close()
 
-init_db()
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
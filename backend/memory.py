@@ -0,0 +1,291 @@
+"""Memory diagnostics: RSS/GC gauges and tracemalloc snapshots.
+
+The ``memory`` background job samples the process RSS and the garbage
+collector every ``SAMPLE_INTERVAL`` seconds and keeps an hour of history,
+so a slow climb shows up in ``GET /api/admin/memory``; GC collections and
+pause times are counted by a ``gc.callbacks`` hook. RSS, GC and tracemalloc
+figures are also exported on ``/metrics``.
+
+tracemalloc is off unless started from the admin API, since tracing makes
+every allocation slower. While it runs, snapshots can be taken (the last
+``MAX_SNAPSHOTS`` are kept) and inspected as the top allocation sites, or
+diffed against each other, grouped by file:line, by file, or by traceback
+(start tracing with more than one frame for useful tracebacks). Taking a
+snapshot of a large heap takes a while and holds the GIL meanwhile.
+"""
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import metrics
+
+SAMPLE_INTERVAL = 15
+HISTORY = 240
+MAX_SNAPSHOTS = 5
+MAX_FRAMES = 25
+DEFAULT_LIMIT = 30
+MAX_LIMIT = 500
+GROUP_PATTERN = '^(lineno|filename|traceback)$'
+
+# Allocations of tracemalloc and the import system are noise here
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+class SnapshotNotFound(Exception):
+    pass
+
+
+def rss_bytes() -> int:
+    """Current resident set size; 0 where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - not on Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# -- garbage collector --------------------------------------------------------
+
+class GcStats:
+    def __init__(self):
+        generations = range(len(gc.get_count()))
+        self.collections = [0 for _ in generations]
+        self.collected = [0 for _ in generations]
+        self.uncollectable = [0 for _ in generations]
+        self.pause_seconds = [0.0 for _ in generations]
+        self.max_pause_seconds = [0.0 for _ in generations]
+        self._started: Dict[int, float] = {}
+
+    def callback(self, phase: str, info: Dict):
+        # Collections run on whichever thread triggered them
+        thread = threading.get_ident()
+        if phase == 'start':
+            self._started[thread] = time.perf_counter()
+            return
+        started = self._started.pop(thread, None)
+        generation = info['generation']
+        self.collections[generation] += 1
+        self.collected[generation] += info.get('collected', 0)
+        self.uncollectable[generation] += info.get('uncollectable', 0)
+        if started is not None:
+            pause = time.perf_counter() - started
+            self.pause_seconds[generation] += pause
+            self.max_pause_seconds[generation] = max(self.max_pause_seconds[generation], pause)
+
+    def as_dict(self) -> Dict:
+        return {
+            "pending": list(gc.get_count()),
+            "thresholds": list(gc.get_threshold()),
+            "collections": self.collections,
+            "collected": self.collected,
+            "uncollectable": self.uncollectable,
+            "pauseMs": [round(s * 1000, 3) for s in self.pause_seconds],
+            "maxPauseMs": [round(s * 1000, 3) for s in self.max_pause_seconds],
+            "garbage": len(gc.garbage),
+        }
+
+
+gc_stats = GcStats()
+_history: Deque[Dict] = deque(maxlen=HISTORY)
+
+
+def install():
+    """Count GC pauses from now on (idempotent)"""
+    if gc_stats.callback not in gc.callbacks:
+        gc.callbacks.append(gc_stats.callback)
+
+
+def sample():
+    """Background job: one point of RSS/GC history"""
+    traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    _history.append({
+        "at": time.time(),
+        "rss": rss_bytes(),
+        "gcCollections": list(gc_stats.collections),
+        "tracedBytes": traced,
+    })
+
+
+# -- tracemalloc --------------------------------------------------------------
+
+# id -> (summary, snapshot)
+_snapshots: 'OrderedDict[int, Tuple[Dict, tracemalloc.Snapshot]]' = OrderedDict()
+_snapshots_lock = threading.Lock()
+_next_id = 1
+
+
+def start_tracing(frames: int = 1) -> Dict:
+    """Start tracemalloc (restarted if it traced another number of frames)"""
+    frames = min(max(int(frames), 1), MAX_FRAMES)
+    if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+        tracemalloc.stop()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracing_stats()
+
+
+def stop_tracing() -> Dict:
+    """Stop tracemalloc and free its traces; snapshots taken so far are kept"""
+    tracemalloc.stop()
+    return tracing_stats()
+
+
+def _site(frame) -> str:
+    return f'{_short(frame.filename)}:{frame.lineno}'
+
+
+_PREFIXES = sorted({os.path.abspath(p) + os.sep for p in sys.path if p and os.path.isdir(p)}, key=len, reverse=True)
+
+
+def _short(filename: str) -> str:
+    for prefix in _PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def _describe(stat, group: str) -> Dict:
+    if group == 'traceback':
+        return {"site": _site(stat.traceback[0]), "traceback": [_site(frame) for frame in reversed(stat.traceback)]}
+    if group == 'filename':
+        return {"site": _short(stat.traceback[0].filename)}
+    return {"site": _site(stat.traceback[0])}
+
+
+def _summary(snapshot_id: int, snapshot: tracemalloc.Snapshot) -> Dict:
+    stats = snapshot.statistics('filename')
+    return {
+        "id": snapshot_id,
+        "takenAt": time.time(),
+        "frames": snapshot.traceback_limit,
+        "size": sum(stat.size for stat in stats),
+        "count": sum(stat.count for stat in stats),
+    }
+
+
+def take_snapshot() -> Dict:
+    global _next_id
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running; start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    with _snapshots_lock:
+        snapshot_id = _next_id
+        _next_id += 1
+    summary = _summary(snapshot_id, snapshot)
+    with _snapshots_lock:
+        _snapshots[snapshot_id] = (summary, snapshot)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return summary
+
+
+def _get(snapshot_id: Optional[int] = None, before: Optional[int] = None) -> Tuple[Dict, tracemalloc.Snapshot]:
+    """A snapshot by id; without id the latest, or the latest taken before ``before``"""
+    with _snapshots_lock:
+        if snapshot_id is None:
+            ids = [i for i in _snapshots if before is None or i < before]
+            if not ids:
+                raise SnapshotNotFound()
+            snapshot_id = ids[-1]
+        if snapshot_id not in _snapshots:
+            raise SnapshotNotFound()
+        return _snapshots[snapshot_id]
+
+
+def top(snapshot_id: Optional[int] = None, group: str = 'lineno', limit: int = DEFAULT_LIMIT) -> Dict:
+    """Largest allocation sites of a snapshot (the latest by default)"""
+    summary, snapshot = _get(snapshot_id)
+    stats = snapshot.statistics(group)
+    return {
+        **summary,
+        "group": group,
+        "top": [{**_describe(stat, group), "size": stat.size, "count": stat.count} for stat in stats[:limit]],
+    }
+
+
+def diff(base: Optional[int] = None, target: Optional[int] = None, group: str = 'lineno',
+         limit: int = DEFAULT_LIMIT) -> Dict:
+    """Sites whose allocations changed most from base to target (by default the last two snapshots)"""
+    target_summary, target_snapshot = _get(target)
+    base_summary, base_snapshot = _get(base, before=target_summary["id"])
+    stats = target_snapshot.compare_to(base_snapshot, group)
+    return {
+        "base": base_summary,
+        "target": target_summary,
+        "group": group,
+        "top": [{
+            **_describe(stat, group),
+            "size": stat.size, "sizeDiff": stat.size_diff,
+            "count": stat.count, "countDiff": stat.count_diff,
+        } for stat in stats[:limit] if stat.size_diff or stat.count_diff],
+    }
+
+
+def clear_snapshots():
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def tracing_stats() -> Dict:
+    tracing = tracemalloc.is_tracing()
+    traced, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    with _snapshots_lock:
+        snapshots = [summary for summary, _ in _snapshots.values()]
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else None,
+        "tracedBytes": traced,
+        "peakTracedBytes": peak,
+        "overheadBytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+        "snapshots": snapshots,
+    }
+
+
+def stats() -> Dict:
+    return {
+        "rss": rss_bytes(),
+        "peakRss": peak_rss_bytes(),
+        "gc": gc_stats.as_dict(),
+        "tracemalloc": tracing_stats(),
+        "history": list(_history),
+    }
+
+
+def _metric_lines() -> List[str]:
+    generations = [{"generation": str(g)} for g in range(len(gc_stats.collections))]
+    lines = metrics.family('process_resident_memory_bytes', 'gauge', 'Resident set size', [({}, rss_bytes())])
+    lines += metrics.family('gc_collections_total', 'counter', 'Garbage collections by generation',
+                            zip(generations, gc_stats.collections))
+    lines += metrics.family('gc_collected_objects_total', 'counter', 'Objects freed by the garbage collector',
+                            zip(generations, gc_stats.collected))
+    lines += metrics.family('gc_pause_seconds_total', 'counter', 'Time spent in garbage collections',
+                            zip(generations, gc_stats.pause_seconds))
+    lines += metrics.family('gc_pending_objects', 'gauge', 'Allocations counted toward the next collection',
+                            zip(generations, gc.get_count()))
+    if tracemalloc.is_tracing():
+        lines += metrics.family('tracemalloc_traced_bytes', 'gauge', 'Memory traced by tracemalloc',
+                                [({}, tracemalloc.get_traced_memory()[0])])
+    return lines
+
+
+metrics.register_collector(_metric_lines)
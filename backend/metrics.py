@@ -0,0 +1,223 @@
+"""Request metrics in the Prometheus text format (``GET /metrics``).
+
+``MetricsMiddleware`` records per route (the route's path template, so
+``/api/songs/{song_id}`` is one series), method and status: a latency
+histogram, a response size histogram, and the number and total time of the
+SQLite statements the request ran on connections from ``db.connect()``.
+``in_flight`` counts requests being handled. Caches count their hits and
+misses on ``cache(name)`` objects; other modules add gauges with
+``register_collector``.
+
+Everything is plain counters updated on the event loop (the statement hook
+runs in the handler's thread but only touches its own request), so the cost
+per request is a few dict lookups and one ``bisect`` per histogram.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import db
+
+PREFIX = 'selfmusic'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNMATCHED = 'unmatched'
+
+enabled = False
+in_flight = 0
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    __slots__ = ('statuses', 'latency', 'size', 'queries', 'query_seconds')
+
+    def __init__(self):
+        self.statuses: Dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+class RequestStats:
+    """SQLite work of one request"""
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+class CacheStats:
+    __slots__ = ('name', 'hits', 'misses')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+
+_routes: Dict[Tuple[str, str], RouteMetrics] = {}
+_caches: Dict[str, CacheStats] = {}
+_caches_lock = threading.Lock()
+_collectors: List[Callable[[], Iterable[str]]] = []
+_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar('metrics_request', default=None)
+
+
+def cache(name: str) -> CacheStats:
+    """Hit/miss counters of a cache, exported as selfmusic_cache_requests_total"""
+    with _caches_lock:
+        return _caches.setdefault(name, CacheStats(name))
+
+
+def register_collector(collect: Callable[[], Iterable[str]]):
+    """Add exposition lines computed at scrape time (see ``family``)"""
+    _collectors.append(collect)
+
+
+def _observe_query(sql: str, seconds: float, statement: bool):
+    stats = _request.get()
+    if stats is not None:
+        if statement:
+            stats.queries += 1
+        stats.seconds += seconds
+
+
+def enable():
+    global enabled
+    enabled = True
+    db.add_query_hook(_observe_query)
+
+
+def disable():
+    global enabled
+    enabled = False
+    db.remove_query_hook(_observe_query)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; does nothing but pass through while metrics are disabled"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not enabled:
+            await self.app(scope, receive, send)
+            return
+
+        global in_flight
+        stats = RequestStats()
+        token = _request.set(stats)
+        status = 500
+        size = 0
+
+        async def send_observed(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_observed)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight -= 1
+            _request.reset(token)
+            # The router stores the matched route in the scope it was given
+            route = getattr(scope.get('route'), 'path', None) or UNMATCHED
+            key = (scope['method'], route)
+            metrics = _routes.get(key)
+            if metrics is None:
+                metrics = _routes[key] = RouteMetrics()
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.latency.observe(elapsed)
+            metrics.size.observe(size)
+            metrics.queries += stats.queries
+            metrics.query_seconds += stats.seconds
+
+
+# -- exposition ---------------------------------------------------------------
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(value) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+    return str(value)
+
+
+def family(name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict, float]]) -> List[str]:
+    """Exposition lines of one metric family: samples are (labels, value)"""
+    full = f'{PREFIX}_{name}'
+    lines = [f'# HELP {full} {help_text}', f'# TYPE {full} {kind}']
+    lines.extend(f'{full}{_labels(labels)} {_number(value)}' for labels, value in samples)
+    return lines
+
+
+def histogram_family(name: str, help_text: str, series: Iterable[Tuple[Dict, Histogram]]) -> List[str]:
+    """Exposition lines of a histogram family: series are (labels, histogram)"""
+    full = f'{PREFIX}_{name}'
+    lines = [f'# HELP {full} {help_text}', f'# TYPE {full} histogram']
+    for labels, histogram in series:
+        cumulative = 0
+        for bound, count in zip(histogram.bounds + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append(f'{full}_bucket{_labels({**labels, "le": bound})} {cumulative}')
+        lines.append(f'{full}_sum{_labels(labels)} {_number(histogram.sum)}')
+        lines.append(f'{full}_count{_labels(labels)} {cumulative}')
+    return lines
+
+
+def render() -> str:
+    routes = sorted(_routes.items())
+    labels = [({"method": method, "route": route}, metrics) for (method, route), metrics in routes]
+    lines = family('http_requests_total', 'counter', 'HTTP requests by route and status', (
+        ({**route_labels, "status": status}, count)
+        for route_labels, metrics in labels for status, count in sorted(metrics.statuses.items())
+    ))
+    lines += family('http_requests_in_flight', 'gauge', 'HTTP requests being handled', [({}, in_flight)])
+    lines += histogram_family('http_request_duration_seconds', 'Time to handle a request, until the last body byte',
+                              [(route_labels, metrics.latency) for route_labels, metrics in labels])
+    lines += histogram_family('http_response_size_bytes', 'Response body size',
+                              [(route_labels, metrics.size) for route_labels, metrics in labels])
+    lines += family('db_queries_total', 'counter', 'SQLite statements run by requests',
+                    ((route_labels, metrics.queries) for route_labels, metrics in labels))
+    lines += family('db_query_seconds_total', 'counter', 'Time requests spent in SQLite statements',
+                    ((route_labels, metrics.query_seconds) for route_labels, metrics in labels))
+    with _caches_lock:
+        caches = sorted(_caches.items())
+    lines += family('cache_requests_total', 'counter', 'Cache lookups by result', (
+        sample for name, stats in caches
+        for sample in (({"cache": name, "result": "hit"}, stats.hits), ({"cache": name, "result": "miss"}, stats.misses))
+    ))
+    for collect in _collectors:
+        lines.extend(collect())
+    return '\n'.join(lines) + '\n'
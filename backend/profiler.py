@@ -0,0 +1,301 @@
+"""On-demand sampling CPU profiler (``POST /api/admin/profile``).
+
+A sampler thread reads every thread's stack with ``sys._current_frames()``
+``hz`` times a second for ``seconds``, and counts identical stacks. Nothing
+is instrumented, so requests run at full speed; the cost is the sampler
+walking the stacks (roughly 10-50 us per sample with a few dozen threads).
+
+Samples can be limited to one route: its template, e.g. ``/api/search``, or
+a request path, which is resolved to the template of the route it matches
+(``/api/songs/abc`` -> ``/api/songs/{song_id}``) since samples are labeled
+by template. A sample belongs to a route when a frame of the route's
+endpoint is on the stack, or, on the event loop thread, when the running
+task is handling a request for it (``ProfilerMiddleware`` notes which
+request each task serves while a profile runs), which also covers
+validation and response encoding outside the endpoint.
+
+Idle threads (blocked in ``select`` or a lock wait) are left out unless
+asked for. Results are collapsed stacks (one ``frame;frame;... count``
+line per stack, for flamegraph.pl and friends) or a speedscope JSON file.
+"""
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+MAX_SECONDS = 60
+MAX_HZ = 250
+DEFAULT_SECONDS = 10
+DEFAULT_HZ = 100
+MAX_DEPTH = 128
+FORMAT_PATTERN = '^(collapsed|speedscope)$'
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# Leaf frames of a thread that is waiting, not working
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('socket.py', 'accept'),
+}
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Request task -> its ASGI scope, while something tracks requests (a profile, the loop watchdog)
+_task_scopes: 'weakref.WeakKeyDictionary[asyncio.Task, Dict]' = weakref.WeakKeyDictionary()
+_trackers = 0
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware noting the request each task handles, while requests are tracked"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if _trackers and scope['type'] == 'http':
+            task = asyncio.current_task()
+            if task is not None:
+                _task_scopes[task] = scope
+        await self.app(scope, receive, send)
+
+
+def track_requests():
+    global _trackers
+    _trackers += 1
+
+
+def untrack_requests():
+    global _trackers
+    _trackers -= 1
+    if not _trackers:
+        _task_scopes.clear()
+
+
+def _route_of(scope: Dict) -> str:
+    return getattr(scope.get('route'), 'path', None) or scope['path']
+
+
+def request_route(loop: asyncio.AbstractEventLoop) -> Optional[str]:
+    """Route of the request whose task the loop is running, if tracked; callable from any thread"""
+    task = asyncio.current_task(loop)
+    scope = _task_scopes.get(task) if task is not None else None
+    return _route_of(scope) if scope is not None else None
+
+
+def _iter_routes(routes):
+    for route in routes:
+        # Newer FastAPI versions keep included routers as one entry
+        included = getattr(route, 'original_router', None)
+        if included is not None:
+            yield from _iter_routes(included.routes)
+        else:
+            yield route
+
+
+def endpoint_codes(routes) -> Dict[object, str]:
+    """Code object of each route's endpoint (unwrapped from decorators) -> route template"""
+    codes = {}
+    for route in _iter_routes(routes):
+        endpoint = getattr(route, 'endpoint', None)
+        if endpoint is None:
+            continue
+        for fn in {endpoint, inspect.unwrap(endpoint)}:
+            code = getattr(fn, '__code__', None)
+            if code is not None:
+                codes[code] = route.path
+    return codes
+
+
+def resolve_route(routes, route: str) -> str:
+    """Template of the first route matching a request path (templates are returned as given)"""
+    path = route.split('?', 1)[0]
+    candidates = [r for r in _iter_routes(routes) if getattr(r, 'path_regex', None) is not None]
+    if any(r.path == path for r in candidates):
+        return path
+    for r in candidates:
+        if r.path_regex.match(path):
+            return r.path
+    # Unmatched requests are labeled with their path
+    return path
+
+
+class Profile:
+    def __init__(self, routes, seconds: float = DEFAULT_SECONDS, hz: int = DEFAULT_HZ,
+                 route: Optional[str] = None, include_idle: bool = False):
+        self.seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+        self.hz = min(max(int(hz), 1), MAX_HZ)
+        self.route = resolve_route(routes, route) if route else None
+        self.include_idle = include_idle
+        self.endpoints = endpoint_codes(routes)
+        # (thread name, route, code objects root first) -> samples
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.sampling_seconds = 0.0
+        self._labels: Dict[object, Tuple[str, str, int]] = {}
+
+    def _frame_label(self, code) -> Tuple[str, str, int]:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (code.co_name, code.co_filename, code.co_firstlineno)
+        return label
+
+    def _loop_route(self, thread_id: int) -> Optional[str]:
+        loop = _loop
+        if loop is None or getattr(loop, '_thread_id', None) != thread_id:
+            return None
+        return request_route(loop)
+
+    def _sample(self, own_id: int, names: Dict[int, str]):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if not self.include_idle:
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+            codes = []
+            route = None
+            while frame is not None and len(codes) < MAX_DEPTH:
+                code = frame.f_code
+                codes.append(code)
+                if route is None:
+                    route = self.endpoints.get(code)
+                frame = frame.f_back
+            if route is None:
+                route = self._loop_route(thread_id)
+            if self.route and self.route != route:
+                continue
+            codes.reverse()
+            if thread_id not in names:
+                names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            self.stacks[(names.get(thread_id, str(thread_id)), route, tuple(codes))] += 1
+            self.samples += 1
+
+    def run(self):
+        """Sample until the duration is over; call from a thread of its own"""
+        own_id = threading.get_ident()
+        interval = 1.0 / self.hz
+        started = time.perf_counter()
+        deadline = started + self.seconds
+        next_tick = started
+        # Thread id -> name, refreshed when an unknown thread shows up
+        names: Dict[int, str] = {}
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            self._sample(own_id, names)
+            self.ticks += 1
+            self.sampling_seconds += time.perf_counter() - now
+            # Fixed rate; ticks missed while the sampler was not scheduled are skipped, not bunched
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+        self.elapsed = time.perf_counter() - started
+
+    # -- output -------------------------------------------------------------
+
+    def _frame_name(self, code) -> str:
+        name, filename, line = self._frame_label(code)
+        return f'{name} ({os.path.basename(filename)}:{line})'
+
+    def collapsed(self) -> str:
+        lines = []
+        for (thread, route, codes), count in self.stacks.most_common():
+            root = [route or thread] if not self.route else [thread]
+            frames = ';'.join(root + [self._frame_name(code).replace(';', ',') for code in codes])
+            lines.append(f'{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self) -> Dict:
+        frames: List[Dict] = []
+        index: Dict[object, int] = {}
+        profiles: Dict[str, Dict] = {}
+        interval = 1.0 / self.hz
+        for (thread, route, codes), count in self.stacks.most_common():
+            name = f'{thread} {route}' if route and not self.route else thread
+            profile = profiles.get(name)
+            if profile is None:
+                profile = profiles[name] = {
+                    "type": "sampled", "name": name, "unit": "seconds",
+                    "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+                }
+            stack = []
+            for code in codes:
+                i = index.get(code)
+                if i is None:
+                    func, filename, line = self._frame_label(code)
+                    i = index[code] = len(frames)
+                    frames.append({"name": func, "file": filename, "line": line})
+                stack.append(i)
+            profile["samples"].append(stack)
+            profile["weights"].append(count * interval)
+            profile["endValue"] += count * interval
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda p: p["endValue"], reverse=True),
+            "name": f"self-music {self.route or 'all threads'} {self.seconds:g}s @ {self.hz} Hz",
+            "exporter": "self-music profiler",
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "seconds": round(self.elapsed, 3),
+            "hz": self.hz,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "route": self.route,
+            # Share of the wall time the sampler itself spent walking stacks
+            "overhead": round(self.sampling_seconds / self.elapsed, 4) if self.elapsed else 0,
+        }
+
+
+async def profile(routes, **options) -> Profile:
+    """Run one profile without blocking the event loop; one at a time"""
+    global _loop
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        current = Profile(routes, **options)
+        loop = _loop = asyncio.get_running_loop()
+        done = loop.create_future()
+    except BaseException:
+        _lock.release()
+        raise
+
+    def finish():
+        # Only once the sampler stopped, even if the request waiting for it went away
+        untrack_requests()
+        _lock.release()
+        if not done.done():
+            done.set_result(None)
+
+    def run():
+        try:
+            current.run()
+        finally:
+            loop.call_soon_threadsafe(finish)
+
+    track_requests()
+    threading.Thread(target=run, name='profiler', daemon=True).start()
+    await asyncio.shield(done)
+    return current
@@ -0,0 +1,408 @@
+"""In-process pub/sub hub for live moment updates.
+
+Moment write paths ``publish()`` compact delta events (a like count, one
+comment, the changed fields); SSE and WebSocket subscribers receive the
+events of the moments they follow, or of every moment. Clients apply the
+deltas to what they already rendered instead of re-polling /api/moments.
+
+Each event is encoded once and the same bytes go to every subscriber. One
+dispatcher task fans events out in publish order, yielding to the event
+loop every ``FANOUT_BATCH`` subscribers so a large topic never stalls
+request handling. The fan-out is bounded:
+
+- at most ``MAX_SUBSCRIBERS`` subscribers, ``MAX_TOPIC_SUBSCRIBERS`` per
+  topic; beyond that subscribing fails with ``HubFull`` (503 / close 1013);
+- every subscriber has a queue of ``QUEUE_SIZE`` events. Writing to a slow
+  client waits for its socket to drain, so its queue fills up; a subscriber
+  whose queue is full is evicted: it gets no more events, and when its
+  stream resumes it is sent a ``resync`` event and closed. Other
+  subscribers are never held back by it.
+
+The last ``REPLAY_SIZE`` events are kept, so a client reconnecting with
+``Last-Event-ID`` gets what it missed, or ``resync`` if that is no longer
+available (or the server restarted).
+
+Events reach the subscribers of this process. With several worker processes
+(see serve.py) ``Hub.relay()`` carries them between workers through the
+``live_events`` table: ``publish()`` hands events to a relay thread that
+writes them, and the thread reads back every worker's events in table order
+(polling ``PRAGMA data_version`` every ``RELAY_INTERVAL``) and feeds them to
+its hub with the table's ``seq`` as id. Every worker thus sends the same
+events with the same ids, and a client reconnecting to another worker
+resumes from its ``Last-Event-ID``.
+"""
+import asyncio
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import orjson
+
+    def _dumps(value) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:  # pragma: no cover - optional speedup
+    def _dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+ALL = '*'
+QUEUE_SIZE = 64
+MAX_SUBSCRIBERS = 10000
+MAX_TOPIC_SUBSCRIBERS = 8000
+MAX_TOPICS_PER_SUBSCRIBER = 100
+FANOUT_BATCH = 500
+REPLAY_SIZE = 512
+HEARTBEAT_INTERVAL = 15
+# WebSocket close codes: resync (evicted or replay gap), hub full
+RESYNC_CLOSE_CODE = 4000
+FULL_CLOSE_CODE = 1013
+# How often the relay looks for events of other workers
+RELAY_INTERVAL = 0.05
+# Relayed events kept in live_events
+RELAY_RETENTION = 4 * REPLAY_SIZE
+
+
+def install(conn: sqlite3.Connection):
+    """Create the table events are relayed through between worker processes"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS live_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            momentId TEXT,
+            data TEXT NOT NULL,
+            createdAt REAL NOT NULL
+        )
+    ''')
+
+
+class HubFull(Exception):
+    pass
+
+
+class Event:
+    __slots__ = ('seq', 'moment_id', 'text', 'sse')
+
+    def __init__(self, seq: int, event_type: str, moment_id: str, fields: Dict):
+        self.seq = seq
+        self.moment_id = moment_id
+        self.text = _dumps({"seq": seq, "type": event_type, "momentId": moment_id, **fields})
+        self.sse = f"id: {seq}\nevent: {event_type}\ndata: {self.text}\n\n".encode()
+
+
+class Subscriber:
+    __slots__ = ('topics', 'queue', 'resync')
+
+    def __init__(self, topics: Iterable[str]):
+        self.topics = tuple(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # Set once the subscriber can't be kept up to date ('evicted', 'gap')
+        self.resync: Optional[str] = None
+
+    async def next_event(self, timeout: float) -> Optional[Event]:
+        """Next event to send; None on heartbeat timeout, a resync event when the stream must end"""
+        if not self.resync:
+            if not self.queue.empty():
+                return self.queue.get_nowait()
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if not self.resync:
+                return event
+        # Evicted while queued events waited: don't bother sending the backlog
+        return hub.resync_event(self.resync)
+
+    def queued(self, limit: int) -> List[Event]:
+        """Events already waiting, up to limit, taken without waiting"""
+        events = []
+        while len(events) < limit and not self.resync and not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+
+class Hub:
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._count = 0
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._replay: Deque[Event] = deque(maxlen=REPLAY_SIZE)
+        self._pending: Deque[Event] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._relay: Optional['Relay'] = None
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def _bind(self, loop: asyncio.AbstractEventLoop):
+        if self._loop is loop and not loop.is_closed():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    # -- subscribers --------------------------------------------------------
+
+    def subscribe(self, moment_ids: Optional[List[str]] = None, last_event_id: Optional[str] = None) -> Subscriber:
+        """Follow some moments (None: all of them); call from the event loop"""
+        self._bind(asyncio.get_running_loop())
+        topics = list(dict.fromkeys(moment_ids))[:MAX_TOPICS_PER_SUBSCRIBER] if moment_ids else [ALL]
+        if self._count >= MAX_SUBSCRIBERS or any(
+                len(self._topics.get(topic, ())) >= MAX_TOPIC_SUBSCRIBERS for topic in topics):
+            self.rejected += 1
+            raise HubFull()
+
+        subscriber = Subscriber(topics)
+        if last_event_id:
+            self._replay_into(subscriber, last_event_id)
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+        self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        removed = False
+        for topic in subscriber.topics:
+            followers = self._topics.get(topic)
+            if followers is not None and subscriber in followers:
+                followers.discard(subscriber)
+                removed = True
+                if not followers:
+                    del self._topics[topic]
+        if removed:
+            self._count -= 1
+
+    def _replay_into(self, subscriber: Subscriber, last_event_id: str):
+        try:
+            last = int(last_event_id)
+        except ValueError:
+            return
+        oldest = self._replay[0].seq if self._replay else self._last_seq + 1
+        if last > self._last_seq or last + 1 < oldest:
+            subscriber.resync = 'gap'
+            return
+        follows_all = subscriber.topics == (ALL,)
+        for event in self._replay:
+            if event.seq > last and (follows_all or event.moment_id in subscriber.topics):
+                if subscriber.queue.full():
+                    subscriber.resync = 'gap'
+                    return
+                subscriber.queue.put_nowait(event)
+
+    def resync_event(self, reason: str) -> Event:
+        """Tells a client to reload what it shows; its id resumes a reconnect from now on"""
+        return Event(self._last_seq, 'resync', None, {"reason": reason})
+
+    def _evict(self, subscriber: Subscriber):
+        subscriber.resync = 'evicted'
+        self.evicted += 1
+        self.unsubscribe(subscriber)
+
+    # -- publishing ---------------------------------------------------------
+
+    def relay(self, db_path: str = 'music.db'):
+        """Share events with the other worker processes; call from the event loop"""
+        if self._relay is None:
+            self._bind(asyncio.get_running_loop())
+            self._relay = Relay(self, db_path)
+            # Ids from before this worker started are not in the replay buffer: resync
+            self._last_seq = self._relay.last_seq
+            self._relay.start()
+
+    def stop_relay(self):
+        if self._relay is not None:
+            self._relay.stop()
+
+    def publish(self, event_type: str, moment_id: str, **fields):
+        """Queue an event for the followers of a moment; safe to call from any thread"""
+        if self._relay is not None:
+            self._relay.send(event_type, moment_id, fields)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None:
+            self._bind(running)
+            self._enqueue(event_type, moment_id, fields)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._enqueue, event_type, moment_id, fields)
+
+    def _enqueue(self, event_type: str, moment_id: str, fields: Dict, seq: Optional[int] = None):
+        event = Event(next(self._seq) if seq is None else seq, event_type, moment_id, fields)
+        self._last_seq = event.seq
+        self._replay.append(event)
+        self._pending.append(event)
+        self.published += 1
+        self._wakeup.set()
+
+    def _receive(self, rows: List[Tuple[int, str, str, str]]):
+        for seq, event_type, moment_id, data in rows:
+            self._enqueue(event_type, moment_id, json.loads(data), seq)
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                event = self._pending.popleft()
+                targets = list(self._topics.get(event.moment_id, ())) + list(self._topics.get(ALL, ()))
+                for i, subscriber in enumerate(targets, 1):
+                    if subscriber.resync:
+                        continue
+                    try:
+                        subscriber.queue.put_nowait(event)
+                        self.delivered += 1
+                    except asyncio.QueueFull:
+                        self._evict(subscriber)
+                    if i % FANOUT_BATCH == 0:
+                        await asyncio.sleep(0)
+
+    def stats(self) -> Dict:
+        largest = sorted(((len(followers), topic) for topic, followers in self._topics.items()), reverse=True)[:5]
+        return {
+            "subscribers": self._count,
+            "topics": len(self._topics),
+            "largestTopics": [{"topic": topic, "subscribers": count} for count, topic in largest],
+            "lastEventId": self._last_seq,
+            "pending": len(self._pending),
+            "published": self.published,
+            "delivered": self.delivered,
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+        }
+
+
+class Relay:
+    """Carries a hub's events to and from the other worker processes through live_events"""
+
+    def __init__(self, hub: Hub, db_path: str):
+        self.hub = hub
+        self._loop = hub._loop
+        self._outbox: Deque[Tuple[str, str, Dict]] = deque()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.last_seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM live_events').fetchone()[0]
+        self._data_version = None
+
+    def start(self):
+        threading.Thread(target=self._run, name='pubsub-relay', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def send(self, event_type: str, moment_id: str, fields: Dict):
+        self._outbox.append((event_type, moment_id, fields))
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(RELAY_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.sync()
+            except sqlite3.Error:
+                print("Live event relay failed:")
+                traceback.print_exc()
+        self._conn.close()
+
+    def sync(self):
+        """Write the events published here, then pass on every event not seen yet"""
+        wrote = False
+        if self._outbox:
+            events = []
+            while self._outbox:
+                event_type, moment_id, fields = self._outbox.popleft()
+                events.append((event_type, moment_id, _dumps(fields), time.time()))
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO live_events (type, momentId, data, createdAt) VALUES (?, ?, ?, ?)', events)
+                self._conn.execute('DELETE FROM live_events WHERE seq <= (SELECT MAX(seq) FROM live_events) - ?',
+                                   (RELAY_RETENTION,))
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+            wrote = True
+        # Commits of other connections change data_version; this connection's own do not
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if not wrote and data_version == self._data_version:
+            return
+        self._data_version = data_version
+        rows = self._conn.execute('SELECT seq, type, momentId, data FROM live_events WHERE seq > ? ORDER BY seq',
+                                  (self.last_seq,)).fetchall()
+        if rows:
+            self.last_seq = rows[-1][0]
+            self._loop.call_soon_threadsafe(self.hub._receive, rows)
+
+
+hub = Hub()
+
+
+def publish(event_type: str, moment_id: str, **fields):
+    hub.publish(event_type, moment_id, **fields)
+
+
+def parse_ids(ids: Optional[str]) -> Optional[List[str]]:
+    values = [value.strip() for value in (ids or '').split(',') if value.strip()]
+    return values or None
+
+
+async def sse_stream(subscriber: Subscriber):
+    """text/event-stream body for a subscriber; unsubscribes when the client goes away"""
+    try:
+        yield b'retry: 3000\n: connected\n\n'
+        while True:
+            event = await subscriber.next_event(HEARTBEAT_INTERVAL)
+            if event is None:
+                yield b': ping\n\n'
+                continue
+            if subscriber.resync:
+                yield event.sse
+                return
+            # A client that fell behind gets its backlog in one write instead of one per event
+            backlog = subscriber.queued(QUEUE_SIZE)
+            yield b''.join([event.sse] + [queued.sse for queued in backlog]) if backlog else event.sse
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+async def websocket_stream(websocket, subscriber: Subscriber):
+    """Send a subscriber's events as text frames until the client leaves or it must resync"""
+
+    async def pump():
+        while True:
+            event = await subscriber.next_event(HEARTBEAT_INTERVAL)
+            if event is None:
+                continue  # the server pings WebSocket clients itself
+            await websocket.send_text(event.text)
+            if subscriber.resync:
+                await websocket.close(code=RESYNC_CLOSE_CODE)
+                return
+
+    async def drain():
+        # Clients send nothing; reading is how a disconnect is noticed
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(drain())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()  # a send to a closed socket is just the client leaving
+        hub.unsubscribe(subscriber)
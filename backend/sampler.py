@@ -0,0 +1,160 @@
+"""Random song sampling for recommendations.
+
+Instead of sorting the whole catalog with ``ORDER BY RANDOM()`` on every
+request, the sampler keeps one compact array of song rowids per filter
+(all songs, per mood, per artist, per genre) and draws k distinct rowids
+from it. The arrays are rebuilt when the catalog version changes.
+
+Seeded requests page through one fixed shuffle of the pool, built once per
+(filters, seed) and catalog version, so consecutive pages never repeat a song.
+"""
+import json
+import random
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import catalog
+import metrics
+
+# Cap on cached mood/artist/genre intersections between refreshes
+MAX_COMBINED_POOLS = 256
+# Cap on cached seeded shuffles between refreshes
+MAX_SEEDED_ORDERS = 64
+POOL_CACHE = metrics.cache('sampler_pools')
+COMBINED_CACHE = metrics.cache('sampler_combined')
+ORDER_CACHE = metrics.cache('sampler_orders')
+
+
+def parse_json_field(field_value: str) -> List[str]:
+    if not field_value:
+        return []
+    try:
+        return json.loads(field_value)
+    except:
+        return []
+
+
+class SongSampler:
+    def __init__(self, db_path: str = 'music.db'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._version = None
+        self._pools: Dict[Tuple[str, str], array] = {}
+        self._combined: Dict[Tuple, array] = {}
+        self._orders: Dict[Tuple, array] = {}
+        self._all = array('q')
+
+    def _refresh(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        # Same eligibility as the recommendation query: songs with an existing primary artist
+        cursor.execute('''
+            SELECT s.rowid, s.artistId, s.moodIds, s.genre
+            FROM songs s
+            JOIN artists ar ON s.artistId = ar.id
+            ORDER BY s.rowid
+        ''')
+
+        all_ids = array('q')
+        pools: Dict[Tuple[str, str], array] = {}
+        for rowid, artist_id, mood_ids, genre in cursor:
+            all_ids.append(rowid)
+            pools.setdefault(('artist', artist_id), array('q')).append(rowid)
+            if genre:
+                pools.setdefault(('genre', genre), array('q')).append(rowid)
+            for mood_id in set(parse_json_field(mood_ids)):
+                pools.setdefault(('mood', mood_id), array('q')).append(rowid)
+        conn.close()
+
+        self._all = all_ids
+        self._pools = pools
+        self._combined = {}
+        self._orders = {}
+
+    def _ensure_fresh(self):
+        version = catalog.current_version()
+        if self._version == version:
+            POOL_CACHE.hits += 1
+            return
+        POOL_CACHE.misses += 1
+        with self._lock:
+            if self._version != version:
+                self._refresh()
+                self._version = version
+
+    def pool(self, mood_id: Optional[str] = None, artist_id: Optional[str] = None,
+             genre: Optional[str] = None) -> array:
+        """Return the array of eligible rowids for the given filters"""
+        self._ensure_fresh()
+
+        keys = []
+        if mood_id:
+            keys.append(('mood', mood_id))
+        if artist_id:
+            keys.append(('artist', artist_id))
+        if genre:
+            keys.append(('genre', genre))
+
+        if not keys:
+            return self._all
+        if len(keys) == 1:
+            return self._pools.get(keys[0], array('q'))
+
+        combined_key = tuple(keys)
+        combined = self._combined.get(combined_key)
+        if combined is not None:
+            COMBINED_CACHE.hits += 1
+        else:
+            COMBINED_CACHE.misses += 1
+            # Intersect starting from the smallest pool
+            pools = sorted((self._pools.get(key, array('q')) for key in keys), key=len)
+            others = [set(p) for p in pools[1:]]
+            combined = array('q', (rowid for rowid in pools[0] if all(rowid in s for s in others)))
+            if len(self._combined) >= MAX_COMBINED_POOLS:
+                self._combined.clear()
+            self._combined[combined_key] = combined
+        return combined
+
+    def seeded_order(self, seed: int, mood_id: Optional[str] = None, artist_id: Optional[str] = None,
+                     genre: Optional[str] = None) -> array:
+        """The pool's rowids in the fixed shuffle for ``seed``"""
+        pool = self.pool(mood_id, artist_id, genre)
+        key = (mood_id, artist_id, genre, seed)
+        orders = self._orders
+        order = orders.get(key)
+        if order is not None:
+            ORDER_CACHE.hits += 1
+            return order
+        ORDER_CACHE.misses += 1
+        order = array('q', pool)
+        random.Random(seed).shuffle(order)
+        if len(orders) >= MAX_SEEDED_ORDERS:
+            orders.clear()
+        orders[key] = order
+        return order
+
+    def sample(self, k: int, mood_id: Optional[str] = None, artist_id: Optional[str] = None,
+               genre: Optional[str] = None, seed: Optional[int] = None, offset: int = 0) -> List[int]:
+        """Pick up to k distinct rowids.
+
+        Without a seed every call returns a fresh random pick. With a seed the
+        order is a fixed shuffle of the pool, so ``offset`` pages through it
+        deterministically.
+        """
+        pool = self.pool(mood_id, artist_id, genre)
+        n = len(pool)
+        if offset >= n or k <= 0:
+            return []
+
+        if seed is not None:
+            # A slice of one shuffle: random.sample() of offset + k items is not an
+            # extension of the sample of offset items, so pages would overlap
+            return list(self.seeded_order(seed, mood_id, artist_id, genre)[offset:offset + k])
+        # Sampling positions from range(n) touches only as many elements as
+        # it returns, so the cost is O(k) regardless of catalog size.
+        return [pool[i] for i in random.sample(range(n), min(k, n))]
+
+
+sampler = SongSampler()
@@ -0,0 +1,89 @@
+"""Start the API server: uvicorn with one or more worker processes.
+
+    python serve.py                          # server.workers in config.yaml (default 1)
+    python serve.py --workers 4 --port 8000
+    WEB_CONCURRENCY=4 python serve.py
+
+``workers: 0`` starts one worker per CPU core. ``init_db`` (schema,
+migrations, the admin user) runs here, once, before any worker starts; the
+workers see ``DB_READY_ENV`` and skip it. With more than one worker the
+database is switched to WAL, so readers in one worker do not wait for a
+writer in another, and the workers (told by ``WORKERS_ENV``) share what would
+otherwise be per-process state through SQLite:
+
+- the catalog version the in-memory caches check, so a write in one worker
+  invalidates the caches of all of them (catalog.py);
+- live moment events, so subscribers of every worker get them (pubsub.py);
+- plays, so the play counts in every worker's in-memory snapshot follow
+  them within a second or so (snapshot.py);
+- background jobs that write the database run in one worker at a time
+  (jobs.py); the in-memory indexes they feed are reloaded by every worker.
+
+Diagnostics kept in memory (``/metrics``, ``/api/admin/loop``, memory,
+profiling, SQL tracing) describe the worker that answered the request.
+"""
+import argparse
+import os
+import sqlite3
+
+import yaml
+
+WORKERS_ENV = 'SELFMUSIC_WORKERS'
+DB_READY_ENV = 'SELFMUSIC_DB_READY'
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 8000
+
+
+def worker_count() -> int:
+    """Worker processes serving the app (1 when not started by serve.py)"""
+    return int(os.environ.get(WORKERS_ENV, 1))
+
+
+def db_ready() -> bool:
+    """Whether serve.py already ran init_db for the workers"""
+    return os.environ.get(DB_READY_ENV) == '1'
+
+
+def configured_workers() -> int:
+    if os.environ.get('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+    try:
+        with open('config.yaml', 'r') as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    return int(config.get('server', {}).get('workers', 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Start the API server')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, help='worker processes, 0 for one per CPU core '
+                                                    '(default: $WEB_CONCURRENCY, then server.workers in config.yaml)')
+    args = parser.parse_args()
+    workers = configured_workers() if args.workers is None else args.workers
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers < 0:
+        parser.error('--workers must be 0 or more')
+
+    os.environ[WORKERS_ENV] = str(workers)
+    # Importing the app runs init_db
+    import main as app_module
+    if workers > 1:
+        conn = sqlite3.connect('music.db')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+    os.environ[DB_READY_ENV] = '1'
+
+    import uvicorn
+    if workers == 1:
+        uvicorn.run(app_module.app, host=args.host, port=args.port)
+    else:
+        # Workers are new processes importing main themselves, with the environment set above
+        uvicorn.run('main:app', host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == '__main__':
+    main()
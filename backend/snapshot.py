@@ -0,0 +1,358 @@
+"""Read-only in-memory snapshot of the catalog.
+
+When enabled (``snapshot.enabled`` in config.yaml) the artists, moods,
+albums, songs and playlists tables plus the song/album artist associations
+are loaded into column-major tables: one ``array('q')``/``array('b')`` per
+integer/boolean column, one list per other column, and an id -> row index
+map per table. Values are stored already converted (parsed JSON lists as tuples, booleans),
+ids and foreign keys are interned.
+
+The batch loaders in fields.py hydrate records from the snapshot instead of
+SQLite whenever it was built from the current ``catalog.current_version()``
+and holds every field asked for (song lyrics are not kept in memory). Every
+admin write bumps the version, so a stale snapshot is simply not used; the
+snapshot job notices the new version, rebuilds in the background and swaps
+the module-level reference, which readers pick up atomically. Play counts
+are the one thing written outside the admin API: ``note_play`` updates them
+in place.
+
+With several worker processes (see serve.py) a play reaches only the
+snapshot of the worker that recorded it. After ``share()``, ``log_play``
+also appends the song to ``play_log`` in the play's transaction, and the
+snapshot job of every worker re-reads the play counts of the songs logged
+since its last look whenever ``PRAGMA data_version`` says another
+connection committed, so counts agree across workers within about
+``REFRESH_INTERVAL`` (the recording worker's included: ``note_play`` then
+leaves them to the job). A worker that fell more than ``PLAY_LOG_RETENTION``
+plays behind rebuilds its snapshot instead.
+"""
+import sqlite3
+import sys
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import catalog
+import fields
+from fields import ENTITIES, ARTIST, Entity, FieldSpec
+
+REFRESH_INTERVAL = 1
+# Rebuild at least this often, to pick up writes made outside the app
+MAX_AGE = 300
+# Plays kept in play_log for the other worker processes to catch up on
+PLAY_LOG_RETENTION = 10000
+
+# Fields never kept in memory; fieldsets asking for them are served from SQLite
+EXCLUDED = {
+    'artist': ('isPrimary',),
+    'song': ('lyrics',),
+}
+# (association table, owner column, owner entity)
+ASSOCIATIONS = (
+    ('song_artists', 'songId', 'song'),
+    ('album_artists', 'albumId', 'album'),
+)
+
+_BOOL = 'b'
+_INT = 'q'
+
+
+def _tuple_or_none(value):
+    return tuple(value) if isinstance(value, list) else value
+
+
+class Table:
+    """One entity's rows, column-major"""
+    __slots__ = ('entity', 'ids', 'index', 'columns', 'kinds')
+
+    def __init__(self, entity: Entity, fields_: List[str], rows: List[tuple]):
+        self.entity = entity
+        self.ids: List[str] = [sys.intern(row[0]) for row in rows]
+        self.index: Dict[str, int] = {row_id: i for i, row_id in enumerate(self.ids)}
+        self.columns: Dict[str, object] = {}
+        # field -> None (plain), 'b' (stored as 0/1) or 'l' (tuple emitted as a list)
+        self.kinds: Dict[str, Optional[str]] = {}
+        for position, field in enumerate(fields_):
+            if field == 'id':
+                self.columns[field] = self.ids
+                self.kinds[field] = None
+                continue
+            convert = entity.columns[field][1]
+            values = [row[position] for row in rows]
+            if convert is not None:
+                values = [convert(v) if v is not None else None for v in values]
+            self.columns[field], self.kinds[field] = self._pack(field, values)
+
+    @staticmethod
+    def _pack(field: str, values: list):
+        if values and all(type(v) is bool for v in values):
+            return array(_BOOL, values), _BOOL
+        if values and all(type(v) is int for v in values):
+            return array(_INT, values), None
+        if any(isinstance(v, list) for v in values):
+            return [_tuple_or_none(v) for v in values], 'l'
+        if field.endswith('Id'):
+            values = [sys.intern(v) if isinstance(v, str) else v for v in values]
+        return values, None
+
+    def plan(self, fields_: List[str]) -> List[tuple]:
+        """(field, column, kind) for each field, resolved once per batch"""
+        return [(field, self.columns[field], self.kinds[field]) for field in fields_]
+
+    @staticmethod
+    def record(i: int, plan: List[tuple]) -> Dict:
+        record = {}
+        for field, column, kind in plan:
+            value = column[i]
+            if kind is not None:
+                if kind == _BOOL:
+                    value = bool(value)
+                elif value is not None:
+                    value = list(value)
+            record[field] = value
+        return record
+
+    def nbytes(self) -> int:
+        """Approximate size: containers plus the objects they hold (shared objects counted once)"""
+        seen = set()
+        total = sys.getsizeof(self.ids) + sys.getsizeof(self.index)
+        for column in self.columns.values():
+            if column is self.ids:
+                values = column
+            else:
+                total += sys.getsizeof(column)
+                if isinstance(column, array):
+                    continue
+                values = column
+            for value in values:
+                if id(value) in seen:
+                    continue
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+                if isinstance(value, tuple):
+                    total += sum(sys.getsizeof(v) for v in value)
+        return total
+
+
+class Snapshot:
+    """All catalog tables at one catalog version; implements the fields.py source interface"""
+    __slots__ = ('version', 'built_at', 'built_monotonic', 'build_seconds', 'tables', 'links', 'bytes')
+
+    def __init__(self, version: int):
+        self.version = version
+        self.built_at = datetime.now().isoformat()
+        self.built_monotonic = time.monotonic()
+        self.build_seconds = 0.0
+        self.tables: Dict[str, Table] = {}
+        # association table -> owner id -> ((artist row index, isPrimary), ...)
+        self.links: Dict[str, Dict[str, Tuple[Tuple[int, bool], ...]]] = {}
+        self.bytes = 0
+
+    def covers(self, entity: Entity, spec: FieldSpec) -> bool:
+        table = self.tables.get(entity.name)
+        return table is not None and all(f in table.columns for f in entity.select_list(spec))
+
+    def fetch(self, entity: Entity, ids: List[str], spec: FieldSpec) -> Dict[str, Dict]:
+        table = self.tables[entity.name]
+        plan = table.plan(entity.select_list(spec))
+        index = table.index
+        records: Dict[str, Dict] = {}
+        for row_id in ids:
+            i = index.get(row_id)
+            if i is not None:
+                records[row_id] = table.record(i, plan)
+        return records
+
+    def associated_artists(self, table: str, key: str, owner_ids: List[str],
+                           spec: FieldSpec) -> Dict[str, List[Dict]]:
+        artists = self.tables['artist']
+        plan = artists.plan([f for f in ARTIST.select_list(spec) if f != 'isPrimary'])
+        links = self.links[table]
+        by_owner: Dict[str, List[Dict]] = {}
+        for owner_id in owner_ids:
+            linked = links.get(owner_id)
+            if not linked:
+                continue
+            entries = by_owner[owner_id] = []
+            for i, is_primary in linked:
+                record = artists.record(i, plan)
+                record['isPrimary'] = is_primary
+                entries.append(record)
+        return by_owner
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "builtAt": self.built_at,
+            "buildSeconds": round(self.build_seconds, 4),
+            "bytes": self.bytes,
+            "rows": {name: len(table.ids) for name, table in self.tables.items()},
+            "links": {name: sum(len(v) for v in links.values()) for name, links in self.links.items()},
+        }
+
+
+def build(db_path: str = 'music.db') -> Snapshot:
+    started = time.perf_counter()
+    # Taken before reading, so a write racing with the build leaves the snapshot stale rather than wrong
+    snapshot = Snapshot(catalog.current_version())
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        # One read transaction: every table is read from the same database state
+        cursor.execute('BEGIN')
+        for name in ('artist', 'mood', 'album', 'song', 'playlist'):
+            entity = ENTITIES[name]
+            excluded = EXCLUDED.get(name, ())
+            fields_ = [f for f in entity.columns if f not in excluded]
+            select = ', '.join(entity.columns[f][0] for f in fields_)
+            cursor.execute(f'SELECT {select} FROM {entity.table} {entity.alias} ORDER BY {entity.alias}.rowid')
+            snapshot.tables[name] = Table(entity, fields_, cursor.fetchall())
+
+        artist_index = snapshot.tables['artist'].index
+        for table, key, owner in ASSOCIATIONS:
+            owners = snapshot.tables[owner].index
+            cursor.execute(f'''
+                SELECT j.{key}, j.artistId, j.isPrimary FROM {table} j
+                JOIN artists a ON a.id = j.artistId
+                ORDER BY j.{key}, j.isPrimary DESC, a.name ASC
+            ''')
+            grouped: Dict[str, List[Tuple[int, bool]]] = {}
+            for owner_id, artist_id, is_primary in cursor.fetchall():
+                if owner_id in owners and artist_id in artist_index:
+                    grouped.setdefault(owner_id, []).append((artist_index[artist_id], bool(is_primary)))
+            snapshot.links[table] = {sys.intern(owner_id): tuple(linked) for owner_id, linked in grouped.items()}
+        conn.rollback()
+    finally:
+        conn.close()
+
+    snapshot.bytes = sum(table.nbytes() for table in snapshot.tables.values()) + sum(
+        sys.getsizeof(links) + sum(sys.getsizeof(v) + len(v) * sys.getsizeof((0, True)) for v in links.values())
+        for links in snapshot.links.values()
+    )
+    snapshot.build_seconds = time.perf_counter() - started
+    return snapshot
+
+
+_current: Optional[Snapshot] = None
+_enabled = False
+_plays: Optional[sqlite3.Connection] = None
+_plays_seq = 0
+_plays_data_version: Optional[int] = None
+
+
+def install(conn: sqlite3.Connection):
+    """Create the table plays are passed between worker processes through"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS play_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            songId TEXT NOT NULL
+        )
+    ''')
+
+
+def _source(entity: Entity, spec: FieldSpec) -> Optional[Snapshot]:
+    snapshot = _current
+    if snapshot is None or snapshot.version != catalog.current_version():
+        return None
+    return snapshot if snapshot.covers(entity, spec) else None
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    fields.snapshot_source = _source
+
+
+def current() -> Optional[Snapshot]:
+    return _current
+
+
+def share(db_path: str = 'music.db'):
+    """Pass play counts between the snapshots of the worker processes through play_log"""
+    global _plays, _plays_seq
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    _plays_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM play_log').fetchone()[0]
+    _plays = conn
+
+
+def log_play(cursor: sqlite3.Cursor, song_id: str):
+    """Log a play for the other workers, in the transaction that counted it (no-op unless shared)"""
+    if _plays is None:
+        return
+    cursor.execute('INSERT INTO play_log (songId) VALUES (?)', (song_id,))
+    cursor.execute('DELETE FROM play_log WHERE seq <= ?', (cursor.lastrowid - PLAY_LOG_RETENTION,))
+
+
+def _read_plays(db_path: str):
+    """Current play counts of the songs played (in any worker) since the last call"""
+    global _plays_seq, _plays_data_version
+    # Commits of other connections change data_version; nothing to read while it stands still
+    data_version = _plays.execute('PRAGMA data_version').fetchone()[0]
+    if data_version == _plays_data_version:
+        return
+    _plays_data_version = data_version
+    oldest = _plays.execute('SELECT MIN(seq) FROM play_log').fetchone()[0]
+    rows = _plays.execute('''
+        SELECT l.seq, s.id, s.playCount FROM play_log l JOIN songs s ON s.id = l.songId
+        WHERE l.seq > ? ORDER BY l.seq
+    ''', (_plays_seq,)).fetchall()
+    missed = oldest is not None and oldest > _plays_seq + 1
+    if rows:
+        _plays_seq = rows[-1][0]
+    snapshot = _current
+    if snapshot is None:
+        return
+    if missed:
+        rebuild(db_path)
+        return
+    songs = snapshot.tables['song']
+    play_counts = songs.columns.get('playCount')
+    if play_counts is None:
+        return
+    for _, song_id, play_count in rows:
+        i = songs.index.get(song_id)
+        if i is not None and play_count is not None:
+            play_counts[i] = play_count
+
+
+def rebuild(db_path: str = 'music.db') -> Snapshot:
+    """Build a new snapshot and swap it in"""
+    global _current
+    snapshot = build(db_path)
+    _current = snapshot
+    return snapshot
+
+
+def refresh(db_path: str = 'music.db'):
+    """Snapshot job: rebuild when the catalog changed or the snapshot got too old"""
+    if not _enabled:
+        return
+    snapshot = _current
+    if (snapshot is None or snapshot.version != catalog.current_version()
+            or time.monotonic() - snapshot.built_monotonic > MAX_AGE):
+        rebuild(db_path)
+    if _plays is not None:
+        _read_plays(db_path)
+
+
+def note_play(song_id: str):
+    """Keep the in-memory play count in step with ``songs.playCount``"""
+    snapshot = _current
+    # Shared: the count is read back from play_log, an increment here would count the play twice
+    if snapshot is None or _plays is not None:
+        return
+    songs = snapshot.tables['song']
+    i = songs.index.get(song_id)
+    play_counts = songs.columns.get('playCount')
+    if i is not None and play_counts is not None and play_counts[i] is not None:
+        play_counts[i] += 1
+
+
+def stats() -> Dict:
+    snapshot = _current
+    return {
+        "enabled": _enabled,
+        "current": snapshot is not None and snapshot.version == catalog.current_version(),
+        "snapshot": snapshot.stats() if snapshot else None,
+    }
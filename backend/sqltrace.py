@@ -0,0 +1,310 @@
+"""SQL tracing: slow-query log and N+1 detection per request.
+
+Opt-in dev mode (``sqltrace.enabled`` in config.yaml) traces every request:
+statements run on connections from ``db.connect()`` are timed by db.py's
+query hook and their text with the bound values comes from
+``Connection.set_trace_callback``. Per request, statements are aggregated by
+shape (whitespace collapsed, literals and ``IN (?, ?, ...)`` lists folded),
+so ``get_song_artists`` called for 50 songs is one shape run 50 times.
+
+- a statement taking at least ``slow_ms`` (execution plus fetching its rows)
+  is logged with its ``EXPLAIN QUERY PLAN``;
+- a request running one shape more than ``nplus1_threshold`` times is
+  flagged as N+1, with its statements by total time.
+
+Both are printed and kept (the last ``RECENT``) for ``GET
+/api/admin/sqltrace``. Tests use ``capture()``, which traces requests
+handled meanwhile without printing, or ``trace()`` for code called directly::
+
+    with sqltrace.capture() as traces:
+        client.get('/api/albums')
+    assert not traces[0].nplus1()
+"""
+import contextvars
+import re
+import sqlite3
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Deque, Dict, List, Optional
+
+import db
+
+RECENT = 100
+DEFAULT_SLOW_MS = 100.0
+DEFAULT_NPLUS1_THRESHOLD = 10
+# Statements listed in a report, by total time
+REPORT_STATEMENTS = 10
+
+enabled = False
+slow_ms = DEFAULT_SLOW_MS
+nplus1_threshold = DEFAULT_NPLUS1_THRESHOLD
+# Printing is for dev mode; captures in tests stay quiet
+log = False
+
+_SPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+@lru_cache(maxsize=4096)
+def normalize(sql: str) -> str:
+    """Statement shape: same shape for the same query with other values or list lengths"""
+    shape = _SPACE.sub(' ', sql).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('(?, ...)', shape)
+
+
+def explain(sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN of a statement (with its values inlined), one indented line per step"""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    # Its own connection: the statement's may be mid-fetch, and EXPLAIN never runs the statement
+    conn = sqlite3.connect(db.DB_PATH, timeout=1)
+    try:
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    finally:
+        conn.close()
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for step_id, parent, _, detail in rows:
+        depth[step_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[step_id] + detail)
+    return lines
+
+
+class Statement:
+    __slots__ = ('shape', 'count', 'seconds', 'max_seconds')
+
+    def __init__(self, shape: str):
+        self.shape = shape
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "shape": self.shape,
+            "count": self.count,
+            "ms": round(self.seconds * 1000, 3),
+            "maxMs": round(self.max_seconds * 1000, 3),
+        }
+
+
+class Trace:
+    """Statements of one request (or one ``trace()`` block), aggregated by shape"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.started = time.time()
+        self.statements: Dict[str, Statement] = {}
+        self.queries = 0
+        self.seconds = 0.0
+        self.slow: List[Dict] = []
+        # Text with values of the statement being prepared, from the trace callback
+        self._expanded: Optional[str] = None
+        # [statement, sql, expanded, seconds] of the last statement, until the next one starts
+        self._current: Optional[list] = None
+
+    def _observe(self, sql: str, seconds: float, statement: bool):
+        if statement:
+            self._settle()
+            shape = normalize(sql)
+            stats = self.statements.get(shape)
+            if stats is None:
+                stats = self.statements[shape] = Statement(shape)
+            stats.count += 1
+            self.queries += 1
+            self._current = [stats, sql, self._expanded, seconds]
+            self._expanded = None
+        else:
+            current = self._current
+            if current is not None and current[1] == sql:
+                stats = current[0]
+                current[3] += seconds
+            else:
+                # Rows of an earlier statement still being fetched (e.g. a streamed listing)
+                stats = self.statements.get(normalize(sql))
+                if stats is None:
+                    return
+        stats.seconds += seconds
+        self.seconds += seconds
+
+    def _settle(self):
+        current, self._current = self._current, None
+        if current is None:
+            return
+        stats, sql, expanded, seconds = current
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        if seconds * 1000 >= slow_ms:
+            text = expanded or sql
+            entry = {
+                "at": time.time(),
+                "label": self.label,
+                "ms": round(seconds * 1000, 3),
+                "sql": text,
+                "plan": explain(text) if expanded else [],
+            }
+            self.slow.append(entry)
+            _slow.append(entry)
+            if log:
+                plan = ''.join(f'\n    {line}' for line in entry["plan"])
+                print(f"Slow query ({entry['ms']} ms) in {self.label or '-'}: {_SPACE.sub(' ', text).strip()}{plan}")
+
+    def finish(self):
+        self._settle()
+
+    def nplus1(self, threshold: Optional[int] = None) -> List[Dict]:
+        """Shapes run more than the threshold times, most repeated first"""
+        limit = nplus1_threshold if threshold is None else threshold
+        repeated = [s for s in self.statements.values() if s.count > limit]
+        return [s.as_dict() for s in sorted(repeated, key=lambda s: s.count, reverse=True)]
+
+    def report(self) -> Dict:
+        top = sorted(self.statements.values(), key=lambda s: s.seconds, reverse=True)[:REPORT_STATEMENTS]
+        return {
+            "label": self.label,
+            "at": self.started,
+            "queries": self.queries,
+            "shapes": len(self.statements),
+            "ms": round(self.seconds * 1000, 3),
+            "nplus1": self.nplus1(),
+            "statements": [s.as_dict() for s in top],
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('sqltrace', default=None)
+_slow: Deque[Dict] = deque(maxlen=RECENT)
+_nplus1: Deque[Dict] = deque(maxlen=RECENT)
+_listeners: List[Callable[[Trace], None]] = []
+_users = 0
+
+
+def _on_statement(statement: str):
+    trace = _trace.get()
+    # Statements of triggers come as "-- TRIGGER name"; the outer statement is the one timed
+    if trace is not None and not statement.startswith('--'):
+        trace._expanded = statement
+
+
+def _on_query(sql: str, seconds: float, statement: bool):
+    trace = _trace.get()
+    if trace is not None:
+        trace._observe(sql, seconds, statement)
+
+
+def _on_connect(conn: sqlite3.Connection):
+    conn.set_trace_callback(_on_statement)
+
+
+def _install():
+    global _users
+    _users += 1
+    db.add_query_hook(_on_query)
+    db.add_connection_hook(_on_connect)
+
+
+def _uninstall():
+    global _users
+    _users -= 1
+    if _users == 0:
+        db.remove_query_hook(_on_query)
+        db.remove_connection_hook(_on_connect)
+
+
+def enable(slow_threshold_ms: float = DEFAULT_SLOW_MS, nplus1_limit: int = DEFAULT_NPLUS1_THRESHOLD,
+           print_findings: bool = True):
+    """Dev mode: trace every request"""
+    global enabled, slow_ms, nplus1_threshold, log
+    slow_ms, nplus1_threshold, log = float(slow_threshold_ms), int(nplus1_limit), print_findings
+    if not enabled:
+        enabled = True
+        _install()
+
+
+def disable():
+    global enabled, log
+    if enabled:
+        enabled = False
+        log = False
+        _uninstall()
+
+
+def _finished(trace: Trace):
+    trace.finish()
+    findings = trace.nplus1()
+    if findings:
+        _nplus1.append(trace.report())
+        if log:
+            for finding in findings:
+                print(f"N+1 in {trace.label}: {finding['count']}x ({finding['ms']} ms) {finding['shape']}")
+    for listener in list(_listeners):
+        listener(trace)
+
+
+@contextmanager
+def trace(label: str = ''):
+    """Trace the statements run in this block (same thread or tasks started from it)"""
+    current = Trace(label)
+    _install()
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+        _uninstall()
+        current.finish()
+
+
+@contextmanager
+def capture():
+    """Collect the traces of the requests handled meanwhile, in the order they finished"""
+    global enabled
+    traces: List[Trace] = []
+    _install()
+    _listeners.append(traces.append)
+    was_enabled, enabled = enabled, True
+    try:
+        yield traces
+    finally:
+        enabled = was_enabled
+        _listeners.remove(traces.append)
+        _uninstall()
+
+
+class SQLTraceMiddleware:
+    """Pure ASGI middleware; one trace per HTTP request while tracing is on"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not enabled:
+            await self.app(scope, receive, send)
+            return
+
+        current = Trace(f"{scope['method']} {scope['path']}")
+        token = _trace.set(current)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _trace.reset(token)
+            route = getattr(scope.get('route'), 'path', None) or scope['path']
+            current.label = f"{scope['method']} {route}"
+            _finished(current)
+
+
+def stats() -> Dict:
+    return {
+        "enabled": enabled,
+        "slowMs": slow_ms,
+        "nplus1Threshold": nplus1_threshold,
+        "slow": list(reversed(_slow)),
+        "nplus1": list(reversed(_nplus1)),
+    }
@@ -0,0 +1,133 @@
+"""Batched and streaming responses for large (admin) listings.
+
+A listing is a query selecting the rows to list plus a ``hydrate(cursor,
+rows)`` function turning one batch of those rows into records (usually via
+the batch loaders in fields.py). The query cursor is read ``BATCH_SIZE``
+rows at a time, so with ``?stream=`` memory stays bounded by one batch and
+the first records go out before the last ones are read:
+
+- ``stream=ndjson``: one JSON record per line (``application/x-ndjson``)
+- ``stream=json``: the usual ``{"success": true, "data": [...]}`` document,
+  encoded incrementally
+
+``paged_listing`` lists one ``LIMIT``/``OFFSET`` page instead and adds the
+``total``/``page``/``limit``/``totalPages`` envelope; ``Filters`` collects
+the WHERE conditions shared by the page query and its ``COUNT(*)``.
+"""
+import math
+import sqlite3
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+
+import db
+from encoding import encode_json
+
+STREAM_PATTERN = '^(ndjson|json)$'
+BATCH_SIZE = 500
+MAX_PAGE_SIZE = 500
+
+Hydrate = Callable[[sqlite3.Cursor, List[tuple]], List[Dict]]
+
+
+def iter_hydrated(sql: str, params: Sequence, hydrate: Hydrate,
+                  db_path: str = 'music.db', batch_size: int = BATCH_SIZE) -> Iterator[List[Dict]]:
+    """Yield hydrated records one batch at a time"""
+    # Starlette may advance a sync generator from different threadpool threads
+    conn = db.connect(db_path, check_same_thread=False)
+    try:
+        rows_cursor = conn.cursor()
+        rows_cursor.execute(sql, params)
+        cursor = conn.cursor()
+        while True:
+            rows = rows_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield hydrate(cursor, rows)
+    finally:
+        conn.close()
+
+
+def _ndjson(batches: Iterator[List[Dict]]) -> Iterator[bytes]:
+    for batch in batches:
+        if batch:
+            yield b'\n'.join(encode_json(record) for record in batch) + b'\n'
+
+
+def _json_document(batches: Iterator[List[Dict]]) -> Iterator[bytes]:
+    yield b'{"success":true,"data":['
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        chunk = b','.join(encode_json(record) for record in batch)
+        yield chunk if first else b',' + chunk
+        first = False
+    yield b']}'
+
+
+def listing_response(sql: str, params: Sequence, hydrate: Hydrate, stream: Optional[str] = None,
+                     db_path: str = 'music.db', batch_size: int = BATCH_SIZE):
+    """``{"success": True, "data": [...]}``, or a streaming response when stream is set"""
+    batches = iter_hydrated(sql, params, hydrate, db_path, batch_size)
+    if stream == 'ndjson':
+        return StreamingResponse(_ndjson(batches), media_type='application/x-ndjson')
+    if stream == 'json':
+        return StreamingResponse(_json_document(batches), media_type='application/json')
+    return {"success": True, "data": [record for batch in batches for record in batch]}
+
+
+class Filters:
+    """WHERE conditions and their parameters, built up from optional query params"""
+
+    def __init__(self):
+        self.conditions: List[str] = []
+        self.params: List = []
+
+    def add(self, condition: str, *params):
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    def search(self, text: Optional[str], *columns: str):
+        """Case-insensitive substring match of text against any of the columns"""
+        text = (text or '').strip()
+        if text:
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            self.add('(' + ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in columns) + ')',
+                     *([pattern] * len(columns)))
+        return self
+
+    @property
+    def where(self) -> str:
+        return ' WHERE ' + ' AND '.join(self.conditions) if self.conditions else ''
+
+
+def paged_listing(select_sql: str, from_sql: str, filters: Filters, order_sql: str, hydrate: Hydrate,
+                  page: int = 1, limit: Optional[int] = None, stream: Optional[str] = None,
+                  db_path: str = 'music.db'):
+    """``SELECT {select_sql} {from_sql} WHERE ... ORDER BY {order_sql}`` as a listing.
+
+    Without limit the whole listing is returned as before. With limit only
+    that page is listed and the total is counted with the same filters; a
+    streamed page carries the counts in ``X-Total-Count``/``X-Total-Pages``.
+    """
+    sql = f'SELECT {select_sql} {from_sql}{filters.where} ORDER BY {order_sql}'
+    if limit is None:
+        return listing_response(sql, filters.params, hydrate, stream, db_path)
+
+    conn = db.connect(db_path)
+    try:
+        total = conn.execute(f'SELECT COUNT(*) {from_sql}{filters.where}', filters.params).fetchone()[0]
+    finally:
+        conn.close()
+    total_pages = math.ceil(total / limit) if total else 0
+
+    response = listing_response(sql + ' LIMIT ? OFFSET ?', [*filters.params, limit, (page - 1) * limit],
+                                hydrate, stream, db_path)
+    if isinstance(response, StreamingResponse):
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Total-Pages'] = str(total_pages)
+        return response
+    response.update(total=total, page=page, limit=limit, totalPages=total_pages)
+    return response
@@ -1,172 +1,57 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Header, Request, WebSocket
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any, Union
-import sqlite3
 import json
 import os
 import mimetypes
 import uuid
+import hashlib
 from datetime import datetime
 
-router = APIRouter()
+import db
+from batch import BatchRequest, run_batch
+from sampler import sampler
+from coalesce import coalesced
+import snapshot
+import changelog
+import pubsub
+import metrics
+from listening import record_play_event, transitions
+from lyrics_index import lyrics_keywords
+from lyrics import parse_lrc, lyrics_payload
+from encoding import EncodedRoute, EncodedResponse
+from fields import (
+    FieldSpec, PROJECTIONS, parse_fields, parse_json_field,
+    load_songs, load_albums, load_artists, load_playlists, load_moods, load_moments, shape_records, normalize,
+    normalize_sections, SHAPE_PATTERN
+)
+from streaming import Filters
+
+router = APIRouter(route_class=EncodedRoute)
+
+# Conditional lyrics requests answered with 304
+LYRICS_ETAG_CACHE = metrics.cache('lyrics_etag')
 
 # Helper functions
-def parse_json_field(field_value: str) -> List[str]:
-    if not field_value:
-        return []
-    try:
-        return json.loads(field_value)
-    except:
-        return []
-
-def ensure_https_url(url: str) -> str:
-    """Convert HTTP URLs to HTTPS to prevent mixed content issues"""
-    if url and url.startswith('http://'):
-        return url.replace('http://', 'https://', 1)
-    return url
-
 def get_artist_by_id(cursor, artist_id: str) -> Optional[Dict]:
-    cursor.execute('SELECT * FROM artists WHERE id=?', (artist_id,))
-    row = cursor.fetchone()
-    if not row:
-        return None
-    return {
-        "id": row[0],
-        "name": row[1],
-        "bio": row[2],
-        "avatar": ensure_https_url(row[3]),
-        "coverUrl": ensure_https_url(row[4]),
-        "followers": row[5],
-        "songCount": row[6],
-        "albumCount": row[7],
-        "genres": parse_json_field(row[8]),
-        "verified": bool(row[9]),
-        "createdAt": row[10],
-        "updatedAt": row[11]
-    }
+    artists = load_artists(cursor, [artist_id], PROJECTIONS['artist']['detail'])
+    return artists[0] if artists else None
 
 def get_album_by_id(cursor, album_id: str) -> Optional[Dict]:
-    cursor.execute('''
-        SELECT a.*, ar.name as artist_name FROM albums a 
-        JOIN artists ar ON a.artistId = ar.id 
-        WHERE a.id=?
-    ''', (album_id,))
-    row = cursor.fetchone()
-    if not row:
-        return None
-    
-    # Get all artists for this album
-    album_artists = get_album_artists(cursor, album_id)
-    primary_artist = next((a for a in album_artists if a.get('isPrimary')), album_artists[0] if album_artists else None)
-    
-    return {
-        "id": row[0],
-        "title": row[1],
-        "artistId": row[2],
-        "artist": primary_artist,  # Primary artist for backward compatibility
-        "artists": album_artists,  # All artists
-        "coverUrl": ensure_https_url(row[3]),
-        "releaseDate": row[4],
-        "songCount": row[5],
-        "duration": row[6],
-        "genre": row[7],
-        "description": row[8],
-        "createdAt": row[9],
-        "updatedAt": row[10]
-    }
-
-def get_album_artists(cursor, album_id: str) -> List[Dict]:
-    """Get all artists for an album with primary artist info"""
-    cursor.execute('''
-        SELECT a.*, aa.isPrimary FROM artists a
-        JOIN album_artists aa ON a.id = aa.artistId
-        WHERE aa.albumId = ?
-        ORDER BY aa.isPrimary DESC, a.name ASC
-    ''', (album_id,))
-    rows = cursor.fetchall()
-    
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": ensure_https_url(row[3]),
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11],
-            "isPrimary": bool(row[12])
-        }
-        artists.append(artist)
-    
-    return artists
-
-def get_song_artists(cursor, song_id: str) -> List[Dict]:
-    """Get all artists for a song with primary artist info"""
-    cursor.execute('''
-        SELECT a.*, sa.isPrimary FROM artists a
-        JOIN song_artists sa ON a.id = sa.artistId
-        WHERE sa.songId = ?
-        ORDER BY sa.isPrimary DESC, a.name ASC
-    ''', (song_id,))
-    rows = cursor.fetchall()
-    
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": ensure_https_url(row[3]),
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11],
-            "isPrimary": bool(row[12])
-        }
-        artists.append(artist)
-    
-    return artists
-
-def get_moods_for_song(cursor, mood_ids: List[str]) -> List[Dict]:
-    if not mood_ids:
-        return []
-    
-    placeholders = ','.join('?' * len(mood_ids))
-    cursor.execute(f'SELECT * FROM moods WHERE id IN ({placeholders})', mood_ids)
-    rows = cursor.fetchall()
-    
-    moods = []
-    for row in rows:
-        mood = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "icon": row[3],
-            "color": row[4],
-            "coverUrl": ensure_https_url(row[5]),
-            "songCount": row[6],
-            "createdAt": row[7],
-            "updatedAt": row[8]
-        }
-        moods.append(mood)
-    
-    return moods
+    albums = load_albums(cursor, [album_id], PROJECTIONS['album']['detail'])
+    return albums[0] if albums else None
 
 # Artists API
 @router.get("/api/artists")
-async def get_artists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
-    conn = sqlite3.connect('music.db')
+async def get_artists(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'artist')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Get total count
@@ -175,33 +60,15 @@ async def get_artists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, l
     
     # Get paginated results
     offset = (page - 1) * limit
-    cursor.execute('SELECT * FROM artists ORDER BY songCount DESC LIMIT ? OFFSET ?', (limit, offset))
-    rows = cursor.fetchall()
+    cursor.execute('SELECT id FROM artists ORDER BY songCount DESC LIMIT ? OFFSET ?', (limit, offset))
+    artists = load_artists(cursor, [row[0] for row in cursor.fetchall()], spec)
     conn.close()
     
-    artists = []
-    for row in rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": row[3],
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        artists.append(artist)
-    
     total_pages = (total + limit - 1) // limit
     
     return {
         "success": True,
-        "data": artists,
+        "data": shape_records('artist', artists, shape),
         "total": total,
         "page": page,
         "limit": limit,
@@ -210,7 +77,7 @@ async def get_artists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, l
 
 @router.get("/api/artists/{artist_id}")
 async def get_artist(artist_id: str):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     artist = get_artist_by_id(cursor, artist_id)
@@ -222,115 +89,74 @@ async def get_artist(artist_id: str):
     return artist
 
 @router.get("/api/artists/{artist_id}/songs")
-async def get_artist_songs(artist_id: str):
-    conn = sqlite3.connect('music.db')
+async def get_artist_songs(
+    artist_id: str,
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify artist exists
-    artist = get_artist_by_id(cursor, artist_id)
-    if not artist:
+    cursor.execute('SELECT id FROM artists WHERE id = ?', (artist_id,))
+    if not cursor.fetchone():
         conn.close()
         raise HTTPException(status_code=404, detail="Artist not found")
     
     # Get songs where this artist is involved (through song_artists table)
     cursor.execute('''
-        SELECT DISTINCT s.*, ar.name as artist_name, al.title as album_title 
+        SELECT DISTINCT s.id, s.createdAt
         FROM songs s 
         JOIN song_artists sa ON s.id = sa.songId
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         WHERE sa.artistId = ?
         ORDER BY s.createdAt DESC
     ''', (artist_id,))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 
 @router.get("/api/artists/{artist_id}/albums")
-async def get_artist_albums(artist_id: str):
-    conn = sqlite3.connect('music.db')
+async def get_artist_albums(
+    artist_id: str,
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'album')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify artist exists
-    artist = get_artist_by_id(cursor, artist_id)
-    if not artist:
+    cursor.execute('SELECT id FROM artists WHERE id = ?', (artist_id,))
+    if not cursor.fetchone():
         conn.close()
         raise HTTPException(status_code=404, detail="Artist not found")
     
     # Get albums where this artist is involved (through album_artists table)
     cursor.execute('''
-        SELECT DISTINCT a.*, ar.name as artist_name FROM albums a 
+        SELECT DISTINCT a.id, a.createdAt FROM albums a 
         JOIN album_artists aa ON a.id = aa.albumId
         JOIN artists ar ON a.artistId = ar.id 
         WHERE aa.artistId = ?
         ORDER BY a.createdAt DESC
     ''', (artist_id,))
-    rows = cursor.fetchall()
-    
-    albums = []
-    for row in rows:
-        # Get all artists for this album
-        album_artists = get_album_artists(cursor, row[0])
-        primary_artist = next((a for a in album_artists if a.get('isPrimary')), album_artists[0] if album_artists else None)
-        
-        album = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": album_artists,  # All artists
-            "coverUrl": ensure_https_url(row[3]),
-            "releaseDate": row[4],
-            "songCount": row[5],
-            "duration": row[6],
-            "genre": row[7],
-            "description": row[8],
-            "createdAt": row[9],
-            "updatedAt": row[10]
-        }
-        albums.append(album)
+    albums = load_albums(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return albums
+    return shape_records('album', albums, shape)
 
 # Albums API
 @router.get("/api/albums")
-async def get_albums(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
-    conn = sqlite3.connect('music.db')
+async def get_albums(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'album')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Get total count
@@ -340,34 +166,11 @@ async def get_albums(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le
     # Get paginated results
     offset = (page - 1) * limit
     cursor.execute('''
-        SELECT a.*, ar.name as artist_name FROM albums a 
+        SELECT a.id FROM albums a 
         JOIN artists ar ON a.artistId = ar.id 
         ORDER BY a.createdAt DESC LIMIT ? OFFSET ?
     ''', (limit, offset))
-    rows = cursor.fetchall()
-    
-    albums = []
-    for row in rows:
-        # Get all artists for this album
-        album_artists = get_album_artists(cursor, row[0])
-        primary_artist = next((a for a in album_artists if a.get('isPrimary')), album_artists[0] if album_artists else None)
-        
-        album = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": album_artists,  # All artists
-            "coverUrl": ensure_https_url(row[3]),
-            "releaseDate": row[4],
-            "songCount": row[5],
-            "duration": row[6],
-            "genre": row[7],
-            "description": row[8],
-            "createdAt": row[9],
-            "updatedAt": row[10]
-        }
-        albums.append(album)
+    albums = load_albums(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
     
@@ -375,7 +178,7 @@ async def get_albums(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le
     
     return {
         "success": True,
-        "data": albums,
+        "data": shape_records('album', albums, shape),
         "total": total,
         "page": page,
         "limit": limit,
@@ -384,7 +187,7 @@ async def get_albums(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le
 
 @router.get("/api/albums/{album_id}")
 async def get_album(album_id: str):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     album = get_album_by_id(cursor, album_id)
@@ -396,68 +199,43 @@ async def get_album(album_id: str):
     return album
 
 @router.get("/api/albums/{album_id}/songs")
-async def get_album_songs(album_id: str):
-    conn = sqlite3.connect('music.db')
+async def get_album_songs(
+    album_id: str,
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify album exists
-    album = get_album_by_id(cursor, album_id)
-    if not album:
+    cursor.execute('SELECT id FROM albums WHERE id = ?', (album_id,))
+    if not cursor.fetchone():
         conn.close()
         raise HTTPException(status_code=404, detail="Album not found")
     
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         WHERE s.albumId = ?
         ORDER BY s.createdAt ASC
     ''', (album_id,))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 
 # Songs API  
 @router.get("/api/songs")
 async def get_songs(
     page: int = Query(1, ge=1), 
     limit: int = Query(20, ge=1, le=100),
-    sort_by: str = Query("created_desc", regex="^(created_desc|created_asc|title_asc|title_desc|play_count_desc|play_count_asc)$")
+    sort_by: str = Query("created_desc", regex="^(created_desc|created_asc|title_asc|title_desc|play_count_desc|play_count_asc)$"),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
 ):
-    conn = sqlite3.connect('music.db')
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Get total count
@@ -480,49 +258,14 @@ async def get_songs(
     else:
         order_clause = "ORDER BY s.createdAt DESC"
     
-    # Get paginated results
+    # Get paginated ids, then load only the requested fields
     offset = (page - 1) * limit
     cursor.execute(f'''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         {order_clause} LIMIT ? OFFSET ?
     ''', (limit, offset))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
     
@@ -530,7 +273,7 @@ async def get_songs(
     
     return {
         "success": True,
-        "data": songs,
+        "data": shape_records('song', songs, shape),
         "total": total,
         "page": page,
         "limit": limit,
@@ -539,59 +282,66 @@ async def get_songs(
     }
 
 @router.get("/api/songs/{song_id}")
-async def get_song(song_id: str):
-    conn = sqlite3.connect('music.db')
+async def get_song(song_id: str, fields: Optional[str] = Query(None)):
+    # The single-song payload also carries the raw lyrics unless fields says otherwise
+    spec = parse_fields(fields, 'song', default='full')
+    conn = db.connect()
+    cursor = conn.cursor()
+    
+    songs = load_songs(cursor, [song_id], spec)
+    conn.close()
+    
+    if not songs:
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    return songs[0]
+
+@router.get("/api/songs/{song_id}/lyrics")
+async def get_song_lyrics(
+    song_id: str,
+    request: Request,
+    at: Optional[int] = Query(None, ge=0),
+    window: int = Query(5, ge=0, le=100)
+):
+    """Parsed timed lyrics; with ?at=<ms> only the lines around that position"""
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
-        JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
+        SELECT s.updatedAt, sl.parsed, sl.songId IS NULL, s.lyrics
+        FROM songs s
+        LEFT JOIN song_lyrics sl ON sl.songId = s.id
         WHERE s.id = ?
     ''', (song_id,))
     row = cursor.fetchone()
+    conn.close()
     
     if not row:
-        conn.close()
         raise HTTPException(status_code=404, detail="Song not found")
     
-    mood_ids = parse_json_field(row[8])
-    moods = get_moods_for_song(cursor, mood_ids)
-    
-    # Get all artists for this song
-    song_artists = get_song_artists(cursor, row[0])
-    primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-    
-    album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-    
-    song = {
-        "id": row[0],
-        "title": row[1],
-        "artistId": row[2],
-        "artist": primary_artist,  # Primary artist for backward compatibility
-        "artists": song_artists,   # All artists
-        "albumId": row[3],
-        "album": album_data,
-        "duration": row[4],
-        "audioUrl": row[5],
-        "coverUrl": ensure_https_url(row[6]),
-        "lyrics": row[7],
-        "moodIds": mood_ids,
-        "moods": moods,
-        "playCount": row[9],
-        "liked": bool(row[10]),
-        "genre": row[11],
-        "createdAt": row[12],
-        "updatedAt": row[13]
-    }
+    updated_at, parsed_json, not_parsed, raw_lyrics = row
+    # Lyrics are parsed on write; rows that slipped through are parsed on the fly
+    parsed = json.loads(parsed_json) if parsed_json else (parse_lrc(raw_lyrics) if not_parsed else None)
     
-    conn.close()
-    return song
+    etag = 'W/"' + hashlib.md5(f"{song_id}:{updated_at}".encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        LYRICS_ETAG_CACHE.hits += 1
+        return Response(status_code=304, headers=headers)
+    LYRICS_ETAG_CACHE.misses += 1
+    
+    return EncodedResponse(
+        {"success": True, "data": lyrics_payload(song_id, parsed, at, window)},
+        headers=headers
+    )
 
 @router.post("/api/songs/{song_id}/play")
-async def record_song_play(song_id: str):
-    conn = sqlite3.connect('music.db')
+async def record_song_play(
+    song_id: str,
+    sessionId: Optional[str] = Query(None, max_length=64),
+    x_session_id: Optional[str] = Header(None, max_length=64)
+):
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Check if song exists
@@ -604,6 +354,12 @@ async def record_song_play(song_id: str):
     
     # Update play count
     cursor.execute('UPDATE songs SET playCount = playCount + 1 WHERE id = ?', (song_id,))
+    snapshot.log_play(cursor, song_id)
+    
+    # Log the play for the co-listening model when the client sent a session id
+    session_id = sessionId or x_session_id
+    if session_id:
+        record_play_event(cursor, session_id, song_id)
     
     # Get updated play count
     cursor.execute('SELECT playCount FROM songs WHERE id = ?', (song_id,))
@@ -611,6 +367,7 @@ async def record_song_play(song_id: str):
     
     conn.commit()
     conn.close()
+    snapshot.note_play(song_id)
     
     return {
         "success": True,
@@ -622,7 +379,7 @@ async def record_song_play(song_id: str):
 
 @router.get("/api/songs/{song_id}/stream")
 async def stream_song(song_id: str):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('SELECT audioUrl FROM songs WHERE id = ?', (song_id,))
@@ -652,9 +409,42 @@ async def stream_song(song_id: str):
         headers={"Accept-Ranges": "bytes"}
     )
 
+@router.get("/api/songs/{song_id}/next")
+async def get_next_songs(
+    song_id: str,
+    limit: int = Query(10, ge=1, le=20),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    """Songs other listeners most often played right after this one"""
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT id FROM songs WHERE id = ?', (song_id,))
+    if not cursor.fetchone():
+        conn.close()
+        raise HTTPException(status_code=404, detail="Song not found")
+    
+    successors = transitions.successors(song_id, limit)
+    weights = dict(successors)
+    songs = load_songs(cursor, [next_id for next_id, _ in successors], spec)
+    for song in songs:
+        song["score"] = round(weights[song["id"]], 3)
+    
+    conn.close()
+    return shape_records('song', songs, shape)
+
 @router.get("/api/songs/{song_id}/similar")
-async def get_similar_songs(song_id: str, limit: int = Query(10, ge=1, le=50)):
-    conn = sqlite3.connect('music.db')
+async def get_similar_songs(
+    song_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    by: str = Query("metadata", pattern="^(metadata|lyrics)$"),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Get the target song's data
@@ -665,91 +455,73 @@ async def get_similar_songs(song_id: str, limit: int = Query(10, ge=1, le=50)):
         conn.close()
         raise HTTPException(status_code=404, detail="Song not found")
     
+    if by == "lyrics":
+        songs = get_lyrics_similar_songs(cursor, song_id, limit, spec)
+        conn.close()
+        return shape_records('song', songs, shape)
+    
     artist_id, mood_ids_str, genre = song_row
     mood_ids = parse_json_field(mood_ids_str)
     
-    # Find similar songs
-    similar_songs = []
-    
     # First, get songs by same artist
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         WHERE s.artistId = ? AND s.id != ?
         ORDER BY s.playCount DESC
     ''', (artist_id, song_id))
-    artist_songs = cursor.fetchall()
+    artist_song_ids = [row[0] for row in cursor.fetchall()]
     
     # Then, get songs with similar moods
     if mood_ids:
-        placeholders = ','.join('?' * len(mood_ids))
-        cursor.execute(f'''
-            SELECT s.*, ar.name as artist_name, al.title as album_title 
-            FROM songs s 
+        cursor.execute('''
+            SELECT s.id FROM songs s 
             JOIN artists ar ON s.artistId = ar.id 
-            LEFT JOIN albums al ON s.albumId = al.id 
             WHERE s.id != ? AND s.moodIds LIKE ?
             ORDER BY s.playCount DESC
         ''', (song_id, f'%{mood_ids[0]}%'))
-        mood_songs = cursor.fetchall()
+        mood_song_ids = [row[0] for row in cursor.fetchall()]
     else:
-        mood_songs = []
+        mood_song_ids = []
     
     # Combine and deduplicate results
-    all_songs = artist_songs + mood_songs
-    seen_ids = set()
-    unique_songs = []
-    
-    for row in all_songs:
-        if row[0] not in seen_ids:
-            seen_ids.add(row[0])
-            unique_songs.append(row)
-            if len(unique_songs) >= limit:
-                break
-    
-    # Build response
-    songs = []
-    for row in unique_songs:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    unique_ids = list(dict.fromkeys(artist_song_ids + mood_song_ids))[:limit]
+    songs = load_songs(cursor, unique_ids, spec)
     
     conn.close()
+    return shape_records('song', songs, shape)
+
+def get_lyrics_similar_songs(cursor, song_id: str, limit: int, spec: FieldSpec) -> List[Dict]:
+    """Songs with the most similar lyrics, from the precomputed TF-IDF index"""
+    cursor.execute('SELECT neighbors FROM song_lyric_index WHERE songId = ?', (song_id,))
+    index_row = cursor.fetchone()
+    neighbors = json.loads(index_row[0]) if index_row and index_row[0] else []
+    
+    scores = dict((neighbor_id, score) for neighbor_id, score in neighbors)
+    songs = load_songs(cursor, [neighbor_id for neighbor_id, _ in neighbors], spec)[:limit]
+    keywords_by_id = {}
+    if songs:
+        placeholders = ','.join('?' * len(songs))
+        cursor.execute(f'SELECT songId, keywords FROM song_lyric_index WHERE songId IN ({placeholders})',
+                       [song["id"] for song in songs])
+        keywords_by_id = {row[0]: parse_json_field(row[1]) for row in cursor.fetchall()}
+    
+    for song in songs:
+        song["score"] = scores[song["id"]]
+        song["keywords"] = keywords_by_id.get(song["id"], [])
+    
     return songs
 
 # Playlists API
 @router.get("/api/playlists")
-async def get_playlists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
-    conn = sqlite3.connect('music.db')
+async def get_playlists(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'playlist')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Get total count of public playlists
@@ -758,28 +530,8 @@ async def get_playlists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1,
     
     # Get paginated results - only basic playlist info, no songs
     offset = (page - 1) * limit
-    cursor.execute('SELECT * FROM playlists WHERE isPublic = 1 ORDER BY createdAt DESC LIMIT ? OFFSET ?', (limit, offset))
-    rows = cursor.fetchall()
-    
-    playlists = []
-    for row in rows:
-        song_ids = parse_json_field(row[4])
-        
-        playlist = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "coverUrl": ensure_https_url(row[3]),
-            "songIds": song_ids,
-            "songCount": row[5],
-            "playCount": row[6],
-            "duration": row[7],
-            "creator": row[8],
-            "isPublic": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        playlists.append(playlist)
+    cursor.execute('SELECT id FROM playlists WHERE isPublic = 1 ORDER BY createdAt DESC LIMIT ? OFFSET ?', (limit, offset))
+    playlists = load_playlists(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
     
@@ -787,7 +539,7 @@ async def get_playlists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1,
     
     return {
         "success": True,
-        "data": playlists,
+        "data": shape_records('playlist', playlists, shape),
         "total": total,
         "page": page,
         "limit": limit,
@@ -795,142 +547,64 @@ async def get_playlists(page: int = Query(1, ge=1), limit: int = Query(20, ge=1,
     }
 
 @router.get("/api/playlists/{playlist_id}")
-async def get_playlist(playlist_id: str):
-    """Get detailed playlist information including all songs"""
-    conn = sqlite3.connect('music.db')
+@coalesced()
+def get_playlist(
+    playlist_id: str,
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    """Get detailed playlist information including all songs; ?fields= selects the song fields"""
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT * FROM playlists WHERE id = ?', (playlist_id,))
-    row = cursor.fetchone()
-    
-    if not row:
+    playlists = load_playlists(cursor, [playlist_id], PROJECTIONS['playlist']['detail'])
+    if not playlists:
         conn.close()
         raise HTTPException(status_code=404, detail="Playlist not found")
+    playlist = playlists[0]
     
-    song_ids = parse_json_field(row[4])
-    
-    # Get songs for this playlist
-    songs = []
-    if song_ids:
-        # Create ORDER BY clause based on song_ids order
-        case_statements = [f"WHEN s.id = '{song_id}' THEN {i}" for i, song_id in enumerate(song_ids)]
-        order_by_case = f"CASE {' '.join(case_statements)} ELSE {len(song_ids)} END"
-        
-        placeholders = ','.join('?' * len(song_ids))
-        cursor.execute(f'''
-            SELECT s.*, ar.name as artist_name, al.title as album_title 
-            FROM songs s 
-            JOIN artists ar ON s.artistId = ar.id 
-            LEFT JOIN albums al ON s.albumId = al.id 
-            WHERE s.id IN ({placeholders})
-            ORDER BY {order_by_case}
-        ''', song_ids)
-        song_rows = cursor.fetchall()
-        
-        for song_row in song_rows:
-            mood_ids = parse_json_field(song_row[8])
-            moods = get_moods_for_song(cursor, mood_ids)
-            
-            # Get all artists for this song
-            song_artists = get_song_artists(cursor, song_row[0])
-            primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-            
-            album_data = get_album_by_id(cursor, song_row[3]) if song_row[3] else None
-            
-            song = {
-                "id": song_row[0],
-                "title": song_row[1],
-                "artistId": song_row[2],
-                "artist": primary_artist,  # Primary artist for backward compatibility
-                "artists": song_artists,   # All artists
-                "albumId": song_row[3],
-                "album": album_data,
-                "duration": song_row[4],
-                "audioUrl": song_row[5],
-                "coverUrl": ensure_https_url(song_row[6]),
-                "lyrics": song_row[7],
-                "moodIds": mood_ids,
-                "moods": moods,
-                "playCount": song_row[9],
-                "liked": bool(song_row[10]),
-                "genre": song_row[11],
-                "createdAt": song_row[12],
-                "updatedAt": song_row[13]
-            }
-            songs.append(song)
-    
-    playlist = {
-        "id": row[0],
-        "name": row[1],
-        "description": row[2],
-        "coverUrl": ensure_https_url(row[3]),
-        "songIds": song_ids,
-        "songs": songs,
-        "songCount": row[5],
-        "playCount": row[6],
-        "duration": row[7],
-        "creator": row[8],
-        "isPublic": bool(row[9]),
-        "createdAt": row[10],
-        "updatedAt": row[11]
-    }
+    # Songs in playlist order
+    songs = load_songs(cursor, playlist['songIds'], spec)
     
     conn.close()
-    return playlist
+    if shape == 'normalized':
+        # songs plus the artists/albums/moods maps, next to the playlist's own fields
+        return {**playlist, **normalize('song', songs)}
+    return {**playlist, "songs": songs}
 # Moods API
 @router.get("/api/moods")
 async def get_moods():
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM moods ORDER BY createdAt DESC')
-    rows = cursor.fetchall()
+    cursor.execute('SELECT id FROM moods ORDER BY createdAt DESC')
+    moods = load_moods(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['mood']['detail'])
     conn.close()
     
-    moods = []
-    for row in rows:
-        mood = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "icon": row[3],
-            "color": row[4],
-            "coverUrl": ensure_https_url(row[5]),
-            "songCount": row[6],
-            "createdAt": row[7],
-            "updatedAt": row[8]
-        }
-        moods.append(mood)
-    
     return moods
 
 @router.get("/api/moods/{mood_id}")
 async def get_mood(mood_id: str):
-    conn = sqlite3.connect('music.db')
+    conn = db.connect()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM moods WHERE id=?', (mood_id,))
-    row = cursor.fetchone()
+    moods = load_moods(cursor, [mood_id], PROJECTIONS['mood']['detail'])
     conn.close()
     
-    if not row:
+    if not moods:
         raise HTTPException(status_code=404, detail="Mood not found")
     
-    mood = {
-        "id": row[0],
-        "name": row[1],
-        "description": row[2],
-        "icon": row[3],
-        "color": row[4],
-        "coverUrl": row[5],
-        "songCount": row[6],
-        "createdAt": row[7],
-        "updatedAt": row[8]
-    }
-    
-    return mood
+    return moods[0]
 
 @router.get("/api/moods/{mood_id}/songs")
-async def get_mood_songs(mood_id: str, page: int = Query(1, ge=1), limit: int = Query(20, ge=1, le=100)):
-    conn = sqlite3.connect('music.db')
+async def get_mood_songs(
+    mood_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Verify mood exists
@@ -949,49 +623,15 @@ async def get_mood_songs(mood_id: str, page: int = Query(1, ge=1), limit: int =
     # Get paginated results
     offset = (page - 1) * limit
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id, s.moodIds FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         WHERE s.moodIds LIKE ?
         ORDER BY s.playCount DESC
         LIMIT ? OFFSET ?
     ''', (f'%{mood_id}%', limit, offset))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        if mood_id in mood_ids:  # Double check the mood is actually in the list
-            moods = get_moods_for_song(cursor, mood_ids)
-            
-            # Get all artists for this song
-            song_artists = get_song_artists(cursor, row[0])
-            primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-            
-            album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-            
-            song = {
-                "id": row[0],
-                "title": row[1],
-                "artistId": row[2],
-                "artist": primary_artist,  # Primary artist for backward compatibility
-                "artists": song_artists,   # All artists
-                "albumId": row[3],
-                "album": album_data,
-                "duration": row[4],
-                "audioUrl": row[5],
-                "coverUrl": ensure_https_url(row[6]),
-                "lyrics": row[7],
-                "moodIds": mood_ids,
-                "moods": moods,
-                "playCount": row[9],
-                "liked": bool(row[10]),
-                "genre": row[11],
-                "createdAt": row[12],
-                "updatedAt": row[13]
-            }
-            songs.append(song)
+    # Double check the mood is actually in the list
+    song_ids = [row[0] for row in cursor.fetchall() if mood_id in parse_json_field(row[1])]
+    songs = load_songs(cursor, song_ids, spec)
     
     conn.close()
     
@@ -999,7 +639,7 @@ async def get_mood_songs(mood_id: str, page: int = Query(1, ge=1), limit: int =
     
     return {
         "success": True,
-        "data": songs,
+        "data": shape_records('song', songs, shape),
         "total": total,
         "page": page,
         "limit": limit,
@@ -1008,89 +648,70 @@ async def get_mood_songs(mood_id: str, page: int = Query(1, ge=1), limit: int =
 
 # Search API
 @router.get("/api/search")
-async def search_content(q: str = Query(..., min_length=1)):
-    conn = sqlite3.connect('music.db')
+@coalesced()
+def search_content(
+    q: str = Query(..., min_length=1),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     query = f"%{q.lower()}%"
     
     # Search songs (include songs by all associated artists, not just primary artist)
     cursor.execute('''
-        SELECT DISTINCT s.*, ar.name as artist_name, al.title as album_title 
+        SELECT DISTINCT s.id, s.title, s.playCount
         FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         LEFT JOIN song_artists sa ON s.id = sa.songId
         LEFT JOIN artists sar ON sa.artistId = sar.id
         WHERE LOWER(s.title) LIKE ? OR LOWER(ar.name) LIKE ? OR LOWER(s.genre) LIKE ? OR LOWER(sar.name) LIKE ?
         ORDER BY s.playCount DESC
-        LIMIT 20
+        LIMIT 50
     ''', (query, query, query, query))
-    song_rows = cursor.fetchall()
-    
-    songs = []
-    for row in song_rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    candidates = {row[0]: row for row in cursor.fetchall()}
+    metadata_ids = set(candidates)
+    
+    # Songs whose lyric keywords contain the query terms
+    lyric_scores = lyrics_keywords.match(q)
+    lyric_ids = [song_id for song_id in sorted(lyric_scores, key=lyric_scores.get, reverse=True)[:50]
+                 if song_id not in candidates]
+    if lyric_ids:
+        placeholders = ','.join('?' * len(lyric_ids))
+        cursor.execute(f'''
+            SELECT s.id, s.title, s.playCount FROM songs s 
+            JOIN artists ar ON s.artistId = ar.id 
+            WHERE s.id IN ({placeholders})
+        ''', lyric_ids)
+        candidates.update((row[0], row) for row in cursor.fetchall())
+    
+    # Rank: title match, then other metadata match, plus lyric keyword overlap; ties by play count
+    q_lower = q.lower()
+    def song_rank(row):
+        score = lyric_scores.get(row[0], 0.0)
+        if q_lower in (row[1] or '').lower():
+            score += 2
+        elif row[0] in metadata_ids:
+            score += 1
+        return (score, row[2] or 0)
+    
+    song_rows = sorted(candidates.values(), key=song_rank, reverse=True)[:20]
+    songs = load_songs(cursor, [row[0] for row in song_rows], spec)
     
     # Search artists
     cursor.execute('''
-        SELECT * FROM artists 
+        SELECT id FROM artists 
         WHERE LOWER(name) LIKE ? OR LOWER(bio) LIKE ?
         ORDER BY followers DESC
         LIMIT 20
     ''', (query, query))
-    artist_rows = cursor.fetchall()
-    
-    artists = []
-    for row in artist_rows:
-        artist = {
-            "id": row[0],
-            "name": row[1],
-            "bio": row[2],
-            "avatar": row[3],
-            "coverUrl": ensure_https_url(row[4]),
-            "followers": row[5],
-            "songCount": row[6],
-            "albumCount": row[7],
-            "genres": parse_json_field(row[8]),
-            "verified": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        artists.append(artist)
+    artists = load_artists(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['artist']['detail'])
     
     # Search albums (include albums by all associated artists, not just primary artist)
     cursor.execute('''
-        SELECT DISTINCT a.*, ar.name as artist_name FROM albums a 
+        SELECT DISTINCT a.id, a.songCount FROM albums a 
         JOIN artists ar ON a.artistId = ar.id 
         LEFT JOIN album_artists aa ON a.id = aa.albumId
         LEFT JOIN artists aar ON aa.artistId = aar.id
@@ -1098,61 +719,29 @@ async def search_content(q: str = Query(..., min_length=1)):
         ORDER BY a.songCount DESC
         LIMIT 20
     ''', (query, query, query, query))
-    album_rows = cursor.fetchall()
-    
-    albums = []
-    for row in album_rows:
-        # Get all artists for this album
-        album_artists = get_album_artists(cursor, row[0])
-        primary_artist = next((a for a in album_artists if a.get('isPrimary')), album_artists[0] if album_artists else None)
-        
-        album = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": album_artists,  # All artists
-            "coverUrl": ensure_https_url(row[3]),
-            "releaseDate": row[4],
-            "songCount": row[5],
-            "duration": row[6],
-            "genre": row[7],
-            "description": row[8],
-            "createdAt": row[9],
-            "updatedAt": row[10]
-        }
-        albums.append(album)
+    albums = load_albums(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['album']['detail'])
     
     # Search playlists
     cursor.execute('''
-        SELECT * FROM playlists 
+        SELECT id FROM playlists 
         WHERE isPublic = 1 AND (LOWER(name) LIKE ? OR LOWER(description) LIKE ?)
         ORDER BY playCount DESC
         LIMIT 20
     ''', (query, query))
-    playlist_rows = cursor.fetchall()
-    
-    playlists = []
-    for row in playlist_rows:
-        playlist = {
-            "id": row[0],
-            "name": row[1],
-            "description": row[2],
-            "coverUrl": ensure_https_url(row[3]),
-            "songIds": parse_json_field(row[4]),
-            "songs": [],  # Not populated for search results
-            "songCount": row[5],
-            "playCount": row[6],
-            "duration": row[7],
-            "creator": row[8],
-            "isPublic": bool(row[9]),
-            "createdAt": row[10],
-            "updatedAt": row[11]
-        }
-        playlists.append(playlist)
+    playlists = load_playlists(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['playlist']['detail'])
     
     conn.close()
     
+    if shape == 'normalized':
+        # Hits as id lists per section; every hit or embedded entity once in the top-level maps
+        return {"success": True, **normalize_sections({
+            "songs": ('song', songs),
+            "artists": ('artist', artists),
+            "albums": ('album', albums),
+            "playlists": ('playlist', playlists),
+        })}
+    for playlist in playlists:
+        playlist["songs"] = []  # Not populated for search results
     return {
         "success": True,
         "songs": songs,
@@ -1162,23 +751,31 @@ async def search_content(q: str = Query(..., min_length=1)):
     }
 
 # Recommendations API
+def _deterministic_recommendations(params: Dict) -> bool:
+    # Without a seed the random sample differs per call, so concurrent callers must not share one
+    return params['seed'] is not None or params['type'] in ('hot', 'new', 'trending')
+
 @router.get("/api/recommendations")
-async def get_recommendations(
+@coalesced(when=_deterministic_recommendations)
+def get_recommendations(
     limit: int = Query(20, ge=1, le=50),
     type: Optional[str] = Query(None),
     moodId: Optional[str] = Query(None),
     artistId: Optional[str] = Query(None),
-    genreId: Optional[str] = Query(None)
+    genreId: Optional[str] = Query(None),
+    seed: Optional[int] = Query(None),
+    page: int = Query(1, ge=1),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
 ):
-    conn = sqlite3.connect('music.db')
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     # Base query
     base_query = '''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
     '''
     
     conditions = []
@@ -1201,212 +798,101 @@ async def get_recommendations(
     where_clause = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
     
     # Apply sorting based on type
-    if type == 'hot':
-        order_clause = 'ORDER BY s.playCount DESC'
-    elif type == 'new':
-        order_clause = 'ORDER BY s.createdAt DESC'
-    elif type == 'trending':
-        order_clause = 'ORDER BY s.playCount DESC'
-    elif type == 'random' or type == 'featured':
-        order_clause = 'ORDER BY RANDOM()'
-    else:
-        order_clause = 'ORDER BY RANDOM()'
-    
-    # Combine query
-    full_query = f"{base_query}{where_clause} {order_clause} LIMIT ?"
-    params.append(limit)
-    
-    cursor.execute(full_query, params)
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
+    if type in ('hot', 'new', 'trending'):
+        if type == 'new':
+            order_clause = 'ORDER BY s.createdAt DESC'
+        else:
+            order_clause = 'ORDER BY s.playCount DESC'
         
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
+        # Combine query
+        full_query = f"{base_query}{where_clause} {order_clause} LIMIT ?"
+        params.append(limit)
         
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+        cursor.execute(full_query, params)
+        song_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        # Random / featured: sample rowids in memory instead of ORDER BY RANDOM()
+        rowids = sampler.sample(
+            limit, mood_id=moodId, artist_id=artistId, genre=genreId,
+            seed=seed, offset=(page - 1) * limit
+        )
+        song_ids = []
+        if rowids:
+            placeholders = ','.join('?' * len(rowids))
+            cursor.execute(f'SELECT rowid, id FROM songs WHERE rowid IN ({placeholders})', rowids)
+            ids_by_rowid = dict(cursor.fetchall())
+            song_ids = [ids_by_rowid[rowid] for rowid in rowids if rowid in ids_by_rowid]
+    
+    songs = load_songs(cursor, song_ids, spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 
 @router.get("/api/trending/songs")
-async def get_trending_songs(limit: int = Query(20, ge=1, le=50)):
-    conn = sqlite3.connect('music.db')
+@coalesced()
+def get_trending_songs(
+    limit: int = Query(20, ge=1, le=50),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         ORDER BY s.playCount DESC
         LIMIT ?
     ''', (limit,))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 
 @router.get("/api/hot/songs")
-async def get_hot_songs(limit: int = Query(20, ge=1, le=50)):
-    conn = sqlite3.connect('music.db')
+@coalesced()
+def get_hot_songs(
+    limit: int = Query(20, ge=1, le=50),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         ORDER BY s.playCount DESC
         LIMIT ?
     ''', (limit,))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 
 @router.get("/api/new/songs")
-async def get_new_songs(limit: int = Query(20, ge=1, le=50)):
-    conn = sqlite3.connect('music.db')
+@coalesced()
+def get_new_songs(
+    limit: int = Query(20, ge=1, le=50),
+    fields: Optional[str] = Query(None),
+    shape: str = Query("nested", pattern=SHAPE_PATTERN)
+):
+    spec = parse_fields(fields, 'song')
+    conn = db.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT s.*, ar.name as artist_name, al.title as album_title 
-        FROM songs s 
+        SELECT s.id FROM songs s 
         JOIN artists ar ON s.artistId = ar.id 
-        LEFT JOIN albums al ON s.albumId = al.id 
         ORDER BY s.createdAt DESC
         LIMIT ?
     ''', (limit,))
-    rows = cursor.fetchall()
-    
-    songs = []
-    for row in rows:
-        mood_ids = parse_json_field(row[8])
-        moods = get_moods_for_song(cursor, mood_ids)
-        
-        # Get all artists for this song
-        song_artists = get_song_artists(cursor, row[0])
-        primary_artist = next((a for a in song_artists if a.get('isPrimary')), song_artists[0] if song_artists else None)
-        
-        album_data = get_album_by_id(cursor, row[3]) if row[3] else None
-        
-        song = {
-            "id": row[0],
-            "title": row[1],
-            "artistId": row[2],
-            "artist": primary_artist,  # Primary artist for backward compatibility
-            "artists": song_artists,   # All artists
-            "albumId": row[3],
-            "album": album_data,
-            "duration": row[4],
-            "audioUrl": row[5],
-            "coverUrl": ensure_https_url(row[6]),
-            "lyrics": row[7],
-            "moodIds": mood_ids,
-            "moods": moods,
-            "playCount": row[9],
-            "liked": bool(row[10]),
-            "genre": row[11],
-            "createdAt": row[12],
-            "updatedAt": row[13]
-        }
-        songs.append(song)
+    songs = load_songs(cursor, [row[0] for row in cursor.fetchall()], spec)
     
     conn.close()
-    return songs
+    return shape_records('song', songs, shape)
 # Music Moments API (Public)
 @router.get("/api/moments")
 async def get_moments(
@@ -1418,117 +904,53 @@ async def get_moments(
     period: Optional[str] = Query(None)
 ):
     """获取音乐朋友圈列表（每首歌只有一个朋友圈，后续分享为评论）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
-    # Build WHERE clause based on filters (除了tags)
-    conditions = []
-    params = []
+    filters = Filters()
 
-    # 解析标签过滤条件
+    # 标签过滤：任一标签命中即可（在 SQL 中展开 tags，只解析当前页的 JSON）
     tag_list = []
     if tags:
         tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
-
-    # 解析年份过滤条件
+    if tag_list:
+        filters.add(
+            f"json_valid(m.tags) AND EXISTS (SELECT 1 FROM json_each(m.tags) t "
+            f"WHERE t.value IN ({','.join('?' * len(tag_list))}))",
+            *tag_list
+        )
+
+    # 年份过滤
     year_list = []
     if year:
         year_list = [int(y.strip()) for y in year.split(",") if y.strip()]
+    if year_list:
+        filters.add(f"m.firstHeardYear IN ({','.join('?' * len(year_list))})", *year_list)
 
-    # 解析时期过滤条件
+    # 时期过滤
     period_list = []
     if period:
         period_list = [p.strip() for p in period.split(",") if p.strip()]
+    if period_list:
+        filters.add(f"m.firstHeardPeriod IN ({','.join('?' * len(period_list))})", *period_list)
 
     if energyLevel is not None:
-        conditions.append("m.energyLevel = ?")
-        params.append(energyLevel)
-
-    where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        filters.add("m.energyLevel = ?", energyLevel)
 
-    # Get all matching moments (without tag filtering in SQL)
-    cursor.execute(f"""
-        SELECT m.*, s.title, s.coverUrl, ar.name as artist_name
+    from_sql = f"""
         FROM music_moments m
         JOIN songs s ON m.songId = s.id
         JOIN artists ar ON s.artistId = ar.id
-        {where_clause}
-        ORDER BY m.createdAt DESC
-    """, params)
-    all_rows = cursor.fetchall()
-
-    # Filter by tags in Python
-    filtered_rows = []
-    for row in all_rows:
-        moment_tags = parse_json_field(row[3])  # row[3] is tags field
-        moment_year = row[5]  # row[5] is firstHeardYear
-        moment_period = row[6]  # row[6] is firstHeardPeriod
-
-        # Check tag filter
-        if tag_list:
-            tag_match = any(tag in moment_tags for tag in tag_list)
-            if not tag_match:
-                continue
-
-        # Check year filter
-        if year_list:
-            if moment_year not in year_list:
-                continue
-
-        # Check period filter
-        if period_list:
-            if moment_period not in period_list:
-                continue
-
-        filtered_rows.append(row)
-
-    # Calculate pagination
-    total = len(filtered_rows)
+        {filters.where}
+    """
+    cursor.execute(f"SELECT COUNT(*) {from_sql}", filters.params)
+    total = cursor.fetchone()[0]
     total_pages = (total + limit - 1) // limit if total > 0 else 1
     offset = (page - 1) * limit
 
-    # Apply pagination
-    paginated_rows = filtered_rows[offset:offset + limit]
-
-    moments = []
-    for row in paginated_rows:
-        moment = {
-            "id": row[0],
-            "songId": row[1],
-            "content": row[2],
-            "tags": parse_json_field(row[3]),
-            "energyLevel": row[4],
-            "firstHeardYear": row[5],
-            "firstHeardPeriod": row[6],
-            "likeCount": row[7],
-            "createdAt": row[8],
-            "updatedAt": row[9],
-            "song": {
-                "id": row[1],
-                "title": row[10],
-                "coverUrl": ensure_https_url(row[11]),
-                "artistName": row[12]
-            }
-        }
-
-        # Get comments for this moment
-        cursor.execute("""
-            SELECT * FROM moment_comments WHERE momentId = ? ORDER BY createdAt ASC
-        """, (moment["id"],))
-        comment_rows = cursor.fetchall()
-
-        moment["comments"] = []
-        for c_row in comment_rows:
-            moment["comments"].append({
-                "id": c_row[0],
-                "momentId": c_row[1],
-                "content": c_row[2],
-                "listenDate": c_row[3],
-                "location": c_row[4],
-                "createdAt": c_row[5]
-            })
-
-        moments.append(moment)
+    cursor.execute(f"SELECT m.id {from_sql} ORDER BY m.createdAt DESC LIMIT ? OFFSET ?",
+                   [*filters.params, limit, offset])
+    moments = load_moments(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['moment']['detail'])
 
     conn.close()
 
@@ -1541,73 +963,63 @@ async def get_moments(
         "totalPages": total_pages
     }
 
+# Live moment updates (likes, comments, edits), see pubsub.py; before /api/moments/{moment_id}
+@router.get("/api/moments/events")
+async def moment_events(
+    ids: Optional[str] = Query(None, description="逗号分隔的朋友圈 id，不传则订阅全部"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Server-Sent Events 推送朋友圈点赞、评论和修改"""
+    try:
+        subscriber = pubsub.hub.subscribe(pubsub.parse_ids(ids), last_event_id)
+    except pubsub.HubFull:
+        raise HTTPException(status_code=503, detail="Too many live subscribers, retry later")
+    return StreamingResponse(
+        pubsub.sse_stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/api/moments/ws")
+async def moment_socket(websocket: WebSocket, ids: Optional[str] = None, lastEventId: Optional[str] = None):
+    """WebSocket 推送朋友圈点赞、评论和修改（消息格式同 SSE 的 data）"""
+    await websocket.accept()
+    try:
+        subscriber = pubsub.hub.subscribe(pubsub.parse_ids(ids), lastEventId)
+    except pubsub.HubFull:
+        await websocket.close(code=pubsub.FULL_CLOSE_CODE)
+        return
+    await pubsub.websocket_stream(websocket, subscriber)
+
 @router.get("/api/moments/{moment_id}")
 async def get_moment(moment_id: str):
     """获取单个音乐朋友圈详情"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT m.*, s.title, s.coverUrl, ar.name as artist_name
+        SELECT m.id
         FROM music_moments m
         JOIN songs s ON m.songId = s.id
         JOIN artists ar ON s.artistId = ar.id
         WHERE m.id = ?
     """, (moment_id,))
-    row = cursor.fetchone()
+    moments = load_moments(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['moment']['detail'])
+    conn.close()
 
-    if not row:
-        conn.close()
+    if not moments:
         raise HTTPException(status_code=404, detail="Moment not found")
 
-    # Get comments for this moment
-    cursor.execute("""
-        SELECT * FROM moment_comments WHERE momentId = ? ORDER BY createdAt ASC
-    """, (moment_id,))
-    comment_rows = cursor.fetchall()
-
-    comments = []
-    for c_row in comment_rows:
-        comments.append({
-            "id": c_row[0],
-            "momentId": c_row[1],
-            "content": c_row[2],
-            "listenDate": c_row[3],
-            "location": c_row[4],
-            "createdAt": c_row[5]
-        })
-
-    moment = {
-        "id": row[0],
-        "songId": row[1],
-        "content": row[2],
-        "tags": parse_json_field(row[3]),
-        "energyLevel": row[4],
-        "firstHeardYear": row[5],
-        "firstHeardPeriod": row[6],
-        "likeCount": row[7],
-        "createdAt": row[8],
-        "updatedAt": row[9],
-        "song": {
-            "id": row[1],
-            "title": row[10],
-            "coverUrl": ensure_https_url(row[11]),
-            "artistName": row[12]
-        },
-        "comments": comments
-    }
-
-    conn.close()
-    return moment
+    return moments[0]
 
 @router.get("/api/songs/{song_id}/moment")
 async def get_song_moment(song_id: str):
     """获取歌曲的朋友圈（用于播放页显示）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute("""
-        SELECT m.*, s.title, s.coverUrl, ar.name as artist_name
+        SELECT m.id
         FROM music_moments m
         JOIN songs s ON m.songId = s.id
         JOIN artists ar ON s.artistId = ar.id
@@ -1615,58 +1027,15 @@ async def get_song_moment(song_id: str):
         ORDER BY m.createdAt DESC
         LIMIT 1
     """, (song_id,))
-    row = cursor.fetchone()
-
-    if not row:
-        conn.close()
-        return {"success": True, "data": None}
-
-    moment_id = row[0]
-
-    # Get comments for this moment
-    cursor.execute("""
-        SELECT * FROM moment_comments WHERE momentId = ? ORDER BY createdAt ASC
-    """, (moment_id,))
-    comment_rows = cursor.fetchall()
-
-    comments = []
-    for c_row in comment_rows:
-        comments.append({
-            "id": c_row[0],
-            "momentId": c_row[1],
-            "content": c_row[2],
-            "listenDate": c_row[3],
-            "location": c_row[4],
-            "createdAt": c_row[5]
-        })
-
-    moment = {
-        "id": row[0],
-        "songId": row[1],
-        "content": row[2],
-        "tags": parse_json_field(row[3]),
-        "energyLevel": row[4],
-        "firstHeardYear": row[5],
-        "firstHeardPeriod": row[6],
-        "likeCount": row[7],
-        "createdAt": row[8],
-        "updatedAt": row[9],
-        "song": {
-            "id": row[1],
-            "title": row[10],
-            "coverUrl": ensure_https_url(row[11]),
-            "artistName": row[12]
-        },
-        "comments": comments
-    }
-
+    moments = load_moments(cursor, [row[0] for row in cursor.fetchall()], PROJECTIONS['moment']['detail'])
     conn.close()
-    return {"success": True, "data": moment}
+
+    return {"success": True, "data": moments[0] if moments else None}
 
 @router.post("/api/moments/{moment_id}/like")
 async def like_moment(moment_id: str):
     """点赞朋友圈（无需鉴权）"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     # Check if moment exists
@@ -1683,6 +1052,7 @@ async def like_moment(moment_id: str):
 
     conn.commit()
     conn.close()
+    pubsub.publish('moment.liked', moment_id, likeCount=new_like_count)
 
     return {
         "success": True,
@@ -1695,7 +1065,7 @@ async def like_moment(moment_id: str):
 @router.get("/api/moments/filters/tags")
 async def get_all_tags():
     """获取所有已使用的标签"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute("SELECT tags FROM music_moments WHERE tags IS NOT NULL AND tags != '[]'")
@@ -1718,7 +1088,7 @@ async def get_all_tags():
 @router.get("/api/moments/filters/years")
 async def get_all_years():
     """获取所有首次听到的年份"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -1741,7 +1111,7 @@ async def get_all_years():
 @router.get("/api/moments/filters/periods")
 async def get_all_periods():
     """获取所有首次听到的时期"""
-    conn = sqlite3.connect("music.db")
+    conn = db.connect()
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -1760,3 +1130,21 @@ async def get_all_periods():
         "success": True,
         "data": periods
     }
+
+@router.post("/api/batch")
+async def batch_requests(batch: BatchRequest, request: Request):
+    """Run several public GET requests on one connection and return all results (see batch.py)"""
+    return await run_batch(router, request, batch)
+
+@router.get("/api/sync")
+async def sync_catalog(
+    since: Optional[str] = Query(None, description="上次同步返回的 next"),
+    limit: int = Query(changelog.DEFAULT_PAGE_SIZE, ge=1, le=changelog.MAX_PAGE_SIZE)
+):
+    """增量同步：返回 since 之后新增/修改的实体和已删除实体的 id（见 changelog.py）"""
+    conn = db.connect()
+    try:
+        data = changelog.changes_since(conn, changelog.parse_token(since), limit)
+    finally:
+        conn.close()
+    return {"success": True, "data": data}
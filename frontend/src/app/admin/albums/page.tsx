@@ -1,7 +1,7 @@
 "use client";
 
 import { useState, useEffect } from 'react';
-import { adminAPI } from '@/lib/admin-api';
+import { adminAPI, AdminAlbumListParams } from '@/lib/admin-api';
 import AdminLayout from '@/components/admin-layout';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -37,11 +37,20 @@ interface AlbumWithArtist extends Album {
   artistName?: string;
 }
 
+const PAGE_SIZE = 50;
+const selectClassName = "flex h-10 rounded-md border border-input bg-background px-3 py-2 text-sm ring-offset-background focus-visible:outline-none focus-visible:ring-2 focus-visible:ring-ring focus-visible:ring-offset-2";
+
 export default function AlbumsPage() {
   const [albums, setAlbums] = useState<AlbumWithArtist[]>([]);
   const [artists, setArtists] = useState<Artist[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [filterArtistId, setFilterArtistId] = useState('');
+  const [sort, setSort] = useState<NonNullable<AdminAlbumListParams['sort']>>('created_desc');
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
+  const [totalPages, setTotalPages] = useState(0);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingAlbum, setEditingAlbum] = useState<AlbumWithArtist | null>(null);
   const [formData, setFormData] = useState({
@@ -57,31 +66,60 @@ export default function AlbumsPage() {
   });
 
   useEffect(() => {
-    fetchData();
+    fetchArtists();
   }, []);
 
-  const fetchData = async () => {
+  // 搜索输入防抖
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // 筛选条件变化时回到第一页
+  useEffect(() => {
+    setPage(1);
+  }, [debouncedSearch, filterArtistId, sort]);
+
+  useEffect(() => {
+    fetchAlbums();
+  }, [page, debouncedSearch, filterArtistId, sort]);
+
+  // 专辑列表由服务端分页、筛选和排序
+  const fetchAlbums = async () => {
     try {
       setLoading(true);
-      const [albumsResponse, artistsResponse] = await Promise.all([
-        adminAPI.getAlbums(),
-        adminAPI.getArtists()
-      ]);
-      
-      if (albumsResponse.success && albumsResponse.data) {
-        setAlbums(albumsResponse.data);
-      }
+      const response = await adminAPI.getAlbums({
+        page,
+        limit: PAGE_SIZE,
+        q: debouncedSearch,
+        artistId: filterArtistId,
+        sort
+      });
       
-      if (artistsResponse.success && artistsResponse.data) {
-        setArtists(artistsResponse.data);
+      if (response.success && response.data) {
+        setAlbums(response.data);
+        setTotal(response.total ?? response.data.length);
+        setTotalPages(response.totalPages ?? 1);
       }
     } catch (error) {
-      console.error('Failed to fetch data:', error);
+      console.error('Failed to fetch albums:', error);
     } finally {
       setLoading(false);
     }
   };
 
+  // 艺术家选择器与筛选下拉框使用全部艺术家
+  const fetchArtists = async () => {
+    try {
+      const response = await adminAPI.getArtists();
+      if (response.success && response.data) {
+        setArtists(response.data);
+      }
+    } catch (error) {
+      console.error('Failed to fetch artists:', error);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     
@@ -112,7 +150,7 @@ export default function AlbumsPage() {
       setDialogOpen(false);
       setEditingAlbum(null);
       resetForm();
-      fetchData();
+      fetchAlbums();
     } catch (error) {
       console.error('Failed to save album:', error);
     }
@@ -144,7 +182,7 @@ export default function AlbumsPage() {
     if (confirm('确定要删除这个专辑吗？')) {
       try {
         await adminAPI.deleteAlbum(id);
-        fetchData();
+        fetchAlbums();
       } catch (error) {
         console.error('Failed to delete album:', error);
       }
@@ -165,14 +203,6 @@ export default function AlbumsPage() {
     });
   };
 
-  const filteredAlbums = albums.filter(album =>
-    album.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    (album.artists && album.artists.some(artist => 
-      artist.name.toLowerCase().includes(searchTerm.toLowerCase())
-    )) ||
-    (album.artistName && album.artistName.toLowerCase().includes(searchTerm.toLowerCase()))
-  );
-
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString('zh-CN');
   };
@@ -319,15 +349,31 @@ export default function AlbumsPage() {
           </Dialog>
         </div>
 
-        {/* Search */}
-        <div className="relative max-w-sm">
-          <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
-          <Input
-            placeholder="搜索专辑或艺术家..."
-            value={searchTerm}
-            onChange={(e) => setSearchTerm(e.target.value)}
-            className="pl-10"
-          />
+        {/* Search & Filters */}
+        <div className="flex flex-wrap items-center gap-3">
+          <div className="relative w-full max-w-sm">
+            <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
+            <Input
+              placeholder="搜索专辑或艺术家..."
+              value={searchTerm}
+              onChange={(e) => setSearchTerm(e.target.value)}
+              className="pl-10"
+            />
+          </div>
+          <select value={filterArtistId} onChange={(e) => setFilterArtistId(e.target.value)} className={selectClassName}>
+            <option value="">全部艺术家</option>
+            {artists.map((artist) => (
+              <option key={artist.id} value={artist.id}>{artist.name}</option>
+            ))}
+          </select>
+          <select value={sort} onChange={(e) => setSort(e.target.value as NonNullable<AdminAlbumListParams['sort']>)} className={selectClassName}>
+            <option value="created_desc">最新创建</option>
+            <option value="created_asc">最早创建</option>
+            <option value="title_asc">标题 A-Z</option>
+            <option value="title_desc">标题 Z-A</option>
+            <option value="release_desc">最新发行</option>
+            <option value="release_asc">最早发行</option>
+          </select>
         </div>
 
         {/* Albums Table */}
@@ -341,12 +387,12 @@ export default function AlbumsPage() {
               <CardTitle className="flex items-center gap-2">
                 <AlbumIcon className="h-5 w-5" />
                 专辑列表
-                <Badge variant="secondary">{filteredAlbums.length}</Badge>
+                <Badge variant="secondary">{total}</Badge>
               </CardTitle>
             </CardHeader>
             <CardContent>
               <div className="space-y-4">
-                {filteredAlbums.map((album, index) => (
+                {albums.map((album, index) => (
                   <div key={album.id}>
                     <div className="flex items-center justify-between">
                       <div className="flex items-center space-x-4">
@@ -424,17 +470,33 @@ export default function AlbumsPage() {
                         </DropdownMenuContent>
                       </DropdownMenu>
                     </div>
-                    {index < filteredAlbums.length - 1 && <Separator className="mt-4" />}
+                    {index < albums.length - 1 && <Separator className="mt-4" />}
                   </div>
                 ))}
               </div>
 
-              {filteredAlbums.length === 0 && (
+              {albums.length === 0 && (
                 <div className="text-center py-12">
                   <AlbumIcon className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
                   <p className="text-muted-foreground">没有找到专辑</p>
                 </div>
               )}
+
+              {totalPages > 1 && (
+                <div className="flex items-center justify-between pt-6">
+                  <p className="text-sm text-muted-foreground">
+                    第 {page} / {totalPages} 页，共 {total} 张
+                  </p>
+                  <div className="flex gap-2">
+                    <Button variant="outline" size="sm" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+                      上一页
+                    </Button>
+                    <Button variant="outline" size="sm" disabled={page >= totalPages} onClick={() => setPage(page + 1)}>
+                      下一页
+                    </Button>
+                  </div>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
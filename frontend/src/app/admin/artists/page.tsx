@@ -1,7 +1,7 @@
 "use client";
 
 import { useState, useEffect } from 'react';
-import { adminAPI } from '@/lib/admin-api';
+import { adminAPI, AdminArtistListParams } from '@/lib/admin-api';
 import AdminLayout from '@/components/admin-layout';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -31,10 +31,18 @@ import {
   DropdownMenuTrigger,
 } from "@/components/ui/dropdown-menu";
 
+const PAGE_SIZE = 50;
+const selectClassName = "flex h-10 rounded-md border border-input bg-background px-3 py-2 text-sm ring-offset-background focus-visible:outline-none focus-visible:ring-2 focus-visible:ring-ring focus-visible:ring-offset-2";
+
 export default function ArtistsPage() {
   const [artists, setArtists] = useState<Artist[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [sort, setSort] = useState<NonNullable<AdminArtistListParams['sort']>>('created_desc');
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
+  const [totalPages, setTotalPages] = useState(0);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingArtist, setEditingArtist] = useState<Artist | null>(null);
   const [formData, setFormData] = useState({
@@ -47,16 +55,30 @@ export default function ArtistsPage() {
     verified: false
   });
 
+  // 搜索输入防抖
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // 筛选条件变化时回到第一页
+  useEffect(() => {
+    setPage(1);
+  }, [debouncedSearch, sort]);
+
   useEffect(() => {
     fetchArtists();
-  }, []);
+  }, [page, debouncedSearch, sort]);
 
+  // 艺术家列表由服务端分页、搜索和排序
   const fetchArtists = async () => {
     try {
       setLoading(true);
-      const response = await adminAPI.getArtists();
+      const response = await adminAPI.getArtists({ page, limit: PAGE_SIZE, q: debouncedSearch, sort });
       if (response.success && response.data) {
         setArtists(response.data);
+        setTotal(response.total ?? response.data.length);
+        setTotalPages(response.totalPages ?? 1);
       }
     } catch (error) {
       console.error('Failed to fetch artists:', error);
@@ -130,10 +152,6 @@ export default function ArtistsPage() {
     setFormData({ ...formData, genres });
   };
 
-  const filteredArtists = artists.filter(artist =>
-    artist.name.toLowerCase().includes(searchTerm.toLowerCase())
-  );
-
   return (
     <AdminLayout>
       <div className="space-y-6">
@@ -255,15 +273,25 @@ export default function ArtistsPage() {
           </Dialog>
         </div>
 
-        {/* Search */}
-        <div className="relative max-w-sm">
-          <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
-          <Input
-            placeholder="搜索艺术家..."
-            value={searchTerm}
-            onChange={(e) => setSearchTerm(e.target.value)}
-            className="pl-10"
-          />
+        {/* Search & Sort */}
+        <div className="flex flex-wrap items-center gap-3">
+          <div className="relative w-full max-w-sm">
+            <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
+            <Input
+              placeholder="搜索艺术家..."
+              value={searchTerm}
+              onChange={(e) => setSearchTerm(e.target.value)}
+              className="pl-10"
+            />
+          </div>
+          <select value={sort} onChange={(e) => setSort(e.target.value as NonNullable<AdminArtistListParams['sort']>)} className={selectClassName}>
+            <option value="created_desc">最新创建</option>
+            <option value="created_asc">最早创建</option>
+            <option value="name_asc">名称 A-Z</option>
+            <option value="name_desc">名称 Z-A</option>
+            <option value="song_count_desc">歌曲最多</option>
+            <option value="followers_desc">粉丝最多</option>
+          </select>
         </div>
 
         {/* Artists Table */}
@@ -277,12 +305,12 @@ export default function ArtistsPage() {
               <CardTitle className="flex items-center gap-2">
                 <Users className="h-5 w-5" />
                 艺术家列表
-                <Badge variant="secondary">{filteredArtists.length}</Badge>
+                <Badge variant="secondary">{total}</Badge>
               </CardTitle>
             </CardHeader>
             <CardContent>
               <div className="space-y-4">
-                {filteredArtists.map((artist, index) => (
+                {artists.map((artist, index) => (
                   <div key={artist.id}>
                     <div className="flex items-center justify-between">
                       <div className="flex items-center space-x-4">
@@ -347,17 +375,33 @@ export default function ArtistsPage() {
                         </DropdownMenuContent>
                       </DropdownMenu>
                     </div>
-                    {index < filteredArtists.length - 1 && <Separator className="mt-4" />}
+                    {index < artists.length - 1 && <Separator className="mt-4" />}
                   </div>
                 ))}
               </div>
 
-              {filteredArtists.length === 0 && (
+              {artists.length === 0 && (
                 <div className="text-center py-12">
                   <Users className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
                   <p className="text-muted-foreground">没有找到艺术家</p>
                 </div>
               )}
+
+              {totalPages > 1 && (
+                <div className="flex items-center justify-between pt-6">
+                  <p className="text-sm text-muted-foreground">
+                    第 {page} / {totalPages} 页，共 {total} 位
+                  </p>
+                  <div className="flex gap-2">
+                    <Button variant="outline" size="sm" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+                      上一页
+                    </Button>
+                    <Button variant="outline" size="sm" disabled={page >= totalPages} onClick={() => setPage(page + 1)}>
+                      下一页
+                    </Button>
+                  </div>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
@@ -57,6 +57,12 @@ interface PlaylistWithSongs extends Omit<Playlist, 'songs'> {
   songs?: Song[];
 }
 
+const PAGE_SIZE = 50;
+// 选歌列表每次搜索返回的歌曲数
+const PICKER_SIZE = 50;
+// 按 ID 获取歌曲时每个请求的 ID 数
+const IDS_CHUNK = 100;
+
 // 可排序的歌曲项组件
 function SortableSongItem({ song, onRemove }: { song: Song; onRemove: () => void }) {
   const {
@@ -118,9 +124,18 @@ function SortableSongItem({ song, onRemove }: { song: Song; onRemove: () => void
 
 export default function PlaylistsPage() {
   const [playlists, setPlaylists] = useState<PlaylistWithSongs[]>([]);
+  // 选歌列表：按关键词搜索的一页歌曲
   const [songs, setSongs] = useState<Song[]>([]);
+  // 已加载过的歌曲（搜索结果与歌单中的歌曲），用于排序列表和时长计算
+  const [songsById, setSongsById] = useState<Record<string, Song>>({});
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [songSearch, setSongSearch] = useState('');
+  const [debouncedSongSearch, setDebouncedSongSearch] = useState('');
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
+  const [totalPages, setTotalPages] = useState(0);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingPlaylist, setEditingPlaylist] = useState<PlaylistWithSongs | null>(null);
   const [formData, setFormData] = useState({
@@ -140,32 +155,88 @@ export default function PlaylistsPage() {
     })
   );
 
+  // 搜索输入防抖
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSongSearch(songSearch.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [songSearch]);
+
+  // 搜索条件变化时回到第一页
+  useEffect(() => {
+    setPage(1);
+  }, [debouncedSearch]);
+
+  useEffect(() => {
+    fetchPlaylists();
+  }, [page, debouncedSearch]);
+
   useEffect(() => {
-    fetchData();
-  }, []);
+    if (dialogOpen) {
+      fetchSongs();
+    }
+  }, [dialogOpen, debouncedSongSearch]);
 
-  const fetchData = async () => {
+  // 歌单列表由服务端分页和搜索
+  const fetchPlaylists = async () => {
     try {
       setLoading(true);
-      const [playlistsResponse, songsResponse] = await Promise.all([
-        adminAPI.getPlaylists(),
-        adminAPI.getSongs()
-      ]);
-      
-      if (playlistsResponse.success && playlistsResponse.data) {
-        setPlaylists(playlistsResponse.data);
-      }
+      const response = await adminAPI.getPlaylists({ page, limit: PAGE_SIZE, q: debouncedSearch });
       
-      if (songsResponse.success && songsResponse.data) {
-        setSongs(songsResponse.data);
+      if (response.success && response.data) {
+        setPlaylists(response.data);
+        setTotal(response.total ?? response.data.length);
+        setTotalPages(response.totalPages ?? 1);
       }
     } catch (error) {
-      console.error('Failed to fetch data:', error);
+      console.error('Failed to fetch playlists:', error);
     } finally {
       setLoading(false);
     }
   };
 
+  const rememberSongs = (loaded: Song[]) => {
+    setSongsById(prev => {
+      const next = { ...prev };
+      loaded.forEach(song => { next[song.id] = song; });
+      return next;
+    });
+  };
+
+  // 选歌列表只取一页不含歌词的歌曲
+  const fetchSongs = async () => {
+    try {
+      const response = await adminAPI.getSongs({ q: debouncedSongSearch, limit: PICKER_SIZE, fields: 'admin_list' });
+      if (response.success && response.data) {
+        setSongs(response.data);
+        rememberSongs(response.data);
+      }
+    } catch (error) {
+      console.error('Failed to fetch songs:', error);
+    }
+  };
+
+  // 编辑时加载歌单中尚未加载的歌曲
+  const fetchSongsByIds = async (songIds: string[]) => {
+    const missing = songIds.filter(id => !songsById[id]);
+    const chunks: string[][] = [];
+    for (let i = 0; i < missing.length; i += IDS_CHUNK) {
+      chunks.push(missing.slice(i, i + IDS_CHUNK));
+    }
+    try {
+      const responses = await Promise.all(chunks.map(ids =>
+        adminAPI.getSongs({ ids: ids.join(','), fields: 'admin_list' })
+      ));
+      rememberSongs(responses.flatMap(response => response.data || []));
+    } catch (error) {
+      console.error('Failed to fetch playlist songs:', error);
+    }
+  };
+
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -191,7 +262,7 @@ export default function PlaylistsPage() {
       setDialogOpen(false);
       setEditingPlaylist(null);
       resetForm();
-      fetchData();
+      fetchPlaylists();
     } catch (error) {
       console.error('Failed to save playlist:', error);
     }
@@ -199,6 +270,7 @@ export default function PlaylistsPage() {
 
   const handleEdit = (playlist: PlaylistWithSongs) => {
     setEditingPlaylist(playlist);
+    fetchSongsByIds(playlist.songIds);
     setFormData({
       name: playlist.name,
       description: playlist.description || '',
@@ -214,7 +286,7 @@ export default function PlaylistsPage() {
     if (confirm('确定要删除这个歌单吗？')) {
       try {
         await adminAPI.deletePlaylist(id);
-        fetchData();
+        fetchPlaylists();
       } catch (error) {
         console.error('Failed to delete playlist:', error);
       }
@@ -258,7 +330,7 @@ export default function PlaylistsPage() {
 
   const calculateDuration = (songIds: string[]) => {
     return songIds.reduce((total, songId) => {
-      const song = songs.find(s => s.id === songId);
+      const song = songsById[songId];
       return total + (song?.duration || 0);
     }, 0);
   };
@@ -273,11 +345,6 @@ export default function PlaylistsPage() {
     return `${minutes}分钟`;
   };
 
-  const filteredPlaylists = playlists.filter(playlist =>
-    playlist.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    (playlist.description && playlist.description.toLowerCase().includes(searchTerm.toLowerCase()))
-  );
-
   return (
     <AdminLayout>
       <div className="space-y-6">
@@ -361,6 +428,15 @@ export default function PlaylistsPage() {
 
                 <div className="space-y-2">
                   <Label>选择歌曲</Label>
+                  <div className="relative">
+                    <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
+                    <Input
+                      placeholder="搜索歌曲或艺术家..."
+                      value={songSearch}
+                      onChange={(e) => setSongSearch(e.target.value)}
+                      className="pl-10"
+                    />
+                  </div>
                   <div className="max-h-60 overflow-y-auto border border-input rounded-lg p-3 space-y-2">
                     {songs.map((song) => (
                       <div
@@ -394,6 +470,9 @@ export default function PlaylistsPage() {
                         </div>
                       </div>
                     ))}
+                    {songs.length === 0 && (
+                      <p className="text-sm text-muted-foreground text-center py-4">没有找到歌曲</p>
+                    )}
                   </div>
                   
                   <div className="text-sm text-muted-foreground">
@@ -417,7 +496,7 @@ export default function PlaylistsPage() {
                         >
                           <div className="space-y-2">
                             {formData.songIds.map((songId) => {
-                              const song = songs.find(s => s.id === songId);
+                              const song = songsById[songId];
                               if (!song) return null;
                               return (
                                 <SortableSongItem
@@ -473,12 +552,12 @@ export default function PlaylistsPage() {
               <CardTitle className="flex items-center gap-2">
                 <List className="h-5 w-5" />
                 歌单列表
-                <Badge variant="secondary">{filteredPlaylists.length}</Badge>
+                <Badge variant="secondary">{total}</Badge>
               </CardTitle>
             </CardHeader>
             <CardContent>
               <div className="space-y-4">
-                {filteredPlaylists.map((playlist, index) => (
+                {playlists.map((playlist, index) => (
                   <div key={playlist.id}>
                     <div className="flex items-center justify-between">
                       <div className="flex items-center space-x-4">
@@ -551,17 +630,33 @@ export default function PlaylistsPage() {
                         </DropdownMenuContent>
                       </DropdownMenu>
                     </div>
-                    {index < filteredPlaylists.length - 1 && <Separator className="mt-4" />}
+                    {index < playlists.length - 1 && <Separator className="mt-4" />}
                   </div>
                 ))}
               </div>
 
-              {filteredPlaylists.length === 0 && (
+              {playlists.length === 0 && (
                 <div className="text-center py-12">
                   <List className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
                   <p className="text-muted-foreground">没有找到歌单</p>
                 </div>
               )}
+
+              {totalPages > 1 && (
+                <div className="flex items-center justify-between pt-6">
+                  <p className="text-sm text-muted-foreground">
+                    第 {page} / {totalPages} 页，共 {total} 个
+                  </p>
+                  <div className="flex gap-2">
+                    <Button variant="outline" size="sm" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+                      上一页
+                    </Button>
+                    <Button variant="outline" size="sm" disabled={page >= totalPages} onClick={() => setPage(page + 1)}>
+                      下一页
+                    </Button>
+                  </div>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
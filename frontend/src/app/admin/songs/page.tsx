@@ -1,7 +1,7 @@
 "use client";
 
 import { useState, useEffect } from 'react';
-import { adminAPI } from '@/lib/admin-api';
+import { adminAPI, AdminSongListParams } from '@/lib/admin-api';
 import AdminLayout from '@/components/admin-layout';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -41,6 +41,9 @@ interface SongWithRelations extends Song {
   albumTitle?: string;
 }
 
+const PAGE_SIZE = 50;
+const selectClassName = "flex h-10 rounded-md border border-input bg-background px-3 py-2 text-sm ring-offset-background focus-visible:outline-none focus-visible:ring-2 focus-visible:ring-ring focus-visible:ring-offset-2";
+
 export default function SongsPage() {
   const [songs, setSongs] = useState<SongWithRelations[]>([]);
   const [artists, setArtists] = useState<Artist[]>([]);
@@ -48,6 +51,14 @@ export default function SongsPage() {
   const [moods, setMoods] = useState<Mood[]>([]);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [filterArtistId, setFilterArtistId] = useState('');
+  const [filterAlbumId, setFilterAlbumId] = useState('');
+  const [filterMoodId, setFilterMoodId] = useState('');
+  const [sort, setSort] = useState<NonNullable<AdminSongListParams['sort']>>('created_desc');
+  const [page, setPage] = useState(1);
+  const [total, setTotal] = useState(0);
+  const [totalPages, setTotalPages] = useState(0);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingSong, setEditingSong] = useState<SongWithRelations | null>(null);
   const [formData, setFormData] = useState({
@@ -71,20 +82,56 @@ export default function SongsPage() {
     fetchData();
   }, []);
 
-  const fetchData = async () => {
+  // 搜索输入防抖
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // 筛选条件变化时回到第一页
+  useEffect(() => {
+    setPage(1);
+  }, [debouncedSearch, filterArtistId, filterAlbumId, filterMoodId, sort]);
+
+  useEffect(() => {
+    fetchSongs();
+  }, [page, debouncedSearch, filterArtistId, filterAlbumId, filterMoodId, sort]);
+
+  // 歌曲列表由服务端分页、筛选和排序
+  const fetchSongs = async () => {
     try {
       setLoading(true);
-      const [songsResponse, artistsResponse, albumsResponse, moodsResponse] = await Promise.all([
-        adminAPI.getSongs(),
+      const response = await adminAPI.getSongs({
+        page,
+        limit: PAGE_SIZE,
+        q: debouncedSearch,
+        artistId: filterArtistId,
+        albumId: filterAlbumId,
+        moodId: filterMoodId,
+        sort,
+        fields: 'admin_list'
+      });
+      
+      if (response.success && response.data) {
+        setSongs(response.data);
+        setTotal(response.total ?? response.data.length);
+        setTotalPages(response.totalPages ?? 1);
+      }
+    } catch (error) {
+      console.error('Failed to fetch songs:', error);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  const fetchData = async () => {
+    try {
+      const [artistsResponse, albumsResponse, moodsResponse] = await Promise.all([
         adminAPI.getArtists(),
         adminAPI.getAlbums(),
         adminAPI.getMoods()
       ]);
       
-      if (songsResponse.success && songsResponse.data) {
-        setSongs(songsResponse.data);
-      }
-      
       if (artistsResponse.success && artistsResponse.data) {
         setArtists(artistsResponse.data);
       }
@@ -98,8 +145,6 @@ export default function SongsPage() {
       }
     } catch (error) {
       console.error('Failed to fetch data:', error);
-    } finally {
-      setLoading(false);
     }
   };
 
@@ -138,13 +183,26 @@ export default function SongsPage() {
       setDialogOpen(false);
       setEditingSong(null);
       resetForm();
-      fetchData();
+      fetchSongs();
     } catch (error) {
       console.error('Failed to save song:', error);
     }
   };
 
-  const handleEdit = (song: SongWithRelations) => {
+  const handleEdit = async (listedSong: SongWithRelations) => {
+    // 列表不含歌词，编辑时获取完整歌曲；获取失败则不打开编辑，以免保存时清空歌词
+    let song: SongWithRelations;
+    try {
+      const response = await adminAPI.getSong(listedSong.id);
+      if (!response.success || !response.data) {
+        throw new Error(response.error || 'Song not found');
+      }
+      song = response.data;
+    } catch (error) {
+      console.error('Failed to fetch song:', error);
+      alert('获取歌曲详情失败: ' + (error instanceof Error ? error.message : '未知错误'));
+      return;
+    }
     setEditingSong(song);
     
     // 检查歌曲是否属于专辑并且继承艺术家
@@ -189,7 +247,7 @@ export default function SongsPage() {
     if (confirm('确定要删除这首歌曲吗？')) {
       try {
         await adminAPI.deleteSong(id);
-        fetchData();
+        fetchSongs();
       } catch (error) {
         console.error('Failed to delete song:', error);
       }
@@ -272,12 +330,6 @@ export default function SongsPage() {
     return `${minutes}:${remainingSeconds.toString().padStart(2, '0')}`;
   };
 
-  const filteredSongs = songs.filter(song =>
-    song.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    (song.artistName && song.artistName.toLowerCase().includes(searchTerm.toLowerCase())) ||
-    (song.albumTitle && song.albumTitle.toLowerCase().includes(searchTerm.toLowerCase()))
-  );
-
   const getAlbumsForArtist = (artistId: string) => {
     return albums.filter(album => album.artistId === artistId);
   };
@@ -478,15 +530,43 @@ export default function SongsPage() {
           </Dialog>
         </div>
 
-        {/* Search */}
-        <div className="relative max-w-sm">
-          <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
-          <Input
-            placeholder="搜索歌曲、艺术家或专辑..."
-            value={searchTerm}
-            onChange={(e) => setSearchTerm(e.target.value)}
-            className="pl-10"
-          />
+        {/* Search & Filters */}
+        <div className="flex flex-wrap items-center gap-3">
+          <div className="relative w-full max-w-sm">
+            <Search className="absolute left-3 top-1/2 transform -translate-y-1/2 h-4 w-4 text-muted-foreground" />
+            <Input
+              placeholder="搜索歌曲或艺术家..."
+              value={searchTerm}
+              onChange={(e) => setSearchTerm(e.target.value)}
+              className="pl-10"
+            />
+          </div>
+          <select value={filterArtistId} onChange={(e) => setFilterArtistId(e.target.value)} className={selectClassName}>
+            <option value="">全部艺术家</option>
+            {artists.map((artist) => (
+              <option key={artist.id} value={artist.id}>{artist.name}</option>
+            ))}
+          </select>
+          <select value={filterAlbumId} onChange={(e) => setFilterAlbumId(e.target.value)} className={selectClassName}>
+            <option value="">全部专辑</option>
+            {albums.map((album) => (
+              <option key={album.id} value={album.id}>{album.title}</option>
+            ))}
+          </select>
+          <select value={filterMoodId} onChange={(e) => setFilterMoodId(e.target.value)} className={selectClassName}>
+            <option value="">全部心情</option>
+            {moods.map((mood) => (
+              <option key={mood.id} value={mood.id}>{mood.name}</option>
+            ))}
+          </select>
+          <select value={sort} onChange={(e) => setSort(e.target.value as NonNullable<AdminSongListParams['sort']>)} className={selectClassName}>
+            <option value="created_desc">最新创建</option>
+            <option value="created_asc">最早创建</option>
+            <option value="title_asc">标题 A-Z</option>
+            <option value="title_desc">标题 Z-A</option>
+            <option value="play_count_desc">播放最多</option>
+            <option value="play_count_asc">播放最少</option>
+          </select>
         </div>
 
         {/* Songs Table */}
@@ -500,12 +580,12 @@ export default function SongsPage() {
               <CardTitle className="flex items-center gap-2">
                 <Music className="h-5 w-5" />
                 歌曲列表
-                <Badge variant="secondary">{filteredSongs.length}</Badge>
+                <Badge variant="secondary">{total}</Badge>
               </CardTitle>
             </CardHeader>
             <CardContent>
               <div className="space-y-4">
-                {filteredSongs.map((song, index) => (
+                {songs.map((song, index) => (
                   <div key={song.id}>
                     <div className="flex items-center justify-between">
                       <div className="flex items-center space-x-4">
@@ -598,17 +678,33 @@ export default function SongsPage() {
                         </DropdownMenuContent>
                       </DropdownMenu>
                     </div>
-                    {index < filteredSongs.length - 1 && <Separator className="mt-4" />}
+                    {index < songs.length - 1 && <Separator className="mt-4" />}
                   </div>
                 ))}
               </div>
 
-              {filteredSongs.length === 0 && (
+              {songs.length === 0 && (
                 <div className="text-center py-12">
                   <Music className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
                   <p className="text-muted-foreground">没有找到歌曲</p>
                 </div>
               )}
+
+              {totalPages > 1 && (
+                <div className="flex items-center justify-between pt-6">
+                  <p className="text-sm text-muted-foreground">
+                    第 {page} / {totalPages} 页，共 {total} 首
+                  </p>
+                  <div className="flex gap-2">
+                    <Button variant="outline" size="sm" disabled={page <= 1} onClick={() => setPage(page - 1)}>
+                      上一页
+                    </Button>
+                    <Button variant="outline" size="sm" disabled={page >= totalPages} onClick={() => setPage(page + 1)}>
+                      下一页
+                    </Button>
+                  </div>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
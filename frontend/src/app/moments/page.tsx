@@ -1,7 +1,7 @@
 'use client';
 
 import { useState, useEffect, useRef } from 'react';
-import { momentsAPI } from '@/lib/moments-api';
+import { momentsAPI, type MomentEvent } from '@/lib/moments-api';
 import type { MusicMoment } from '@/types';
 import { Card, CardContent } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
@@ -36,6 +36,40 @@ export default function MomentsPage() {
     loadMoments();
   }, [filters, currentPage]);
 
+  // 实时更新当前页朋友圈的点赞、评论和修改，无需重新加载
+  const momentIds = moments.map(m => m.id).join(',');
+  useEffect(() => {
+    if (!momentIds) return;
+    return momentsAPI.subscribeMoments(momentIds.split(','), applyMomentEvent);
+  }, [momentIds]);
+
+  const applyMomentEvent = (event: MomentEvent) => {
+    if (event.type === 'resync') {
+      loadMoments();
+      return;
+    }
+    setMoments(prev => {
+      if (event.type === 'moment.deleted') return prev.filter(m => m.id !== event.momentId);
+      return prev.map(m => {
+        if (m.id !== event.momentId) return m;
+        switch (event.type) {
+          case 'moment.liked':
+            return { ...m, likeCount: event.likeCount };
+          case 'comment.added':
+            return m.comments?.some(c => c.id === event.comment.id)
+              ? m
+              : { ...m, comments: [...(m.comments || []), event.comment] };
+          case 'comment.deleted':
+            return { ...m, comments: (m.comments || []).filter(c => c.id !== event.commentId) };
+          case 'moment.updated':
+            return { ...m, ...event.changes };
+          default:
+            return m;
+        }
+      });
+    });
+  };
+
   const loadMoments = async () => {
     setIsLoading(true);
     setError(null);
@@ -97,9 +131,12 @@ export default function MomentsPage() {
 
   const handleLike = async (momentId: string) => {
     try {
-      await momentsAPI.likeMoment(momentId);
-      // Refresh moments to show updated like count
-      loadMoments();
+      const response = await momentsAPI.likeMoment(momentId);
+      // 直接更新点赞数（其他人的点赞通过实时推送到达）
+      if (response.success && response.data) {
+        const { likeCount } = response.data;
+        setMoments(prev => prev.map(m => (m.id === momentId ? { ...m, likeCount } : m)));
+      }
     } catch (error) {
       console.error('Failed to like moment:', error);
     }
@@ -20,7 +20,7 @@ import { isModernBrowser } from '@/lib/utils';
 import { LightSongMoments } from '@/components/light-song-moments';
 import { QuickShareDialog } from '@/components/quick-share-dialog';
 import { momentsAPI } from '@/lib/moments-api';
-import type { MusicMoment } from '@/types';
+import type { MusicMoment, LyricLine } from '@/types';
 
 export default function PlayClient() {
   const [isModern, setIsModern] = useState(true);
@@ -158,6 +158,33 @@ export default function PlayClient() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [searchParams]);
 
+  // 列表接口不再携带歌词，按需获取服务端解析好的歌词
+  const [fetchedLyrics, setFetchedLyrics] = useState<{ songId: string; lines: LyricLine[] } | null>(null);
+
+  useEffect(() => {
+    if (!currentSong || currentSong.lyrics || currentSong.hasLyrics === false || currentSong.id === 'demo-song-1') {
+      return;
+    }
+    if (fetchedLyrics?.songId === currentSong.id) return;
+
+    let cancelled = false;
+    const songId = currentSong.id;
+    api.getSongLyrics(songId).then(response => {
+      if (cancelled || !response.success || !response.data) return;
+      // 原文与翻译在服务端合并为一行，这里展开为同一时间的两行，与 parseLRC 的结果一致
+      const lines = response.data.data.lines.flatMap(line => (
+        line.translation
+          ? [{ time: line.time, text: line.text }, { time: line.time, text: line.translation }]
+          : [{ time: line.time, text: line.text }]
+      ));
+      setFetchedLyrics({ songId, lines });
+    });
+
+    return () => {
+      cancelled = true;
+    };
+  }, [currentSong, fetchedLyrics?.songId]);
+
   // 动态歌词数据 - 使用真实的歌词解析
   const currentLyrics = useMemo(() => {
     if (!currentSong) return [];
@@ -183,6 +210,10 @@ export default function PlayClient() {
       }
     }
 
+    if (fetchedLyrics?.songId === currentSong.id && fetchedLyrics.lines.length > 0) {
+      return fetchedLyrics.lines;
+    }
+
     // 如果没有歌词，显示歌曲基本信息
     return [
       { time: 0, text: `♪ ${currentSong.title} ♪` },
@@ -191,7 +222,7 @@ export default function PlayClient() {
       { time: 30, text: '暂无歌词' },
       { time: 40, text: '享受这美妙的旋律' },
     ];
-  }, [currentSong]);
+  }, [currentSong, fetchedLyrics]);
 
   const handlePlayPause = () => {
     if (isPlaying) {
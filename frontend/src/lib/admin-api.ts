@@ -1,7 +1,39 @@
-import { LoginRequest, LoginResponse, AdminApiResponse, Artist, Album, Song, Mood, Playlist, ImportBatchRequest, ImportBatchResponse } from '@/types';
+import { LoginRequest, LoginResponse, AdminApiResponse, Artist, Album, Song, Mood, Playlist, ImportBatchRequest, ImportBatchResponse, PaginatedResponse } from '@/types';
 
 const API_BASE = process.env.NODE_ENV === 'production' ? process.env.NEXT_PUBLIC_API_URL : 'http://localhost:8000/api';
 
+export interface AdminListParams {
+  page?: number;
+  limit?: number;
+  q?: string;
+}
+
+export interface AdminArtistListParams extends AdminListParams {
+  sort?: 'created_desc' | 'created_asc' | 'name_asc' | 'name_desc' | 'song_count_desc' | 'followers_desc';
+}
+
+export interface AdminAlbumListParams extends AdminListParams {
+  artistId?: string;
+  genre?: string;
+  sort?: 'created_desc' | 'created_asc' | 'title_asc' | 'title_desc' | 'release_desc' | 'release_asc';
+}
+
+export interface AdminSongListParams extends AdminListParams {
+  ids?: string;
+  artistId?: string;
+  albumId?: string;
+  moodId?: string;
+  genre?: string;
+  sort?: 'created_desc' | 'created_asc' | 'title_asc' | 'title_desc' | 'play_count_desc' | 'play_count_asc';
+  fields?: string;
+}
+
+export interface AdminPlaylistListParams extends AdminListParams {
+  sort?: 'created_desc' | 'created_asc' | 'name_asc' | 'name_desc' | 'play_count_desc';
+}
+
+export type AdminPage = Omit<PaginatedResponse<unknown>, 'data'>;
+
 class AdminAPI {
   private token: string | null = null;
 
@@ -11,6 +43,18 @@ class AdminAPI {
     }
   }
 
+  // 列表查询参数，忽略未设置的项
+  private listQuery(params: object): string {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+      if (value !== undefined && value !== '') {
+        query.append(key, String(value));
+      }
+    });
+    const queryString = query.toString();
+    return queryString ? `?${queryString}` : '';
+  }
+
   private getHeaders() {
     const headers: Record<string, string> = {
       'Content-Type': 'application/json',
@@ -66,8 +110,9 @@ class AdminAPI {
   }
 
   // Artists
-  async getArtists(): Promise<AdminApiResponse<Artist[]>> {
-    const response = await fetch(`${API_BASE}/admin/artists`, {
+  // 不传 limit 时返回全部艺术家（下拉选择用）；传 limit 时服务端分页
+  async getArtists(params: AdminArtistListParams = {}): Promise<AdminApiResponse<Artist[]> & Partial<AdminPage>> {
+    const response = await fetch(`${API_BASE}/admin/artists${this.listQuery(params)}`, {
       headers: this.getHeaders(),
     });
     
@@ -120,8 +165,9 @@ class AdminAPI {
   }
 
   // Albums
-  async getAlbums(): Promise<AdminApiResponse<Album[]>> {
-    const response = await fetch(`${API_BASE}/admin/albums`, {
+  // 不传 limit 时返回全部专辑（下拉选择用）；传 limit 时服务端分页
+  async getAlbums(params: AdminAlbumListParams = {}): Promise<AdminApiResponse<Album[]> & Partial<AdminPage>> {
+    const response = await fetch(`${API_BASE}/admin/albums${this.listQuery(params)}`, {
       headers: this.getHeaders(),
     });
     
@@ -174,8 +220,9 @@ class AdminAPI {
   }
 
   // Songs
-  async getSongs(): Promise<AdminApiResponse<Song[]>> {
-    const response = await fetch(`${API_BASE}/admin/songs`, {
+  // 不传 limit 时返回全部歌曲（下拉选择用）；传 limit 时服务端分页
+  async getSongs(params: AdminSongListParams = {}): Promise<AdminApiResponse<Song[]> & Partial<AdminPage>> {
+    const response = await fetch(`${API_BASE}/admin/songs${this.listQuery(params)}`, {
       headers: this.getHeaders(),
     });
     
@@ -186,6 +233,18 @@ class AdminAPI {
     return response.json();
   }
 
+  async getSong(id: string): Promise<AdminApiResponse<Song>> {
+    const response = await fetch(`${API_BASE}/admin/songs/${id}`, {
+      headers: this.getHeaders(),
+    });
+    
+    if (!response.ok) {
+      throw new Error('Failed to fetch song');
+    }
+    
+    return response.json();
+  }
+
   async createSong(song: Omit<Song, 'id' | 'createdAt' | 'updatedAt' | 'artist' | 'album' | 'moods'>): Promise<AdminApiResponse<Song>> {
     const response = await fetch(`${API_BASE}/admin/songs`, {
       method: 'POST',
@@ -282,8 +341,8 @@ class AdminAPI {
   }
 
   // Playlists
-  async getPlaylists(): Promise<AdminApiResponse<Playlist[]>> {
-    const response = await fetch(`${API_BASE}/admin/playlists`, {
+  async getPlaylists(params: AdminPlaylistListParams = {}): Promise<AdminApiResponse<Playlist[]> & Partial<AdminPage>> {
+    const response = await fetch(`${API_BASE}/admin/playlists${this.listQuery(params)}`, {
       headers: this.getHeaders(),
     });
     
@@ -7,12 +7,31 @@ import type {
   ApiResponse, 
   PaginatedResponse, 
   SearchResult,
-  RecommendationParams 
+  RecommendationParams,
+  Lyrics
 } from '@/types';
 import { mockApi } from './mock-api';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
 const USE_MOCK_API = false;
+const LISTENING_SESSION_KEY = 'listening-session-id';
+
+// Anonymous per-tab session id, lets the server learn which songs are played after which
+function getListeningSessionId(): string | undefined {
+  if (typeof window === 'undefined') return undefined;
+  try {
+    let sessionId = sessionStorage.getItem(LISTENING_SESSION_KEY);
+    if (!sessionId) {
+      sessionId = typeof crypto !== 'undefined' && 'randomUUID' in crypto
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      sessionStorage.setItem(LISTENING_SESSION_KEY, sessionId);
+    }
+    return sessionId;
+  } catch {
+    return undefined;
+  }
+}
 
 // Real API Client Configuration
 class RealApiClient {
@@ -87,7 +106,7 @@ class RealApiClient {
 
   // Songs API
   async getSongs(page = 1, limit = 20, sortBy = 'created_desc'): Promise<ApiResponse<PaginatedResponse<Song>>> {
-    return this.request(`/songs?page=${page}&limit=${limit}&sort_by=${sortBy}`);
+    return this.request(`/songs?page=${page}&limit=${limit}&sort_by=${sortBy}&fields=card`);
   }
 
   async getSong(id: string): Promise<ApiResponse<Song>> {
@@ -96,7 +115,7 @@ class RealApiClient {
 
   // Playlists API
   async getPlaylists(page = 1, limit = 20): Promise<ApiResponse<PaginatedResponse<Playlist>>> {
-    return this.request(`/playlists?page=${page}&limit=${limit}`);
+    return this.request(`/playlists?page=${page}&limit=${limit}&fields=card`);
   }
 
   async getPlaylist(id: string): Promise<ApiResponse<Playlist>> {
@@ -164,21 +183,29 @@ class RealApiClient {
     return this.request(`/songs/${songId}/similar?limit=${limit}`);
   }
 
+  async getSongLyrics(songId: string): Promise<ApiResponse<{ data: Lyrics }>> {
+    return this.request(`/songs/${songId}/lyrics`);
+  }
+
   async getTrendingSongs(limit = 20): Promise<ApiResponse<Song[]>> {
-    return this.request(`/trending/songs?limit=${limit}`);
+    return this.request(`/trending/songs?limit=${limit}&fields=card`);
   }
 
   async getHotSongs(limit = 20): Promise<ApiResponse<Song[]>> {
-    return this.request(`/hot/songs?limit=${limit}`);
+    return this.request(`/hot/songs?limit=${limit}&fields=card`);
   }
 
   async getNewSongs(limit = 20): Promise<ApiResponse<Song[]>> {
-    return this.request(`/new/songs?limit=${limit}`);
+    return this.request(`/new/songs?limit=${limit}&fields=card`);
   }
 
   // Play tracking API
   async recordPlay(songId: string): Promise<ApiResponse<{ songId: string; playCount: number }>> {
-    return this.request(`/songs/${songId}/play`, { method: 'POST' });
+    const sessionId = getListeningSessionId();
+    return this.request(`/songs/${songId}/play`, {
+      method: 'POST',
+      headers: sessionId ? { 'X-Session-Id': sessionId } : undefined,
+    });
   }
 }
 
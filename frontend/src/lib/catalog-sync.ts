@@ -0,0 +1,190 @@
+import type { Artist, Album, Song, Playlist, Mood, ApiResponse } from '@/types';
+
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api';
+const DB_NAME = 'selfmusic-catalog';
+const DB_VERSION = 1;
+const META_STORE = 'meta';
+const TOKEN_KEY = 'next';
+const PAGE_SIZE = 2000;
+// 两次增量同步之间的最短间隔（毫秒）
+const MIN_SYNC_INTERVAL = 30 * 1000;
+
+export const CATALOG_STORES = ['artists', 'albums', 'moods', 'songs', 'playlists'] as const;
+export type CatalogStore = typeof CATALOG_STORES[number];
+
+interface CatalogRecords {
+  artists: Artist;
+  albums: Album;
+  moods: Mood;
+  songs: Song;
+  playlists: Playlist;
+}
+
+// One page of /sync (see backend/changelog.py); relations are ids only
+export interface SyncPage {
+  artists: Artist[];
+  albums: Album[];
+  moods: Mood[];
+  songs: Song[];
+  playlists: Playlist[];
+  deleted: Record<CatalogStore, string[]>;
+  next: string;
+  hasMore: boolean;
+  reset: boolean;
+}
+
+function promised<T>(request: IDBRequest<T>): Promise<T> {
+  return new Promise((resolve, reject) => {
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+/**
+ * Local copy of the catalog kept current through GET /sync.
+ *
+ * The last `next` token is stored with the records, in the same IndexedDB
+ * transaction as each page, so an interrupted sync resumes where it stopped.
+ * Each page's upserts and `deleted` ids are applied in place; on `reset` the
+ * local copy is dropped first and rebuilt from the start of the log.
+ * Play counts are not synced (they move with the next change to the song).
+ */
+class CatalogSync {
+  private db: Promise<IDBDatabase | null> | null = null;
+  private running: Promise<boolean> | null = null;
+  private lastSync = 0;
+
+  private open(): Promise<IDBDatabase | null> {
+    if (!this.db) {
+      if (typeof window === 'undefined' || typeof indexedDB === 'undefined') {
+        this.db = Promise.resolve(null);
+      } else {
+        const request = indexedDB.open(DB_NAME, DB_VERSION);
+        request.onupgradeneeded = () => {
+          [...CATALOG_STORES, META_STORE].forEach(name => {
+            if (!request.result.objectStoreNames.contains(name)) {
+              request.result.createObjectStore(name, name === META_STORE ? undefined : { keyPath: 'id' });
+            }
+          });
+        };
+        this.db = promised(request).catch(error => {
+          console.error('Catalog cache unavailable:', error);
+          return null;
+        });
+      }
+    }
+    return this.db;
+  }
+
+  private async fetchPage(since: string | undefined): Promise<SyncPage> {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+    if (since) params.append('since', since);
+    const response = await fetch(`${API_BASE_URL}/sync?${params.toString()}`);
+    if (!response.ok) throw new Error('Failed to sync catalog');
+    const body: ApiResponse<SyncPage> = await response.json();
+    if (!body.success || !body.data) throw new Error(body.error || 'Failed to sync catalog');
+    return body.data;
+  }
+
+  private async apply(db: IDBDatabase, page: SyncPage): Promise<void> {
+    const transaction = db.transaction([...CATALOG_STORES, META_STORE], 'readwrite');
+    const done = new Promise<void>((resolve, reject) => {
+      transaction.oncomplete = () => resolve();
+      transaction.onerror = () => reject(transaction.error);
+      transaction.onabort = () => reject(transaction.error);
+    });
+    CATALOG_STORES.forEach(name => {
+      const store = transaction.objectStore(name);
+      if (page.reset) store.clear();
+      page[name].forEach(record => store.put(record));
+      (page.deleted[name] || []).forEach(id => store.delete(id));
+    });
+    transaction.objectStore(META_STORE).put(page.next, TOKEN_KEY);
+    return done;
+  }
+
+  private async run(): Promise<boolean> {
+    const db = await this.open();
+    if (!db) return false;
+    try {
+      let since = await promised(db.transaction(META_STORE).objectStore(META_STORE).get(TOKEN_KEY)) as string | undefined;
+      let page: SyncPage;
+      do {
+        page = await this.fetchPage(since);
+        await this.apply(db, page);
+        since = page.next;
+      } while (page.hasMore);
+      this.lastSync = Date.now();
+      return true;
+    } catch (error) {
+      console.error('Catalog sync failed:', error);
+      return false;
+    }
+  }
+
+  /**
+   * Bring the local copy up to date (at most every MIN_SYNC_INTERVAL unless forced).
+   * Resolves to whether it is current; callers fall back to the network when it is not.
+   */
+  sync(force = false): Promise<boolean> {
+    if (!force && this.lastSync && Date.now() - this.lastSync < MIN_SYNC_INTERVAL) {
+      return Promise.resolve(true);
+    }
+    if (!this.running) {
+      this.running = this.run().finally(() => { this.running = null; });
+    }
+    return this.running;
+  }
+
+  /** Sync again on the next call, e.g. after this client changed the catalog itself */
+  invalidate() {
+    this.lastSync = 0;
+  }
+
+  /** Whether anything was ever synced, i.e. the local copy can stand in while offline */
+  async hasData(): Promise<boolean> {
+    const db = await this.open();
+    if (!db) return false;
+    const token = await promised(db.transaction(META_STORE).objectStore(META_STORE).get(TOKEN_KEY));
+    return token !== undefined;
+  }
+
+  async getAll<K extends CatalogStore>(name: K): Promise<CatalogRecords[K][]> {
+    const db = await this.open();
+    if (!db) return [];
+    return promised(db.transaction(name).objectStore(name).getAll()) as Promise<CatalogRecords[K][]>;
+  }
+
+  /** Synced songs with their artists, album and moods joined in, shaped like the list endpoints' songs */
+  async getSongs(): Promise<Song[]> {
+    const [songs, artists, albums, moods] = await Promise.all([
+      this.getAll('songs'), this.getAll('artists'), this.getAll('albums'), this.getAll('moods')
+    ]);
+    const artistsById = new Map(artists.map(artist => [artist.id, artist]));
+    const albumsById = new Map(albums.map(album => [album.id, album]));
+    const moodsById = new Map(moods.map(mood => [mood.id, mood]));
+    const joinArtists = (links: { id: string; isPrimary?: boolean }[] | undefined) =>
+      (links || []).flatMap(link => {
+        const artist = artistsById.get(link.id);
+        return artist ? [{ ...artist, isPrimary: link.isPrimary }] : [];
+      });
+
+    return songs.flatMap(song => {
+      const artist = artistsById.get(song.artistId);
+      // The list endpoints join the primary artist, so songs without one are not listed
+      if (!artist) return [];
+      const album = song.albumId ? albumsById.get(song.albumId) : undefined;
+      return [{
+        ...song,
+        artist,
+        artists: joinArtists(song.artists),
+        album: album
+          ? { ...album, artist: artistsById.get(album.artistId), artists: joinArtists(album.artists) } as Album
+          : undefined,
+        moods: song.moodIds.flatMap(id => moodsById.get(id) || []),
+      }];
+    });
+  }
+}
+
+export const catalogSync = new CatalogSync();
@@ -2,6 +2,32 @@ import { create } from 'zustand';
 import { devtools } from 'zustand/middleware';
 import type { Artist, Album, Song, Playlist, Mood, PaginatedResponse } from '@/types';
 import { api } from './api';
+import { catalogSync } from './catalog-sync';
+
+const byCreatedDesc = (a: { createdAt: string }, b: { createdAt: string }) =>
+  a.createdAt < b.createdAt ? 1 : a.createdAt > b.createdAt ? -1 : 0;
+
+// One page of the synced songs, ordered as GET /songs orders them; used while offline
+async function offlineSongs(page: number, limit: number, sortBy: string): Promise<PaginatedResponse<Song> | null> {
+  if (!(await catalogSync.hasData())) return null;
+  const songs = await catalogSync.getSongs();
+  const compare: Record<string, (a: Song, b: Song) => number> = {
+    created_desc: byCreatedDesc,
+    created_asc: (a, b) => byCreatedDesc(b, a),
+    title_asc: (a, b) => (a.title < b.title ? -1 : a.title > b.title ? 1 : 0),
+    title_desc: (a, b) => (a.title < b.title ? 1 : a.title > b.title ? -1 : 0),
+    play_count_desc: (a, b) => b.playCount - a.playCount,
+    play_count_asc: (a, b) => a.playCount - b.playCount,
+  };
+  songs.sort(compare[sortBy] || byCreatedDesc);
+  return {
+    data: songs.slice((page - 1) * limit, page * limit),
+    total: songs.length,
+    page,
+    limit,
+    totalPages: Math.ceil(songs.length / limit),
+  };
+}
 
 // Artists Store
 interface ArtistsState {
@@ -203,7 +229,12 @@ export const useSongsStore = create<SongsState & SongsActions>()(
       fetchSongs: async (page = 1, limit = 20, sortBy = 'created_desc') => {
         set({ isLoading: true, error: null });
         try {
-          const response = await api.getSongs(page, limit, sortBy);
+          let response = await api.getSongs(page, limit, sortBy);
+          if (!response.success) {
+            // Offline: serve the page from the synced catalog (play counts as of the last change)
+            const synced = await offlineSongs(page, limit, sortBy);
+            if (synced) response = { success: true, data: synced };
+          }
           if (response.success && response.data) {
             set({
               songs: response.data.data || [],
@@ -379,6 +410,21 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
       fetchPlaylists: async (page = 1, limit = 20) => {
         set({ isLoading: true, error: null });
         try {
+          // Public playlists from the synced catalog, ordered as GET /playlists orders them
+          if (await catalogSync.sync() || await catalogSync.hasData()) {
+            const playlists = (await catalogSync.getAll('playlists')).filter(p => p.isPublic).sort(byCreatedDesc);
+            set({
+              playlists: playlists.slice((page - 1) * limit, page * limit),
+              pagination: {
+                page,
+                limit,
+                total: playlists.length,
+                totalPages: Math.ceil(playlists.length / limit),
+              },
+              isLoading: false,
+            });
+            return;
+          }
           const response = await api.getPlaylists(page, limit);
           if (response.success && response.data) {
             set({
@@ -426,6 +472,7 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
         try {
           const response = await api.createPlaylist(playlist);
           if (response.success && response.data) {
+            catalogSync.invalidate();
             set((state) => ({
               playlists: [...state.playlists, response.data!],
               isLoading: false,
@@ -443,6 +490,7 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
         try {
           const response = await api.updatePlaylist(id, playlist);
           if (response.success && response.data) {
+            catalogSync.invalidate();
             set((state) => ({
               playlists: state.playlists.map(p => p.id === id ? response.data! : p),
               currentPlaylist: state.currentPlaylist?.id === id ? response.data! : state.currentPlaylist,
@@ -461,6 +509,7 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
         try {
           const response = await api.deletePlaylist(id);
           if (response.success) {
+            catalogSync.invalidate();
             set((state) => ({
               playlists: state.playlists.filter(p => p.id !== id),
               currentPlaylist: state.currentPlaylist?.id === id ? null : state.currentPlaylist,
@@ -478,6 +527,7 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
         try {
           const response = await api.addSongToPlaylist(playlistId, songId);
           if (response.success) {
+            catalogSync.invalidate();
             // Refresh the playlist to get updated song list
             const { fetchPlaylist } = get();
             await fetchPlaylist(playlistId);
@@ -491,6 +541,7 @@ export const usePlaylistsStore = create<PlaylistsState & PlaylistsActions>()(
         try {
           const response = await api.removeSongFromPlaylist(playlistId, songId);
           if (response.success) {
+            catalogSync.invalidate();
             // Refresh the playlist to get updated song list
             const { fetchPlaylist } = get();
             await fetchPlaylist(playlistId);
@@ -550,6 +601,11 @@ export const useMoodsStore = create<MoodsState & MoodsActions>()(
       fetchMoods: async () => {
         set({ isLoading: true, error: null });
         try {
+          // The synced catalog has every mood, ordered as GET /moods orders them
+          if (await catalogSync.sync() || await catalogSync.hasData()) {
+            set({ moods: (await catalogSync.getAll('moods')).sort(byCreatedDesc), isLoading: false });
+            return;
+          }
           const response = await api.getMoods();
           if (response.success && response.data) {
             set({ moods: response.data, isLoading: false });
@@ -7,7 +7,8 @@ import type {
   ApiResponse, 
   PaginatedResponse, 
   SearchResult,
-  RecommendationParams 
+  RecommendationParams,
+  Lyrics
 } from '@/types';
 import { 
   mockArtists, 
@@ -16,6 +17,7 @@ import {
   mockPlaylists, 
   mockMoods
 } from './mock-data';
+import { parseLRC } from './lyrics-parser';
 
 // Mock API delay for realistic experience
 const mockDelay = (ms: number = 300) => new Promise(resolve => setTimeout(resolve, ms));
@@ -185,6 +187,23 @@ class MockApiClient {
     };
   }
 
+  async getSongLyrics(songId: string): Promise<ApiResponse<{ data: Lyrics }>> {
+    await mockDelay();
+    const song = mockSongs.find(s => s.id === songId);
+    
+    if (!song) {
+      return {
+        success: false,
+        error: 'Song not found',
+      };
+    }
+    
+    return {
+      success: true,
+      data: { data: { songId, lines: song.lyrics ? parseLRC(song.lyrics) : [] } },
+    };
+  }
+
   // Playlists API
   async getPlaylists(page = 1, limit = 20): Promise<ApiResponse<PaginatedResponse<Playlist>>> {
     await mockDelay();
@@ -11,6 +11,20 @@ export interface MomentFilters {
   period?: string;
 }
 
+// Live updates pushed by /moments/events (see backend/pubsub.py)
+export type MomentEvent =
+  | { type: 'moment.liked'; momentId: string; likeCount: number }
+  | { type: 'comment.added'; momentId: string; comment: MomentComment }
+  | { type: 'comment.deleted'; momentId: string; commentId: string }
+  | { type: 'moment.created'; momentId: string; moment: MusicMoment }
+  | { type: 'moment.updated'; momentId: string; changes: Partial<MusicMoment> }
+  | { type: 'moment.deleted'; momentId: string }
+  | { type: 'resync'; momentId: null; reason: string };
+
+const MOMENT_EVENT_TYPES: MomentEvent['type'][] = [
+  'moment.liked', 'comment.added', 'comment.deleted', 'moment.created', 'moment.updated', 'moment.deleted', 'resync'
+];
+
 class MomentsAPI {
   private getAuthHeaders() {
     const token = typeof window !== 'undefined' ? localStorage.getItem('admin_token') : null;
@@ -51,6 +65,27 @@ class MomentsAPI {
     return response.json();
   }
 
+  /**
+   * Follow live likes/comments/edits of some moments (all moments when ids is empty).
+   * EventSource reconnects by itself and the server replays what was missed;
+   * on `resync` the caller should reload its moments. Returns the unsubscribe function.
+   */
+  subscribeMoments(ids: string[], onEvent: (event: MomentEvent) => void): () => void {
+    if (typeof window === 'undefined' || typeof EventSource === 'undefined') return () => {};
+    const params = ids.length > 0 ? `?ids=${encodeURIComponent(ids.join(','))}` : '';
+    const source = new EventSource(`${API_BASE_URL}/moments/events${params}`);
+    MOMENT_EVENT_TYPES.forEach(type => {
+      source.addEventListener(type, (message) => {
+        try {
+          onEvent(JSON.parse((message as MessageEvent).data) as MomentEvent);
+        } catch (error) {
+          console.error('Bad moment event:', error);
+        }
+      });
+    });
+    return () => source.close();
+  }
+
   // Admin methods
   async createMoment(moment: Partial<MusicMoment>): Promise<ApiResponse<MusicMoment>> {
     const response = await fetch(`${API_BASE_URL}/admin/moments`, {
@@ -43,7 +43,8 @@ export interface Song {
   duration: number;
   audioUrl?: string;
   coverUrl?: string;
-  lyrics?: string;
+  lyrics?: string; // Only on single-song responses
+  hasLyrics?: boolean; // List responses: lyrics are served by /songs/{id}/lyrics
   moods: Mood[];
   moodIds: string[];
   playCount: number;
@@ -72,11 +73,16 @@ export interface Playlist {
 export interface LyricLine {
   time: number;
   text: string;
+  translation?: string;
 }
 
 export interface Lyrics {
   songId: string;
   lines: LyricLine[];
+  timed?: boolean;
+  total?: number;
+  startIndex?: number;
+  currentIndex?: number;
 }
 
 export interface Mood {